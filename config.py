@@ -1,4 +1,5 @@
 import os
+import socket
 
 # Database configuration
 DATABASE_DIR = "data"
@@ -25,3 +26,59 @@ DEFAULT_TAX_RATE = 0.10  # 10%
 # System settings
 RECEIPT_DIRECTORY = "receipts"
 REPORT_DIRECTORY = "reports"
+ANALYTICS_DIRECTORY = os.path.join(DATABASE_DIR, "analytics")
+METRICS_CHECKPOINT_PATH = os.path.join(DATABASE_DIR, "sales_metrics.json")
+ARCHIVE_DIRECTORY = os.path.join(DATABASE_DIR, "archive")
+BACKUP_DIRECTORY = os.path.join(DATABASE_DIR, "backups")
+
+# Security settings
+PASSWORD_HASHER = "scrypt"  # or "pbkdf2_sha256"
+PASSWORD_HASHING_PATH = os.path.join(DATABASE_DIR, "password_hashing.json")
+SESSION_TTL = 15 * 60  # seconds
+LOGIN_FLUSH_INTERVAL = 5  # seconds between batched last_login writes
+PIN_MAX_ATTEMPTS = 5
+PIN_LOCKOUT_SECONDS = 60
+PROFILE_CACHE_TTL = 10 * 60  # seconds
+CUSTOMER_INDEX_REFRESH = 5  # seconds between picking up customers added or changed elsewhere
+
+# Loyalty settings
+LOYALTY_POINTS_PER_UNIT = 1  # points per currency unit spent
+LOYALTY_POINT_VALUE = 0.01  # currency value of one redeemed point
+LOYALTY_EXPIRY_DAYS = 365
+LOYALTY_TIERS = [(0, "Bronze"), (1000, "Silver"), (5000, "Gold")]  # points earned in the last year
+
+# Store settings
+STORE_ID = 1  # store-specific price list entries for this id apply here
+PRICE_REFRESH_INTERVAL = 60  # seconds between checks for price changes scheduled elsewhere
+
+# Replication settings
+REPLICATION_INBOX = None  # head-office inbox directory (e.g. on a network share); None disables shipping
+REPLICATION_INTERVAL = 30  # seconds between shipments
+
+# Offline till settings
+OFFLINE_JOURNAL_PATH = os.path.join(os.path.expanduser("~"), ".supermarket_billing", "offline_journal.db")  # keep on a local disk
+OFFLINE_AFTER_SECONDS = 2  # how long a sale waits for a locked store database before going offline
+OFFLINE_RETRY_INTERVAL = 15  # seconds between attempts to replay queued sales
+
+# Query instrumentation settings
+SLOW_QUERY_MS = 100  # queries at least this slow are logged with their plan
+SLOW_QUERY_LOG_PATH = os.path.join(DATABASE_DIR, "slow_queries.jsonl")
+SLOW_QUERY_LOG_SIZE = 200  # slow queries kept in memory
+
+# Tracing settings
+TRACE_BUFFER_SIZE = 200  # recent billing traces kept in memory
+TRACE_DIRECTORY = os.path.join(DATABASE_DIR, "traces")
+
+# Billing service settings
+SERVICE_HOST = "127.0.0.1"  # only terminals on this machine; use 0.0.0.0 behind a firewall for the store network
+SERVICE_PORT = 8765
+SERVICE_WORKERS = 8  # threads running database work for the service
+SERVICE_MAX_BODY = 1024 * 1024  # bytes
+SERVICE_KEEPALIVE_SECONDS = 15
+
+# Cart session settings
+TILL_ID = socket.gethostname()  # baskets left open by a crash are restored on the till that rang them up
+CART_SNAPSHOT_INTERVAL = 2  # seconds between writing changed baskets; a crash loses at most this much scanning
+
+# Shift close settings
+SHIFT_FOLD_INTERVAL = 30  # seconds between folding new payments into the open shifts' counters
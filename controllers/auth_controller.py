@@ -1,10 +1,12 @@
 from models.user import User
+from utils.session_cache import session_cache
 
 class AuthController:
     def __init__(self, db_manager):
         self.db_manager = db_manager
         self.user_model = User(db_manager)
         self.current_user = None
+        self.session_token = None
         
     def login(self, username, password):
         """
@@ -12,14 +14,33 @@ class AuthController:
         Returns user object if successful, None otherwise
         """
         user = self.user_model.authenticate(username, password)
+        if user:
+            token = session_cache.create_session(user)
+            # Ties the session to the password it was opened with
+            user = self.user_model.get_session_user(token)
         if user:
             self.current_user = user
+            self.session_token = token
             return user
         return None
         
+    def resume_session(self, token):
+        """
+        Restore the user of a live session token without re-entering the password
+        Returns user object if the session is still valid, None otherwise
+        """
+        user = self.user_model.get_session_user(token)
+        if user:
+            self.current_user = user
+            self.session_token = token
+        return user
+        
     def logout(self):
         """Log out the current user"""
+        if self.session_token:
+            session_cache.end_session(self.session_token)
         self.current_user = None
+        self.session_token = None
         
     def get_current_user(self):
         """Get the currently logged in user"""
@@ -40,17 +61,8 @@ class AuthController:
         Change a user's password
         Returns True if successful, False otherwise
         """
-        # Verify current password first
-        user = self.user_model.get_user_by_id(user_id)
-        if not user:
-            return False
-            
-        # Check if current password is correct
-        if not self.user_model.verify_password(user['username'], current_password):
-            return False
-            
-        # Update password
-        return self.user_model.update_password(user_id, new_password)
+        # Verifies the current password and re-hashes in a single connection
+        return self.user_model.change_password(user_id, current_password, new_password)
         
     def create_user(self, username, password, full_name, role, email=None):
         """
@@ -60,7 +72,7 @@ class AuthController:
         if not self.is_admin():
             return False
             
-        return self.user_model.create_user(username, password, full_name, role, email)
+        return self.user_model.add_user(username, password, full_name, role, email)
         
     def update_user(self, user_id, full_name, role, email=None):
         """
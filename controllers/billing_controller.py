@@ -1,35 +1,44 @@
 from models.product import Product
 from models.customer import Customer
 from models.invoice import Invoice
+from utils.tracing import traced
+from utils.cart_store import get_cart_store
+from config import TILL_ID
 import datetime
-import os
-from utils.pdf_generator import generate_receipt
 
 class BillingController:
-    def __init__(self, db_manager, auth_controller):
+    def __init__(self, db_manager, auth_controller, till_id=TILL_ID):
         self.db_manager = db_manager
         self.auth_controller = auth_controller
+        self.till_id = till_id
         self.product_model = Product(db_manager)
         self.customer_model = Customer(db_manager)
         self.invoice_model = Invoice(db_manager)
         
-        # Current cart
-        self.cart_items = []
+        # Current cart, held in the cart store and snapshotted from there
+        self.cart_store = get_cart_store(db_manager)
+        self.cart = self._open_cart()
         self.customer = None
         
+    def _open_cart(self):
+        user = self.auth_controller.get_current_user() if self.auth_controller else None
+        return self.cart_store.open(user['id'] if user else None, self.till_id)
+        
+    @traced("billing.search_product")
     def search_product(self, search_term):
         """Search for a product by barcode or name"""
         if not search_term:
             return []
             
-        # Try to find by exact barcode first
-        product = self.product_model.get_product_by_barcode(search_term)
+        # Try to find by exact barcode (SKU) first
+        product = self.product_model.get_product_by_sku(search_term)
         if product:
             return [product]
             
         # Otherwise search by name or partial barcode
         return self.product_model.search_products(search_term)
         
+    @traced("billing.add_to_cart")
     def add_to_cart(self, product_id, quantity=1):
         """Add a product to the cart"""
         if quantity <= 0:
@@ -44,23 +53,8 @@ class BillingController:
         if product['stock'] < quantity:
             return False
             
-        # Check if product is already in cart
-        for item in self.cart_items:
-            if item['id'] == product_id:
-                # Update quantity
-                item['quantity'] += quantity
-                item['total'] = item['quantity'] * item['price']
-                return True
-                
-        # Add new item to cart
-        self.cart_items.append({
-            'id': product['id'],
-            'name': product['name'],
-            'price': product['price'],
-            'quantity': quantity,
-            'total': product['price'] * quantity
-        })
-        
+        # Merges with the product's line if it is already in the cart
+        self.cart.add(product, quantity)
         return True
         
     def update_cart_item(self, product_id, quantity):
@@ -78,39 +72,69 @@ class BillingController:
             return False
             
         # Update quantity
-        for item in self.cart_items:
-            if item['id'] == product_id:
-                item['quantity'] = quantity
-                item['total'] = quantity * item['price']
-                return True
-                
-        return False
+        return self.cart.set_quantity(product_id, quantity)
         
     def remove_from_cart(self, product_id):
         """Remove an item from the cart"""
-        for i, item in enumerate(self.cart_items):
-            if item['id'] == product_id:
-                self.cart_items.pop(i)
-                return True
-                
-        return False
+        return self.cart.remove(product_id)
         
     def clear_cart(self):
         """Clear the cart"""
-        self.cart_items = []
+        self.cart.clear()
+        self.set_customer(None)
+        
+    def discard_cart(self):
+        """Drop the cart from the store, e.g. when its terminal goes away"""
+        self.cart_store.close(self.cart.session_id)
+        self.cart = self._open_cart()
+        self.customer = None
+        
+    def suspend_cart(self, note=None):
+        """Park the cart for any till to resume and start an empty one
+
+        Returns:
+            str: The suspended cart's session id, or None if it is empty or
+                could not be saved
+        """
+        session_id = self.cart.session_id
+        if not self.cart_store.suspend(session_id, note):
+            return None
+        self.cart = self._open_cart()
         self.customer = None
+        return session_id
+        
+    def resume_cart(self, session_id):
+        """Take over a parked cart in place of the current, empty, one
+
+        The cart is re-priced on resume; see its price_changes and unavailable.
+        """
+        if len(self.cart):
+            return False
+        user = self.auth_controller.get_current_user() if self.auth_controller else None
+        cart = self.cart_store.resume(session_id, user['id'] if user else None, self.till_id)
+        if not cart:
+            return False
+        self.cart = cart
+        self.customer = self.customer_model.get_customer_by_id(cart.customer_id) if cart.customer_id else None
+        return True
         
     def get_cart_total(self):
         """Get the total amount of the cart"""
-        return sum(item['total'] for item in self.cart_items)
+        return self.cart.total()
         
     def get_cart_item_count(self):
         """Get the number of items in the cart"""
-        return len(self.cart_items)
+        return len(self.cart)
         
     def get_cart_items(self):
         """Get all items in the cart"""
-        return self.cart_items
+        return [{
+            'id': item['product_id'],
+            'name': item['product_name'],
+            'price': item['unit_price'],
+            'quantity': item['quantity'],
+            'total': item['total_price']
+        } for item in self.cart.items()]
         
     def search_customer(self, phone):
         """Search for a customer by phone number"""
@@ -122,6 +146,7 @@ class BillingController:
     def set_customer(self, customer):
         """Set the customer for the current transaction"""
         self.customer = customer
+        self.cart.set_customer(customer['id'] if customer else None)
         
     def create_or_update_customer(self, name, phone, email=None, address=None):
         """Create a new customer or update an existing one"""
@@ -138,7 +163,7 @@ class BillingController:
             )
             if success:
                 customer = self.customer_model.get_customer_by_id(customer['id'])
-                self.customer = customer
+                self.set_customer(customer)
                 return customer
             return None
         else:
@@ -146,88 +171,88 @@ class BillingController:
             customer_id = self.customer_model.add_customer(name, phone, email, address)
             if customer_id:
                 customer = self.customer_model.get_customer_by_id(customer_id)
-                self.customer = customer
+                self.set_customer(customer)
                 return customer
             return None
             
-    def create_invoice(self, payment_method, discount=0, notes=None):
-        """Create a new invoice from the current cart"""
-        if not self.cart_items:
+    @traced("billing.create_invoice")
+    def create_invoice(self, payment_method, discount=0, notes=None, print_receipt=True, card_last4=None, tenders=None):
+        """Create a new invoice from the current cart
+        
+        tenders splits the payment across tenders (see settle_tenders), in
+        which case payment_method is ignored. A ValueError is raised when
+        they don't settle the total.
+        """
+        cart_items = self.cart.items()
+        if not cart_items:
             return None
     
         if not self.auth_controller.is_authenticated():
             return None
     
         # Calculate totals
-        subtotal = self.get_cart_total()
+        subtotal = sum(item['total_price'] for item in cart_items)
         tax = subtotal * 0.1  # 10% tax
         final_amount = subtotal + tax - discount
     
         # Prepare invoice items
         invoice_items = [{
-            'product_id': item['id'],
+            'product_id': item['product_id'],
             'quantity': item['quantity'],
-            'unit_price': item['price'],
-            'total_price': item['total']
-        } for item in self.cart_items]
+            'unit_price': item['unit_price'],
+            'total_price': item['total_price']
+        } for item in cart_items]
     
-        # Create invoice using the Invoice model
-        success, invoice_id, invoice_number = self.invoice_model.create_invoice(
-            customer_id=self.customer['id'] if self.customer else None,
-            items=invoice_items,
-            total_amount=subtotal,
-            tax_amount=tax,
-            discount_amount=discount,
-            final_amount=final_amount,
-            payment_method=payment_method,
-            payment_status='paid',
-            created_by=self.auth_controller.get_current_user()['id']
-        )
+        # Create invoice using the Invoice model; the basket is kept out of
+        # the snapshots meanwhile, its rows go in the invoice transaction
+        session = self.cart_store.detach(self.cart.session_id)
+        try:
+            success, invoice_id, invoice_number = self.invoice_model.create_invoice(
+                customer_id=self.customer['id'] if self.customer else None,
+                items=invoice_items,
+                total_amount=subtotal,
+                tax_amount=tax,
+                discount_amount=discount,
+                final_amount=final_amount,
+                payment_method=payment_method,
+                payment_status='paid',
+                created_by=self.auth_controller.get_current_user()['id'],
+                card_last4=card_last4,
+                tenders=tenders,
+                till_id=self.till_id,
+                cart_session_id=self.cart.session_id
+            )
+        except ValueError:
+            self.cart_store.reattach(session)
+            raise
     
         if not success:
+            self.cart_store.reattach(session)
             return None
     
+        # Sales queued offline have no invoice until they are replayed
+        if invoice_id is None:
+            self.clear_cart()
+            return {'id': None, 'invoice_number': invoice_number, 'offline': True}
+    
         # Get the complete invoice
         invoice = self.invoice_model.get_invoice_by_id(invoice_id)
     
         # Generate receipt
-        if invoice:
+        if invoice and print_receipt:
             self.generate_receipt(invoice)
-            self.clear_cart()  # Clear the cart after successful invoice creation
+        self.clear_cart()  # The sale is committed, so the basket is done with either way
     
         return invoice
 
         
+    @traced("billing.generate_receipt")
     def generate_receipt(self, invoice):
         """Generate a PDF receipt for an invoice"""
         try:
-            # Create receipts directory if it doesn't exist
-            os.makedirs('receipts', exist_ok=True)
-            
-            # Generate receipt filename
-            filename = f"receipts/receipt_{invoice['invoice_number']}.pdf"
-            
-            # Get invoice items
-            items = self.invoice_model.get_invoice_items(invoice['id'])
-            
-            # Get customer details
-            customer = None
-            if invoice['customer_id']:
-                customer = self.customer_model.get_customer_by_id(invoice['customer_id'])
-                
-            # Get cashier details
-            cashier = self.auth_controller.user_model.get_user_by_id(invoice['user_id'])
-            
-            # Generate PDF
-            generate_receipt(
-                filename,
-                invoice,
-                items,
-                customer,
-                cashier['full_name'] if cashier else "Unknown"
-            )
-            
-            return filename
+            # Generate PDF; it reads the invoice, items and customer itself
+            from utils.pdf_generator import generate_receipt
+            return generate_receipt(self.db_manager, invoice['id'])
         except Exception as e:
             print(f"Error generating receipt: {e}")
             return None
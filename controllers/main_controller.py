@@ -2,9 +2,7 @@ import tkinter as tk
 from views.login_window import LoginWindow
 from views.main_menu import MainMenu
 from views.billing_window import BillingWindow
-from views.inventory_window import InventoryWindow
-from views.reports_window import ReportsWindow
-from views.settings_window import SettingsWindow
+from views.quick_switch_window import QuickSwitchWindow
 
 class MainController:
     def __init__(self, root, db_manager):
@@ -12,6 +10,8 @@ class MainController:
         self.db_manager = db_manager
         self.current_user = None
         self.current_frame = None
+        # Billing window kept alive while the till is locked for a cashier switch
+        self.parked_billing = None
         
         # Configure the root window
         self.root.title("Supermarket Billing System")
@@ -22,9 +22,13 @@ class MainController:
         self.show_login()
         
     def clear_window(self):
-        # Destroy all widgets in the root window
+        # Destroy all widgets in the root window, only hiding a parked bill
+        parked_frame = self.parked_billing.frame if self.parked_billing else None
         for widget in self.root.winfo_children():
-            widget.destroy()
+            if widget is parked_frame:
+                widget.pack_forget()
+            else:
+                widget.destroy()
             
     def show_login(self):
         self.clear_window()
@@ -32,7 +36,34 @@ class MainController:
         
     def handle_login(self, user):
         self.current_user = user
-        self.show_main_menu()
+        self.resume_or_show_main_menu()
+        
+    def show_quick_switch(self):
+        # Keep the bill in progress so the next cashier can carry on with it
+        if isinstance(self.current_frame, BillingWindow):
+            self.parked_billing = self.current_frame
+        self.clear_window()
+        self.current_frame = QuickSwitchWindow(
+            self.root,
+            self.db_manager,
+            self.handle_quick_switch,
+            self.show_login
+        )
+        
+    def handle_quick_switch(self, user):
+        self.current_user = user
+        self.resume_or_show_main_menu()
+        
+    def resume_or_show_main_menu(self):
+        if self.parked_billing and self.parked_billing.frame.winfo_exists():
+            billing = self.parked_billing
+            self.clear_window()
+            self.parked_billing = None
+            billing.resume(self.current_user)
+            self.current_frame = billing
+        else:
+            self.parked_billing = None
+            self.show_main_menu()
         
     def show_main_menu(self):
         self.clear_window()
@@ -43,7 +74,9 @@ class MainController:
             self.show_inventory,
             self.show_reports,
             self.show_settings,
-            self.handle_logout
+            self.handle_logout,
+            self.show_quick_switch,
+            self.show_returns
         )
         
     def show_billing(self):
@@ -52,10 +85,13 @@ class MainController:
             self.root,
             self.db_manager,
             self.current_user,
-            self.show_main_menu
+            self.show_main_menu,
+            self.show_quick_switch
         )
         
+    # Back-office windows are imported on first use to keep till startup fast
     def show_inventory(self):
+        from views.inventory_window import InventoryWindow
         self.clear_window()
         self.current_frame = InventoryWindow(
             self.root,
@@ -65,6 +101,7 @@ class MainController:
         )
         
     def show_reports(self):
+        from views.reports_window import ReportsWindow
         self.clear_window()
         self.current_frame = ReportsWindow(
             self.root,
@@ -73,7 +110,18 @@ class MainController:
             self.show_main_menu
         )
         
+    def show_returns(self):
+        from views.returns_window import ReturnsWindow
+        self.clear_window()
+        self.current_frame = ReturnsWindow(
+            self.root,
+            self.db_manager,
+            self.current_user,
+            self.show_main_menu
+        )
+        
     def show_settings(self):
+        from views.settings_window import SettingsWindow
         self.clear_window()
         self.current_frame = SettingsWindow(
             self.root,
@@ -84,4 +132,5 @@ class MainController:
         
     def handle_logout(self):
         self.current_user = None
+        self.parked_billing = None
         self.show_login()
@@ -1,14 +1,42 @@
 from models.product import Product
 from models.invoice import Invoice
+from models.payment import Payment
 import datetime
 import os
-from utils.pdf_generator import generate_sales_report
+from utils.analytics import SalesSnapshot
+from utils.report_cache import report_cache
+from utils.shift_ledger import get_shift_ledger
 
 class ReportController:
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, use_snapshot=True, cache=report_cache):
         self.db_manager = db_manager
         self.product_model = Product(db_manager)
         self.invoice_model = Invoice(db_manager)
+        self.payment_model = Payment(db_manager)
+        self.shift_ledger = get_shift_ledger(db_manager)
+        
+        # Results of date range reports, shared across windows (None disables)
+        self.cache = cache
+        
+        # Columnar snapshot for the heavy aggregate reports (needs NumPy)
+        self.snapshot = None
+        if use_snapshot and SalesSnapshot.is_available():
+            self.snapshot = SalesSnapshot(db_manager)
+            
+    def _fresh_snapshot(self):
+        """Get the analytics snapshot brought up to date, or None to use SQL"""
+        if self.snapshot and self.snapshot.refresh():
+            return self.snapshot
+        return None
+        
+    def _cached(self, report, compute, from_date, to_date, *params):
+        """Get a date range report from the result cache, computing it on a miss"""
+        if not self.cache:
+            return compute()
+        return self.cache.get_or_compute(
+            self.db_manager, report, (from_date, to_date) + params, compute,
+            date_range=(from_date, to_date)
+        )
         
     def get_sales_report(self, from_date, to_date, category_id=None, product_id=None, 
                          customer_id=None, include_canceled=False):
@@ -20,49 +48,68 @@ class ReportController:
         
     def get_sales_summary(self, from_date, to_date):
         """Get sales summary for a date range"""
-        sales_data = self.invoice_model.get_sales_report(from_date, to_date)
+        return self._cached(
+            'sales_summary', lambda: self._compute_sales_summary(from_date, to_date),
+            from_date, to_date
+        )
         
-        if not sales_data:
-            return {
-                'total_sales': 0,
-                'total_invoices': 0,
-                'average_sale': 0,
-                'total_items': 0,
-                'payment_methods': {}
-            }
+    def _compute_sales_summary(self, from_date, to_date):
+        snapshot = self._fresh_snapshot()
+        if snapshot:
+            return snapshot.sales_summary(from_date, to_date)
             
-        # Calculate summary
-        total_sales = sum(sale['final_amount'] for sale in sales_data)
-        total_invoices = len(sales_data)
+        # Totals and the payment method breakdown come from one grouped query
+        totals = self.invoice_model.get_sales_totals(from_date, to_date)
+        
+        total_sales = sum(row['total_sales'] for row in totals)
+        total_invoices = sum(row['invoice_count'] for row in totals)
         average_sale = total_sales / total_invoices if total_invoices > 0 else 0
-        total_items = sum(sale['item_count'] for sale in sales_data)
-        
-        # Count payment methods
-        payment_methods = {}
-        for sale in sales_data:
-            method = sale['payment_method']
-            if method in payment_methods:
-                payment_methods[method] += 1
-            else:
-                payment_methods[method] = 1
-                
+        total_items = sum(row['total_items'] for row in totals)
+        
         return {
             'total_sales': total_sales,
             'total_invoices': total_invoices,
             'average_sale': average_sale,
             'total_items': total_items,
-            'payment_methods': payment_methods
+            'payment_methods': {row['payment_method']: row['invoice_count'] for row in totals}
         }
         
+    def get_invoice_sales(self, from_date, to_date):
+        """Get per-invoice sales rows for a date range"""
+        return self._cached(
+            'invoice_sales', lambda: self.invoice_model.get_sales_report(from_date, to_date),
+            from_date, to_date
+        )
+        
+    def get_cash_up(self, from_date, to_date=None, till_id=None, cashier_id=None):
+        """Get takings by tender, till and cashier for the end-of-day cash-up"""
+        return self.payment_model.cash_up(from_date, to_date, till_id, cashier_id)
+        
+    def reconcile(self, counted, from_date, to_date=None, till_id=None, cashier_id=None, opening_float=0.0):
+        """Compare counted takings per tender with what the payments expect"""
+        return self.payment_model.reconcile(counted, from_date, to_date, till_id, cashier_id, opening_float)
+        
+    def get_x_report(self, till_id):
+        """Get the running totals of a till's open shift"""
+        return self.shift_ledger.x_report(till_id)
+        
+    def close_shift(self, till_id, closed_by, counted=None):
+        """Close a till's shift and get its Z report"""
+        return self.shift_ledger.close_shift(till_id, closed_by, counted)
+        
+    def close_day(self, business_date, closed_by):
+        """Freeze a business day once its shifts are closed"""
+        return self.shift_ledger.close_day(business_date, closed_by)
+        
     def get_inventory_report(self, category_id=None):
         """Get inventory report with optional category filter"""
         return self.product_model.get_inventory_report(category_id)
         
     def get_inventory_summary(self):
         """Get inventory summary"""
-        inventory_data = self.product_model.get_inventory_report()
+        totals = self.product_model.get_inventory_totals(low_stock_threshold=10)
         
-        if not inventory_data:
+        if not totals or not totals['total_products']:
             return {
                 'total_products': 0,
                 'total_value': 0,
@@ -70,36 +117,18 @@ class ReportController:
                 'out_of_stock_count': 0
             }
             
-        # Calculate summary
-        total_products = len(inventory_data)
-        total_value = 0
-        low_stock_count = 0
-        out_of_stock_count = 0
-        
-        for product in inventory_data:
-            # Calculate stock value
-            cost = product["cost_price"] if product["cost_price"] else product["price"]
-            stock_value = cost * product["stock"]
-            total_value += stock_value
-            
-            # Count low stock and out of stock items
-            if product["stock"] == 0:
-                out_of_stock_count += 1
-            elif product["stock"] < 10:
-                low_stock_count += 1
-                
         return {
-            'total_products': total_products,
-            'total_value': total_value,
-            'low_stock_count': low_stock_count,
-            'out_of_stock_count': out_of_stock_count
+            'total_products': totals['total_products'],
+            'total_value': totals['total_value'] or 0,
+            'low_stock_count': totals['low_stock_count'] or 0,
+            'out_of_stock_count': totals['out_of_stock_count'] or 0
         }
         
     def export_sales_report_to_pdf(self, from_date, to_date, file_path):
         """Export sales report to PDF"""
         try:
             # Get sales data
-            sales_data = self.invoice_model.get_sales_report(from_date, to_date)
+            sales_data = self.get_invoice_sales(from_date, to_date)
             
             if not sales_data:
                 return False
@@ -111,6 +140,7 @@ class ReportController:
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
             
             # Fix parameter mismatch - we need to match what utils.pdf_generator.generate_sales_report expects
+            from utils.pdf_generator import generate_sales_report
             generate_sales_report(
                 file_path,                  # file_path
                 sales_data,                 # sales_data
@@ -126,12 +156,27 @@ class ReportController:
             
     def get_top_selling_products(self, from_date, to_date, limit=10):
         """Get top selling products for a date range"""
-        return self.invoice_model.get_top_selling_products(from_date, to_date, limit)
+        def compute():
+            snapshot = self._fresh_snapshot()
+            if snapshot:
+                return snapshot.top_selling_products(from_date, to_date, limit)
+            return self.invoice_model.get_top_selling_products(from_date, to_date, limit)
+        return self._cached('top_selling_products', compute, from_date, to_date, limit)
         
     def get_sales_by_category(self, from_date, to_date):
         """Get sales by category for a date range"""
-        return self.invoice_model.get_sales_by_category(from_date, to_date)
+        def compute():
+            snapshot = self._fresh_snapshot()
+            if snapshot:
+                return snapshot.sales_by_category(from_date, to_date)
+            return self.invoice_model.get_sales_by_category(from_date, to_date)
+        return self._cached('sales_by_category', compute, from_date, to_date)
         
     def get_daily_sales(self, from_date, to_date):
         """Get daily sales for a date range"""
-        return self.invoice_model.get_daily_sales(from_date, to_date)
\ No newline at end of file
+        def compute():
+            snapshot = self._fresh_snapshot()
+            if snapshot:
+                return snapshot.daily_sales(from_date, to_date)
+            return self.invoice_model.get_daily_sales(from_date, to_date)
+        return self._cached('daily_sales', compute, from_date, to_date)
\ No newline at end of file
@@ -1,8 +1,11 @@
 import sqlite3
 import os
-import hashlib
 import datetime
 import uuid
+from utils.password_hasher import get_password_hashing
+from utils.migrations import SCHEMA_VERSION, set_user_version
+from utils import query_stats
+from config import TILL_ID
 
 class DatabaseManager:
     def __init__(self, db_path):
@@ -13,7 +16,8 @@ class DatabaseManager:
     def connect(self):
         """Connect to the SQLite database"""
         try:
-            self.connection = sqlite3.connect(self.db_path)
+            # Instrumented only while query stats are enabled
+            self.connection = sqlite3.connect(self.db_path, factory=query_stats.connection_factory())
             self.connection.row_factory = sqlite3.Row
             self.cursor = self.connection.cursor()
             return True
@@ -92,10 +96,13 @@ class DatabaseManager:
             
             # Execute schema script
             self.connection.executescript(schema_script)
+            
+            # schema.sql is always the latest schema, so no migration applies
+            set_user_version(self.connection, SCHEMA_VERSION)
         
             # Create default admin user
             salt = os.urandom(32).hex()
-            hashed_password = hashlib.sha256(('admin' + salt).encode()).hexdigest()
+            hashed_password = get_password_hashing().hash('admin', salt)
             self.execute("""
                 INSERT INTO users (username, password, salt, full_name, role, email)
                 VALUES (?, ?, ?, ?, ?, ?)
@@ -205,96 +212,35 @@ class DatabaseManager:
             self.disconnect()
 
     # Cart Management Functions
+    # Carts live in the cart store and reach cart_items at its snapshots
+    def _cart(self, session_id):
+        from utils.cart_store import get_cart_store
+        store = get_cart_store(self)
+        return store.get(session_id) or store.open(session_id=session_id)
+
     def add_to_cart(self, session_id, product_id, quantity=1):
         """Add an item to the shopping cart"""
-        try:
-            self.connect()
-            
-            # Check if the product is already in the cart
-            existing_item = self.fetch_one(
-                "SELECT * FROM cart_items WHERE session_id = ? AND product_id = ?",
-                (session_id, product_id)
-            )
-            
-            if existing_item:
-                # Update quantity if the product is already in the cart
-                new_quantity = existing_item['quantity'] + quantity
-                self.execute(
-                    """
-                    UPDATE cart_items 
-                    SET quantity = ?
-                    WHERE session_id = ? AND product_id = ?
-                    """,
-                    (new_quantity, session_id, product_id)
-                )
-            else:
-                # Add new item to cart
-                self.execute(
-                    """
-                    INSERT INTO cart_items (session_id, product_id, quantity)
-                    VALUES (?, ?, ?)
-                    """,
-                    (session_id, product_id, quantity)
-                )
-                
-            self.commit()
-            return True
-        finally:
-            self.disconnect()
+        product = self.get_product_by_id(product_id)
+        if not product:
+            return False
+        self._cart(session_id).add(product, quantity)
+        return True
             
     def update_cart_item(self, session_id, product_id, quantity):
         """Update the quantity of an item in the cart"""
-        try:
-            self.connect()
-            
-            if quantity <= 0:
-                # Remove item if quantity is 0 or negative
-                self.execute(
-                    "DELETE FROM cart_items WHERE session_id = ? AND product_id = ?",
-                    (session_id, product_id)
-                )
-            else:
-                # Update quantity
-                self.execute(
-                    """
-                    UPDATE cart_items 
-                    SET quantity = ?
-                    WHERE session_id = ? AND product_id = ?
-                    """,
-                    (quantity, session_id, product_id)
-                )
-                
-            self.commit()
-            return True
-        finally:
-            self.disconnect()
+        self._cart(session_id).set_quantity(product_id, quantity)
+        return True
             
     def get_cart_items(self, session_id):
         """Get all items in a user's cart with product details"""
-        try:
-            self.connect()
-            return self.fetch_all(
-                """
-                SELECT c.*, p.name, p.price, p.stock, 
-                       (p.price * c.quantity) as total_price
-                FROM cart_items c
-                JOIN products p ON c.product_id = p.id
-                WHERE c.session_id = ?
-                """,
-                (session_id,)
-            )
-        finally:
-            self.disconnect()
+        return [dict(item, name=item['product_name'], price=item['unit_price'])
+                for item in self._cart(session_id).items()]
             
     def clear_cart(self, session_id):
         """Remove all items from a user's cart"""
-        try:
-            self.connect()
-            self.execute("DELETE FROM cart_items WHERE session_id = ?", (session_id,))
-            self.commit()
-            return True
-        finally:
-            self.disconnect()
+        from utils.cart_store import get_cart_store
+        get_cart_store(self).close(session_id)
+        return True
 
     # Billing and Invoice Functions
     def create_invoice(self, session_id, customer_id, payment_method, created_by, tax_rate=0.1):
@@ -329,6 +275,16 @@ class DatabaseManager:
             
             invoice_id = self.get_last_row_id()
             
+            # Paid in full in one tender
+            self.execute(
+                """
+                INSERT INTO payments
+                (invoice_id, tender, amount, tendered, till_id, created_by, created_at)
+                VALUES (?, ?, ROUND(?, 2), ROUND(?, 2), ?, ?, datetime('now'))
+                """,
+                (invoice_id, payment_method, final_amount, final_amount, TILL_ID, created_by)
+            )
+            
             # Add invoice items
             for item in cart_items:
                 product_id = item['product_id']
@@ -362,10 +318,10 @@ class DatabaseManager:
                     (product_id, -quantity, 'sale', invoice_id, created_by)
                 )
             
-            # Clear the cart
-            self.clear_cart(session_id)
-            
             self.commit()
+            
+            # Clear the cart once the sale is in
+            self.clear_cart(session_id)
             return invoice_id
         finally:
             self.disconnect()
@@ -478,25 +434,29 @@ class DatabaseManager:
             self.disconnect()
 
     def get_daily_sales_summary(self, date):
-        """Get daily sales summary for a specific date"""
-        try:
-            self.connect()
-            
-            # Format date as string for SQL comparison
-            date_str = date.strftime('%Y-%m-%d')
-            
-            return self.fetch_one(
-                """
-                SELECT 
-                    COUNT(*) as total_invoices,
-                    SUM(total_amount) as total_sales,
-                    SUM(tax_amount) as total_tax,
-                    SUM(final_amount) as total_revenue,
-                    AVG(final_amount) as average_sale
-                FROM invoices
-                WHERE DATE(created_at) = ?
-                """,
-                (date_str,)
-            )
-        finally:
-            self.disconnect()
\ No newline at end of file
+        """Get daily sales summary for a specific date
+        
+        A closed business day is read from its frozen day close; an open one
+        from the running counters of its shifts, plus sales no shift holds.
+        Sales are attributed to days the same way in both, so closing a day
+        doesn't change its figures; 'closed' tells them apart.
+        """
+        date_str = date.strftime('%Y-%m-%d')
+        
+        from utils.shift_ledger import get_shift_ledger
+        ledger = get_shift_ledger(self)
+        day = ledger.get_day_report(date_str)
+        closed = day is not None
+        if not closed:
+            day = ledger.get_day_totals(date_str)
+            if day is None:
+                return None
+        return {
+            'total_invoices': day['sale_count'],
+            'total_sales': day['subtotal'],
+            'total_tax': day['tax_total'],
+            'total_revenue': day['gross_sales'],
+            'average_sale': day['gross_sales'] / day['sale_count'] if day['sale_count'] else None,
+            'total_refunds': day['refund_total'],
+            'closed': closed
+        }
\ No newline at end of file
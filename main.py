@@ -1,14 +1,20 @@
-import tkinter as tk
+import time
+STARTED = time.perf_counter()
+
 import os
+import sys
 from db_manager import DatabaseManager
-from controllers.main_controller import MainController
+from utils.password_hasher import get_password_hashing
+from utils.startup_profile import StartupProfile
+from utils.migrations import MigrationRunner
+from config import REPLICATION_INBOX
 
 def initialize_default_data(db_manager):
     print("Checking for default data...")
     
     # Check if categories exist
     db_manager.connect()
-    categories = db_manager.fetch_all("SELECT * FROM categories")
+    categories = db_manager.fetch_one("SELECT 1 FROM categories LIMIT 1")
     
     # If no categories, create default ones
     if not categories:
@@ -24,7 +30,7 @@ def initialize_default_data(db_manager):
         db_manager.commit()
 
     # Check if products exist
-    products = db_manager.fetch_all("SELECT * FROM products")
+    products = db_manager.fetch_one("SELECT 1 FROM products LIMIT 1")
     
     # If no products, create default ones
     if not products:
@@ -197,34 +203,30 @@ def initialize_default_data(db_manager):
         ]
         
         # Insert products and create initial stock transactions
-        for product in sample_products:
-            name, category_id, price, stock = product
-            
-            # Insert the product
-            db_manager.execute(
-                "INSERT INTO products (name, category_id, price, stock) VALUES (?, ?, ?, ?)",
-                (name, category_id, price, stock)
-            )
-            
-            # Get the last inserted product ID
-            product_id = db_manager.fetch_one("SELECT last_insert_rowid() as id")['id']
-            
-            # Create an initial stock transaction
-            db_manager.execute(
-                "INSERT INTO stock_transactions (product_id, quantity, type, notes, user_id) VALUES (?, ?, ?, ?, ?)",
-                (product_id, stock, 'initial', 'Initial stock', 1)  # Assuming admin user ID is 1
-            )
+        db_manager.cursor.executemany(
+            "INSERT INTO products (name, category_id, price, stock) VALUES (?, ?, ?, ?)",
+            sample_products
+        )
+        
+        # Create the initial stock transactions, assuming admin user ID is 1
+        db_manager.execute(
+            """
+            INSERT INTO stock_transactions (product_id, quantity, type, notes, user_id)
+            SELECT id, stock, 'initial', 'Initial stock', 1 FROM products
+            """
+        )
             
         db_manager.commit()
         
         # Check if admin user exists
-        admin_user = db_manager.fetch_one("SELECT * FROM users WHERE username = 'admin'")
+        admin_user = db_manager.fetch_one("SELECT 1 FROM users WHERE username = 'admin' LIMIT 1")
         if not admin_user:
             print("Creating admin user...")
             # Create admin user with password 'admin'
+            salt = os.urandom(32).hex()
             db_manager.execute(
-                "INSERT INTO users (username, password, full_name, role) VALUES (?, ?, ?, ?)",
-                ('admin', 'admin', 'Administrator', 'admin')
+                "INSERT INTO users (username, password, salt, full_name, role) VALUES (?, ?, ?, ?, ?)",
+                ('admin', get_password_hashing().hash('admin', salt), salt, 'Administrator', 'admin')
             )
             db_manager.commit()
     
@@ -232,6 +234,21 @@ def initialize_default_data(db_manager):
     print("Default data initialization complete")
 
 def main():
+    # --profile prints how long each startup stage takes
+    profile = StartupProfile("--profile" in sys.argv[1:], STARTED)
+    profile.mark("python and core imports")
+    
+    # --query-stats times every query and prints the costliest on exit
+    if "--query-stats" in sys.argv[1:]:
+        import atexit
+        from utils import query_stats
+        query_stats.enable()
+        atexit.register(lambda: print(query_stats.format_stats()))
+    
+    with profile.stage("import user interface"):
+        import tkinter as tk
+        from controllers.main_controller import MainController
+    
     # Create database directory if it doesn't exist
     os.makedirs('data', exist_ok=True)
     
@@ -246,15 +263,30 @@ def main():
     db_manager = DatabaseManager(db_path)
     
     # Initialize database schema if needed
-    if not os.path.exists(db_path) or os.path.getsize(db_path) == 0:
-        db_manager.initialize_database()
-        print("Database initialized successfully")
+    with profile.stage("initialize database"):
+        if not os.path.exists(db_path) or os.path.getsize(db_path) == 0:
+            db_manager.initialize_database()
+            print("Database initialized successfully")
+        else:
+            # Bring older stores up to the current schema
+            def report_migration(message, done, total):
+                print(f"[{done}/{total}] {message}")
+                
+            MigrationRunner(db_path).migrate(progress=report_migration)
+            
+        # Initialize default data
+        initialize_default_data(db_manager)
         
-    # Initialize default data
-    initialize_default_data(db_manager)
+    # Ship sales to head office in the background
+    if REPLICATION_INBOX:
+        from utils.replication import get_replication_shipper
+        shipper = get_replication_shipper(db_manager)
+        if shipper.enable():
+            shipper.start()
     
     # Create the main window
-    root = tk.Tk()
+    with profile.stage("create main window"):
+        root = tk.Tk()
     
     # Set application icon if available
     try:
@@ -265,11 +297,19 @@ def main():
         pass
     
     # Initialize the controller
-    app = MainController(root, db_manager)
+    with profile.stage("build login screen"):
+        app = MainController(root, db_manager)
+        
+    # Report once the first screen has been drawn
+    def report_startup():
+        profile.mark("till ready")
+        profile.report()
+        
+    if profile.enabled:
+        root.after_idle(report_startup)
     
     # Start the main loop
     root.mainloop()
 
 if __name__ == "__main__":
     main()
-
@@ -140,10 +140,10 @@ class Category:
             self.db_manager.connect()
             
             # Check if category has products
-            check_query = "SELECT COUNT(*) as count FROM products WHERE category_id = ?"
+            check_query = "SELECT 1 FROM products WHERE category_id = ? LIMIT 1"
             result = self.db_manager.fetch_one(check_query, (category_id,))
             
-            if result and result['count'] > 0:
+            if result:
                 self.db_manager.disconnect()
                 return False
                 
@@ -1,3 +1,5 @@
+from utils.customer_index import get_customer_index
+
 class Customer:
     def __init__(self, db_manager):
         self.db_manager = db_manager
@@ -29,8 +31,31 @@ class Customer:
             (phone,)
         )
         self.db_manager.disconnect()
+        
+        # Same number typed with different spacing or punctuation
+        if not customer:
+            customer_id = get_customer_index(self.db_manager).find_by_phone(phone)
+            if customer_id is not None:
+                customer = self.get_customer_by_id(customer_id)
         return customer
         
+    def search_customers(self, query, limit=20):
+        """Search customers by phone (full number or last digits) or fuzzy name, best match first"""
+        matches = get_customer_index(self.db_manager).search(query, limit)
+        if not matches:
+            return []
+            
+        ids = [customer_id for customer_id, _ in matches]
+        self.db_manager.connect()
+        rows = self.db_manager.fetch_all(
+            f"SELECT * FROM customers WHERE id IN ({', '.join('?' for _ in ids)})",
+            ids
+        )
+        self.db_manager.disconnect()
+        
+        by_id = {row['id']: row for row in rows}
+        return [by_id[customer_id] for customer_id in ids if customer_id in by_id]
+        
     def add_customer(self, name, phone, email=None, address=None):
         """Add a new customer"""
         try:
@@ -53,9 +78,11 @@ class Customer:
                 """,
                 (name, phone, email, address)
             )
+            customer_id = self.db_manager.get_last_row_id()
             
             self.db_manager.commit()
             self.db_manager.disconnect()
+            get_customer_index(self.db_manager).add(customer_id, name, phone)
             return True
             
         except Exception as e:
@@ -90,6 +117,7 @@ class Customer:
             
             self.db_manager.commit()
             self.db_manager.disconnect()
+            get_customer_index(self.db_manager).update(customer_id, name, phone)
             return True
             
         except Exception as e:
@@ -105,11 +133,11 @@ class Customer:
             
             # Check if customer has invoices
             invoices = self.db_manager.fetch_one(
-                "SELECT COUNT(*) as count FROM invoices WHERE customer_id = ?",
+                "SELECT 1 FROM invoices WHERE customer_id = ? LIMIT 1",
                 (customer_id,)
             )
             
-            if invoices and invoices['count'] > 0:
+            if invoices:
                 return False
                 
             # Delete customer
@@ -120,6 +148,7 @@ class Customer:
             
             self.db_manager.commit()
             self.db_manager.disconnect()
+            get_customer_index(self.db_manager).remove(customer_id)
             return True
             
         except Exception as e:
@@ -1,19 +1,135 @@
+import sqlite3
 import datetime
+from config import OFFLINE_AFTER_SECONDS
+from db_manager import DatabaseManager
+from utils.sales_metrics import get_sales_metrics, utc_timestamp, day_bounds
+from utils.invoice_archive import report_tables, archive_tables_for_invoice
+from models.loyalty import record_accrual, record_redemption
+from models.payment import settle_tenders, payment_method_for, record_payments
+from utils.offline_journal import get_offline_journal, is_unavailable
+from utils.tracing import traced
 
 class Invoice:
     def __init__(self, db_manager):
         self.db_manager = db_manager
 
-    def create_invoice(self, customer_id, items, total_amount, tax_amount, discount_amount, final_amount, payment_method, payment_status, created_by):
-        """Create a new invoice with its items"""
+    @traced("invoice.create_invoice")
+    def create_invoice(self, customer_id, items, total_amount, tax_amount, discount_amount, final_amount, payment_method, payment_status, created_by, points_redeemed=0, card_last4=None, tenders=None, till_id=None, cart_session_id=None):
+        """Create a new invoice with its items, settling loyalty points in the same transaction
+
+        When the store database can't be reached the sale is queued in the
+        offline journal instead, and the result carries no invoice id and a
+        provisional OFF- number. card_last4, the last four digits of the card
+        paid with, lets the sale be found again for a return.
+
+        tenders splits the payment: dicts with 'tender', 'tendered' and
+        optionally 'card_last4' (see settle_tenders). Without them the sale
+        is paid in full by payment_method.
+
+        cart_session_id names the basket rung up; its snapshot is removed in
+        the invoice transaction, so a till restarted after the sale doesn't
+        restore a basket that has been paid for. Detach it from the cart
+        store first (see CartStore.detach).
+
+        Raises:
+            ValueError: If the discount is negative or more than the bill, or
+                the tenders don't settle final_amount
+        """
+        if discount_amount < 0 or round(discount_amount, 2) > round(total_amount + tax_amount, 2):
+            raise ValueError("The discount can't be more than the bill")
+        # A single tender is settled the same way, so a bad method or a
+        # non-positive amount is refused whichever way the sale was paid
+        payments = settle_tenders(final_amount, tenders or [{'tender': payment_method, 'card_last4': card_last4}])
+        if tenders:
+            payment_method = payment_method_for(payments)
+            card_last4 = card_last4 or next(
+                (payment['card_last4'] for payment in payments if payment.get('card_last4')), None
+            )
+
+        sale = {
+            'customer_id': customer_id,
+            'items': [
+                {key: item[key] for key in ('product_id', 'quantity', 'unit_price', 'total_price')}
+                for item in items
+            ],
+            'total_amount': total_amount,
+            'tax_amount': tax_amount,
+            'discount_amount': discount_amount,
+            'final_amount': final_amount,
+            'payment_method': payment_method,
+            'payment_status': payment_status,
+            'created_by': created_by,
+            'points_redeemed': points_redeemed,
+            'card_last4': card_last4,
+            'payments': payments,
+            'till_id': till_id
+        }
+
+        # Sales queued while offline go first, so invoices keep the order
+        # they were rung up in. Replaying them is left to the background
+        # thread; checkout queues behind it rather than wait on the database.
+        journal = get_offline_journal()
+        if journal.has_pending():
+            result = journal.enqueue(sale)
+            journal.start(self._replay_sale)
+            return result
+
         try:
-            self.db_manager.connect()
+            invoice_id, invoice_number, _ = self._commit_sale(sale, cart_session_id=cart_session_id)
+            return True, invoice_id, invoice_number
+        except Exception as e:
+            if is_unavailable(e):
+                print(f"Store database unavailable, sale queued offline: {e}")
+                result = journal.enqueue(sale)
+                journal.start(self._replay_sale)
+                return result
+            print(f"Error creating invoice: {e}")
+            return False, None, None
+
+    def _replay_sale(self, sale):
+        # Replays also run on the journal's background thread, so they get
+        # their own connection manager
+        return Invoice(DatabaseManager(self.db_manager.db_path))._commit_sale(sale, replaying=True)
+
+    @traced("invoice.commit_sale")
+    def _commit_sale(self, sale, replaying=False, cart_session_id=None):
+        """Write one sale in a single transaction
+
+        A replayed offline sale is numbered for the day it was made, and is
+        committed even if it takes stock below zero or the customer no
+        longer has the points it redeemed; those are returned as conflicts.
 
-            today = datetime.datetime.now().strftime("%Y%m%d")
+        Returns:
+            tuple: (invoice_id, invoice_number, conflicts)
+
+        Raises:
+            sqlite3.Error: If the database could not be written
+            ValueError: If the customer does not have the points redeemed
+        """
+        if not self.db_manager.connect():
+            raise sqlite3.OperationalError("unable to open database file")
+        try:
+            connection = self.db_manager.connection
+            connection.execute(f"PRAGMA busy_timeout = {int(OFFLINE_AFTER_SECONDS * 1000)}")
+
+            # Numbering inside the write transaction keeps two tills from
+            # taking the same invoice number
+            connection.execute("BEGIN IMMEDIATE")
+
+            if replaying:
+                existing = self.db_manager.fetch_one(
+                    "SELECT id, invoice_number FROM invoices WHERE client_ref = ?", (sale['client_ref'],)
+                )
+                if existing:
+                    # Committed by an earlier replay that stopped before the journal was updated
+                    self.db_manager.rollback()
+                    return existing['id'], existing['invoice_number'], []
+
+            day = sale.get('sold_on') or datetime.datetime.now().strftime("%Y%m%d")
 
             last_invoice = self.db_manager.fetch_one(
                 "SELECT invoice_number FROM invoices WHERE invoice_number LIKE ? ORDER BY id DESC LIMIT 1",
-                (f"INV-{today}-%",)
+                (f"INV-{day}-%",)
             )
 
             if last_invoice:
@@ -21,34 +137,33 @@ class Invoice:
             else:
                 seq_num = 1
 
-            invoice_number = f"INV-{today}-{seq_num:04d}"
+            invoice_number = f"INV-{day}-{seq_num:04d}"
+            created_at = sale.get('sold_at') or utc_timestamp()
 
             # Insert invoice
-            self.db_manager.execute(
+            cursor = connection.execute(
                 """
                 INSERT INTO invoices (
                     invoice_number, customer_id, total_amount, tax_amount, 
                     discount_amount, final_amount, payment_method, 
-                    payment_status, created_by, created_at
+                    payment_status, created_by, created_at, client_ref, card_last4
                 )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
                 (
-                    invoice_number, customer_id, total_amount, tax_amount,
-                    discount_amount, final_amount, payment_method,
-                    payment_status, created_by
+                    invoice_number, sale['customer_id'], sale['total_amount'], sale['tax_amount'],
+                    sale['discount_amount'], sale['final_amount'], sale['payment_method'],
+                    sale['payment_status'], sale['created_by'], created_at, sale.get('client_ref'),
+                    sale.get('card_last4')
                 )
             )
 
-            invoice_id = self.db_manager.get_last_row_id()
-
-            if not invoice_id:
-                self.db_manager.rollback()
-                return False, None, None
+            invoice_id = cursor.lastrowid
+            conflicts = []
 
             # Insert invoice items
-            for item in items:
-                success = self.db_manager.execute(
+            for item in sale['items']:
+                connection.execute(
                     """
                     INSERT INTO invoice_items (
                         invoice_id, product_id, quantity, unit_price, total_price
@@ -60,12 +175,9 @@ class Invoice:
                         item['unit_price'], item['total_price']
                     )
                 )
-                if not success:
-                    self.db_manager.rollback()
-                    return False, None, None
 
                 # Update product stock
-                self.db_manager.execute(
+                connection.execute(
                     """
                     UPDATE inventory
                     SET quantity = quantity - ?
@@ -74,43 +186,91 @@ class Invoice:
                     (item['quantity'], item['product_id'])
                 )
 
-            self.db_manager.commit()
-            return True, invoice_id, invoice_number
+            if replaying:
+                # Goods already left the store; record oversold stock for a manager to check
+                placeholders = ", ".join("?" for _ in sale['items'])
+                for row in self.db_manager.fetch_all(
+                    f"SELECT product_id, quantity FROM inventory WHERE product_id IN ({placeholders}) AND quantity < 0",
+                    [item['product_id'] for item in sale['items']]
+                ):
+                    conflicts.append({'type': 'stock', 'product_id': row['product_id'], 'quantity': row['quantity']})
 
-        except Exception as e:
-            print(f"Error creating invoice: {e}")
+            # Sales queued offline before payments were recorded paid in one tender
+            payments = sale.get('payments') or [{
+                'tender': sale['payment_method'], 'amount': round(sale['final_amount'], 2),
+                'tendered': round(sale['final_amount'], 2), 'card_last4': sale.get('card_last4')
+            }]
+            record_payments(self.db_manager, invoice_id, payments, sale['created_by'], created_at,
+                            till_id=sale.get('till_id'))
+
+            # Loyalty points move with the sale: both commit or neither does
+            customer_id = sale['customer_id']
+            if customer_id:
+                if not record_redemption(self.db_manager, customer_id, invoice_id, sale['points_redeemed']):
+                    if not replaying:
+                        raise ValueError("Customer does not have enough loyalty points")
+                    conflicts.append({'type': 'loyalty', 'customer_id': customer_id,
+                                      'points': sale['points_redeemed']})
+                record_accrual(self.db_manager, customer_id, invoice_id, sale['final_amount'])
+
+            # The paid basket goes with the sale, never to be recovered again
+            if cart_session_id:
+                connection.execute("DELETE FROM cart_items WHERE session_id = ?", (cart_session_id,))
+                connection.execute("DELETE FROM cart_sessions WHERE session_id = ?", (cart_session_id,))
+
+            self.db_manager.commit()
+        except Exception:
             self.db_manager.rollback()
-            return False, None, None
+            raise
         finally:
             self.db_manager.disconnect()
 
+        # Feed the live sales dashboard; the sale itself is already committed
+        try:
+            get_sales_metrics(self.db_manager).record_invoice(
+                invoice_id, created_at, sale['final_amount'],
+                sum(item['quantity'] for item in sale['items']),
+                sale['payment_method'], sale['created_by']
+            )
+        except Exception as e:
+            print(f"Error recording sales metrics: {e}")
+
+        return invoice_id, invoice_number, conflicts
+
+    @traced("invoice.get_invoice_by_id")
     def get_invoice_by_id(self, invoice_id):
         """Get invoice details by ID"""
         try:
             self.db_manager.connect()
 
-            invoice = self.db_manager.fetch_one(
-                """
+            invoice_query = """
                 SELECT i.*, c.name as customer_name, c.phone as customer_phone,
                        u.username as created_by_user
-                FROM invoices i
+                FROM {invoices} i
                 LEFT JOIN customers c ON i.customer_id = c.id
                 LEFT JOIN users u ON i.created_by = u.id
                 WHERE i.id = ?
-                """,
-                (invoice_id,)
-            )
+            """
+            invoices, invoice_items, payments = 'invoices', 'invoice_items', 'payments'
+            invoice = self.db_manager.fetch_one(invoice_query.format(invoices=invoices), (invoice_id,))
 
             if not invoice:
-                return None
+                # Older invoices may have been moved to a monthly archive
+                archived = archive_tables_for_invoice(self.db_manager, invoice_id)
+                if not archived:
+                    return None
+                invoices, invoice_items, payments = archived
+                invoice = self.db_manager.fetch_one(invoice_query.format(invoices=invoices), (invoice_id,))
+                if not invoice:
+                    return None
                 
             # Convert SQLite row to dictionary
             invoice_dict = dict(invoice)
 
             items = self.db_manager.fetch_all(
-                """
+                f"""
                 SELECT ii.*, p.name as product_name
-                FROM invoice_items ii
+                FROM {invoice_items} ii
                 JOIN products p ON ii.product_id = p.id
                 WHERE ii.invoice_id = ?
                 """,
@@ -119,6 +279,10 @@ class Invoice:
 
             # Add items to the dictionary, not directly to the SQLite Row
             invoice_dict['items'] = items
+            # Tenders are archived with their invoice
+            invoice_dict['payments'] = self.db_manager.fetch_all(
+                f"SELECT * FROM {payments} WHERE invoice_id = ? ORDER BY id", (invoice_id,)
+            )
             return invoice_dict
 
         except Exception as e:
@@ -131,13 +295,15 @@ class Invoice:
         """Get sales report for a date range"""
         try:
             self.db_manager.connect()
+            # Months moved to the archive are unioned in when the range needs them
+            invoices, invoice_items = report_tables(self.db_manager, from_date, to_date)
             return self.db_manager.fetch_all(
-                """
+                f"""
                 SELECT i.id, i.invoice_number, i.created_at, c.name as customer_name,
                        COUNT(ii.id) as item_count, i.final_amount, i.payment_method
-                FROM invoices i
+                FROM {invoices} i
                 LEFT JOIN customers c ON i.customer_id = c.id
-                JOIN invoice_items ii ON i.id = ii.invoice_id
+                JOIN {invoice_items} ii ON i.id = ii.invoice_id
                 WHERE DATE(i.created_at) BETWEEN ? AND ?
                 GROUP BY i.id
                 ORDER BY i.created_at DESC
@@ -150,19 +316,53 @@ class Invoice:
         finally:
             self.db_manager.disconnect()
 
+    def get_sales_totals(self, from_date, to_date):
+        """Get invoice count, takings and items sold per payment method for a date range
+
+        One aggregate over the created_at index; invoices without items are
+        left out, as in get_sales_report.
+        """
+        try:
+            self.db_manager.connect()
+            invoices, invoice_items = report_tables(self.db_manager, from_date, to_date)
+            start, end = day_bounds(from_date, to_date)
+            return self.db_manager.fetch_all(
+                f"""
+                SELECT payment_method,
+                       COUNT(*) AS invoice_count,
+                       SUM(final_amount) AS total_sales,
+                       SUM(item_count) AS total_items
+                FROM (
+                    SELECT i.payment_method, i.final_amount,
+                           (SELECT COUNT(*) FROM {invoice_items} ii WHERE ii.invoice_id = i.id) AS item_count
+                    FROM {invoices} i
+                    WHERE i.created_at >= ? AND i.created_at < ?
+                )
+                WHERE item_count > 0
+                GROUP BY payment_method
+                """,
+                (start, end)
+            )
+        except Exception as e:
+            print(f"Error getting sales totals: {e}")
+            return []
+        finally:
+            self.db_manager.disconnect()
+
     def get_top_selling_products(self, from_date, to_date, limit=10):
         """Get top selling products for a date range"""
         try:
             self.db_manager.connect()
+            invoices, invoice_items = report_tables(self.db_manager, from_date, to_date)
             return self.db_manager.fetch_all(
-                """
+                f"""
                 SELECT p.id, p.name, c.name as category_name,
                        SUM(ii.quantity) as total_quantity,
                        SUM(ii.total_price) as total_sales
-                FROM invoice_items ii
+                FROM {invoice_items} ii
                 JOIN products p ON ii.product_id = p.id
                 LEFT JOIN categories c ON p.category_id = c.id
-                JOIN invoices i ON ii.invoice_id = i.id
+                JOIN {invoices} i ON ii.invoice_id = i.id
                 WHERE DATE(i.created_at) BETWEEN ? AND ?
                 GROUP BY p.id
                 ORDER BY total_quantity DESC
@@ -180,15 +380,16 @@ class Invoice:
         """Get sales by category for a date range"""
         try:
             self.db_manager.connect()
+            invoices, invoice_items = report_tables(self.db_manager, from_date, to_date)
             return self.db_manager.fetch_all(
-                """
+                f"""
                 SELECT c.name as category_name,
                        SUM(ii.quantity) as total_quantity,
                        SUM(ii.total_price) as total_sales
-                FROM invoice_items ii
+                FROM {invoice_items} ii
                 JOIN products p ON ii.product_id = p.id
                 LEFT JOIN categories c ON p.category_id = c.id
-                JOIN invoices i ON ii.invoice_id = i.id
+                JOIN {invoices} i ON ii.invoice_id = i.id
                 WHERE DATE(i.created_at) BETWEEN ? AND ?
                 GROUP BY c.id
                 ORDER BY total_sales DESC
@@ -205,12 +406,13 @@ class Invoice:
         """Get daily sales for a date range"""
         try:
             self.db_manager.connect()
+            invoices, invoice_items = report_tables(self.db_manager, from_date, to_date)
             return self.db_manager.fetch_all(
-                """
+                f"""
                 SELECT DATE(i.created_at) as date,
                        COUNT(i.id) as invoice_count,
                        SUM(i.final_amount) as total_sales
-                FROM invoices i
+                FROM {invoices} i
                 WHERE DATE(i.created_at) BETWEEN ? AND ?
                 GROUP BY DATE(i.created_at)
                 ORDER BY date
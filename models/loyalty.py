@@ -0,0 +1,305 @@
+import datetime
+from config import (LOYALTY_POINTS_PER_UNIT, LOYALTY_POINT_VALUE, LOYALTY_EXPIRY_DAYS,
+                    LOYALTY_TIERS)
+
+
+def points_for_amount(amount):
+    """Points earned for a purchase amount"""
+    return int(max(amount, 0) * LOYALTY_POINTS_PER_UNIT)
+
+
+def points_value(points):
+    """Currency value of redeemed points"""
+    return round(points * LOYALTY_POINT_VALUE, 2)
+
+
+def tier_for_points(points):
+    """Tier reached with the points earned over the last year"""
+    name = LOYALTY_TIERS[0][1]
+    for threshold, tier in LOYALTY_TIERS:
+        if points >= threshold:
+            name = tier
+    return name
+
+
+def record_accrual(db_manager, customer_id, invoice_id, amount):
+    """Add an earn entry and raise the balance
+
+    Runs on the caller's open connection so it commits or rolls back with
+    the checkout transaction.
+
+    Returns:
+        int: Points earned
+    """
+    points = points_for_amount(amount)
+    if points <= 0:
+        return 0
+
+    expires_at = (datetime.date.today() + datetime.timedelta(days=LOYALTY_EXPIRY_DAYS)).isoformat()
+    db_manager.connection.execute(
+        """
+        INSERT INTO loyalty_ledger (customer_id, invoice_id, entry_type, points, remaining, expires_at)
+        VALUES (?, ?, 'earn', ?, ?, ?)
+        """,
+        (customer_id, invoice_id, points, points, expires_at)
+    )
+    db_manager.connection.execute(
+        "UPDATE customers SET loyalty_points = COALESCE(loyalty_points, 0) + ? WHERE id = ?",
+        (points, customer_id)
+    )
+    return points
+
+
+def record_redemption(db_manager, customer_id, invoice_id, points):
+    """Spend points, oldest lots first, on the caller's open connection
+
+    Returns:
+        bool: False if the customer does not have enough points
+    """
+    if points <= 0:
+        return True
+
+    customer = db_manager.fetch_one(
+        "SELECT loyalty_points FROM customers WHERE id = ?",
+        (customer_id,)
+    )
+    if not customer or (customer['loyalty_points'] or 0) < points:
+        return False
+
+    _spend_lots(db_manager, customer_id, points)
+
+    # Balances carried over from before the ledger have no lots to draw from
+    db_manager.connection.execute(
+        """
+        INSERT INTO loyalty_ledger (customer_id, invoice_id, entry_type, points)
+        VALUES (?, ?, 'redeem', ?)
+        """,
+        (customer_id, invoice_id, -points)
+    )
+    db_manager.connection.execute(
+        "UPDATE customers SET loyalty_points = loyalty_points - ? WHERE id = ?",
+        (points, customer_id)
+    )
+    return True
+
+
+def _spend_lots(db_manager, customer_id, points):
+    """Draw points from a customer's open lots, oldest expiry first"""
+    lots = db_manager.fetch_all(
+        """
+        SELECT id, remaining FROM loyalty_ledger
+        WHERE customer_id = ? AND remaining > 0
+        ORDER BY expires_at, id
+        """,
+        (customer_id,)
+    )
+
+    to_spend = points
+    for lot in lots:
+        if to_spend <= 0:
+            break
+        spent = min(lot['remaining'], to_spend)
+        db_manager.connection.execute(
+            "UPDATE loyalty_ledger SET remaining = remaining - ? WHERE id = ?",
+            (spent, lot['id'])
+        )
+        to_spend -= spent
+
+
+def record_return(db_manager, customer_id, invoice_id, points_earned, points_redeemed):
+    """Undo the loyalty side of returned goods on the caller's open connection
+
+    Points earned on the returned share of the sale are taken back, as far
+    as the balance allows since they may have been spent meanwhile, and
+    points redeemed against it are given back as a new lot. Both are
+    'adjust' entries against the original invoice.
+
+    Returns:
+        tuple: (points taken back, points given back)
+    """
+    taken = 0
+    if points_earned > 0:
+        customer = db_manager.fetch_one("SELECT loyalty_points FROM customers WHERE id = ?", (customer_id,))
+        taken = min(points_earned, max(customer['loyalty_points'] or 0, 0) if customer else 0)
+        if taken:
+            _spend_lots(db_manager, customer_id, taken)
+            db_manager.connection.execute(
+                """
+                INSERT INTO loyalty_ledger (customer_id, invoice_id, entry_type, points)
+                VALUES (?, ?, 'adjust', ?)
+                """,
+                (customer_id, invoice_id, -taken)
+            )
+
+    given = max(points_redeemed, 0)
+    if given:
+        expires_at = (datetime.date.today() + datetime.timedelta(days=LOYALTY_EXPIRY_DAYS)).isoformat()
+        db_manager.connection.execute(
+            """
+            INSERT INTO loyalty_ledger (customer_id, invoice_id, entry_type, points, remaining, expires_at)
+            VALUES (?, ?, 'adjust', ?, ?, ?)
+            """,
+            (customer_id, invoice_id, given, given, expires_at)
+        )
+
+    if taken or given:
+        db_manager.connection.execute(
+            "UPDATE customers SET loyalty_points = COALESCE(loyalty_points, 0) - ? + ? WHERE id = ?",
+            (taken, given, customer_id)
+        )
+    return taken, given
+
+
+class Loyalty:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def get_balance(self, customer_id):
+        """Get a customer's current points balance"""
+        try:
+            self.db_manager.connect()
+            customer = self.db_manager.fetch_one(
+                "SELECT loyalty_points FROM customers WHERE id = ?",
+                (customer_id,)
+            )
+            return (customer['loyalty_points'] or 0) if customer else 0
+        except Exception as e:
+            print(f"Error getting loyalty balance: {e}")
+            return 0
+        finally:
+            self.db_manager.disconnect()
+
+    def get_tier(self, customer_id):
+        """Get a customer's tier from the points earned over the last year"""
+        try:
+            self.db_manager.connect()
+            row = self.db_manager.fetch_one(
+                """
+                SELECT COALESCE(SUM(points), 0) AS earned
+                FROM loyalty_ledger
+                WHERE customer_id = ? AND entry_type = 'earn'
+                  AND created_at >= datetime('now', '-1 year')
+                """,
+                (customer_id,)
+            )
+            return tier_for_points(row['earned'] if row else 0)
+        except Exception as e:
+            print(f"Error getting loyalty tier: {e}")
+            return LOYALTY_TIERS[0][1]
+        finally:
+            self.db_manager.disconnect()
+
+    def get_history(self, customer_id, limit=50):
+        """Get a customer's latest ledger entries"""
+        try:
+            self.db_manager.connect()
+            return self.db_manager.fetch_all(
+                """
+                SELECT l.*, i.invoice_number
+                FROM loyalty_ledger l
+                LEFT JOIN invoices i ON l.invoice_id = i.id
+                WHERE l.customer_id = ?
+                ORDER BY l.id DESC
+                LIMIT ?
+                """,
+                (customer_id, limit)
+            )
+        except Exception as e:
+            print(f"Error getting loyalty history: {e}")
+            return []
+        finally:
+            self.db_manager.disconnect()
+
+    def adjust_points(self, customer_id, points, invoice_id=None):
+        """Manually add (or with a negative value remove) points"""
+        try:
+            self.db_manager.connect()
+
+            if points > 0:
+                expires_at = (datetime.date.today() + datetime.timedelta(days=LOYALTY_EXPIRY_DAYS)).isoformat()
+                self.db_manager.connection.execute(
+                    """
+                    INSERT INTO loyalty_ledger (customer_id, invoice_id, entry_type, points, remaining, expires_at)
+                    VALUES (?, ?, 'adjust', ?, ?, ?)
+                    """,
+                    (customer_id, invoice_id, points, points, expires_at)
+                )
+                self.db_manager.connection.execute(
+                    "UPDATE customers SET loyalty_points = COALESCE(loyalty_points, 0) + ? WHERE id = ?",
+                    (points, customer_id)
+                )
+            elif not record_redemption(self.db_manager, customer_id, invoice_id, -points):
+                self.db_manager.rollback()
+                return False
+
+            self.db_manager.commit()
+            return True
+        except Exception as e:
+            print(f"Error adjusting loyalty points: {e}")
+            self.db_manager.rollback()
+            return False
+        finally:
+            self.db_manager.disconnect()
+
+    def expire_points(self, as_of=None):
+        """Expire every lot past its date in a handful of set-wise statements
+
+        Args:
+            as_of (str, optional): Expire lots with expires_at on or before
+                this YYYY-MM-DD date, today by default
+
+        Returns:
+            dict: Number of customers affected and points expired, or None on error
+        """
+        as_of = as_of or datetime.date.today().isoformat()
+        try:
+            self.db_manager.connect()
+            self.db_manager.execute("BEGIN IMMEDIATE")
+
+            self.db_manager.connection.execute("DROP TABLE IF EXISTS temp.expiring_points")
+            self.db_manager.connection.execute(
+                """
+                CREATE TEMP TABLE expiring_points AS
+                SELECT customer_id, SUM(remaining) AS points
+                FROM loyalty_ledger
+                WHERE remaining > 0 AND expires_at <= ?
+                GROUP BY customer_id
+                """,
+                (as_of,)
+            )
+
+            totals = self.db_manager.fetch_one(
+                "SELECT COUNT(*) AS customers, COALESCE(SUM(points), 0) AS points FROM expiring_points"
+            )
+
+            self.db_manager.connection.execute(
+                """
+                INSERT INTO loyalty_ledger (customer_id, entry_type, points)
+                SELECT customer_id, 'expire', -points FROM expiring_points
+                """
+            )
+            self.db_manager.connection.execute(
+                """
+                UPDATE customers
+                SET loyalty_points = MAX(COALESCE(loyalty_points, 0) - e.points, 0)
+                FROM expiring_points e
+                WHERE e.customer_id = customers.id
+                """
+            )
+            self.db_manager.connection.execute(
+                """
+                UPDATE loyalty_ledger SET remaining = 0
+                WHERE remaining > 0 AND expires_at <= ?
+                """,
+                (as_of,)
+            )
+            self.db_manager.connection.execute("DROP TABLE temp.expiring_points")
+
+            self.db_manager.commit()
+            return {'customers': totals['customers'], 'points': totals['points']}
+        except Exception as e:
+            print(f"Error expiring loyalty points: {e}")
+            self.db_manager.rollback()
+            return None
+        finally:
+            self.db_manager.disconnect()
@@ -0,0 +1,223 @@
+from config import TILL_ID
+from utils.sales_metrics import day_bounds
+from utils.tracing import traced
+
+# Tenders a sale can be paid with
+TENDERS = ('Cash', 'Credit Card', 'Debit Card', 'Mobile Payment')
+
+# Tenders that can be handed over in excess, the difference going back as change
+CHANGE_TENDERS = ('Cash',)
+
+# Payment method recorded on an invoice settled with more than one tender
+SPLIT_PAYMENT_METHOD = "Split"
+
+
+def _cents(amount):
+    return int(round(amount * 100))
+
+
+def settle_tenders(amount_due, tenders):
+    """Apply the tenders handed over to the amount due and work out the change
+
+    Tenders that give change are applied last, so a card covers its share
+    exactly and the cash makes up the rest.
+
+    Args:
+        amount_due (float): The invoice's final amount
+        tenders (list): dicts with 'tender', 'tendered' (what was handed
+            over, what is still due if left out) and optionally 'card_last4'
+
+    Returns:
+        list: One payment per tender with the 'amount' it settled and the
+            'change_given', in the order they were applied
+
+    Raises:
+        ValueError: If the tenders don't cover the amount, a tender is not
+            one of TENDERS or is not positive, or a tender that gives no
+            change is over the amount still due
+    """
+    if not tenders:
+        raise ValueError("No payment tendered")
+
+    remaining = _cents(amount_due)
+    payments = []
+    for tender in sorted(tenders, key=lambda tender: tender['tender'] in CHANGE_TENDERS):
+        name = tender['tender']
+        if name not in TENDERS:
+            raise ValueError(f"Unknown tender: {name}")
+        tendered = tender.get('tendered')
+        tendered = remaining if tendered is None else _cents(tendered)
+        if tendered <= 0:
+            raise ValueError(f"{name} amount must be more than zero")
+        if remaining <= 0:
+            raise ValueError(f"The sale was already paid before {name}")
+        if tendered > remaining and name not in CHANGE_TENDERS:
+            raise ValueError(f"{name} can't be more than the {remaining / 100:.2f} still due")
+
+        amount = min(tendered, remaining)
+        remaining -= amount
+        payments.append({
+            'tender': name,
+            'amount': amount / 100,
+            'tendered': tendered / 100,
+            'change_given': (tendered - amount) / 100,
+            'card_last4': tender.get('card_last4'),
+        })
+
+    if remaining > 0:
+        raise ValueError(f"{remaining / 100:.2f} is still due")
+    return payments
+
+
+def payment_method_for(payments):
+    """The payment method to show on an invoice settled by these payments"""
+    tenders = {payment['tender'] for payment in payments}
+    return tenders.pop() if len(tenders) == 1 else SPLIT_PAYMENT_METHOD
+
+
+def record_payments(db_manager, invoice_id, payments, created_by, created_at, till_id=None, return_id=None):
+    """Write the payments of a sale, or the payout of a return
+
+    Runs inside the caller's transaction, so the payments commit with the
+    invoice or return they settle.
+    """
+    db_manager.connection.executemany(
+        """
+        INSERT INTO payments (
+            invoice_id, return_id, tender, amount, tendered, change_given,
+            card_last4, till_id, created_by, created_at
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (invoice_id, return_id, payment['tender'], payment['amount'], payment['tendered'],
+             payment.get('change_given', 0), payment.get('card_last4'), till_id or TILL_ID,
+             created_by, created_at)
+            for payment in payments
+        ]
+    )
+
+
+class Payment:
+    """Tenders taken and paid out, and the end-of-day cash-up over them.
+
+    Sales write one payment per tender and returns a negative one, so the
+    takings of a till are a single aggregate over payments. The cash-up
+    reads a range of created_at grouped by till, cashier and tender, which
+    idx_payments_cash_up covers without touching the table. Invoices moved
+    to the monthly archive take their payments with them; cash-ups are for
+    days still in the hot database.
+    """
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def get_invoice_payments(self, invoice_id):
+        """Get the payments taken and paid out against an invoice, oldest first"""
+        try:
+            self.db_manager.connect()
+            return self.db_manager.fetch_all(
+                "SELECT * FROM payments WHERE invoice_id = ? ORDER BY id",
+                (invoice_id,)
+            )
+        except Exception as e:
+            print(f"Error getting payments: {e}")
+            return []
+        finally:
+            self.db_manager.disconnect()
+
+    @traced("payment.cash_up")
+    def cash_up(self, from_date, to_date=None, till_id=None, cashier_id=None):
+        """Get takings by tender, till and cashier for whole days
+
+        Args:
+            from_date (str): First day, YYYY-MM-DD
+            to_date (str, optional): Last day, from_date by default
+            till_id (str, optional): Only this till
+            cashier_id (int, optional): Only this cashier
+
+        Returns:
+            list: One row per tender, till and cashier with the payments
+                taken, refunds paid out and the net that should be in the
+                drawer or with the card processor
+        """
+        start, end = day_bounds(from_date, to_date)
+        query = """
+            SELECT tender, till_id, created_by,
+                   SUM(amount > 0) AS payment_count,
+                   SUM(MAX(amount, 0)) AS taken,
+                   -SUM(MIN(amount, 0)) AS refunded,
+                   SUM(amount) AS net,
+                   SUM(tendered) AS tendered,
+                   SUM(change_given) AS change_given
+            FROM payments
+            WHERE created_at >= ? AND created_at < ?
+        """
+        params = [start, end]
+        if till_id is not None:
+            query += " AND till_id = ?"
+            params.append(till_id)
+        if cashier_id is not None:
+            query += " AND created_by = ?"
+            params.append(cashier_id)
+        query += " GROUP BY till_id, created_by, tender"
+
+        try:
+            self.db_manager.connect()
+            # Grouped first so usernames are looked up once per row, not per payment
+            return self.db_manager.fetch_all(
+                f"""
+                SELECT t.*, u.username AS cashier
+                FROM ({query}) t
+                LEFT JOIN users u ON u.id = t.created_by
+                ORDER BY t.till_id, u.username, t.tender
+                """,
+                params
+            )
+        except Exception as e:
+            print(f"Error getting cash-up: {e}")
+            return []
+        finally:
+            self.db_manager.disconnect()
+
+    def get_tender_totals(self, from_date, to_date=None, till_id=None, cashier_id=None):
+        """Get the cash-up summed per tender
+
+        Returns:
+            dict: tender -> {'payment_count', 'taken', 'refunded', 'net', 'change_given'}
+        """
+        totals = {}
+        for row in self.cash_up(from_date, to_date, till_id, cashier_id):
+            total = totals.setdefault(row['tender'], dict.fromkeys(
+                ('payment_count', 'taken', 'refunded', 'net', 'change_given'), 0
+            ))
+            for key in total:
+                total[key] += row[key]
+        return totals
+
+    def reconcile(self, counted, from_date, to_date=None, till_id=None, cashier_id=None, opening_float=0.0):
+        """Compare what was counted against what the payments say should be there
+
+        Args:
+            counted (dict): tender -> amount counted in the drawer or on the
+                card terminal's end-of-day slip
+            opening_float (float): Cash in the drawer before the first sale
+
+        Returns:
+            list: One row per tender with 'expected', 'counted' and
+                'variance' (positive when over)
+        """
+        totals = self.get_tender_totals(from_date, to_date, till_id, cashier_id)
+        rows = []
+        for tender in sorted(set(totals) | set(counted)):
+            expected = totals.get(tender, {}).get('net', 0)
+            if tender in CHANGE_TENDERS:
+                expected += opening_float
+            actual = counted.get(tender, 0)
+            rows.append({
+                'tender': tender,
+                'expected': round(expected, 2),
+                'counted': round(actual, 2),
+                'variance': round(actual - expected, 2),
+            })
+        return rows
@@ -0,0 +1,313 @@
+import os
+import time
+import datetime
+import threading
+from config import STORE_ID, PRICE_REFRESH_INTERVAL
+from utils.tracing import traced
+
+# Next scheduled price change per database, so checkout can tell without a
+# query whether any price is due to change
+_boundaries = {}
+_boundaries_lock = threading.Lock()
+
+
+def to_utc(when):
+    """Normalise a local date, datetime or ISO string to a UTC timestamp string
+
+    Timestamps are stored in UTC like CURRENT_TIMESTAMP, so price entries
+    compare directly with invoice created_at.
+    """
+    if when is None:
+        when = datetime.datetime.now()
+    elif isinstance(when, str):
+        when = datetime.datetime.fromisoformat(when.strip())
+    elif not isinstance(when, datetime.datetime):
+        when = datetime.datetime.combine(when, datetime.time())
+    return when.astimezone(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def record_price(db_manager, product_id, price, cost_price=None):
+    """Add a shared entry effective now, on the caller's open connection
+
+    Used where products.price is written directly, so the change still
+    shows in the price history.
+    """
+    db_manager.connection.execute(
+        """
+        INSERT INTO price_list_entries (product_id, price, cost_price, effective_from)
+        VALUES (?, ?, ?, ?)
+        """,
+        (product_id, price, cost_price, to_utc(None))
+    )
+
+
+class PriceList:
+    """Effective-dated prices with products.price as the materialized current price.
+
+    A price list entry sets a product's price (and optionally cost price) from
+    effective_from onwards, for every store or, with store_id, for one store.
+    At any moment the entry with the latest effective_from applies; a store
+    entry beats a shared one taking effect at the same time. Checkout keeps
+    reading products.price, which refresh_current_prices rewrites when a
+    scheduled change falls due, and reports look up the price in force at the
+    time of sale through idx_price_list_product.
+    """
+
+    def __init__(self, db_manager, store_id=STORE_ID):
+        self.db_manager = db_manager
+        self.store_id = store_id
+
+    def schedule_price_change(self, product_id, price, effective_from=None, cost_price=None,
+                              store_id=None, user_id=None, note=None):
+        """Add a price list entry
+
+        Args:
+            product_id (int): Product to reprice
+            price (float): New selling price
+            effective_from (datetime or str, optional): Local time the price
+                applies from, now by default
+            cost_price (float, optional): New cost price, unchanged if None
+            store_id (int, optional): Only reprice this store, all stores if None
+            user_id (int, optional): User making the change
+            note (str, optional): Reason shown in the price history
+
+        Returns:
+            int: Id of the new entry, or None on error
+        """
+        try:
+            effective_from = to_utc(effective_from)
+            self.db_manager.connect()
+            cursor = self.db_manager.connection.execute(
+                """
+                INSERT INTO price_list_entries
+                (product_id, store_id, price, cost_price, effective_from, note, created_by)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (product_id, store_id, price, cost_price, effective_from, note, user_id)
+            )
+            self.db_manager.commit()
+            entry_id = cursor.lastrowid
+        except Exception as e:
+            print(f"Error scheduling price change: {e}")
+            self.db_manager.rollback()
+            return None
+        finally:
+            self.db_manager.disconnect()
+
+        # Apply the change now if it is already due, otherwise make sure
+        # refresh_if_due wakes up for it
+        if effective_from <= to_utc(None):
+            self.refresh_current_prices(product_ids=[product_id])
+        else:
+            self._note_boundary(effective_from)
+        return entry_id
+
+    def cancel_price_change(self, entry_id):
+        """Delete a price list entry that has not taken effect yet"""
+        try:
+            self.db_manager.connect()
+            cursor = self.db_manager.connection.execute(
+                "DELETE FROM price_list_entries WHERE id = ? AND effective_from > ?",
+                (entry_id, to_utc(None))
+            )
+            self.db_manager.commit()
+            cancelled = cursor.rowcount > 0
+        except Exception as e:
+            print(f"Error cancelling price change: {e}")
+            self.db_manager.rollback()
+            return False
+        finally:
+            self.db_manager.disconnect()
+
+        # A cached boundary left behind by the entry only costs one empty refresh
+        return cancelled
+
+    def get_price_history(self, product_id, limit=50):
+        """Get a product's price list entries, scheduled ones first"""
+        try:
+            self.db_manager.connect()
+            return self.db_manager.fetch_all(
+                """
+                SELECT e.*, u.full_name AS created_by_name
+                FROM price_list_entries e
+                LEFT JOIN users u ON e.created_by = u.id
+                WHERE e.product_id = ? AND (e.store_id IS NULL OR e.store_id = ?)
+                ORDER BY e.effective_from DESC, e.id DESC
+                LIMIT ?
+                """,
+                (product_id, self.store_id, limit)
+            )
+        except Exception as e:
+            print(f"Error getting price history: {e}")
+            return []
+        finally:
+            self.db_manager.disconnect()
+
+    def refresh_current_prices(self, as_of=None, product_ids=None, since=None):
+        """Rewrite products.price from the entries in force at as_of
+
+        Args:
+            as_of (datetime or str, optional): Local time to price at, now by default
+            product_ids (list, optional): Only refresh these products
+            since (str, optional): Only refresh products with an entry taking
+                effect after this UTC timestamp
+
+        Returns:
+            int: Number of products repriced, or None on error
+        """
+        as_of = to_utc(as_of)
+        product_filter = ""
+        params = [as_of, self.store_id]
+        if product_ids:
+            product_filter = f"AND product_id IN ({', '.join('?' for _ in product_ids)})"
+            params.extend(product_ids)
+        elif since:
+            product_filter = """
+                AND product_id IN (
+                    SELECT product_id FROM price_list_entries WHERE effective_from > ? AND effective_from <= ?
+                )
+            """
+            params.extend([since, as_of])
+
+        try:
+            self.db_manager.connect()
+            self.db_manager.execute("BEGIN IMMEDIATE")
+            cursor = self.db_manager.connection.execute(
+                f"""
+                UPDATE products SET
+                    price = current.price,
+                    cost_price = COALESCE(current.cost_price, products.cost_price),
+                    updated_at = CURRENT_TIMESTAMP
+                FROM (
+                    SELECT product_id, price, cost_price,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY product_id
+                               ORDER BY effective_from DESC, store_id IS NULL, id DESC
+                           ) AS rank
+                    FROM price_list_entries
+                    WHERE effective_from <= ? AND (store_id IS NULL OR store_id = ?) {product_filter}
+                ) AS current
+                WHERE current.rank = 1 AND products.id = current.product_id
+                  AND (products.price IS NOT current.price
+                       OR (current.cost_price IS NOT NULL AND products.cost_price IS NOT current.cost_price))
+                """,
+                params
+            )
+            self.db_manager.commit()
+            return cursor.rowcount
+        except Exception as e:
+            print(f"Error refreshing current prices: {e}")
+            self.db_manager.rollback()
+            return None
+        finally:
+            self.db_manager.disconnect()
+
+    def _next_boundary(self, after):
+        try:
+            self.db_manager.connect()
+            row = self.db_manager.fetch_one(
+                """
+                SELECT MIN(effective_from) AS next_change FROM price_list_entries
+                WHERE effective_from > ? AND (store_id IS NULL OR store_id = ?)
+                """,
+                (after, self.store_id)
+            )
+            return row['next_change'] if row else None
+        finally:
+            self.db_manager.disconnect()
+
+    def _note_boundary(self, effective_from):
+        with _boundaries_lock:
+            boundary = _boundaries.get(os.path.abspath(self.db_manager.db_path))
+            if boundary and (boundary['next_change'] is None or effective_from < boundary['next_change']):
+                boundary['next_change'] = effective_from
+
+    @traced("price_list.refresh_if_due")
+    def refresh_if_due(self):
+        """Apply scheduled price changes that have fallen due
+
+        Cheap enough to call before every product lookup: the next boundary
+        is cached, and only re-read every PRICE_REFRESH_INTERVAL seconds to
+        pick up changes scheduled on other tills.
+
+        Returns:
+            int: Number of products repriced
+        """
+        key = os.path.abspath(self.db_manager.db_path)
+        now = to_utc(None)
+        with _boundaries_lock:
+            boundary = _boundaries.get(key)
+            if boundary and boundary.get('refreshing'):
+                return 0
+            due = boundary is None or (boundary['next_change'] is not None and now >= boundary['next_change'])
+            if not due and time.monotonic() - boundary['checked'] < PRICE_REFRESH_INTERVAL:
+                return 0
+            since = boundary['as_of'] if boundary else None
+            # Claim the refresh; other callers sell at the current prices
+            # until it is done, and changes noted meanwhile land in next_change
+            _boundaries[key] = {'as_of': since, 'next_change': None, 'checked': 0, 'refreshing': True}
+
+        # The write runs outside the lock, so no other database waits on it
+        repriced, next_change = 0, None
+        try:
+            if due:
+                # The first call in a process catches up on every product,
+                # later ones only on products with an entry that fell due
+                repriced = self.refresh_current_prices(since=since)
+            if repriced is not None:
+                # A re-read looks from the last refresh on, so changes other
+                # tills scheduled into the past are still due next call
+                next_change = self._next_boundary(now if due else since)
+        except Exception as e:
+            print(f"Error checking scheduled prices: {e}")
+            repriced = None
+
+        with _boundaries_lock:
+            if repriced is None:
+                # Try again on the next call
+                if boundary:
+                    _boundaries[key] = boundary
+                else:
+                    _boundaries.pop(key, None)
+                return 0
+            noted = _boundaries[key]['next_change']
+            if noted is not None and (next_change is None or noted < next_change):
+                next_change = noted
+            _boundaries[key] = {'as_of': now if due else since, 'next_change': next_change,
+                                'checked': time.monotonic()}
+        return repriced
+
+    def get_margin_report(self, from_date, to_date):
+        """Get revenue, cost and margin per product, costed at the price list in force at each sale
+
+        Sales made before a product's first price list entry fall back to
+        its current cost price.
+        """
+        try:
+            self.db_manager.connect()
+            return self.db_manager.fetch_all(
+                """
+                SELECT p.id, p.name, SUM(ii.quantity) AS quantity,
+                       SUM(ii.total_price) AS revenue,
+                       SUM(ii.quantity * COALESCE((
+                           SELECT e.cost_price FROM price_list_entries e
+                           WHERE e.product_id = ii.product_id AND e.cost_price IS NOT NULL
+                             AND e.effective_from <= i.created_at
+                             AND (e.store_id IS NULL OR e.store_id = ?)
+                           ORDER BY e.effective_from DESC, e.store_id IS NULL, e.id DESC
+                           LIMIT 1
+                       ), p.cost_price)) AS cost
+                FROM invoice_items ii
+                JOIN invoices i ON ii.invoice_id = i.id
+                JOIN products p ON ii.product_id = p.id
+                WHERE DATE(i.created_at) BETWEEN ? AND ?
+                GROUP BY p.id, p.name
+                ORDER BY revenue DESC
+                """,
+                (self.store_id, from_date, to_date)
+            )
+        except Exception as e:
+            print(f"Error getting margin report: {e}")
+            return []
+        finally:
+            self.db_manager.disconnect()
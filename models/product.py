@@ -1,9 +1,12 @@
 from db_manager import DatabaseManager
 from datetime import datetime
+from models.price_list import PriceList, record_price
+from utils.tracing import traced
 
 class Product:
     def __init__(self, db_manager):
         self.db_manager = db_manager
+        self.price_list = PriceList(db_manager)
 
     def get_all_products(self):
         """Get all products with stock from inventory"""
@@ -18,8 +21,11 @@ class Product:
         self.db_manager.disconnect()
         return products
 
+    @traced("product.get_product_by_id")
     def get_product_by_id(self, product_id):
         """Get a single product by ID"""
+        # Lookups made at sale time see scheduled prices that fell due
+        self.price_list.refresh_if_due()
         self.db_manager.connect()
         product = self.db_manager.fetch_one("""
             SELECT p.*, c.name AS category_name, i.quantity AS stock
@@ -31,8 +37,25 @@ class Product:
         self.db_manager.disconnect()
         return product
 
+    @traced("product.get_product_by_sku")
+    def get_product_by_sku(self, sku):
+        """Get a single product by its SKU, as read by a barcode scanner"""
+        self.price_list.refresh_if_due()
+        self.db_manager.connect()
+        product = self.db_manager.fetch_one("""
+            SELECT p.*, c.name AS category_name, i.quantity AS stock
+            FROM products p
+            LEFT JOIN categories c ON p.category_id = c.id
+            LEFT JOIN inventory i ON p.id = i.product_id
+            WHERE p.sku = ?
+        """, (sku,))
+        self.db_manager.disconnect()
+        return product
+
+    @traced("product.search_products")
     def search_products(self, search_term):
         """Search products by name"""
+        self.price_list.refresh_if_due()
         self.db_manager.connect()
         products = self.db_manager.fetch_all("""
             SELECT p.*, c.name AS category_name, i.quantity AS stock
@@ -58,6 +81,9 @@ class Product:
 
             product_id = self.db_manager.get_last_row_id()
 
+            # Start the product's price history
+            record_price(self.db_manager, product_id, price, cost_price)
+
             # Insert into inventory
             self.db_manager.execute("""
                 INSERT INTO inventory (product_id, quantity)
@@ -78,6 +104,13 @@ class Product:
         try:
             self.db_manager.connect()
 
+            # Keep the old price in the price history
+            current = self.db_manager.fetch_one(
+                "SELECT price, cost_price FROM products WHERE id = ?", (product_id,)
+            )
+            if current and (current['price'] != price or current['cost_price'] != cost_price):
+                record_price(self.db_manager, product_id, price, cost_price)
+
             # Update product details
             self.db_manager.execute("""
                 UPDATE products
@@ -154,11 +187,11 @@ class Product:
 
             # Check if product is used in invoices
             used_in_invoice = self.db_manager.fetch_one(
-                "SELECT COUNT(*) as count FROM invoice_items WHERE product_id = ?",
+                "SELECT 1 FROM invoice_items WHERE product_id = ? LIMIT 1",
                 (product_id,)
             )
 
-            if used_in_invoice and used_in_invoice['count'] > 0:
+            if used_in_invoice:
                 self.db_manager.disconnect()
                 return False, "Cannot delete product that has been sold."
 
@@ -213,7 +246,22 @@ class Product:
         self.db_manager.disconnect()
         return inventory_report
     
-    def get_inventory_update(self): 
+    def get_inventory_totals(self, low_stock_threshold=10):
+        """Get product count, stock value and stock alert counts in one aggregate query"""
+        self.db_manager.connect()
+        totals = self.db_manager.fetch_one("""
+            SELECT COUNT(*) AS total_products,
+                   SUM(CASE WHEN p.cost_price THEN p.cost_price ELSE p.price END
+                       * COALESCE(i.quantity, 0)) AS total_value,
+                   SUM(CASE WHEN i.quantity <> 0 AND i.quantity < ? THEN 1 ELSE 0 END) AS low_stock_count,
+                   SUM(CASE WHEN i.quantity = 0 THEN 1 ELSE 0 END) AS out_of_stock_count
+            FROM products p
+            LEFT JOIN inventory i ON p.id = i.product_id
+        """, (low_stock_threshold,))
+        self.db_manager.disconnect()
+        return totals
+
+    def get_inventory_update(self):
         """Get current inventory status with stock levels"""
         self.db_manager.connect() 
         query = """
@@ -0,0 +1,389 @@
+import datetime
+from models.loyalty import record_return
+from models.payment import record_payments, payment_method_for, SPLIT_PAYMENT_METHOD
+from utils.sales_metrics import utc_timestamp
+from utils.tracing import traced
+
+# Columns shown when choosing the invoice to return against
+_INVOICE_COLUMNS = """
+    i.id, i.invoice_number, i.created_at, i.final_amount, i.payment_method, i.card_last4,
+    i.customer_id, c.name AS customer_name
+"""
+
+
+class Refund:
+    """Returns of goods against the invoice they were sold on.
+
+    The original sale is found through an index whichever way it is
+    identified: invoice number (typed or scanned from the receipt barcode),
+    the customer's phone number or the last four digits of the card. The
+    quantities still returnable come from one aggregate over the invoice
+    and its earlier returns, and the refund, restock and loyalty reversal
+    are posted in one transaction that repeats that check, so two tills
+    can't refund the same goods twice. Each return refunds its share of
+    what was paid, so discounts and tax are refunded pro rata and the last
+    return of an invoice settles any rounding left over.
+    """
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    @traced("refund.find_invoices")
+    def find_invoices(self, term, limit=20):
+        """Find invoices to return against, newest first
+
+        Args:
+            term (str): An invoice number or receipt barcode, a customer
+                phone number, or the last four digits of a card
+        """
+        term = (term or "").strip()
+        if not term:
+            return []
+        try:
+            self.db_manager.connect()
+            # Invoice numbers are unique, and are what the receipt barcode encodes
+            rows = self.db_manager.fetch_all(
+                f"""
+                SELECT {_INVOICE_COLUMNS}
+                FROM invoices i LEFT JOIN customers c ON c.id = i.customer_id
+                WHERE i.invoice_number = ?
+                """,
+                (term.upper(),)
+            )
+            if rows:
+                return rows
+
+            if len(term) == 4 and term.isdigit():
+                return self.db_manager.fetch_all(
+                    f"""
+                    SELECT {_INVOICE_COLUMNS}
+                    FROM invoices i LEFT JOIN customers c ON c.id = i.customer_id
+                    WHERE i.card_last4 = ?
+                    ORDER BY i.created_at DESC
+                    LIMIT ?
+                    """,
+                    (term, limit)
+                )
+
+            return self.db_manager.fetch_all(
+                f"""
+                SELECT {_INVOICE_COLUMNS}
+                FROM customers c JOIN invoices i ON i.customer_id = c.id
+                WHERE c.phone = ?
+                ORDER BY i.id DESC
+                LIMIT ?
+                """,
+                (term, limit)
+            )
+        except Exception as e:
+            print(f"Error finding invoices: {e}")
+            return []
+        finally:
+            self.db_manager.disconnect()
+
+    def get_customer_invoices(self, customer_id, limit=20):
+        """Get a customer's latest invoices to return against"""
+        try:
+            self.db_manager.connect()
+            return self.db_manager.fetch_all(
+                f"""
+                SELECT {_INVOICE_COLUMNS}
+                FROM invoices i LEFT JOIN customers c ON c.id = i.customer_id
+                WHERE i.customer_id = ?
+                ORDER BY i.id DESC
+                LIMIT ?
+                """,
+                (customer_id, limit)
+            )
+        except Exception as e:
+            print(f"Error getting customer invoices: {e}")
+            return []
+        finally:
+            self.db_manager.disconnect()
+
+    def _get_invoice(self, invoice_id):
+        # The invoice with what its earlier returns already refunded
+        return self.db_manager.fetch_one(
+            """
+            SELECT i.id, i.invoice_number, i.customer_id, i.total_amount, i.tax_amount, i.final_amount,
+                   i.payment_method, i.created_at,
+                   COALESCE(r.refunded, 0) AS refunded, COALESCE(r.tax_refunded, 0) AS tax_refunded,
+                   COALESCE(r.points_reversed, 0) AS points_reversed,
+                   COALESCE(r.points_restored, 0) AS points_restored
+            FROM invoices i
+            LEFT JOIN (
+                SELECT invoice_id, SUM(refund_amount) AS refunded, SUM(tax_refunded) AS tax_refunded,
+                       SUM(points_reversed) AS points_reversed, SUM(points_restored) AS points_restored
+                FROM returns WHERE invoice_id = ?
+            ) r ON r.invoice_id = i.id
+            WHERE i.id = ?
+            """,
+            (invoice_id, invoice_id)
+        )
+
+    def _get_lines(self, invoice_id):
+        # Sold and already returned quantities per product in one aggregate
+        return self.db_manager.fetch_all(
+            """
+            SELECT ii.product_id, COALESCE(p.name, 'Product ' || ii.product_id) AS product_name,
+                   SUM(ii.quantity) AS sold, SUM(ii.total_price) AS sold_value,
+                   COALESCE(r.returned, 0) AS returned,
+                   SUM(ii.quantity) - COALESCE(r.returned, 0) AS returnable
+            FROM invoice_items ii
+            LEFT JOIN products p ON p.id = ii.product_id
+            LEFT JOIN (
+                SELECT product_id, SUM(quantity) AS returned
+                FROM return_items WHERE invoice_id = ?
+                GROUP BY product_id
+            ) r ON r.product_id = ii.product_id
+            WHERE ii.invoice_id = ?
+            GROUP BY ii.product_id
+            ORDER BY MIN(ii.id)
+            """,
+            (invoice_id, invoice_id)
+        )
+
+    def get_returnable(self, invoice_id):
+        """Get an invoice with its lines and the quantity of each still returnable
+
+        Returns:
+            dict: The invoice with what was refunded so far and 'lines', or
+                None if it isn't in the hot database (archived invoices are
+                past returning)
+        """
+        try:
+            self.db_manager.connect()
+            invoice = self._get_invoice(invoice_id)
+            if not invoice:
+                return None
+            invoice = dict(invoice)
+            invoice['lines'] = [dict(line) for line in self._get_lines(invoice_id)]
+            return invoice
+        except Exception as e:
+            print(f"Error getting returnable items: {e}")
+            return None
+        finally:
+            self.db_manager.disconnect()
+
+    def _split_payouts(self, invoice_id, refund_amount):
+        # Back to each tender in the order they were applied, none refunded
+        # more than it still has unrefunded
+        tenders = self.db_manager.fetch_all(
+            """
+            SELECT tender, MAX(card_last4) AS card_last4, SUM(amount) AS unrefunded
+            FROM payments
+            WHERE invoice_id = ?
+            GROUP BY tender
+            ORDER BY MIN(id)
+            """,
+            (invoice_id,)
+        )
+        remaining = int(round(refund_amount * 100))
+        payouts = []
+        for tender in tenders:
+            amount = min(remaining, int(round(tender['unrefunded'] * 100)))
+            if amount <= 0:
+                continue
+            remaining -= amount
+            payouts.append({'tender': tender['tender'], 'amount': -amount / 100, 'tendered': -amount / 100,
+                            'card_last4': tender['card_last4']})
+        if remaining > 0:
+            # Rounding the tenders can't cover goes back in cash
+            if payouts and payouts[-1]['tender'] == "Cash":
+                payouts[-1]['amount'] = payouts[-1]['tendered'] = round(payouts[-1]['amount'] - remaining / 100, 2)
+            else:
+                payouts.append({'tender': "Cash", 'amount': -remaining / 100, 'tendered': -remaining / 100})
+        return payouts
+
+    @traced("refund.process_return")
+    def process_return(self, invoice_id, quantities, created_by, refund_method=None, reason=None, restock=True,
+                       till_id=None):
+        """Return goods from an invoice and refund them
+
+        Args:
+            invoice_id (int): The original invoice
+            quantities (dict): product_id -> quantity returned
+            created_by (int): The user taking the return
+            refund_method (str, optional): How the money goes back, the
+                invoice's payment method by default; a split sale is
+                refunded to its tenders, each up to what it paid
+            reason (str, optional): Noted on the return
+            restock (bool): Put the goods back into inventory; False for
+                damaged goods, which are written off
+            till_id (str, optional): The till paying the refund out, this
+                one by default
+
+        Returns:
+            tuple: (True, the return as a dict) or (False, why it was refused)
+        """
+        quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity}
+        if not quantities:
+            return False, "Nothing to return"
+
+        try:
+            self.db_manager.connect()
+            connection = self.db_manager.connection
+            connection.execute("BEGIN IMMEDIATE")
+
+            invoice = self._get_invoice(invoice_id)
+            if not invoice:
+                raise ValueError("Invoice not found")
+            lines = {line['product_id']: line for line in self._get_lines(invoice_id)}
+
+            items = []
+            for product_id, quantity in quantities.items():
+                line = lines.get(product_id)
+                if not line:
+                    raise ValueError(f"Product {product_id} is not on invoice {invoice['invoice_number']}")
+                if quantity < 0 or quantity > line['returnable']:
+                    raise ValueError(f"Only {line['returnable']} of {line['product_name']} can be returned")
+                unit_price = line['sold_value'] / line['sold']
+                items.append((product_id, quantity, unit_price, round(unit_price * quantity, 2)))
+
+            # Refund the returned share of what was actually paid; the return
+            # that completes the invoice takes whatever is left
+            completes = all(
+                line['returned'] + quantities.get(product_id, 0) == line['sold']
+                for product_id, line in lines.items()
+            )
+            earned, redeemed = 0, 0
+            if invoice['customer_id']:
+                points = self.db_manager.fetch_one(
+                    """
+                    SELECT COALESCE(SUM(CASE WHEN entry_type = 'earn' THEN points END), 0) AS earned,
+                           COALESCE(-SUM(CASE WHEN entry_type = 'redeem' THEN points END), 0) AS redeemed
+                    FROM loyalty_ledger
+                    WHERE customer_id = ? AND invoice_id = ?
+                    """,
+                    (invoice['customer_id'], invoice_id)
+                )
+                earned, redeemed = points['earned'], points['redeemed']
+
+            if completes:
+                refund_amount = round(invoice['final_amount'] - invoice['refunded'], 2)
+                tax_refunded = round(invoice['tax_amount'] - invoice['tax_refunded'], 2)
+                points_earned = earned - invoice['points_reversed']
+                points_redeemed = redeemed - invoice['points_restored']
+            else:
+                share = sum(item[3] for item in items) / invoice['total_amount'] if invoice['total_amount'] else 0
+                refund_amount = round(invoice['final_amount'] * share, 2)
+                tax_refunded = round(invoice['tax_amount'] * share, 2)
+                points_earned = int(earned * share)
+                points_redeemed = int(redeemed * share)
+
+            # Numbering inside the write transaction, like invoices
+            day = datetime.datetime.now().strftime("%Y%m%d")
+            last_return = self.db_manager.fetch_one(
+                "SELECT return_number FROM returns WHERE return_number LIKE ? ORDER BY id DESC LIMIT 1",
+                (f"RET-{day}-%",)
+            )
+            seq_num = int(last_return['return_number'].split('-')[-1]) + 1 if last_return else 1
+            return_number = f"RET-{day}-{seq_num:04d}"
+            created_at = utc_timestamp()
+
+            if refund_method:
+                payouts = [{'tender': refund_method, 'amount': -refund_amount, 'tendered': -refund_amount}]
+            elif invoice['payment_method'] == SPLIT_PAYMENT_METHOD:
+                payouts = self._split_payouts(invoice_id, refund_amount)
+                refund_method = payment_method_for(payouts)
+            else:
+                refund_method = invoice['payment_method']
+                payouts = [{'tender': refund_method, 'amount': -refund_amount, 'tendered': -refund_amount}]
+
+            cursor = connection.execute(
+                """
+                INSERT INTO returns (
+                    return_number, invoice_id, customer_id, refund_amount, tax_refunded,
+                    refund_method, reason, created_by, created_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (return_number, invoice_id, invoice['customer_id'], refund_amount, tax_refunded,
+                 refund_method, reason, created_by, created_at)
+            )
+            return_id = cursor.lastrowid
+
+            # The payout comes off the till's takings for the cash-up
+            record_payments(
+                self.db_manager, invoice_id, payouts,
+                created_by, created_at, till_id=till_id, return_id=return_id
+            )
+
+            connection.executemany(
+                """
+                INSERT INTO return_items (return_id, invoice_id, product_id, quantity, unit_price, total_price, restocked)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [(return_id, invoice_id, product_id, quantity, unit_price, total_price, int(restock))
+                 for product_id, quantity, unit_price, total_price in items]
+            )
+
+            if restock:
+                connection.executemany(
+                    "UPDATE inventory SET quantity = quantity + ? WHERE product_id = ?",
+                    [(quantity, product_id) for product_id, quantity, _, _ in items]
+                )
+                connection.executemany(
+                    """
+                    INSERT INTO inventory_transactions
+                    (product_id, quantity_change, transaction_type, reference_id, notes, created_by)
+                    VALUES (?, ?, 'return', ?, ?, ?)
+                    """,
+                    [(product_id, quantity, return_id, return_number, created_by)
+                     for product_id, quantity, _, _ in items]
+                )
+
+            points_reversed, points_restored = 0, 0
+            if invoice['customer_id']:
+                points_reversed, points_restored = record_return(
+                    self.db_manager, invoice['customer_id'], invoice_id, points_earned, points_redeemed
+                )
+                if points_reversed or points_restored:
+                    connection.execute(
+                        "UPDATE returns SET points_reversed = ?, points_restored = ? WHERE id = ?",
+                        (points_reversed, points_restored, return_id)
+                    )
+
+            self.db_manager.commit()
+            return True, {
+                'id': return_id,
+                'return_number': return_number,
+                'invoice_id': invoice_id,
+                'invoice_number': invoice['invoice_number'],
+                'refund_amount': refund_amount,
+                'tax_refunded': tax_refunded,
+                'refund_method': refund_method,
+                'payments': payouts,
+                'points_reversed': points_reversed,
+                'points_restored': points_restored,
+                'items': [{'product_id': product_id, 'quantity': quantity, 'unit_price': unit_price,
+                           'total_price': total_price} for product_id, quantity, unit_price, total_price in items],
+            }
+        except ValueError as e:
+            self.db_manager.rollback()
+            return False, str(e)
+        except Exception as e:
+            print(f"Error processing return: {e}")
+            self.db_manager.rollback()
+            return False, "The return could not be saved"
+        finally:
+            self.db_manager.disconnect()
+
+    def get_returns_for_invoice(self, invoice_id):
+        """Get the returns made against an invoice, oldest first"""
+        try:
+            self.db_manager.connect()
+            return self.db_manager.fetch_all(
+                """
+                SELECT r.*, u.username AS created_by_user
+                FROM returns r LEFT JOIN users u ON u.id = r.created_by
+                WHERE r.invoice_id = ?
+                ORDER BY r.id
+                """,
+                (invoice_id,)
+            )
+        except Exception as e:
+            print(f"Error getting returns: {e}")
+            return []
+        finally:
+            self.db_manager.disconnect()
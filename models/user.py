@@ -1,5 +1,8 @@
-import hashlib
 import os
+from utils.password_hasher import get_password_hashing
+from utils.session_cache import session_cache
+from utils.login_recorder import get_login_recorder
+from utils.quick_switch import get_quick_switch
 
 class User:
     def __init__(self, db_manager):
@@ -19,31 +22,86 @@ class User:
             self.db_manager.disconnect()
             return None
             
+        # A login verified moments ago at this till skips the slow hash,
+        # unless the password was changed since, here or on another till
+        cached_user = session_cache.lookup_login(username, password, user['password'])
+        if cached_user:
+            self.db_manager.disconnect()
+            get_login_recorder(self.db_manager).record(user['id'])
+            return self._public(user)
+            
         # Check password
-        hashed_password = self._hash_password(password, user['salt'])
+        hashing = get_password_hashing()
         
-        if hashed_password != user['password']:
+        if not hashing.verify(password, user['salt'], user['password']):
             self.db_manager.disconnect()
             return None
             
-        # Update last login
-        self.db_manager.execute(
-            "UPDATE users SET last_login = datetime('now') WHERE id = ?",
-            (user['id'],)
-        )
-        
-        self.db_manager.commit()
+        # Upgrade hashes made with an older algorithm or cost
+        stored_hash = user['password']
+        if hashing.needs_rehash(stored_hash):
+            new_salt = os.urandom(32).hex()
+            stored_hash = hashing.hash(password, new_salt)
+            self.db_manager.execute(
+                "UPDATE users SET password = ?, salt = ? WHERE id = ?",
+                (stored_hash, new_salt, user['id'])
+            )
+            self.db_manager.commit()
+            
         self.db_manager.disconnect()
         
-        # Convert to dictionary before removing sensitive data
-        user_dict = dict(user)
+        # Last login is written in batches off the login path
+        get_login_recorder(self.db_manager).record(user['id'])
+        
+        user_dict = self._public(user)
+        session_cache.remember_login(username, password, user_dict, stored_hash)
+        return user_dict
         
-        # Remove sensitive data
+    @staticmethod
+    def _public(user):
+        # Convert to dictionary and remove sensitive data
+        user_dict = dict(user)
         del user_dict['password']
         del user_dict['salt']
-        
         return user_dict
         
+    def get_session_user(self, token):
+        """Get the user of a live session token as stored now
+        
+        The user is re-read on every use, so a role change made on another
+        till applies at once, and deleting the user or changing the password
+        there ends the session.
+        """
+        session_user = session_cache.get_session(token)
+        if not session_user:
+            return None
+            
+        try:
+            self.db_manager.connect()
+            user = self.db_manager.fetch_one(
+                "SELECT * FROM users WHERE id = ?",
+                (session_user['id'],)
+            )
+        finally:
+            self.db_manager.disconnect()
+            
+        if not user or not session_cache.check_session(token, user['password']):
+            session_cache.end_session(token)
+            return None
+        return self._public(user)
+        
+    def verify_password(self, username, password):
+        """Check a user's password without recording a login"""
+        try:
+            self.db_manager.connect()
+            user = self.db_manager.fetch_one(
+                "SELECT password, salt FROM users WHERE username = ?",
+                (username,)
+            )
+            return bool(user) and get_password_hashing().verify(password, user['salt'], user['password'])
+        finally:
+            self.db_manager.disconnect()
+        
     def get_all_users(self):
         """Get all users"""
         self.db_manager.connect()
@@ -80,7 +138,7 @@ class User:
                 
             # Generate salt and hash password
             salt = os.urandom(32).hex()
-            hashed_password = self._hash_password(password, salt)
+            hashed_password = get_password_hashing().hash(password, salt)
             
             # Insert user
             self.db_manager.execute(
@@ -117,6 +175,8 @@ class User:
             
             self.db_manager.commit()
             self.db_manager.disconnect()
+            session_cache.forget_user(user_id)
+            get_quick_switch(self.db_manager).invalidate()
             return True
             
         except Exception as e:
@@ -141,15 +201,15 @@ class User:
                 return False
                 
             # Verify current password
-            current_hashed = self._hash_password(current_password, user['salt'])
+            hashing = get_password_hashing()
             
-            if current_hashed != user['password']:
+            if not hashing.verify(current_password, user['salt'], user['password']):
                 self.db_manager.disconnect()
                 return False
                 
             # Generate new salt and hash new password
             new_salt = os.urandom(32).hex()
-            new_hashed = self._hash_password(new_password, new_salt)
+            new_hashed = hashing.hash(new_password, new_salt)
             
             # Update password
             self.db_manager.execute(
@@ -163,6 +223,8 @@ class User:
             
             self.db_manager.commit()
             self.db_manager.disconnect()
+            session_cache.forget_user(user_id)
+            get_quick_switch(self.db_manager).invalidate()
             return True
             
         except Exception as e:
@@ -178,11 +240,11 @@ class User:
             
             # Check if user has created invoices
             invoices = self.db_manager.fetch_one(
-                "SELECT COUNT(*) as count FROM invoices WHERE created_by = ?",
+                "SELECT 1 FROM invoices WHERE created_by = ? LIMIT 1",
                 (user_id,)
             )
             
-            if invoices and invoices['count'] > 0:
+            if invoices:
                 self.db_manager.disconnect()
                 return False
                 
@@ -191,9 +253,15 @@ class User:
                 "DELETE FROM users WHERE id = ?",
                 (user_id,)
             )
+            self.db_manager.execute(
+                "DELETE FROM user_pins WHERE user_id = ?",
+                (user_id,)
+            )
             
             self.db_manager.commit()
             self.db_manager.disconnect()
+            session_cache.forget_user(user_id)
+            get_quick_switch(self.db_manager).invalidate()
             return True
             
         except Exception as e:
@@ -202,6 +270,52 @@ class User:
             self.db_manager.disconnect()
             return False
             
-    def _hash_password(self, password, salt):
-        """Hash password with salt"""
-        return hashlib.sha256((password + salt).encode()).hexdigest()
\ No newline at end of file
+    def set_pin(self, user_id, pin):
+        """Set the quick switch PIN of a user"""
+        try:
+            self.db_manager.connect()
+            
+            salt = os.urandom(32).hex()
+            self.db_manager.execute(
+                """
+                INSERT INTO user_pins (user_id, pin_hash, salt, updated_at)
+                VALUES (?, ?, ?, datetime('now'))
+                ON CONFLICT(user_id) DO UPDATE SET
+                    pin_hash = excluded.pin_hash,
+                    salt = excluded.salt,
+                    updated_at = excluded.updated_at
+                """,
+                (user_id, get_password_hashing().hash(pin, salt), salt)
+            )
+            
+            self.db_manager.commit()
+            self.db_manager.disconnect()
+            get_quick_switch(self.db_manager).invalidate()
+            return True
+            
+        except Exception as e:
+            print(f"Error setting PIN: {e}")
+            self.db_manager.rollback()
+            self.db_manager.disconnect()
+            return False
+            
+    def remove_pin(self, user_id):
+        """Remove the quick switch PIN of a user"""
+        try:
+            self.db_manager.connect()
+            
+            self.db_manager.execute(
+                "DELETE FROM user_pins WHERE user_id = ?",
+                (user_id,)
+            )
+            
+            self.db_manager.commit()
+            self.db_manager.disconnect()
+            get_quick_switch(self.db_manager).invalidate()
+            return True
+            
+        except Exception as e:
+            print(f"Error removing PIN: {e}")
+            self.db_manager.rollback()
+            self.db_manager.disconnect()
+            return False
@@ -32,6 +32,7 @@ CREATE TABLE IF NOT EXISTS products (
     reorder_level INTEGER DEFAULT 10,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sku TEXT,
     FOREIGN KEY (category_id) REFERENCES categories (id)
 );
 
@@ -47,6 +48,8 @@ CREATE TABLE IF NOT EXISTS inventory (
 -- Create index for faster product searches
 CREATE INDEX IF NOT EXISTS idx_product_name ON products(name);
 CREATE INDEX IF NOT EXISTS idx_product_category ON products(category_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku ON products (sku);
+CREATE INDEX IF NOT EXISTS idx_inventory_product ON inventory (product_id);
 
 -- Customers table
 CREATE TABLE IF NOT EXISTS customers (
@@ -56,7 +59,8 @@ CREATE TABLE IF NOT EXISTS customers (
     email TEXT UNIQUE,
     address TEXT,
     loyalty_points INTEGER DEFAULT 0,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP
 );
 
 -- Shopping cart table
@@ -66,10 +70,28 @@ CREATE TABLE IF NOT EXISTS cart_items (
     product_id INTEGER NOT NULL,
     quantity INTEGER NOT NULL DEFAULT 1,
     added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    unit_price REAL,
     FOREIGN KEY (product_id) REFERENCES products (id)
 );
 
-CREATE TABLE stock_transactions (
+-- Baskets being rung up or suspended; their lines are in cart_items
+CREATE TABLE IF NOT EXISTS cart_sessions (
+    session_id TEXT PRIMARY KEY,
+    till_id TEXT NOT NULL,
+    user_id INTEGER,
+    customer_id INTEGER,
+    status TEXT NOT NULL DEFAULT 'active' CHECK (status IN ('active', 'suspended')),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    state TEXT,
+    FOREIGN KEY (user_id) REFERENCES users (id),
+    FOREIGN KEY (customer_id) REFERENCES customers (id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_cart_sessions_till ON cart_sessions (till_id, status);
+CREATE INDEX IF NOT EXISTS idx_cart_sessions_status ON cart_sessions (status, updated_at);
+CREATE INDEX IF NOT EXISTS idx_cart_sessions_customer ON cart_sessions (customer_id, status);
+
+CREATE TABLE IF NOT EXISTS stock_transactions (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     product_id INTEGER NOT NULL,
     quantity INTEGER NOT NULL,
@@ -94,6 +116,8 @@ CREATE TABLE IF NOT EXISTS invoices (
     payment_status TEXT NOT NULL,
     created_by INTEGER NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    client_ref TEXT,
+    card_last4 TEXT,
     FOREIGN KEY (customer_id) REFERENCES customers (id),
     FOREIGN KEY (created_by) REFERENCES users (id)
 );
@@ -123,4 +147,404 @@ CREATE TABLE IF NOT EXISTS inventory_transactions (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (product_id) REFERENCES products (id),
     FOREIGN KEY (created_by) REFERENCES users (id)
-);
\ No newline at end of file
+);
+
+-- Returns against past invoices; return_items repeats the invoice id so
+-- returnable quantities are summed per invoice without a join
+CREATE TABLE IF NOT EXISTS returns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    return_number TEXT UNIQUE NOT NULL,
+    invoice_id INTEGER NOT NULL,
+    customer_id INTEGER,
+    refund_amount REAL NOT NULL,
+    tax_refunded REAL NOT NULL DEFAULT 0,
+    refund_method TEXT NOT NULL,
+    points_reversed INTEGER NOT NULL DEFAULT 0,
+    points_restored INTEGER NOT NULL DEFAULT 0,
+    reason TEXT,
+    created_by INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (invoice_id) REFERENCES invoices (id),
+    FOREIGN KEY (customer_id) REFERENCES customers (id),
+    FOREIGN KEY (created_by) REFERENCES users (id)
+);
+
+CREATE TABLE IF NOT EXISTS return_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    return_id INTEGER NOT NULL,
+    invoice_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL CHECK (quantity > 0),
+    unit_price REAL NOT NULL,
+    total_price REAL NOT NULL,
+    restocked INTEGER NOT NULL DEFAULT 1,
+    FOREIGN KEY (return_id) REFERENCES returns (id),
+    FOREIGN KEY (invoice_id) REFERENCES invoices (id),
+    FOREIGN KEY (product_id) REFERENCES products (id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_returns_invoice ON returns (invoice_id);
+CREATE INDEX IF NOT EXISTS idx_return_items_invoice ON return_items (invoice_id, product_id);
+
+-- One row per tender taken for a sale, or paid out for a return (negative
+-- amount); amount is what the tender settled, net of change
+CREATE TABLE IF NOT EXISTS payments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    invoice_id INTEGER NOT NULL,
+    return_id INTEGER,
+    tender TEXT NOT NULL,
+    amount REAL NOT NULL,
+    tendered REAL NOT NULL,
+    change_given REAL NOT NULL DEFAULT 0,
+    card_last4 TEXT,
+    till_id TEXT,
+    created_by INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (invoice_id) REFERENCES invoices (id),
+    FOREIGN KEY (return_id) REFERENCES returns (id),
+    FOREIGN KEY (created_by) REFERENCES users (id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_payments_invoice ON payments (invoice_id);
+-- Covers the cash-up: a range of created_at grouped by till, cashier and tender
+CREATE INDEX IF NOT EXISTS idx_payments_cash_up ON payments (created_at, till_id, created_by, tender, amount, tendered, change_given);
+
+-- Till shifts. Counters are folded in from payments during the day and
+-- frozen by the Z report; closed shifts and days can't be changed
+CREATE TABLE IF NOT EXISTS shifts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    till_id TEXT NOT NULL,
+    business_date TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'open' CHECK (status IN ('open', 'closed')),
+    opened_by INTEGER,
+    opened_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    opening_float REAL NOT NULL DEFAULT 0,
+    sale_count INTEGER NOT NULL DEFAULT 0,
+    subtotal REAL NOT NULL DEFAULT 0,
+    tax_total REAL NOT NULL DEFAULT 0,
+    discount_total REAL NOT NULL DEFAULT 0,
+    gross_sales REAL NOT NULL DEFAULT 0,
+    refund_count INTEGER NOT NULL DEFAULT 0,
+    refund_total REAL NOT NULL DEFAULT 0,
+    tax_refunded REAL NOT NULL DEFAULT 0,
+    first_payment_id INTEGER NOT NULL DEFAULT 0,
+    last_payment_id INTEGER NOT NULL DEFAULT 0,
+    z_number INTEGER,
+    closed_by INTEGER,
+    closed_at TIMESTAMP,
+    FOREIGN KEY (opened_by) REFERENCES users (id),
+    FOREIGN KEY (closed_by) REFERENCES users (id)
+);
+
+CREATE TABLE IF NOT EXISTS shift_tenders (
+    shift_id INTEGER NOT NULL,
+    tender TEXT NOT NULL,
+    payment_count INTEGER NOT NULL DEFAULT 0,
+    taken REAL NOT NULL DEFAULT 0,
+    refunded REAL NOT NULL DEFAULT 0,
+    change_given REAL NOT NULL DEFAULT 0,
+    counted REAL,
+    PRIMARY KEY (shift_id, tender),
+    FOREIGN KEY (shift_id) REFERENCES shifts (id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS day_closes (
+    business_date TEXT PRIMARY KEY,
+    shift_count INTEGER NOT NULL,
+    sale_count INTEGER NOT NULL,
+    subtotal REAL NOT NULL,
+    tax_total REAL NOT NULL,
+    discount_total REAL NOT NULL,
+    gross_sales REAL NOT NULL,
+    refund_count INTEGER NOT NULL,
+    refund_total REAL NOT NULL,
+    tax_refunded REAL NOT NULL,
+    cash_variance REAL,
+    closed_by INTEGER NOT NULL,
+    closed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (closed_by) REFERENCES users (id)
+);
+
+CREATE TABLE IF NOT EXISTS shift_cursor (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_payment_id INTEGER NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_shifts_open_till ON shifts (till_id) WHERE status = 'open';
+CREATE INDEX IF NOT EXISTS idx_shifts_business_date ON shifts (business_date, status);
+-- A shift holds its till's payments with ids in (first_payment_id, last_payment_id]
+CREATE INDEX IF NOT EXISTS idx_shifts_till ON shifts (till_id, first_payment_id);
+
+-- Last payment folded into shift counters
+INSERT OR IGNORE INTO shift_cursor (id, last_payment_id) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS shifts_closed_locked
+BEFORE UPDATE ON shifts WHEN OLD.status = 'closed'
+BEGIN
+    SELECT RAISE(ABORT, 'shift is closed');
+END;
+
+CREATE TRIGGER IF NOT EXISTS shifts_closed_kept
+BEFORE DELETE ON shifts WHEN OLD.status = 'closed'
+BEGIN
+    SELECT RAISE(ABORT, 'shift is closed');
+END;
+
+CREATE TRIGGER IF NOT EXISTS shifts_day_closed
+BEFORE INSERT ON shifts WHEN EXISTS (SELECT 1 FROM day_closes WHERE business_date = NEW.business_date)
+BEGIN
+    SELECT RAISE(ABORT, 'day is closed');
+END;
+
+CREATE TRIGGER IF NOT EXISTS shift_tenders_insert_locked
+BEFORE INSERT ON shift_tenders WHEN (SELECT status FROM shifts WHERE id = NEW.shift_id) = 'closed'
+BEGIN
+    SELECT RAISE(ABORT, 'shift is closed');
+END;
+
+CREATE TRIGGER IF NOT EXISTS shift_tenders_update_locked
+BEFORE UPDATE ON shift_tenders WHEN (SELECT status FROM shifts WHERE id = OLD.shift_id) = 'closed'
+BEGIN
+    SELECT RAISE(ABORT, 'shift is closed');
+END;
+
+CREATE TRIGGER IF NOT EXISTS shift_tenders_delete_locked
+BEFORE DELETE ON shift_tenders WHEN (SELECT status FROM shifts WHERE id = OLD.shift_id) = 'closed'
+BEGIN
+    SELECT RAISE(ABORT, 'shift is closed');
+END;
+
+CREATE TRIGGER IF NOT EXISTS day_closes_update_locked
+BEFORE UPDATE ON day_closes
+BEGIN
+    SELECT RAISE(ABORT, 'day is closed');
+END;
+
+CREATE TRIGGER IF NOT EXISTS day_closes_delete_locked
+BEFORE DELETE ON day_closes
+BEGIN
+    SELECT RAISE(ABORT, 'day is closed');
+END;
+
+-- Manifest of invoice months moved to per-month archive files
+CREATE TABLE IF NOT EXISTS invoice_archives (
+    period TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    first_invoice_id INTEGER NOT NULL,
+    last_invoice_id INTEGER NOT NULL,
+    invoice_count INTEGER NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Quick switch PINs for shared tills
+CREATE TABLE IF NOT EXISTS user_pins (
+    user_id INTEGER PRIMARY KEY,
+    pin_hash TEXT NOT NULL,
+    salt TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+
+-- Loyalty points ledger; customers.loyalty_points holds the running balance
+CREATE TABLE IF NOT EXISTS loyalty_ledger (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_id INTEGER NOT NULL,
+    invoice_id INTEGER,
+    entry_type TEXT NOT NULL CHECK (entry_type IN ('earn', 'redeem', 'expire', 'adjust')),
+    points INTEGER NOT NULL,
+    remaining INTEGER NOT NULL DEFAULT 0,
+    expires_at DATE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (customer_id) REFERENCES customers (id),
+    FOREIGN KEY (invoice_id) REFERENCES invoices (id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_loyalty_ledger_customer ON loyalty_ledger (customer_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_loyalty_ledger_open_lots ON loyalty_ledger (expires_at) WHERE remaining > 0;
+
+-- Indexes for invoice, report and stock lookups
+CREATE INDEX IF NOT EXISTS idx_invoices_created_at ON invoices (created_at);
+CREATE INDEX IF NOT EXISTS idx_invoices_customer ON invoices (customer_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_invoices_client_ref ON invoices (client_ref);
+CREATE INDEX IF NOT EXISTS idx_invoices_card_last4 ON invoices (card_last4, created_at) WHERE card_last4 IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice ON invoice_items (invoice_id);
+CREATE INDEX IF NOT EXISTS idx_invoice_items_product ON invoice_items (product_id);
+CREATE INDEX IF NOT EXISTS idx_inventory_transactions_product ON inventory_transactions (product_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_stock_transactions_product ON stock_transactions (product_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_cart_items_session ON cart_items (session_id, product_id);
+
+-- Effective-dated prices; products.price holds the price in force now
+CREATE TABLE IF NOT EXISTS price_list_entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id INTEGER NOT NULL,
+    store_id INTEGER,
+    price REAL NOT NULL,
+    cost_price REAL,
+    effective_from TIMESTAMP NOT NULL,
+    note TEXT,
+    created_by INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (product_id) REFERENCES products (id),
+    FOREIGN KEY (created_by) REFERENCES users (id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_price_list_product ON price_list_entries (product_id, effective_from);
+CREATE INDEX IF NOT EXISTS idx_price_list_effective ON price_list_entries (effective_from);
+
+-- Change log shipped to head office (utils/replication.py). Triggers only
+-- log while replication is enabled in replication_state
+CREATE TABLE IF NOT EXISTS replication_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS replication_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TRIGGER IF NOT EXISTS replicate_invoices_insert
+AFTER INSERT ON invoices
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('invoices', NEW.id, json_object('id', NEW.id, 'invoice_number', NEW.invoice_number, 'customer_id', NEW.customer_id, 'total_amount', NEW.total_amount, 'tax_amount', NEW.tax_amount, 'discount_amount', NEW.discount_amount, 'final_amount', NEW.final_amount, 'payment_method', NEW.payment_method, 'payment_status', NEW.payment_status, 'card_last4', NEW.card_last4, 'client_ref', NEW.client_ref, 'created_by', NEW.created_by, 'created_at', NEW.created_at));
+END;
+
+CREATE TRIGGER IF NOT EXISTS replicate_invoices_update
+AFTER UPDATE ON invoices
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('invoices', NEW.id, json_object('id', NEW.id, 'invoice_number', NEW.invoice_number, 'customer_id', NEW.customer_id, 'total_amount', NEW.total_amount, 'tax_amount', NEW.tax_amount, 'discount_amount', NEW.discount_amount, 'final_amount', NEW.final_amount, 'payment_method', NEW.payment_method, 'payment_status', NEW.payment_status, 'card_last4', NEW.card_last4, 'client_ref', NEW.client_ref, 'created_by', NEW.created_by, 'created_at', NEW.created_at));
+END;
+
+CREATE TRIGGER IF NOT EXISTS replicate_invoice_items_insert
+AFTER INSERT ON invoice_items
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('invoice_items', NEW.id, json_object('id', NEW.id, 'invoice_id', NEW.invoice_id, 'product_id', NEW.product_id, 'quantity', NEW.quantity, 'unit_price', NEW.unit_price, 'total_price', NEW.total_price, 'created_at', NEW.created_at));
+END;
+
+CREATE TRIGGER IF NOT EXISTS replicate_invoice_items_update
+AFTER UPDATE ON invoice_items
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('invoice_items', NEW.id, json_object('id', NEW.id, 'invoice_id', NEW.invoice_id, 'product_id', NEW.product_id, 'quantity', NEW.quantity, 'unit_price', NEW.unit_price, 'total_price', NEW.total_price, 'created_at', NEW.created_at));
+END;
+
+CREATE TRIGGER IF NOT EXISTS replicate_returns_insert
+AFTER INSERT ON returns
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('returns', NEW.id, json_object('id', NEW.id, 'return_number', NEW.return_number, 'invoice_id', NEW.invoice_id, 'customer_id', NEW.customer_id, 'refund_amount', NEW.refund_amount, 'tax_refunded', NEW.tax_refunded, 'refund_method', NEW.refund_method, 'points_reversed', NEW.points_reversed, 'points_restored', NEW.points_restored, 'reason', NEW.reason, 'created_by', NEW.created_by, 'created_at', NEW.created_at));
+END;
+
+CREATE TRIGGER IF NOT EXISTS replicate_returns_update
+AFTER UPDATE ON returns
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('returns', NEW.id, json_object('id', NEW.id, 'return_number', NEW.return_number, 'invoice_id', NEW.invoice_id, 'customer_id', NEW.customer_id, 'refund_amount', NEW.refund_amount, 'tax_refunded', NEW.tax_refunded, 'refund_method', NEW.refund_method, 'points_reversed', NEW.points_reversed, 'points_restored', NEW.points_restored, 'reason', NEW.reason, 'created_by', NEW.created_by, 'created_at', NEW.created_at));
+END;
+
+CREATE TRIGGER IF NOT EXISTS replicate_return_items_insert
+AFTER INSERT ON return_items
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('return_items', NEW.id, json_object('id', NEW.id, 'return_id', NEW.return_id, 'invoice_id', NEW.invoice_id, 'product_id', NEW.product_id, 'quantity', NEW.quantity, 'unit_price', NEW.unit_price, 'total_price', NEW.total_price, 'restocked', NEW.restocked));
+END;
+
+CREATE TRIGGER IF NOT EXISTS replicate_return_items_update
+AFTER UPDATE ON return_items
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('return_items', NEW.id, json_object('id', NEW.id, 'return_id', NEW.return_id, 'invoice_id', NEW.invoice_id, 'product_id', NEW.product_id, 'quantity', NEW.quantity, 'unit_price', NEW.unit_price, 'total_price', NEW.total_price, 'restocked', NEW.restocked));
+END;
+
+CREATE TRIGGER IF NOT EXISTS replicate_payments_insert
+AFTER INSERT ON payments
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('payments', NEW.id, json_object('id', NEW.id, 'invoice_id', NEW.invoice_id, 'return_id', NEW.return_id, 'tender', NEW.tender, 'amount', NEW.amount, 'tendered', NEW.tendered, 'change_given', NEW.change_given, 'card_last4', NEW.card_last4, 'till_id', NEW.till_id, 'created_by', NEW.created_by, 'created_at', NEW.created_at));
+END;
+
+CREATE TRIGGER IF NOT EXISTS replicate_payments_update
+AFTER UPDATE ON payments
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('payments', NEW.id, json_object('id', NEW.id, 'invoice_id', NEW.invoice_id, 'return_id', NEW.return_id, 'tender', NEW.tender, 'amount', NEW.amount, 'tendered', NEW.tendered, 'change_given', NEW.change_given, 'card_last4', NEW.card_last4, 'till_id', NEW.till_id, 'created_by', NEW.created_by, 'created_at', NEW.created_at));
+END;
+
+CREATE TRIGGER IF NOT EXISTS replicate_inventory_insert
+AFTER INSERT ON inventory
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('inventory', NEW.id, json_object('id', NEW.id, 'product_id', NEW.product_id, 'quantity', NEW.quantity, 'last_updated', NEW.last_updated, 'last_restock_date', NEW.last_restock_date));
+END;
+
+CREATE TRIGGER IF NOT EXISTS replicate_inventory_update
+AFTER UPDATE ON inventory
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('inventory', NEW.id, json_object('id', NEW.id, 'product_id', NEW.product_id, 'quantity', NEW.quantity, 'last_updated', NEW.last_updated, 'last_restock_date', NEW.last_restock_date));
+END;
+
+CREATE TRIGGER IF NOT EXISTS replicate_inventory_transactions_insert
+AFTER INSERT ON inventory_transactions
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('inventory_transactions', NEW.id, json_object('id', NEW.id, 'product_id', NEW.product_id, 'quantity_change', NEW.quantity_change, 'transaction_type', NEW.transaction_type, 'reference_id', NEW.reference_id, 'notes', NEW.notes, 'created_by', NEW.created_by, 'created_at', NEW.created_at));
+END;
+
+CREATE TRIGGER IF NOT EXISTS replicate_inventory_transactions_update
+AFTER UPDATE ON inventory_transactions
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('inventory_transactions', NEW.id, json_object('id', NEW.id, 'product_id', NEW.product_id, 'quantity_change', NEW.quantity_change, 'transaction_type', NEW.transaction_type, 'reference_id', NEW.reference_id, 'notes', NEW.notes, 'created_by', NEW.created_by, 'created_at', NEW.created_at));
+END;
+
+CREATE TRIGGER IF NOT EXISTS replicate_stock_transactions_insert
+AFTER INSERT ON stock_transactions
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('stock_transactions', NEW.id, json_object('id', NEW.id, 'product_id', NEW.product_id, 'quantity', NEW.quantity, 'type', NEW.type, 'notes', NEW.notes, 'user_id', NEW.user_id, 'created_at', NEW.created_at));
+END;
+
+CREATE TRIGGER IF NOT EXISTS replicate_stock_transactions_update
+AFTER UPDATE ON stock_transactions
+WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+BEGIN
+    INSERT INTO replication_log (table_name, row_id, payload)
+    VALUES ('stock_transactions', NEW.id, json_object('id', NEW.id, 'product_id', NEW.product_id, 'quantity', NEW.quantity, 'type', NEW.type, 'notes', NEW.notes, 'user_id', NEW.user_id, 'created_at', NEW.created_at));
+END;
+
+-- Customer change times, read by the search index refresh (utils/customer_index.py)
+CREATE INDEX IF NOT EXISTS idx_customers_updated_at ON customers (updated_at);
+
+CREATE TRIGGER IF NOT EXISTS customers_touch_insert
+AFTER INSERT ON customers WHEN NEW.updated_at IS NULL
+BEGIN
+    UPDATE customers SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS customers_touch_update
+AFTER UPDATE OF name, phone ON customers
+BEGIN
+    UPDATE customers SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+END;
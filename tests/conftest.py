@@ -0,0 +1,66 @@
+import os
+import sys
+
+import pytest
+
+# Tests import the application modules the way main.py does, from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_manager import DatabaseManager
+from models.invoice import Invoice
+from utils.benchmark import build_fixture
+from utils.offline_journal import OfflineJournal, get_offline_journal, set_offline_journal
+
+TILL = "TEST-TILL"
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    """A fresh store database with a small catalog and stock to sell from"""
+    db_path = str(tmp_path / "store.db")
+    build_fixture(db_path, 5, 0, 1)
+    return DatabaseManager(db_path)
+
+
+@pytest.fixture(autouse=True)
+def offline_journal(tmp_path):
+    """Keep sales a test queues offline off the till's own journal"""
+    previous = get_offline_journal()
+    journal = OfflineJournal(str(tmp_path / "offline_journal.db"))
+    set_offline_journal(journal)
+    yield journal
+    set_offline_journal(previous)
+
+
+@pytest.fixture
+def sell(db_manager):
+    """Ring up a sale of (product_id, quantity, unit_price) lines on the test till
+
+    Tax is 10% of the lines and the tenders default to cash for the exact
+    amount; returns the invoice id.
+    """
+    invoice_model = Invoice(db_manager)
+
+    def sell(lines, tenders=None, discount=0.0):
+        items = [{'product_id': product_id, 'quantity': quantity, 'unit_price': unit_price,
+                  'total_price': round(quantity * unit_price, 2)} for product_id, quantity, unit_price in lines]
+        subtotal = round(sum(item['total_price'] for item in items), 2)
+        tax = round(subtotal * 0.1, 2)
+        final = round(subtotal + tax - discount, 2)
+        success, invoice_id, _ = invoice_model.create_invoice(
+            None, items, subtotal, tax, discount, final, 'Cash', 'paid', 1,
+            tenders=tenders, till_id=TILL
+        )
+        assert success and invoice_id is not None
+        return invoice_id
+
+    return sell
+
+
+def query(db_manager, query, params=()):
+    """Run a query against the store database outside the models"""
+    db_manager.connect()
+    try:
+        return [dict(row) for row in db_manager.fetch_all(query, params)]
+    finally:
+        db_manager.disconnect()
@@ -0,0 +1,47 @@
+import pytest
+
+from models.payment import settle_tenders, payment_method_for, SPLIT_PAYMENT_METHOD
+
+
+def test_cash_gives_change():
+    [payment] = settle_tenders(12.30, [{'tender': 'Cash', 'tendered': 20}])
+    assert payment['amount'] == 12.30
+    assert payment['tendered'] == 20.00
+    assert payment['change_given'] == 7.70
+
+
+def test_tender_left_out_pays_what_is_due():
+    [payment] = settle_tenders(9.99, [{'tender': 'Debit Card'}])
+    assert (payment['amount'], payment['tendered'], payment['change_given']) == (9.99, 9.99, 0)
+
+
+def test_card_is_applied_before_cash_and_cash_gives_the_change():
+    payments = settle_tenders(15.00, [
+        {'tender': 'Cash', 'tendered': 20},
+        {'tender': 'Credit Card', 'tendered': 6, 'card_last4': '4242'},
+    ])
+    assert [payment['tender'] for payment in payments] == ['Credit Card', 'Cash']
+    card, cash = payments
+    assert (card['amount'], card['change_given'], card['card_last4']) == (6.00, 0, '4242')
+    assert (cash['amount'], cash['tendered'], cash['change_given']) == (9.00, 20.00, 11.00)
+    assert payment_method_for(payments) == SPLIT_PAYMENT_METHOD
+
+
+def test_amounts_are_settled_in_cents():
+    payments = settle_tenders(0.30, [{'tender': 'Mobile Payment', 'tendered': 0.1},
+                                     {'tender': 'Cash', 'tendered': 0.2}])
+    assert sum(payment['amount'] for payment in payments) == pytest.approx(0.30)
+    assert all(payment['change_given'] == 0 for payment in payments)
+
+
+@pytest.mark.parametrize("amount_due, tenders, message", [
+    (10.00, [], "No payment tendered"),
+    (10.00, [{'tender': 'Cash', 'tendered': 9.99}], "0.01 is still due"),
+    (10.00, [{'tender': 'Credit Card', 'tendered': 10.01}], "can't be more than"),
+    (10.00, [{'tender': 'Cheque', 'tendered': 10}], "Unknown tender"),
+    (10.00, [{'tender': 'Cash', 'tendered': 0}], "must be more than zero"),
+    (10.00, [{'tender': 'Credit Card', 'tendered': 10}, {'tender': 'Cash', 'tendered': 5}], "already paid"),
+])
+def test_tenders_that_do_not_settle_are_refused(amount_due, tenders, message):
+    with pytest.raises(ValueError, match=message):
+        settle_tenders(amount_due, tenders)
@@ -0,0 +1,83 @@
+import pytest
+
+from models.refund import Refund
+from conftest import TILL, query
+
+# Two of product 1 at 10.00 and one of product 2 at 5.00, plus 10% tax: 27.50,
+# paid 20.00 by card and the rest in cash
+SPLIT_SALE = [(1, 2, 10.00), (2, 1, 5.00)]
+SPLIT_TENDERS = [{'tender': 'Credit Card', 'tendered': 20, 'card_last4': '4242'},
+                 {'tender': 'Cash', 'tendered': 10}]
+
+
+def tender_totals(db_manager, invoice_id):
+    rows = query(db_manager, "SELECT tender, SUM(amount) AS amount FROM payments WHERE invoice_id = ? GROUP BY tender",
+                 (invoice_id,))
+    return {row['tender']: round(row['amount'], 2) for row in rows}
+
+
+@pytest.fixture
+def refund_model(db_manager):
+    return Refund(db_manager)
+
+
+def test_partial_return_refunds_its_share_to_the_first_tender(db_manager, sell, refund_model):
+    invoice_id = sell(SPLIT_SALE, SPLIT_TENDERS)
+    assert tender_totals(db_manager, invoice_id) == {'Credit Card': 20.00, 'Cash': 7.50}
+
+    success, result = refund_model.process_return(invoice_id, {1: 1}, 1, till_id=TILL)
+    assert success, result
+    # 10.00 of a 25.00 subtotal: 40% of what was paid and of the tax
+    assert result['refund_amount'] == 11.00
+    assert result['tax_refunded'] == 1.00
+    assert [(payout['tender'], payout['amount']) for payout in result['payments']] == [('Credit Card', -11.00)]
+    assert result['refund_method'] == 'Credit Card'
+    assert tender_totals(db_manager, invoice_id) == {'Credit Card': 9.00, 'Cash': 7.50}
+
+
+def test_completing_return_refunds_what_is_left_across_tenders(db_manager, sell, refund_model):
+    invoice_id = sell(SPLIT_SALE, SPLIT_TENDERS)
+    assert refund_model.process_return(invoice_id, {1: 1}, 1, till_id=TILL)[0]
+
+    success, result = refund_model.process_return(invoice_id, {1: 1, 2: 1}, 1, till_id=TILL)
+    assert success, result
+    assert result['refund_amount'] == 16.50
+    assert result['tax_refunded'] == 1.50
+    assert {payout['tender']: payout['amount'] for payout in result['payments']} == \
+        {'Credit Card': -9.00, 'Cash': -7.50}
+    # Every tender is paid back exactly what it paid, not a cent more
+    assert tender_totals(db_manager, invoice_id) == {'Credit Card': 0, 'Cash': 0}
+
+
+def test_uneven_shares_still_refund_the_whole_sale(db_manager, sell, refund_model):
+    invoice_id = sell([(1, 3, 3.33)], [{'tender': 'Debit Card', 'tendered': 5}, {'tender': 'Cash', 'tendered': 6}])
+    refunded = 0
+    for _ in range(3):
+        success, result = refund_model.process_return(invoice_id, {1: 1}, 1, till_id=TILL)
+        assert success, result
+        refunded += result['refund_amount']
+    assert round(refunded, 2) == 10.99
+    assert tender_totals(db_manager, invoice_id) == {'Debit Card': 0, 'Cash': 0}
+
+
+def test_goods_cannot_be_refunded_twice(db_manager, sell, refund_model):
+    invoice_id = sell(SPLIT_SALE, SPLIT_TENDERS)
+    assert refund_model.process_return(invoice_id, {2: 1}, 1, till_id=TILL)[0]
+
+    success, message = refund_model.process_return(invoice_id, {2: 1}, 1, till_id=TILL)
+    assert not success
+    assert message.startswith("Only 0 of")
+
+    success, message = refund_model.process_return(invoice_id, {1: 3}, 1, till_id=TILL)
+    assert not success
+    assert message.startswith("Only 2 of")
+
+    returns = query(db_manager, "SELECT COUNT(*) AS count FROM returns WHERE invoice_id = ?", (invoice_id,))
+    assert returns[0]['count'] == 1
+
+
+def test_product_not_on_the_invoice_is_refused(sell, refund_model):
+    invoice_id = sell([(1, 1, 2.00)])
+    success, message = refund_model.process_return(invoice_id, {3: 1}, 1, till_id=TILL)
+    assert not success
+    assert "is not on invoice" in message
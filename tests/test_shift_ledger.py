@@ -0,0 +1,102 @@
+import pytest
+
+from models.refund import Refund
+from utils.shift_ledger import get_shift_ledger
+from conftest import TILL, query
+
+
+@pytest.fixture
+def ledger(db_manager):
+    return get_shift_ledger(db_manager)
+
+
+@pytest.fixture
+def trading(db_manager, sell, ledger):
+    """A shift with three sales in mixed tenders and a return of part of one"""
+    assert ledger.open_shift(TILL, 1, opening_float=50.0)[0]
+    sell([(1, 2, 4.50)], [{'tender': 'Cash', 'tendered': 10}])
+    split = sell([(2, 1, 12.00), (3, 3, 1.25)], [{'tender': 'Credit Card', 'tendered': 10, 'card_last4': '1111'},
+                                                 {'tender': 'Cash', 'tendered': 20}])
+    sell([(4, 1, 7.99)], [{'tender': 'Mobile Payment'}], discount=0.79)
+    assert Refund(db_manager).process_return(split, {3: 1}, 1, till_id=TILL)[0]
+
+
+def expected_counters(db_manager):
+    # The counters recomputed from the payments, invoices and returns themselves
+    sales = query(db_manager, """
+        SELECT COUNT(*) AS sale_count, SUM(final_amount) AS gross_sales, SUM(tax_amount) AS tax_total,
+               SUM(discount_amount) AS discount_total
+        FROM invoices
+    """)[0]
+    refunds = query(db_manager, "SELECT COUNT(*) AS refund_count, SUM(refund_amount) AS refund_total FROM returns")[0]
+    tenders = query(db_manager, """
+        SELECT tender, SUM(amount > 0) AS payment_count, SUM(MAX(amount, 0)) AS taken,
+               -SUM(MIN(amount, 0)) AS refunded, SUM(change_given) AS change_given
+        FROM payments GROUP BY tender
+    """)
+    return dict(sales, **refunds), {row['tender']: row for row in tenders}
+
+
+def assert_matches(report, db_manager):
+    counters, tenders = expected_counters(db_manager)
+    for key, value in counters.items():
+        assert report[key] == pytest.approx(value), key
+    assert {tender['tender'] for tender in report['tenders']} == set(tenders)
+    for tender in report['tenders']:
+        expected = tenders[tender['tender']]
+        for key in ('payment_count', 'taken', 'refunded', 'change_given'):
+            assert tender[key] == pytest.approx(expected[key]), (tender['tender'], key)
+        assert tender['net'] == pytest.approx(expected['taken'] - expected['refunded'])
+
+
+def test_x_report_matches_the_payments(db_manager, ledger, trading):
+    report = ledger.x_report(TILL)
+    assert report['status'] == 'open'
+    assert_matches(report, db_manager)
+    assert report['sale_count'] == 3 and report['refund_count'] == 1
+    cash = next(tender for tender in report['tenders'] if tender['tender'] == 'Cash')
+    assert cash['expected'] == pytest.approx(cash['net'] + 50.0)
+
+
+def test_counters_are_not_folded_twice(db_manager, ledger, trading):
+    ledger.fold()
+    ledger.fold()
+    assert_matches(ledger.x_report(TILL), db_manager)
+
+
+def test_z_report_and_day_close_match_the_payments(db_manager, ledger, trading):
+    success, z_report = ledger.close_shift(TILL, 1, counted={'Cash': 80.0})
+    assert success, z_report
+    assert z_report['status'] == 'closed' and z_report['z_number'] == 1
+    assert_matches(z_report, db_manager)
+
+    business_date = z_report['business_date']
+    day_totals = ledger.get_day_totals(business_date)
+    counters, _ = expected_counters(db_manager)
+    for key, value in counters.items():
+        assert day_totals[key] == pytest.approx(value), key
+
+    success, day = ledger.close_day(business_date, 1)
+    assert success, day
+    assert day['shift_count'] == 1
+    assert_matches(day, db_manager)
+    assert ledger.close_day(business_date, 1) == (False, f"{business_date} is already closed")
+
+
+def test_sales_after_the_close_go_to_a_new_shift(db_manager, sell, ledger, trading):
+    success, z_report = ledger.close_shift(TILL, 1)
+    assert success, z_report
+    sell([(5, 1, 3.00)], [{'tender': 'Cash', 'tendered': 5}])
+
+    report = ledger.x_report(TILL)
+    assert report['id'] != z_report['id']
+    assert report['sale_count'] == 1
+    assert report['gross_sales'] == pytest.approx(3.30)
+    assert ledger.get_shift_report(z_report['id'])['sale_count'] == 3
+
+
+def test_day_with_an_open_shift_cannot_be_closed(ledger, trading):
+    business_date = ledger.x_report(TILL)['business_date']
+    success, message = ledger.close_day(business_date, 1)
+    assert not success
+    assert TILL in message
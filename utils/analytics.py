@@ -0,0 +1,358 @@
+import os
+import json
+import datetime
+
+try:
+    import numpy as np
+except ImportError:  # The snapshot is optional; reports fall back to SQL
+    np = None
+
+from config import ANALYTICS_DIRECTORY
+from utils.invoice_archive import report_tables, last_archived_invoice_id
+
+# Day numbers are stored as days since 1970-01-01
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+EPOCH_JULIAN_DAY = 2440587.5
+
+# Column layouts of the two snapshot tables
+LINE_COLUMNS = (
+    ('item_id', 'int64'),
+    ('invoice_id', 'int64'),
+    ('product_id', 'int64'),
+    ('category_id', 'int64'),
+    ('day', 'int32'),
+    ('quantity', 'int64'),
+    ('total_price', 'float64'),
+)
+
+INVOICE_COLUMNS = (
+    ('invoice_id', 'int64'),
+    ('day', 'int32'),
+    ('final_amount', 'float64'),
+    ('payment_method', 'int32'),
+    ('item_count', 'int32'),
+)
+
+CHUNK_SIZE = 50000
+
+
+def date_to_day(value):
+    """Convert a YYYY-MM-DD string or date to a snapshot day number"""
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value[:10])
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def day_to_date(day):
+    """Convert a snapshot day number back to a YYYY-MM-DD string"""
+    return datetime.date.fromordinal(int(day) + EPOCH_ORDINAL).isoformat()
+
+
+class SalesSnapshot:
+    """Columnar, memory-mapped copy of invoices and invoice lines.
+
+    Each column is a flat binary file that only ever grows: refresh() appends
+    the rows created since the last watermark, and queries run vectorized over
+    memory-mapped arrays instead of iterating sqlite3.Row objects. A full
+    build reads archived months through report_tables(); archiving later
+    only moves rows the snapshot already has, and new ids are always hot.
+    """
+
+    def __init__(self, db_manager, directory=None):
+        self.db_manager = db_manager
+        self.directory = directory or ANALYTICS_DIRECTORY
+        self.meta = None
+        self._columns = {}
+
+    @staticmethod
+    def is_available():
+        """Check whether NumPy is installed"""
+        return np is not None
+
+    # Storage helpers
+    def _meta_path(self):
+        return os.path.join(self.directory, 'meta.json')
+
+    def _column_path(self, table, name):
+        return os.path.join(self.directory, f"{table}.{name}.bin")
+
+    def _empty_meta(self):
+        return {
+            'db_path': os.path.abspath(self.db_manager.db_path),
+            'lines': {'rows': 0, 'last_id': 0},
+            'invoices': {'rows': 0, 'last_id': 0},
+            'payment_methods': [],
+        }
+
+    def _load_meta(self):
+        if self.meta is not None:
+            return self.meta
+
+        try:
+            with open(self._meta_path(), 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+
+        # A snapshot built from another database file is useless here
+        if not meta or meta.get('db_path') != os.path.abspath(self.db_manager.db_path):
+            meta = self._empty_meta()
+            self._reset_files()
+
+        self.meta = meta
+        return meta
+
+    def _save_meta(self):
+        tmp_path = self._meta_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self._meta_path())
+
+    def _reset_files(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for table, columns in (('lines', LINE_COLUMNS), ('invoices', INVOICE_COLUMNS)):
+            for name, _ in columns:
+                path = self._column_path(table, name)
+                if os.path.exists(path):
+                    os.remove(path)
+        self._columns = {}
+
+    def _append(self, table, columns, values):
+        """Append one chunk of column values to the column files"""
+        # Release the memory maps before the files change underneath them
+        self._columns.pop(table, None)
+        rows = self.meta[table]['rows']
+        for (name, dtype), column in zip(columns, values):
+            data = np.asarray(column, dtype=dtype)
+            path = self._column_path(table, name)
+            with open(path, 'ab') as f:
+                # Drop bytes left behind by an interrupted refresh
+                f.truncate(rows * np.dtype(dtype).itemsize)
+                data.tofile(f)
+        self.meta[table]['rows'] = rows + len(values[0])
+
+    def _payment_method_code(self, method):
+        methods = self.meta['payment_methods']
+        if method not in methods:
+            methods.append(method)
+        return methods.index(method)
+
+    def _table(self, table):
+        """Get the memory-mapped columns of a table"""
+        if table in self._columns:
+            return self._columns[table]
+
+        columns = LINE_COLUMNS if table == 'lines' else INVOICE_COLUMNS
+        rows = self._load_meta()[table]['rows']
+        arrays = {}
+        for name, dtype in columns:
+            if rows:
+                arrays[name] = np.memmap(
+                    self._column_path(table, name), dtype=dtype, mode='r', shape=(rows,)
+                )
+            else:
+                arrays[name] = np.zeros(0, dtype=dtype)
+        self._columns[table] = arrays
+        return arrays
+
+    # Refresh
+    def refresh(self):
+        """Append invoices and invoice lines created since the last refresh"""
+        if np is None:
+            return False
+
+        meta = self._load_meta()
+
+        try:
+            self.db_manager.connect()
+
+            newest = self.db_manager.fetch_one("SELECT COALESCE(MAX(id), 0) AS id FROM invoices")
+            if max(newest['id'], last_archived_invoice_id(self.db_manager)) < meta['invoices']['last_id']:
+                # Invoices disappeared without being archived (restored backup), start over
+                self.meta = meta = self._empty_meta()
+                self._reset_files()
+
+            # Archives are attached before the read transaction starts
+            invoices, invoice_items = 'invoices', 'invoice_items'
+            if not meta['invoices']['last_id']:
+                invoices, invoice_items = report_tables(self.db_manager)
+
+            # Read both tables from one consistent view of the database
+            self.db_manager.execute("BEGIN")
+
+            cursor = self.db_manager.cursor
+            cursor.execute(
+                f"""
+                SELECT i.id, COALESCE(CAST(julianday(DATE(i.created_at)) - ? AS INTEGER), -1),
+                       i.final_amount, i.payment_method,
+                       (SELECT COUNT(*) FROM {invoice_items} ii WHERE ii.invoice_id = i.id)
+                FROM {invoices} i
+                WHERE i.id > ?
+                ORDER BY i.id
+                """,
+                (EPOCH_JULIAN_DAY, meta['invoices']['last_id'])
+            )
+            while True:
+                rows = cursor.fetchmany(CHUNK_SIZE)
+                if not rows:
+                    break
+                ids, days, amounts, methods, counts = zip(*rows)
+                codes = [self._payment_method_code(method) for method in methods]
+                self._append('invoices', INVOICE_COLUMNS, (ids, days, amounts, codes, counts))
+                meta['invoices']['last_id'] = ids[-1]
+
+            cursor.execute(
+                f"""
+                SELECT ii.id, ii.invoice_id, ii.product_id, COALESCE(p.category_id, 0),
+                       COALESCE(CAST(julianday(DATE(i.created_at)) - ? AS INTEGER), -1),
+                       ii.quantity, ii.total_price
+                FROM {invoice_items} ii
+                JOIN {invoices} i ON ii.invoice_id = i.id
+                LEFT JOIN products p ON ii.product_id = p.id
+                WHERE ii.id > ?
+                ORDER BY ii.id
+                """,
+                (EPOCH_JULIAN_DAY, meta['lines']['last_id'])
+            )
+            while True:
+                rows = cursor.fetchmany(CHUNK_SIZE)
+                if not rows:
+                    break
+                self._append('lines', LINE_COLUMNS, tuple(zip(*rows)))
+                meta['lines']['last_id'] = rows[-1][0]
+
+            self.db_manager.rollback()
+            self._save_meta()
+            return True
+        except Exception as e:
+            print(f"Error refreshing analytics snapshot: {e}")
+            self.db_manager.rollback()
+            return False
+        finally:
+            self.db_manager.disconnect()
+
+    def rebuild(self):
+        """Discard the snapshot and export everything again"""
+        self.meta = self._empty_meta()
+        self._reset_files()
+        return self.refresh()
+
+    # Queries
+    def _day_mask(self, days, from_date, to_date):
+        return (days >= date_to_day(from_date)) & (days <= date_to_day(to_date))
+
+    def _lookup_names(self, query, ids):
+        """Fetch an id -> name mapping for a handful of ids"""
+        if not ids:
+            return {}
+        placeholders = ", ".join("?" for _ in ids)
+        try:
+            self.db_manager.connect()
+            rows = self.db_manager.fetch_all(query.format(placeholders=placeholders), ids)
+            return {row['id']: row for row in rows}
+        finally:
+            self.db_manager.disconnect()
+
+    def top_selling_products(self, from_date, to_date, limit=10):
+        """Get top selling products for a date range"""
+        lines = self._table('lines')
+        mask = self._day_mask(lines['day'], from_date, to_date)
+        product_ids = lines['product_id'][mask]
+        if not len(product_ids) or limit <= 0:
+            return []
+
+        quantities = np.bincount(product_ids, weights=lines['quantity'][mask])
+        sales = np.bincount(product_ids, weights=lines['total_price'][mask])
+
+        sold = np.flatnonzero(quantities)
+        if len(sold) > limit:
+            sold = sold[np.argpartition(-quantities[sold], limit - 1)[:limit]]
+        top = sold[np.argsort(-quantities[sold], kind='stable')]
+
+        ids = [int(product_id) for product_id in top]
+        products = self._lookup_names(
+            """
+            SELECT p.id, p.name, c.name AS category_name
+            FROM products p
+            LEFT JOIN categories c ON p.category_id = c.id
+            WHERE p.id IN ({placeholders})
+            """,
+            ids
+        )
+
+        return [{
+            'id': product_id,
+            'name': products[product_id]['name'] if product_id in products else None,
+            'category_name': products[product_id]['category_name'] if product_id in products else None,
+            'total_quantity': int(quantities[product_id]),
+            'total_sales': float(sales[product_id])
+        } for product_id in ids]
+
+    def sales_by_category(self, from_date, to_date):
+        """Get sales by category for a date range"""
+        lines = self._table('lines')
+        mask = self._day_mask(lines['day'], from_date, to_date)
+        category_ids = lines['category_id'][mask]
+        if not len(category_ids):
+            return []
+
+        counts = np.bincount(category_ids)
+        quantities = np.bincount(category_ids, weights=lines['quantity'][mask])
+        sales = np.bincount(category_ids, weights=lines['total_price'][mask])
+
+        present = np.flatnonzero(counts)
+        ordered = present[np.argsort(-sales[present], kind='stable')]
+
+        ids = [int(category_id) for category_id in ordered]
+        categories = self._lookup_names(
+            "SELECT id, name FROM categories WHERE id IN ({placeholders})", ids
+        )
+
+        return [{
+            'category_name': categories[category_id]['name'] if category_id in categories else None,
+            'total_quantity': int(quantities[category_id]),
+            'total_sales': float(sales[category_id])
+        } for category_id in ids]
+
+    def daily_sales(self, from_date, to_date):
+        """Get daily sales for a date range"""
+        invoices = self._table('invoices')
+        mask = self._day_mask(invoices['day'], from_date, to_date)
+        days = invoices['day'][mask]
+        if not len(days):
+            return []
+
+        first_day = date_to_day(from_date)
+        offsets = days - first_day
+        counts = np.bincount(offsets)
+        totals = np.bincount(offsets, weights=invoices['final_amount'][mask])
+
+        return [{
+            'date': day_to_date(first_day + offset),
+            'invoice_count': int(counts[offset]),
+            'total_sales': float(totals[offset])
+        } for offset in np.flatnonzero(counts)]
+
+    def sales_summary(self, from_date, to_date):
+        """Get sales summary for a date range"""
+        invoices = self._table('invoices')
+        # Invoices without lines are left out, as in Invoice.get_sales_report
+        mask = self._day_mask(invoices['day'], from_date, to_date) & (invoices['item_count'] > 0)
+
+        total_invoices = int(np.count_nonzero(mask))
+        total_sales = float(invoices['final_amount'][mask].sum())
+        total_items = int(invoices['item_count'][mask].sum())
+
+        payment_methods = {}
+        if total_invoices:
+            counts = np.bincount(invoices['payment_method'][mask])
+            for code in np.flatnonzero(counts):
+                payment_methods[self.meta['payment_methods'][code]] = int(counts[code])
+
+        return {
+            'total_sales': total_sales,
+            'total_invoices': total_invoices,
+            'average_sale': total_sales / total_invoices if total_invoices > 0 else 0,
+            'total_items': total_items,
+            'payment_methods': payment_methods
+        }
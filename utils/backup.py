@@ -0,0 +1,348 @@
+import os
+import re
+import gzip
+import time
+import shutil
+import sqlite3
+import argparse
+import datetime
+import tempfile
+import threading
+
+from config import BACKUP_DIRECTORY, DATABASE_PATH
+
+# Pages copied per backup step; the source is only read-locked during a step
+PAGES_PER_STEP = 256
+
+# Pause between steps so tills can commit while a backup is running
+STEP_DELAY = 0.01
+
+# Restarts allowed before the copy is finished in one unthrottled step
+MAX_RESTARTS = 3
+
+# Number of snapshots kept by rotation
+KEEP_SNAPSHOTS = 7
+
+SNAPSHOT_PATTERN = re.compile(r"^(?P<name>.+)_(?P<stamp>\d{8}_\d{6})(_(?P<label>[\w-]+))?\.db(\.gz)?$")
+
+
+def _percentile(values, percent):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class _TooManyRestarts(Exception):
+    """Raised from the progress callback to abandon a throttled backup"""
+
+
+class BackupManager:
+    """Online snapshots of the live database using SQLite's backup API.
+
+    The database is copied a few pages at a time with a pause between steps,
+    so a checkout commit waits at most one step for the backup's read lock.
+    The backup API restarts when another connection writes mid-copy, which
+    makes every finished snapshot a consistent point-in-time image. On a
+    busy store that could go on all day, so after max_restarts the copy is
+    finished in a single step, holding the read lock for the whole copy.
+    """
+
+    def __init__(self, db_path, backup_dir=None, pages_per_step=PAGES_PER_STEP,
+                 step_delay=STEP_DELAY, keep=KEEP_SNAPSHOTS, compress=True, max_restarts=MAX_RESTARTS):
+        self.db_path = db_path
+        self.backup_dir = backup_dir or BACKUP_DIRECTORY
+        self.pages_per_step = pages_per_step
+        self.step_delay = step_delay
+        self.keep = keep
+        self.compress = compress
+        self.max_restarts = max_restarts
+        self._thread = None
+        self.last_result = None
+
+    def _snapshot_name(self, label=None):
+        name = os.path.splitext(os.path.basename(self.db_path))[0]
+        stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        suffix = f"_{re.sub(r'[^A-Za-z0-9-]', '-', label)}" if label else ""
+        return f"{name}_{stamp}{suffix}.db"
+
+    def create_snapshot(self, label=None, progress=None):
+        """Copy the database into a new snapshot file
+
+        Args:
+            label (str, optional): Tag added to the snapshot file name
+            progress (callable, optional): Called with (copied_pages, total_pages)
+
+        Returns:
+            dict: Snapshot path and timing statistics, or None on error
+        """
+        os.makedirs(self.backup_dir, exist_ok=True)
+        target = os.path.join(self.backup_dir, self._snapshot_name(label))
+        partial = target + ".partial"
+
+        step_times = []
+        state = {'last': time.perf_counter(), 'steps': 0, 'remaining': None, 'restarts': 0}
+
+        def on_step(status, remaining, total):
+            # Time spent inside the step, i.e. how long writers could be held up
+            now = time.perf_counter()
+            step_times.append(now - state['last'])
+            state['steps'] += 1
+            # A write by another connection sends the copy back to the start
+            if state['remaining'] is not None and remaining > state['remaining']:
+                state['restarts'] += 1
+                if state['restarts'] > self.max_restarts:
+                    raise _TooManyRestarts()
+            state['remaining'] = remaining
+            if progress:
+                progress(total - remaining, total)
+            if self.step_delay and remaining:
+                time.sleep(self.step_delay)
+            state['last'] = time.perf_counter()
+
+        started = time.perf_counter()
+        source = None
+        destination = None
+        try:
+            source = sqlite3.connect(self.db_path)
+            destination = sqlite3.connect(partial)
+            try:
+                source.backup(destination, pages=self.pages_per_step, progress=on_step)
+            except _TooManyRestarts:
+                started_step = time.perf_counter()
+                source.backup(destination)
+                step_times.append(time.perf_counter() - started_step)
+                state['steps'] += 1
+            destination.close()
+            destination = None
+
+            if self.compress:
+                with open(partial, 'rb') as raw, gzip.open(target + ".gz", 'wb', compresslevel=6) as packed:
+                    shutil.copyfileobj(raw, packed, 1024 * 1024)
+                os.remove(partial)
+                target += ".gz"
+            else:
+                os.replace(partial, target)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Backup error: {e}")
+            if os.path.exists(partial):
+                os.remove(partial)
+            return None
+        finally:
+            if destination:
+                destination.close()
+            if source:
+                source.close()
+
+        result = {
+            'path': target,
+            'size': os.path.getsize(target),
+            'duration': time.perf_counter() - started,
+            'steps': state['steps'],
+            'restarts': state['restarts'],
+            'max_step_ms': max(step_times, default=0) * 1000,
+            'p95_step_ms': _percentile(step_times, 95) * 1000
+        }
+        self.last_result = result
+        self.rotate()
+        return result
+
+    def start_background_snapshot(self, label=None, on_done=None):
+        """Run create_snapshot in a background thread
+
+        Returns:
+            bool: False if a backup is already running
+        """
+        if self.is_running():
+            return False
+
+        def run():
+            result = self.create_snapshot(label)
+            if on_done:
+                on_done(result)
+
+        self._thread = threading.Thread(target=run, name="database-backup", daemon=True)
+        self._thread.start()
+        return True
+
+    def is_running(self):
+        """Check whether a background backup is in progress"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def list_snapshots(self):
+        """Get snapshots of this database, newest first"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+
+        name = os.path.splitext(os.path.basename(self.db_path))[0]
+        snapshots = []
+        for file_name in os.listdir(self.backup_dir):
+            match = SNAPSHOT_PATTERN.match(file_name)
+            if match and match.group('name') == name:
+                snapshots.append({
+                    'path': os.path.join(self.backup_dir, file_name),
+                    'created_at': datetime.datetime.strptime(match.group('stamp'), '%Y%m%d_%H%M%S'),
+                    'label': match.group('label'),
+                    'compressed': file_name.endswith('.gz')
+                })
+        snapshots.sort(key=lambda snapshot: (snapshot['created_at'], snapshot['path']), reverse=True)
+        return snapshots
+
+    def rotate(self):
+        """Delete the oldest unlabelled snapshots beyond the retention count
+
+        Labelled snapshots (e.g. before a migration) are kept until removed by hand.
+        """
+        removed = []
+        unlabelled = [snapshot for snapshot in self.list_snapshots() if not snapshot['label']]
+        for snapshot in unlabelled[self.keep:]:
+            try:
+                os.remove(snapshot['path'])
+                removed.append(snapshot['path'])
+            except OSError as e:
+                print(f"Error removing old backup {snapshot['path']}: {e}")
+        return removed
+
+    def restore_snapshot(self, snapshot_path, target_path=None):
+        """Restore a snapshot over the database (or into target_path)
+
+        The restore also goes through the backup API, so the target is
+        replaced page by page under SQLite's locking instead of being
+        overwritten on disk while it might be open.
+        """
+        target_path = target_path or self.db_path
+        source_path = snapshot_path
+        unpacked = None
+
+        try:
+            if snapshot_path.endswith('.gz'):
+                unpacked = target_path + ".restore"
+                with gzip.open(snapshot_path, 'rb') as packed, open(unpacked, 'wb') as raw:
+                    shutil.copyfileobj(packed, raw, 1024 * 1024)
+                source_path = unpacked
+
+            source = sqlite3.connect(source_path)
+            destination = sqlite3.connect(target_path)
+            try:
+                source.backup(destination)
+            finally:
+                destination.close()
+                source.close()
+            return True
+        except (sqlite3.Error, OSError) as e:
+            print(f"Restore error: {e}")
+            return False
+        finally:
+            if unpacked and os.path.exists(unpacked):
+                os.remove(unpacked)
+
+    def measure_checkout_impact(self, writes=200):
+        """Measure how a running backup delays small write transactions
+
+        Works on a scratch copy of the database so the live data is never
+        touched: commits shaped like a checkout (one short IMMEDIATE
+        transaction) are timed once on their own and once while a throttled
+        backup of the copy runs.
+
+        Returns:
+            dict: Commit latency percentiles in milliseconds, without and during a backup
+        """
+        scratch_dir = tempfile.mkdtemp(prefix="backup_probe_")
+        scratch_path = os.path.join(scratch_dir, os.path.basename(self.db_path))
+        try:
+            source = sqlite3.connect(self.db_path)
+            copy = sqlite3.connect(scratch_path)
+            try:
+                source.backup(copy)
+            finally:
+                copy.close()
+                source.close()
+
+            probe = BackupManager(
+                scratch_path, backup_dir=os.path.join(scratch_dir, "backups"),
+                pages_per_step=self.pages_per_step, step_delay=self.step_delay,
+                keep=1, compress=self.compress
+            )
+
+            connection = sqlite3.connect(scratch_path, timeout=30, isolation_level=None)
+            connection.execute("CREATE TABLE IF NOT EXISTS backup_probe (id INTEGER PRIMARY KEY, value INTEGER)")
+
+            def timed_writes(keep_going):
+                latencies = []
+                while len(latencies) < writes and keep_going():
+                    started = time.perf_counter()
+                    connection.execute("BEGIN IMMEDIATE")
+                    connection.execute("INSERT INTO backup_probe (value) VALUES (?)", (len(latencies),))
+                    connection.execute("COMMIT")
+                    latencies.append(time.perf_counter() - started)
+                    time.sleep(0.001)
+                return latencies
+
+            baseline = timed_writes(lambda: True)
+
+            probe.start_background_snapshot()
+            during = timed_writes(probe.is_running)
+            probe._thread.join()
+            connection.close()
+
+            def summary(latencies):
+                return {
+                    'writes': len(latencies),
+                    'p50_ms': _percentile(latencies, 50) * 1000,
+                    'p95_ms': _percentile(latencies, 95) * 1000,
+                    'max_ms': max(latencies, default=0) * 1000
+                }
+
+            return {
+                'baseline': summary(baseline),
+                'during_backup': summary(during),
+                'backup': probe.last_result
+            }
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error measuring backup impact: {e}")
+            return None
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Take an online snapshot of the database")
+    parser.add_argument("--db", default=DATABASE_PATH, help="Path to the database")
+    parser.add_argument("--label", help="Tag for the snapshot (labelled snapshots are never rotated)")
+    parser.add_argument("--keep", type=int, default=KEEP_SNAPSHOTS, help="Unlabelled snapshots to keep")
+    parser.add_argument("--no-compress", action="store_true", help="Store the snapshot uncompressed")
+    parser.add_argument("--restore", metavar="SNAPSHOT", help="Restore the given snapshot instead")
+    parser.add_argument("--pages", type=int, default=PAGES_PER_STEP, help="Pages copied per step")
+    parser.add_argument("--delay", type=float, default=STEP_DELAY, help="Seconds to pause between steps")
+    parser.add_argument("--max-restarts", type=int, default=MAX_RESTARTS,
+                        help="Restarts allowed before the copy is finished in one step")
+    parser.add_argument("--measure", action="store_true",
+                        help="Measure commit latency during a backup of a scratch copy")
+    args = parser.parse_args()
+
+    manager = BackupManager(args.db, pages_per_step=args.pages, step_delay=args.delay,
+                            keep=args.keep, compress=not args.no_compress, max_restarts=args.max_restarts)
+
+    if args.measure:
+        impact = manager.measure_checkout_impact()
+        if impact:
+            for phase in ('baseline', 'during_backup'):
+                stats = impact[phase]
+                print(f"{phase}: {stats['writes']} commits, p50 {stats['p50_ms']:.2f}ms, "
+                      f"p95 {stats['p95_ms']:.2f}ms, max {stats['max_ms']:.2f}ms")
+        return
+
+    if args.restore:
+        print("Restored" if manager.restore_snapshot(args.restore) else "Restore failed")
+        return
+
+    result = manager.create_snapshot(args.label)
+    if result:
+        print(f"Snapshot written to {result['path']} ({result['size']} bytes) in {result['duration']:.2f}s, "
+              f"{result['steps']} steps, {result['restarts']} restarts, longest step {result['max_step_ms']:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from config import DATABASE_DIR, DATABASE_NAME
+
+# Checkout stages timed separately, in the order a till runs them
+STAGES = ["scan", "cart", "invoice", "receipt", "checkout"]
+
+PERCENTILES = [50, 95, 99]
+
+PAYMENT_METHODS = ["Cash", "Credit Card", "Debit Card", "Mobile Payment"]
+
+# Share of checkouts made for a known customer, which adds the loyalty path
+CUSTOMER_SHARE = 0.3
+
+# Stock given to every product so a run never sells out
+FIXTURE_STOCK = 10 ** 9
+
+# Report and lookup queries timed by the queries suite, by name
+QUERY_CASES = {
+    "sales_report_30_days":
+        lambda q: q['invoice'].get_sales_report(q['last'] - datetime.timedelta(days=29), q['last']),
+    "top_products_full_range": lambda q: q['invoice'].get_top_selling_products(q['first'], q['last']),
+    "sales_by_category_full_range": lambda q: q['invoice'].get_sales_by_category(q['first'], q['last']),
+    "daily_sales_full_range": lambda q: q['invoice'].get_daily_sales(q['first'], q['last']),
+    "search_products": lambda q: q['product'].search_products(q['rng'].choice(SEARCH_TERMS)),
+    "product_by_sku": lambda q: q['product'].get_product_by_sku(q['rng'].choice(q['skus'])),
+    "customer_by_phone": lambda q: q['customer'].get_customer_by_phone(q['rng'].choice(q['phones'])),
+}
+
+SEARCH_TERMS = ["Milk", "Apples", "Bread", "Chicken", "Cola", "Pizza", "Organic", "Family Pack", "Fresh Farm"]
+
+
+def build_fixture(db_path, products, customers, seed, invoices=0):
+    """Create a database with a synthetic catalog, customer list and sales history
+
+    Args:
+        db_path (str): Path of the new database
+        products (int): Number of products, each with a SKU
+        customers (int): Number of customers
+        seed (int): Seed for the generated data
+        invoices (int): Invoices of history over the past year
+
+    Returns:
+        tuple: (product SKUs, customer phone numbers)
+    """
+    from utils.synthetic_data import SyntheticDataGenerator
+
+    SyntheticDataGenerator(db_path, seed=seed, products=products, customers=customers,
+                           invoices=invoices, stock=FIXTURE_STOCK).generate()
+    return _fixture_keys(db_path)
+
+
+def _fixture_keys(db_path):
+    connection = sqlite3.connect(db_path)
+    try:
+        skus = [row[0] for row in connection.execute("SELECT sku FROM products WHERE sku IS NOT NULL ORDER BY id")]
+        phones = [row[0] for row in connection.execute("SELECT phone FROM customers WHERE phone IS NOT NULL ORDER BY id")]
+        return skus, phones
+    finally:
+        connection.close()
+
+
+def generate_baskets(skus, phones, count, basket_size, seed):
+    """Generate the checkouts of a run, identical for the same arguments
+
+    Basket sizes are uniform between 1 and twice basket_size - 1, so they
+    average basket_size items.
+    """
+    rng = random.Random(seed + 1)
+    baskets = []
+    for _ in range(count):
+        size = rng.randint(1, max(1, 2 * basket_size - 1))
+        baskets.append({
+            'items': [(rng.choice(skus), rng.randint(1, 3)) for _ in range(size)],
+            'phone': rng.choice(phones) if phones and rng.random() < CUSTOMER_SHARE else None,
+            'payment_method': rng.choice(PAYMENT_METHODS),
+        })
+    return baskets
+
+
+def percentile(sorted_values, pct):
+    """Linearly interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def summarize(latencies):
+    """Count, mean, max and percentiles of a list of latencies in seconds, reported in milliseconds"""
+    values = sorted(latencies)
+    if not values:
+        return {'count': 0}
+    summary = {'count': len(values), 'mean_ms': sum(values) / len(values) * 1000, 'max_ms': values[-1] * 1000}
+    for pct in PERCENTILES:
+        summary[f"p{pct}_ms"] = percentile(values, pct) * 1000
+    return summary
+
+
+def _run_till(db_path, baskets, warmup, receipts):
+    """Ring up baskets one after another as one till, in its own process
+
+    Returns:
+        dict: Latencies per stage, start and end wall times, and failure counts
+    """
+    from db_manager import DatabaseManager
+    from controllers.auth_controller import AuthController
+    from controllers.billing_controller import BillingController
+    from utils.offline_journal import OfflineJournal, set_offline_journal
+
+    # A locked database sends sales to the offline journal; keep those in the
+    # benchmark's directory and count them, rather than queue them on this till
+    set_offline_journal(OfflineJournal(os.path.join(os.path.dirname(db_path), f"offline_{os.getpid()}.db")))
+
+    db_manager = DatabaseManager(db_path)
+    auth_controller = AuthController(db_manager)
+    if not auth_controller.login("admin", "admin"):
+        raise RuntimeError("Could not log in to the benchmark database")
+    billing = BillingController(db_manager, auth_controller)
+
+    latencies = {stage: [] for stage in STAGES}
+    result = {'latencies': latencies, 'failed': 0, 'offline': 0, 'started': None, 'finished': None}
+
+    for number, basket in enumerate(baskets):
+        if number == warmup:
+            result['started'] = time.time()
+        timings = {}
+        started = time.perf_counter()
+
+        products = []
+        for sku, quantity in basket['items']:
+            products.append((billing.search_product(sku), quantity))
+        if basket['phone']:
+            billing.set_customer(billing.search_customer(basket['phone']))
+        timings['scan'] = time.perf_counter() - started
+
+        mark = time.perf_counter()
+        added = all(found and billing.add_to_cart(found[0]['id'], quantity) for found, quantity in products)
+        timings['cart'] = time.perf_counter() - mark
+
+        invoice = None
+        if added:
+            mark = time.perf_counter()
+            invoice = billing.create_invoice(basket['payment_method'], print_receipt=False)
+            timings['invoice'] = time.perf_counter() - mark
+
+        if not invoice or invoice.get('offline'):
+            billing.clear_cart()
+            if number >= warmup:
+                result['offline' if invoice else 'failed'] += 1
+            continue
+
+        if receipts:
+            mark = time.perf_counter()
+            billing.generate_receipt(invoice)
+            timings['receipt'] = time.perf_counter() - mark
+        timings['checkout'] = time.perf_counter() - started
+
+        if number >= warmup:
+            for stage, elapsed in timings.items():
+                latencies[stage].append(elapsed)
+
+    result['finished'] = time.time()
+    if result['started'] is None:
+        result['started'] = result['finished']
+    return result
+
+
+def run_benchmark(workdir, products=1000, customers=500, checkouts=200, basket_size=8,
+                  concurrency=1, warmup=10, receipts=True, seed=42, invoices=0):
+    """Build a fixture in workdir and ring up checkouts on concurrent tills
+
+    Each till is a separate process with its own controllers and database
+    connections, as on a real store floor, and rings up its share of the
+    baskets back to back. The first warmup checkouts of every till are not
+    counted. invoices adds that much sales history to the fixture first.
+
+    Returns:
+        dict: Parameters, environment, throughput and latency summaries
+    """
+    workdir = os.path.abspath(workdir)
+    os.makedirs(os.path.join(workdir, DATABASE_DIR), exist_ok=True)
+    db_path = os.path.join(workdir, DATABASE_DIR, DATABASE_NAME)
+
+    # Receipts and metrics checkpoints are written relative to the working directory
+    os.chdir(workdir)
+
+    fixture_started = time.perf_counter()
+    skus, phones = build_fixture(db_path, products, customers, seed, invoices)
+    fixture_seconds = time.perf_counter() - fixture_started
+
+    baskets = generate_baskets(skus, phones, checkouts + warmup * concurrency, basket_size, seed)
+    shares = [baskets[till::concurrency] for till in range(concurrency)]
+
+    with ProcessPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(_run_till, [db_path] * concurrency, shares,
+                                [warmup] * concurrency, [receipts] * concurrency))
+
+    latencies = {stage: [] for stage in STAGES}
+    for result in results:
+        for stage in STAGES:
+            latencies[stage].extend(result['latencies'][stage])
+    elapsed = max(result['finished'] for result in results) - min(result['started'] for result in results)
+    completed = len(latencies['checkout'])
+
+    return {
+        **_run_info('checkout'),
+        'parameters': {
+            'products': products, 'customers': customers, 'invoices': invoices, 'checkouts': checkouts,
+            'basket_size': basket_size, 'concurrency': concurrency, 'warmup': warmup,
+            'receipts': receipts, 'seed': seed,
+        },
+        'fixture_seconds': fixture_seconds,
+        'elapsed_seconds': elapsed,
+        'completed': completed,
+        'failed': sum(result['failed'] for result in results),
+        'offline': sum(result['offline'] for result in results),
+        'throughput_per_second': completed / elapsed if elapsed > 0 else None,
+        'latency': {stage: summarize(values) for stage, values in latencies.items()},
+    }
+
+
+def run_query_benchmark(db_path, repeat=5, seed=42):
+    """Time the report and lookup queries against a generated store
+
+    Args:
+        db_path (str): A database made by utils.synthetic_data, or build_fixture
+        repeat (int): Timed runs of each query, after one untimed run
+        seed (int): Seed for the search terms and keys looked up
+
+    Returns:
+        dict: Parameters, environment and latency summaries per query
+    """
+    from db_manager import DatabaseManager
+    from models.invoice import Invoice
+    from models.product import Product
+    from models.customer import Customer
+
+    connection = sqlite3.connect(db_path)
+    try:
+        first, last, invoices = connection.execute(
+            "SELECT DATE(MIN(created_at)), DATE(MAX(created_at)), COUNT(*) FROM invoices"
+        ).fetchone()
+    finally:
+        connection.close()
+    if not invoices:
+        raise ValueError(f"{db_path} has no invoices to report on")
+
+    skus, phones = _fixture_keys(db_path)
+    db_manager = DatabaseManager(db_path)
+    query = {
+        'invoice': Invoice(db_manager), 'product': Product(db_manager), 'customer': Customer(db_manager),
+        'first': datetime.date.fromisoformat(first), 'last': datetime.date.fromisoformat(last),
+        'skus': skus, 'phones': phones, 'rng': random.Random(seed),
+    }
+
+    latencies = {}
+    rows = {}
+    started = time.perf_counter()
+    for name, run in QUERY_CASES.items():
+        result = run(query)
+        rows[name] = len(result) if isinstance(result, list) else int(result is not None)
+        latencies[name] = []
+        for _ in range(repeat):
+            mark = time.perf_counter()
+            run(query)
+            latencies[name].append(time.perf_counter() - mark)
+
+    return {
+        **_run_info('queries'),
+        'parameters': {'database': os.path.abspath(db_path), 'invoices': invoices, 'products': len(skus),
+                       'customers': len(phones), 'first_day': first, 'last_day': last,
+                       'repeat': repeat, 'seed': seed},
+        'elapsed_seconds': time.perf_counter() - started,
+        'rows': rows,
+        'latency': {name: summarize(values) for name, values in latencies.items()},
+    }
+
+
+def _run_info(benchmark):
+    return {
+        'benchmark': benchmark,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': _git_commit(),
+        'environment': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+    }
+
+
+def _git_commit():
+    # Results are compared across commits, so record which one ran
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_report(results, baseline=None):
+    """Render benchmark results, with the change from a baseline run if given"""
+    parameters = results['parameters']
+    commit = results['commit'] or 'unknown commit'
+    if results['benchmark'] == 'queries':
+        lines = [
+            f"Query benchmark at {commit}: {parameters['invoices']} invoices from {parameters['first_day']} "
+            f"to {parameters['last_day']}, {parameters['products']} products, {parameters['repeat']} runs each",
+        ]
+    else:
+        lines = [
+            f"Checkout benchmark at {commit}: "
+            f"{parameters['concurrency']} till(s), {parameters['checkouts']} checkouts, "
+            f"~{parameters['basket_size']} items per basket, {parameters['products']} products",
+            f"Completed {results['completed']} in {results['elapsed_seconds']:.2f}s "
+            f"({results['throughput_per_second'] or 0:.1f}/s), "
+            f"{results['failed']} failed, {results['offline']} went offline",
+        ]
+        if baseline and baseline.get('throughput_per_second') and results['throughput_per_second']:
+            change = results['throughput_per_second'] / baseline['throughput_per_second'] - 1
+            lines[-1] += f", throughput {change:+.1%} vs {baseline.get('commit') or 'baseline'}"
+
+    width = max(len(name) for name in results['latency']) + 2
+    keys = [f"p{pct}_ms" for pct in PERCENTILES] + ["max_ms"]
+    lines.append(f"{'':<{width}}" + "".join(f"{key.replace('_', ' '):>20}" for key in keys))
+    for name, summary in results['latency'].items():
+        if not summary['count']:
+            continue
+        line = f"{name:<{width}}"
+        for key in keys:
+            cell = f"{summary[key]:.2f}"
+            previous = ((baseline or {}).get('latency', {}).get(name) or {}).get(key)
+            if previous:
+                cell += f" ({summary[key] / previous - 1:+.0%})"
+            line += f"{cell:>20}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark checkout, reports and lookups headlessly")
+    parser.add_argument("--suite", choices=["checkout", "queries"], default="checkout",
+                        help="Ring up checkouts, or time report and lookup queries")
+    parser.add_argument("--fixture", help="Database from utils.synthetic_data to run the queries suite on")
+    parser.add_argument("--products", type=int, default=1000, help="Products in the synthetic catalog")
+    parser.add_argument("--customers", type=int, default=500, help="Customers in the synthetic database")
+    parser.add_argument("--invoices", type=int, help="Invoices of generated history, "
+                                                     "0 for checkout and 100000 for queries by default")
+    parser.add_argument("--checkouts", type=int, default=200, help="Checkouts counted across all tills")
+    parser.add_argument("--basket-size", type=int, default=8, help="Average items per basket")
+    parser.add_argument("--concurrency", type=int, default=1, help="Tills ringing up at the same time")
+    parser.add_argument("--warmup", type=int, default=10, help="Uncounted checkouts per till before timing")
+    parser.add_argument("--no-receipts", action="store_true", help="Skip generating PDF receipts")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs of each query")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the generated data and baskets")
+    parser.add_argument("--output", help="JSON file for the results, <suite>_benchmark.json by default")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare against")
+    parser.add_argument("--workdir", help="Directory for the benchmark database and receipts, "
+                                          "a temporary one by default")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output or f"{args.suite}_benchmark.json")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.suite == "queries" and args.fixture:
+        workdir = None
+        results = run_query_benchmark(args.fixture, args.repeat, args.seed)
+    else:
+        workdir = args.workdir or tempfile.mkdtemp(prefix=f"{args.suite}_benchmark_")
+        if args.suite == "queries":
+            db_path = os.path.join(workdir, DATABASE_NAME)
+            build_fixture(db_path, args.products, args.customers, args.seed,
+                          100000 if args.invoices is None else args.invoices)
+            results = run_query_benchmark(db_path, args.repeat, args.seed)
+        else:
+            results = run_benchmark(
+                workdir, products=args.products, customers=args.customers, checkouts=args.checkouts,
+                basket_size=args.basket_size, concurrency=args.concurrency, warmup=args.warmup,
+                receipts=not args.no_receipts, seed=args.seed, invoices=args.invoices or 0
+            )
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(format_report(results, baseline))
+    print(f"Results written to {output}" + (f", benchmark database in {workdir}" if workdir else ""))
+    return 0 if results['latency'] and any(summary['count'] for summary in results['latency'].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
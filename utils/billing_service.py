@@ -0,0 +1,559 @@
+import re
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import argparse
+import datetime
+import threading
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (DATABASE_PATH, SESSION_TTL, SERVICE_HOST, SERVICE_PORT, SERVICE_WORKERS,
+                    SERVICE_MAX_BODY, SERVICE_KEEPALIVE_SECONDS, TILL_ID)
+from db_manager import DatabaseManager
+from models.product import Product
+from models.invoice import Invoice
+from models.payment import Payment, TENDERS
+from models.user import User
+from controllers.auth_controller import AuthController
+from controllers.billing_controller import BillingController
+from utils.session_cache import session_cache
+from utils.cart_store import get_cart_store
+from utils.shift_ledger import get_shift_ledger
+from utils.tracing import span
+
+# Results returned by a catalog search unless the client asks for fewer
+SEARCH_LIMIT = 50
+
+# Till the service's carts are rung up on, kept apart from a till app on the same machine
+SERVICE_TILL_ID = f"{TILL_ID}:service"
+
+REASONS = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 401: "Unauthorized",
+           403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class ServiceError(Exception):
+    """A request the service refuses, answered with status and message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.params = {}
+        self.user = None
+        self.token = None
+
+    def json(self):
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError as e:
+            raise ServiceError(400, f"Invalid JSON: {e}")
+        if not isinstance(data, dict):
+            raise ServiceError(400, "Expected a JSON object")
+        return data
+
+    def arg(self, name, default=None):
+        values = self.query.get(name)
+        return values[0] if values else default
+
+
+class Cart:
+    """A terminal's cart: a BillingController of its own, used by one request at a time"""
+
+    def __init__(self, cart_id, db_path, user, token):
+        self.cart_id = cart_id
+        self.user_id = user['id']
+        self.token = token
+        auth_controller = AuthController(DatabaseManager(db_path))
+        auth_controller.current_user = user
+        auth_controller.session_token = token
+        self.controller = BillingController(DatabaseManager(db_path), auth_controller, SERVICE_TILL_ID)
+        self.lock = threading.Lock()
+        self.touched = time.monotonic()
+
+    def to_dict(self):
+        controller = self.controller
+        return {
+            'id': self.cart_id,
+            'session_id': controller.cart.session_id,
+            'items': controller.get_cart_items(),
+            'customer': controller.customer,
+            'item_count': controller.get_cart_item_count(),
+            'total': controller.get_cart_total(),
+        }
+
+
+def _json_default(value):
+    if isinstance(value, sqlite3.Row):
+        return dict(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class BillingService:
+    """Local HTTP/JSON API for scanners, kiosks and web tills.
+
+    An asyncio server parses requests and keeps connections alive; every
+    handler touches SQLite, so handlers run on a pool of worker threads and
+    the event loop only does I/O. Terminals log in for a session token
+    (the same sessions the tills use) and send it as a Bearer token. Each
+    cart is a BillingController held in memory with its own connection
+    manager and lock, so different carts are worked on in parallel while
+    requests for one cart are applied in order. Their baskets live in the
+    cart store, so they survive a restart and can be suspended here and
+    resumed on a till or the other way round.
+    """
+
+    def __init__(self, db_path=DATABASE_PATH, workers=SERVICE_WORKERS):
+        self.db_path = db_path
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="billing-service")
+        self.carts = {}
+        self._carts_lock = threading.Lock()
+        self.routes = [
+            ("GET", r"/api/health", self.health, False),
+            ("POST", r"/api/login", self.login, False),
+            ("POST", r"/api/logout", self.logout, True),
+            ("GET", r"/api/products", self.search_products, True),
+            ("GET", r"/api/products/sku/(?P<sku>[^/]+)", self.get_product_by_sku, True),
+            ("GET", r"/api/products/(?P<product_id>\d+)", self.get_product, True),
+            ("POST", r"/api/carts", self.create_cart, True),
+            ("GET", r"/api/carts/(?P<cart_id>\w+)", self.get_cart, True),
+            ("DELETE", r"/api/carts/(?P<cart_id>\w+)", self.delete_cart, True),
+            ("POST", r"/api/carts/(?P<cart_id>\w+)/items", self.add_item, True),
+            ("PUT", r"/api/carts/(?P<cart_id>\w+)/items/(?P<product_id>\d+)", self.update_item, True),
+            ("DELETE", r"/api/carts/(?P<cart_id>\w+)/items/(?P<product_id>\d+)", self.remove_item, True),
+            ("PUT", r"/api/carts/(?P<cart_id>\w+)/customer", self.set_customer, True),
+            ("POST", r"/api/carts/(?P<cart_id>\w+)/checkout", self.checkout, True),
+            ("POST", r"/api/carts/(?P<cart_id>\w+)/suspend", self.suspend_cart, True),
+            ("POST", r"/api/carts/(?P<cart_id>\w+)/resume", self.resume_cart, True),
+            ("GET", r"/api/suspended-carts", self.get_suspended_carts, True),
+            ("GET", r"/api/invoices/(?P<invoice_id>\d+)", self.get_invoice, True),
+            ("GET", r"/api/invoices/(?P<invoice_id>\d+)/receipt", self.get_receipt, True),
+            ("GET", r"/api/cash-up", self.get_cash_up, True),
+            ("GET", r"/api/shifts/current", self.get_x_report, True),
+            ("POST", r"/api/shifts/close", self.close_shift, True),
+            ("GET", r"/api/days/(?P<business_date>\d{4}-\d{2}-\d{2})", self.get_day_report, True),
+            ("POST", r"/api/days/(?P<business_date>\d{4}-\d{2}-\d{2})/close", self.close_day, True),
+        ]
+        self.routes = [(method, re.compile(pattern + "$"), handler, auth)
+                       for method, pattern, handler, auth in self.routes]
+
+    def recover_carts(self):
+        """Suspend the baskets open when the service last stopped
+
+        Their terminals' sessions ended with it, so they are left for a
+        terminal or till to resume.
+        """
+        store = get_cart_store(DatabaseManager(self.db_path))
+        recovered = store.recover(SERVICE_TILL_ID)
+        for session in recovered:
+            store.suspend(session.session_id)
+        if recovered:
+            print(f"Suspended {len(recovered)} cart(s) left open by the last run")
+
+    # HTTP
+
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        self.recover_carts()
+        get_shift_ledger(DatabaseManager(self.db_path)).start()
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        print(f"Billing service listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), SERVICE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length") or 0)
+                if length > SERVICE_MAX_BODY:
+                    await self._write(writer, 413, {'error': "Request body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self._dispatch(method, target, headers, body)
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+                await self._write(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            # Malformed or abandoned request; nothing sensible to answer
+            pass
+        finally:
+            writer.close()
+
+    async def _write(self, writer, status, payload, keep_alive):
+        if isinstance(payload, bytes):
+            content_type, body = "application/pdf", payload
+        elif payload is None:
+            content_type, body = None, b""
+        else:
+            content_type, body = "application/json", json.dumps(payload, default=_json_default).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Length: {len(body)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if content_type:
+            head.append(f"Content-Type: {content_type}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        request = Request(method, url.path.rstrip("/") or "/", parse_qs(url.query), headers, body)
+        allowed = False
+        for route_method, pattern, handler, auth in self.routes:
+            match = pattern.match(request.path)
+            if not match:
+                continue
+            allowed = True
+            if route_method != method:
+                continue
+            request.params = match.groupdict()
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self.pool, self._run, handler, request, auth
+                )
+            except ServiceError as e:
+                return e.status, {'error': e.message}
+            except Exception as e:
+                print(f"Error handling {method} {request.path}: {e}")
+                return 500, {'error': "Internal error"}
+            return result if isinstance(result, tuple) else (200, result)
+        if allowed:
+            return 405, {'error': f"{method} not allowed on {request.path}"}
+        return 404, {'error': f"No such endpoint {request.path}"}
+
+    def _run(self, handler, request, auth):
+        with span(f"service.{handler.__name__}", path=request.path):
+            # Checking the session reads the users table, so it runs here
+            # on the pool rather than on the event loop
+            if auth:
+                self._authenticate(request)
+            return handler(request)
+
+    def _authenticate(self, request):
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        user = None
+        if scheme.lower() == "bearer":
+            user = User(DatabaseManager(self.db_path)).get_session_user(token.strip())
+        if not user:
+            raise ServiceError(401, "Log in and send the session token as a Bearer token")
+        request.user = user
+        request.token = token.strip()
+
+    # Sessions
+
+    def health(self, request):
+        return {'status': 'ok', 'carts': len(self.carts)}
+
+    def login(self, request):
+        data = request.json()
+        auth_controller = AuthController(DatabaseManager(self.db_path))
+        user = auth_controller.login(data.get('username', ''), data.get('password', ''))
+        if not user:
+            raise ServiceError(401, "Invalid username or password")
+        return {'token': auth_controller.session_token,
+                'user': {key: user[key] for key in ('id', 'username', 'full_name', 'role')}}
+
+    def logout(self, request):
+        session_cache.end_session(request.token)
+        with self._carts_lock:
+            for cart_id in [cart_id for cart_id, cart in self.carts.items() if cart.token == request.token]:
+                self.carts.pop(cart_id).controller.discard_cart()
+        return 204, None
+
+    # Catalog
+
+    def search_products(self, request):
+        term = (request.arg('q') or "").strip()
+        if not term:
+            raise ServiceError(400, "Give a search term as ?q=")
+        try:
+            limit = min(int(request.arg('limit', SEARCH_LIMIT)), SEARCH_LIMIT)
+        except ValueError:
+            raise ServiceError(400, "limit must be a number")
+        controller = BillingController(DatabaseManager(self.db_path), None)
+        return {'products': controller.search_product(term)[:limit]}
+
+    def get_product_by_sku(self, request):
+        product = Product(DatabaseManager(self.db_path)).get_product_by_sku(request.params['sku'])
+        if not product:
+            raise ServiceError(404, "No product with that SKU")
+        return product
+
+    def get_product(self, request):
+        product = Product(DatabaseManager(self.db_path)).get_product_by_id(int(request.params['product_id']))
+        if not product:
+            raise ServiceError(404, "No such product")
+        return product
+
+    # Carts
+
+    def _cart(self, request):
+        with self._carts_lock:
+            cart = self.carts.get(request.params['cart_id'])
+        # Another terminal's cart is reported as missing rather than forbidden
+        if not cart or cart.user_id != request.user['id']:
+            raise ServiceError(404, "No such cart")
+        cart.touched = time.monotonic()
+        return cart
+
+    def _expire_carts(self):
+        cutoff = time.monotonic() - SESSION_TTL
+        with self._carts_lock:
+            for cart_id in [cart_id for cart_id, cart in self.carts.items() if cart.touched < cutoff]:
+                self.carts.pop(cart_id).controller.discard_cart()
+
+    def create_cart(self, request):
+        self._expire_carts()
+        cart = Cart(uuid.uuid4().hex, self.db_path, request.user, request.token)
+        with self._carts_lock:
+            self.carts[cart.cart_id] = cart
+        return 201, cart.to_dict()
+
+    def get_cart(self, request):
+        return self._cart(request).to_dict()
+
+    def delete_cart(self, request):
+        cart = self._cart(request)
+        with self._carts_lock:
+            self.carts.pop(cart.cart_id, None)
+        with cart.lock:
+            cart.controller.discard_cart()
+        return 204, None
+
+    def _quantity(self, data, default=None):
+        quantity = data.get('quantity', default)
+        if not isinstance(quantity, int) or isinstance(quantity, bool):
+            raise ServiceError(400, "quantity must be a whole number")
+        return quantity
+
+    def add_item(self, request):
+        cart = self._cart(request)
+        data = request.json()
+        quantity = self._quantity(data, 1)
+        with cart.lock:
+            product_id = data.get('product_id')
+            if product_id is None and data.get('sku'):
+                product = cart.controller.product_model.get_product_by_sku(str(data['sku']))
+                product_id = product['id'] if product else None
+            if not isinstance(product_id, int):
+                raise ServiceError(404, "No such product")
+            if not cart.controller.add_to_cart(product_id, quantity):
+                raise ServiceError(409, "Product not found, not enough stock or invalid quantity")
+            return cart.to_dict()
+
+    def update_item(self, request):
+        cart = self._cart(request)
+        quantity = self._quantity(request.json())
+        with cart.lock:
+            if not cart.controller.update_cart_item(int(request.params['product_id']), quantity):
+                raise ServiceError(409, "Item not in cart or not enough stock")
+            return cart.to_dict()
+
+    def remove_item(self, request):
+        cart = self._cart(request)
+        with cart.lock:
+            if not cart.controller.remove_from_cart(int(request.params['product_id'])):
+                raise ServiceError(404, "Item not in cart")
+            return cart.to_dict()
+
+    def set_customer(self, request):
+        cart = self._cart(request)
+        phone = str(request.json().get('phone') or "").strip()
+        with cart.lock:
+            customer = cart.controller.search_customer(phone) if phone else None
+            if phone and not customer:
+                raise ServiceError(404, "No customer with that phone number")
+            cart.controller.set_customer(customer)
+            return cart.to_dict()
+
+    def checkout(self, request):
+        cart = self._cart(request)
+        data = request.json()
+        payment_method = data.get('payment_method') or "Cash"
+        if data.get('tenders') is None and payment_method not in TENDERS:
+            raise ServiceError(400, f"payment_method must be one of {', '.join(TENDERS)}")
+        discount = data.get('discount') or 0
+        if not isinstance(discount, (int, float)) or discount < 0:
+            raise ServiceError(400, "discount must be a positive amount")
+        card_last4 = data.get('card_last4')
+        if card_last4 is not None and not (isinstance(card_last4, str) and len(card_last4) == 4 and card_last4.isdigit()):
+            raise ServiceError(400, "card_last4 must be four digits")
+        tenders = data.get('tenders')
+        if tenders is not None:
+            if not isinstance(tenders, list) or not all(
+                isinstance(tender, dict) and isinstance(tender.get('tender'), str)
+                and isinstance(tender.get('tendered', 0), (int, float))
+                for tender in tenders
+            ):
+                raise ServiceError(400, "tenders must be a list of {tender, tendered, card_last4}")
+            tenders = [
+                {'tender': tender['tender'], 'tendered': tender.get('tendered'),
+                 'card_last4': tender.get('card_last4')}
+                for tender in tenders
+            ]
+        with cart.lock:
+            if not cart.controller.get_cart_items():
+                raise ServiceError(409, "Cart is empty")
+            # Receipts are fetched separately, so checkout doesn't wait on ReportLab
+            try:
+                invoice = cart.controller.create_invoice(payment_method, discount, print_receipt=False,
+                                                         card_last4=card_last4, tenders=tenders)
+            except ValueError as e:
+                raise ServiceError(400, str(e))
+            if not invoice:
+                raise ServiceError(409, "The sale could not be completed")
+        with self._carts_lock:
+            self.carts.pop(cart.cart_id, None)
+        return 201, invoice
+
+    def suspend_cart(self, request):
+        """Put the cart's basket aside for any till to resume; the cart is left empty"""
+        cart = self._cart(request)
+        note = str(request.json().get('note') or "").strip() or None
+        with cart.lock:
+            session_id = cart.controller.suspend_cart(note)
+            if not session_id:
+                raise ServiceError(409, "Cart is empty or could not be saved")
+            return {'suspended': session_id, 'cart': cart.to_dict()}
+
+    def resume_cart(self, request):
+        cart = self._cart(request)
+        session_id = str(request.json().get('session_id') or "")
+        with cart.lock:
+            if cart.controller.get_cart_item_count():
+                raise ServiceError(409, "Cart is not empty")
+            if not cart.controller.resume_cart(session_id):
+                raise ServiceError(404, "No such suspended cart")
+            return dict(cart.to_dict(), price_changes=cart.controller.cart.price_changes,
+                        unavailable=cart.controller.cart.unavailable)
+
+    def get_suspended_carts(self, request):
+        store = get_cart_store(DatabaseManager(self.db_path))
+        customer_id = request.arg('customer_id')
+        if customer_id is not None and not customer_id.isdigit():
+            raise ServiceError(400, "customer_id must be a number")
+        carts = store.get_suspended(request.arg('till'), int(customer_id) if customer_id else None)
+        return {'carts': [dict(row) for row in carts]}
+
+    # Invoices
+
+    def get_invoice(self, request):
+        invoice = Invoice(DatabaseManager(self.db_path)).get_invoice_by_id(int(request.params['invoice_id']))
+        if not invoice:
+            raise ServiceError(404, "No such invoice")
+        return invoice
+
+    def get_receipt(self, request):
+        from utils.pdf_generator import generate_receipt
+        path = generate_receipt(DatabaseManager(self.db_path), int(request.params['invoice_id']))
+        if not path:
+            raise ServiceError(404, "No such invoice")
+        with open(path, "rb") as f:
+            return f.read()
+
+    def get_cash_up(self, request):
+        """Takings by tender, till and cashier for a day (?date=YYYY-MM-DD&till=)"""
+        day = request.arg('date') or datetime.date.today().isoformat()
+        try:
+            datetime.date.fromisoformat(day)
+        except ValueError:
+            raise ServiceError(400, "date must be YYYY-MM-DD")
+        rows = Payment(DatabaseManager(self.db_path)).cash_up(day, till_id=request.arg('till'))
+        return {'date': day, 'rows': [dict(row) for row in rows]}
+
+    # Shift and day close
+
+    def get_x_report(self, request):
+        """Running totals of a till's open shift (?till=, this service's till by default)"""
+        report = get_shift_ledger(DatabaseManager(self.db_path)).x_report(request.arg('till') or SERVICE_TILL_ID)
+        if not report:
+            raise ServiceError(404, "No shift is open on that till")
+        return report
+
+    def close_shift(self, request):
+        """Z report: close a till's shift with the amounts counted per tender
+
+        Cashiers close this service's own shift; closing another till's
+        takes an admin, as closing the day does.
+        """
+        data = request.json()
+        counted = data.get('counted') or {}
+        if not isinstance(counted, dict) or not all(isinstance(amount, (int, float)) for amount in counted.values()):
+            raise ServiceError(400, "counted must map tenders to amounts")
+        till_id = data.get('till') or SERVICE_TILL_ID
+        if till_id != SERVICE_TILL_ID and request.user['role'] != 'admin':
+            raise ServiceError(403, "Only an admin can close another till's shift")
+        success, result = get_shift_ledger(DatabaseManager(self.db_path)).close_shift(
+            till_id, request.user['id'], counted
+        )
+        if not success:
+            raise ServiceError(409, result)
+        return result
+
+    def get_day_report(self, request):
+        report = get_shift_ledger(DatabaseManager(self.db_path)).get_day_report(request.params['business_date'])
+        if not report:
+            raise ServiceError(404, "That day has not been closed")
+        return report
+
+    def close_day(self, request):
+        if request.user['role'] != 'admin':
+            raise ServiceError(403, "Only an admin can close the day")
+        success, result = get_shift_ledger(DatabaseManager(self.db_path)).close_day(
+            request.params['business_date'], request.user['id']
+        )
+        if not success:
+            raise ServiceError(409, result)
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve billing operations over HTTP/JSON")
+    parser.add_argument("--db", default=DATABASE_PATH, help="Path to the database")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="Threads running database work")
+    args = parser.parse_args()
+
+    service = BillingService(args.db, args.workers)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.pool.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
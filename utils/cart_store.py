@@ -0,0 +1,445 @@
+import os
+import json
+import uuid
+import atexit
+import threading
+
+from config import TILL_ID, CART_SNAPSHOT_INTERVAL
+from db_manager import DatabaseManager
+from models.price_list import PriceList
+from utils.sales_metrics import utc_timestamp
+
+
+class CartSession:
+    """One basket: its lines in scan order, the till ringing it up and the customer.
+
+    Changes only touch memory and mark the basket for the store's next
+    snapshot. A basket is worked on by one till at a time.
+    """
+
+    def __init__(self, store, session_id, till_id, user_id=None, customer_id=None, status='active', state=None):
+        self.store = store
+        self.session_id = session_id
+        self.till_id = till_id
+        self.user_id = user_id
+        self.customer_id = customer_id
+        self.status = status
+        # product_id -> {product_id, product_name, unit_price, quantity, total_price}
+        self.lines = {}
+        # Bill-level extras kept with the basket, e.g. discount, points_redeemed and note
+        self.state = state or {}
+        # Filled in by a resume: lines whose price changed while parked, and
+        # lines the stock no longer covers or whose product has gone
+        self.price_changes = []
+        self.unavailable = []
+
+    def __len__(self):
+        return len(self.lines)
+
+    def items(self):
+        """Get copies of the lines in scan order"""
+        with self.store._lock:
+            return [dict(line) for line in self.lines.values()]
+
+    def quantity(self, product_id):
+        """Get the quantity of a product in the basket, 0 if it isn't"""
+        with self.store._lock:
+            line = self.lines.get(product_id)
+            return line['quantity'] if line else 0
+
+    def total(self):
+        with self.store._lock:
+            return sum(line['total_price'] for line in self.lines.values())
+
+    def add(self, product, quantity=1):
+        """Add a product row (id, name and price), merging with its line if already scanned"""
+        with self.store._lock:
+            line = self.lines.get(product['id'])
+            if line:
+                line['quantity'] += quantity
+            else:
+                line = self.lines[product['id']] = {
+                    'product_id': product['id'],
+                    'product_name': product['name'],
+                    'unit_price': product['price'],
+                    'quantity': quantity,
+                }
+            line['total_price'] = line['quantity'] * line['unit_price']
+            self.store._changed(self)
+
+    def set_quantity(self, product_id, quantity):
+        """Change the quantity of a line, removing it at 0
+
+        Returns:
+            bool: False if the product isn't in the basket
+        """
+        if quantity <= 0:
+            return self.remove(product_id)
+        with self.store._lock:
+            line = self.lines.get(product_id)
+            if not line:
+                return False
+            line['quantity'] = quantity
+            line['total_price'] = quantity * line['unit_price']
+            self.store._changed(self)
+            return True
+
+    def remove(self, product_id):
+        with self.store._lock:
+            if self.lines.pop(product_id, None) is None:
+                return False
+            self.store._changed(self)
+            return True
+
+    def clear(self):
+        with self.store._lock:
+            self.lines.clear()
+            self.store._changed(self)
+
+    def set_customer(self, customer_id):
+        with self.store._lock:
+            self.customer_id = customer_id
+            self.store._changed(self)
+
+    def set_state(self, **values):
+        """Keep bill-level values with the basket; None removes one"""
+        with self.store._lock:
+            for key, value in values.items():
+                if value is None:
+                    self.state.pop(key, None)
+                else:
+                    self.state[key] = value
+            self.store._changed(self)
+
+
+class CartStore:
+    """Every basket of the process, kept in memory and snapshotted to the database.
+
+    Scanning only changes memory; a background thread writes the baskets
+    changed since the last snapshot every CART_SNAPSHOT_INTERVAL seconds in
+    one transaction, so a till commits once per interval rather than once
+    per scan and a crash loses at most the last interval. A basket is one
+    cart_sessions row with its lines in cart_items, rewritten whole; empty
+    baskets have no rows and are not kept in memory. Suspending writes the
+    basket at once and leaves it for any till to resume, and baskets a till
+    had open when it stopped are restored by recover() on its next start.
+
+    Parking is suspending with the bill's discount, redeemed points and a
+    note kept alongside as compact JSON. Parked baskets are listed by till
+    or customer through their indexes, and a resume claims, loads and
+    re-prices a basket in one transaction of two statements.
+    """
+
+    def __init__(self, db_manager, interval=CART_SNAPSHOT_INTERVAL):
+        # A private manager, snapshots never disturb the caller's connection
+        self.db_manager = DatabaseManager(db_manager.db_path)
+        self.interval = interval
+        self.sessions = {}
+        self._dirty = set()
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def open(self, user_id=None, till_id=TILL_ID, session_id=None):
+        """Start a basket; it is kept from its first change on"""
+        return CartSession(self, session_id or uuid.uuid4().hex, till_id, user_id)
+
+    def get(self, session_id):
+        """Get a basket this process is working on, or None"""
+        with self._lock:
+            return self.sessions.get(session_id)
+
+    def _changed(self, session):
+        # Called with the lock held
+        self.sessions[session.session_id] = session
+        self._dirty.add(session.session_id)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="cart-snapshots", daemon=True)
+            self._thread.start()
+
+    def close(self, session_id):
+        """Drop a finished or abandoned basket; its rows go at the next snapshot"""
+        with self._lock:
+            if self.sessions.pop(session_id, None) is not None:
+                self._dirty.add(session_id)
+
+    def detach(self, session_id):
+        """Stop snapshotting a basket that is being checked out
+
+        Waits for a snapshot in progress, so none can write the basket back
+        after the invoice transaction has removed its rows. Changing the
+        basket again, or reattach(), hands it back to the snapshots.
+
+        Returns:
+            CartSession: The basket, or None if this process wasn't keeping it
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._dirty.discard(session_id)
+                return self.sessions.pop(session_id, None)
+
+    def reattach(self, session):
+        """Snapshot a detached basket again, e.g. after its checkout failed"""
+        if session is not None:
+            with self._lock:
+                self._changed(session)
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            self.snapshot()
+
+    def snapshot(self):
+        """Write the baskets changed since the last snapshot
+
+        Returns:
+            int: Number of baskets written or removed, None on error
+        """
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                if not dirty:
+                    return 0
+                kept, removed = [], []
+                for session_id in dirty:
+                    session = self.sessions.get(session_id)
+                    if session is None or not session.lines:
+                        self.sessions.pop(session_id, None)
+                        removed.append((session_id,))
+                    else:
+                        kept.append((session.session_id, session.till_id, session.user_id,
+                                     session.customer_id, session.status,
+                                     json.dumps(session.state, separators=(',', ':')) if session.state else None,
+                                     [(line['product_id'], line['quantity'], line['unit_price'])
+                                      for line in session.lines.values()]))
+
+            now = utc_timestamp()
+            try:
+                self.db_manager.connect()
+                connection = self.db_manager.connection
+                connection.execute("BEGIN IMMEDIATE")
+                connection.executemany("DELETE FROM cart_items WHERE session_id = ?", [(session_id,) for session_id in dirty])
+                connection.executemany("DELETE FROM cart_sessions WHERE session_id = ?", removed)
+                connection.executemany(
+                    """
+                    INSERT OR REPLACE INTO cart_sessions (session_id, till_id, user_id, customer_id, status, state, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    [(session_id, till_id, user_id, customer_id, status, state, now)
+                     for session_id, till_id, user_id, customer_id, status, state, _ in kept]
+                )
+                connection.executemany(
+                    "INSERT INTO cart_items (session_id, product_id, quantity, unit_price, added_at) VALUES (?, ?, ?, ?, ?)",
+                    [(session_id, product_id, quantity, unit_price, now)
+                     for session_id, _, _, _, _, _, lines in kept
+                     for product_id, quantity, unit_price in lines]
+                )
+                self.db_manager.commit()
+                return len(dirty)
+            except Exception as e:
+                print(f"Error snapshotting carts: {e}")
+                self.db_manager.rollback()
+                # Write them again next time; baskets emptied meanwhile are removed then
+                with self._lock:
+                    self._dirty.update(dirty)
+                return None
+            finally:
+                self.db_manager.disconnect()
+
+    def suspend(self, session_id, note=None):
+        """Park a basket, written at once so another till can resume it
+
+        Args:
+            session_id (str): The basket
+            note (str, optional): Why it was parked, shown when choosing one to resume
+
+        Returns:
+            bool: True if the basket was suspended
+        """
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None or not session.lines:
+                return False
+            if note:
+                session.state['note'] = note
+            session.status = 'suspended'
+            self._dirty.add(session_id)
+        if self.snapshot() is None:
+            with self._lock:
+                session.status = 'active'
+            return False
+        with self._lock:
+            if self.sessions.get(session_id) is session:
+                del self.sessions[session_id]
+        return True
+
+    def resume(self, session_id, user_id=None, till_id=TILL_ID):
+        """Take over a suspended basket on this till
+
+        Only one till can resume a basket. It becomes active here at the
+        prices now in force, read with the basket in the same query; changed
+        prices are listed in its price_changes, and lines short of stock or
+        whose product has been deleted (those are dropped) in unavailable.
+
+        Returns:
+            CartSession: The basket, or None if it isn't suspended (any more)
+        """
+        # Apply price changes that fell due while the basket was parked
+        PriceList(self.db_manager).refresh_if_due()
+
+        try:
+            self.db_manager.connect()
+            connection = self.db_manager.connection
+            connection.execute("BEGIN IMMEDIATE")
+            claimed = connection.execute(
+                """
+                UPDATE cart_sessions SET status = 'active', till_id = ?, user_id = COALESCE(?, user_id), updated_at = ?
+                WHERE session_id = ? AND status = 'suspended'
+                """,
+                (till_id, user_id, utc_timestamp(), session_id)
+            ).rowcount
+            if not claimed:
+                self.db_manager.rollback()
+                return None
+            sessions = self._load(connection, "s.session_id = ?", (session_id,), reprice=True)
+            self.db_manager.commit()
+        except Exception as e:
+            print(f"Error resuming cart: {e}")
+            self.db_manager.rollback()
+            return None
+        finally:
+            self.db_manager.disconnect()
+
+        with self._lock:
+            for session in sessions:
+                self.sessions[session.session_id] = session
+                # The note was for finding the basket again
+                if session.state.pop('note', None) or session.price_changes or session.unavailable:
+                    self._changed(session)
+        return sessions[0] if sessions else None
+
+    def recover(self, till_id=TILL_ID):
+        """Restore the baskets a till had open when it last stopped
+
+        Returns:
+            list: The restored baskets, most recently changed last
+        """
+        try:
+            self.db_manager.connect()
+            sessions = self._load(self.db_manager.connection, "s.till_id = ? AND s.status = 'active'", (till_id,))
+        except Exception as e:
+            print(f"Error recovering carts: {e}")
+            return []
+        finally:
+            self.db_manager.disconnect()
+
+        with self._lock:
+            # A basket still open in this process is newer than its snapshot
+            sessions = [session for session in sessions if session.session_id not in self.sessions]
+            for session in sessions:
+                self.sessions[session.session_id] = session
+        return sessions
+
+    def _load(self, connection, where, params, reprice=False):
+        # Lines come back in scan order with their product's current price
+        # and stock; products deleted since fall back to their id
+        rows = connection.execute(
+            f"""
+            SELECT s.session_id, s.till_id, s.user_id, s.customer_id, s.status, s.state,
+                   c.product_id, c.quantity, COALESCE(p.name, 'Product ' || c.product_id) AS product_name,
+                   COALESCE(c.unit_price, p.price, 0) AS unit_price,
+                   p.id IS NOT NULL AS listed, p.price AS current_price, i.quantity AS current_stock
+            FROM cart_sessions s
+            JOIN cart_items c ON c.session_id = s.session_id
+            LEFT JOIN products p ON p.id = c.product_id
+            LEFT JOIN inventory i ON i.product_id = c.product_id
+            WHERE {where}
+            ORDER BY s.updated_at, s.session_id, c.id
+            """,
+            params
+        ).fetchall()
+
+        sessions = {}
+        for row in rows:
+            session = sessions.get(row['session_id'])
+            if session is None:
+                session = sessions[row['session_id']] = CartSession(
+                    self, row['session_id'], row['till_id'], row['user_id'], row['customer_id'], row['status'],
+                    json.loads(row['state']) if row['state'] else None
+                )
+            line = {
+                'product_id': row['product_id'],
+                'product_name': row['product_name'],
+                'unit_price': row['unit_price'],
+                'quantity': row['quantity'],
+            }
+            if reprice:
+                if not row['listed']:
+                    session.unavailable.append(dict(line, stock=0, removed=True))
+                    continue
+                if row['current_price'] != line['unit_price']:
+                    session.price_changes.append({'product_id': line['product_id'], 'product_name': line['product_name'],
+                                                  'old_price': line['unit_price'], 'new_price': row['current_price']})
+                    line['unit_price'] = row['current_price']
+                if (row['current_stock'] or 0) < line['quantity']:
+                    session.unavailable.append(dict(line, stock=row['current_stock'] or 0, removed=False))
+            line['total_price'] = line['quantity'] * line['unit_price']
+            session.lines[row['product_id']] = line
+        return list(sessions.values())
+
+    def get_suspended(self, till_id=None, customer_id=None):
+        """Get parked baskets, newest first, with their customer, note, item count and total
+
+        Args:
+            till_id (str, optional): Only those parked on this till
+            customer_id (int, optional): Only those of this customer
+        """
+        where = "s.status = 'suspended'"
+        params = []
+        if till_id is not None:
+            where += " AND s.till_id = ?"
+            params.append(till_id)
+        if customer_id is not None:
+            where += " AND s.customer_id = ?"
+            params.append(customer_id)
+        try:
+            self.db_manager.connect()
+            return self.db_manager.connection.execute(
+                f"""
+                SELECT s.session_id, s.till_id, s.user_id, s.customer_id, s.updated_at,
+                       json_extract(s.state, '$.note') AS note,
+                       cu.name AS customer_name, COUNT(*) AS item_count,
+                       SUM(c.quantity * c.unit_price) AS total
+                FROM cart_sessions s
+                JOIN cart_items c ON c.session_id = s.session_id
+                LEFT JOIN customers cu ON cu.id = s.customer_id
+                WHERE {where}
+                GROUP BY s.session_id
+                ORDER BY s.updated_at DESC
+                """,
+                params
+            ).fetchall()
+        except Exception as e:
+            print(f"Error getting suspended carts: {e}")
+            return []
+        finally:
+            self.db_manager.disconnect()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_cart_store(db_manager):
+    """Get the cart store of a database, shared within the process"""
+    db_path = os.path.abspath(db_manager.db_path)
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = CartStore(db_manager)
+        return _stores[db_path]
+
+
+@atexit.register
+def _snapshot_all():
+    for store in list(_stores.values()):
+        store.snapshot()
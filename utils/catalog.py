@@ -0,0 +1,410 @@
+import os
+import csv
+import json
+import time
+import argparse
+
+from config import DATABASE_PATH
+from db_manager import DatabaseManager
+from models.price_list import to_utc
+
+# Columns of a catalog file, in export order
+CATALOG_FIELDS = ["sku", "name", "description", "category", "price", "cost_price", "stock", "reorder_level"]
+
+# Rows staged and upserted per transaction
+CHUNK_SIZE = 5000
+
+# Invalid rows listed in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+STAGING_DDL = """
+    CREATE TEMP TABLE IF NOT EXISTS catalog_staging (
+        line INTEGER,
+        sku TEXT NOT NULL,
+        name TEXT NOT NULL,
+        description TEXT,
+        category_id INTEGER,
+        price REAL NOT NULL,
+        cost_price REAL,
+        stock INTEGER,
+        reorder_level INTEGER
+    )
+"""
+
+
+def read_catalog(path):
+    """Yield (line_number, row) pairs from a .csv or .jsonl catalog file"""
+    if path.lower().endswith((".jsonl", ".ndjson")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_number, {"_error": f"invalid JSON: {e}"}
+                    continue
+                yield line_number, row if isinstance(row, dict) else {"_error": "expected a JSON object"}
+    else:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def _text(value):
+    value = "" if value is None else str(value).strip()
+    return value or None
+
+
+def _number(row, field, convert, default=None):
+    value = _text(row.get(field))
+    if value is None:
+        return default
+    try:
+        number = convert(value)
+    except ValueError:
+        raise ValueError(f"{field} is not a number: {value!r}")
+    if number < 0:
+        raise ValueError(f"{field} is negative: {value!r}")
+    return number
+
+
+def validate_row(row):
+    """Check and convert one catalog row
+
+    Returns:
+        dict: The cleaned row
+
+    Raises:
+        ValueError: Describing the first problem found
+    """
+    if "_error" in row:
+        raise ValueError(row["_error"])
+
+    sku = _text(row.get("sku"))
+    name = _text(row.get("name"))
+    if not sku:
+        raise ValueError("sku is missing")
+    if not name:
+        raise ValueError("name is missing")
+
+    price = _number(row, "price", float)
+    if price is None:
+        raise ValueError("price is missing")
+
+    return {
+        "sku": sku,
+        "name": name,
+        "description": _text(row.get("description")),
+        "category": _text(row.get("category")),
+        "price": price,
+        "cost_price": _number(row, "cost_price", float),
+        # int(float(...)) accepts "12.0" from spreadsheets
+        "stock": _number(row, "stock", lambda value: int(float(value))),
+        "reorder_level": _number(row, "reorder_level", lambda value: int(float(value))),
+    }
+
+
+class CatalogImporter:
+    """Streams a catalog file into products and inventory, upserting by SKU.
+
+    Rows are validated, then staged in a temp table a chunk at a time with
+    executemany and merged with one set-wise UPDATE and INSERT per chunk
+    against the unique SKU index, so each transaction (and the write lock
+    tills wait on) covers at most CHUNK_SIZE rows. Categories are resolved through a name to id map
+    loaded once; unknown names are created on first sight. Empty cost_price,
+    stock and reorder_level cells leave the stored value unchanged.
+    """
+
+    def __init__(self, db_manager, chunk_size=CHUNK_SIZE):
+        self.db_manager = DatabaseManager(db_manager.db_path)
+        self.chunk_size = chunk_size
+        self._categories = None
+        # New SKUs counted by a dry run, whose inserts are rolled back
+        self._dry_run_skus = set()
+
+    def _load_categories(self):
+        rows = self.db_manager.fetch_all("SELECT id, name FROM categories")
+        self._categories = {row['name'].strip().lower(): row['id'] for row in rows}
+
+    def _category_id(self, name, report, dry_run):
+        if not name:
+            return None
+        key = name.lower()
+        if key not in self._categories:
+            if dry_run:
+                self._categories[key] = None
+            else:
+                cursor = self.db_manager.connection.execute("INSERT INTO categories (name) VALUES (?)", (name,))
+                self._categories[key] = cursor.lastrowid
+            report['categories_created'].append(name)
+        return self._categories[key]
+
+    def import_file(self, path, dry_run=False, progress=None):
+        """Import a .csv or .jsonl catalog
+
+        Args:
+            path (str): Catalog file
+            dry_run (bool): Validate and count, then roll every chunk back
+            progress (callable, optional): Called with the number of rows read so far
+
+        Returns:
+            dict: Counts of rows read, inserted, updated, rejected and
+                superseded by a later row of the same SKU in their chunk, the
+                categories created and the first MAX_REPORTED_ERRORS errors
+        """
+        report = {
+            'rows': 0, 'inserted': 0, 'updated': 0, 'rejected': 0, 'duplicates': 0,
+            'categories_created': [], 'errors': [], 'dry_run': dry_run, 'seconds': 0
+        }
+        self._dry_run_skus = set()
+        started = time.perf_counter()
+        try:
+            self.db_manager.connect()
+            self.db_manager.connection.execute(STAGING_DDL)
+            self._load_categories()
+
+            chunk = []
+            for line_number, row in read_catalog(path):
+                report['rows'] += 1
+                try:
+                    chunk.append((line_number, validate_row(row)))
+                except ValueError as e:
+                    report['rejected'] += 1
+                    if len(report['errors']) < MAX_REPORTED_ERRORS:
+                        report['errors'].append((line_number, str(e)))
+                    continue
+
+                if len(chunk) >= self.chunk_size:
+                    self._apply_chunk(chunk, report, dry_run)
+                    chunk = []
+                    if progress:
+                        progress(report['rows'])
+
+            if chunk:
+                self._apply_chunk(chunk, report, dry_run)
+            if progress:
+                progress(report['rows'])
+            return report
+        except Exception as e:
+            print(f"Error importing catalog: {e}")
+            self.db_manager.rollback()
+            report['errors'].append((None, str(e)))
+            return report
+        finally:
+            self.db_manager.disconnect()
+            report['seconds'] = time.perf_counter() - started
+
+    def _apply_chunk(self, chunk, report, dry_run):
+        connection = self.db_manager.connection
+        self.db_manager.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM temp.catalog_staging")
+            connection.executemany(
+                """
+                INSERT INTO temp.catalog_staging
+                (line, sku, name, description, category_id, price, cost_price, stock, reorder_level)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [(line_number, row['sku'], row['name'], row['description'],
+                  self._category_id(row['category'], report, dry_run), row['price'],
+                  row['cost_price'], row['stock'], row['reorder_level'])
+                 for line_number, row in chunk]
+            )
+
+            # The last row of a SKU repeated within the chunk wins
+            connection.execute(
+                """
+                DELETE FROM temp.catalog_staging
+                WHERE line NOT IN (SELECT MAX(line) FROM temp.catalog_staging GROUP BY sku)
+                """
+            )
+            staged = self.db_manager.fetch_one("SELECT COUNT(*) AS count FROM temp.catalog_staging")['count']
+            report['duplicates'] += len(chunk) - staged
+
+            if dry_run:
+                # Nothing is written, so a new SKU seen in an earlier chunk
+                # is still missing from products; the real import updates it
+                new_skus = {
+                    row['sku'] for row in self.db_manager.fetch_all(
+                        """
+                        SELECT sku FROM temp.catalog_staging s
+                        WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.sku = s.sku)
+                        """
+                    )
+                } - self._dry_run_skus
+                self._dry_run_skus |= new_skus
+                report['inserted'] += len(new_skus)
+                report['updated'] += staged - len(new_skus)
+                self.db_manager.rollback()
+                return
+
+            new_skus = self.db_manager.fetch_one(
+                """
+                SELECT COUNT(*) AS count FROM temp.catalog_staging s
+                WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.sku = s.sku)
+                """
+            )['count']
+            report['inserted'] += new_skus
+            report['updated'] += staged - new_skus
+
+            # Price changes go into the price history before they are applied
+            effective_from = to_utc(None)
+            connection.execute(
+                """
+                INSERT INTO price_list_entries (product_id, price, cost_price, effective_from, note)
+                SELECT p.id, s.price, s.cost_price, ?, 'Catalog import'
+                FROM temp.catalog_staging s JOIN products p ON p.sku = s.sku
+                WHERE p.price IS NOT s.price
+                   OR (s.cost_price IS NOT NULL AND p.cost_price IS NOT s.cost_price)
+                """,
+                (effective_from,)
+            )
+            last_product_id = self.db_manager.fetch_one("SELECT COALESCE(MAX(id), 0) AS id FROM products")['id']
+
+            # Upsert by SKU: update the products already known, then add the rest
+            connection.execute(
+                """
+                UPDATE products SET
+                    name = s.name,
+                    description = COALESCE(s.description, products.description),
+                    category_id = COALESCE(s.category_id, products.category_id),
+                    price = s.price,
+                    cost_price = COALESCE(s.cost_price, products.cost_price),
+                    stock = COALESCE(s.stock, products.stock),
+                    reorder_level = COALESCE(s.reorder_level, products.reorder_level),
+                    updated_at = CURRENT_TIMESTAMP
+                FROM temp.catalog_staging s
+                WHERE products.sku = s.sku
+                """
+            )
+            connection.execute(
+                """
+                INSERT INTO products (sku, name, description, category_id, price, cost_price,
+                                      stock, reorder_level, updated_at)
+                SELECT sku, name, description, category_id, price, COALESCE(cost_price, 0),
+                       COALESCE(stock, 0), COALESCE(reorder_level, 10), CURRENT_TIMESTAMP
+                FROM temp.catalog_staging s
+                WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.sku = s.sku)
+                ORDER BY line
+                """
+            )
+            connection.execute(
+                """
+                INSERT INTO price_list_entries (product_id, price, cost_price, effective_from, note)
+                SELECT id, price, cost_price, ?, 'Catalog import' FROM products WHERE id > ?
+                """,
+                (effective_from, last_product_id)
+            )
+
+            # Stock lives in inventory; rows without a stock value leave it alone
+            connection.execute(
+                """
+                UPDATE inventory SET quantity = s.stock, last_updated = CURRENT_TIMESTAMP
+                FROM temp.catalog_staging s JOIN products p ON p.sku = s.sku
+                WHERE inventory.product_id = p.id AND s.stock IS NOT NULL
+                """
+            )
+            connection.execute(
+                """
+                INSERT INTO inventory (product_id, quantity)
+                SELECT p.id, COALESCE(s.stock, p.stock)
+                FROM temp.catalog_staging s JOIN products p ON p.sku = s.sku
+                WHERE NOT EXISTS (SELECT 1 FROM inventory i WHERE i.product_id = p.id)
+                """
+            )
+            self.db_manager.commit()
+        except Exception:
+            self.db_manager.rollback()
+            # Categories created in the failed chunk are gone again
+            self._load_categories()
+            raise
+
+
+def export_catalog(db_manager, path, progress=None):
+    """Write every product to a .csv or .jsonl catalog file
+
+    Returns:
+        int: Number of products written, or None on error
+    """
+    db_manager = DatabaseManager(db_manager.db_path)
+    jsonl = path.lower().endswith((".jsonl", ".ndjson"))
+    count = 0
+    try:
+        db_manager.connect()
+        cursor = db_manager.cursor
+        cursor.execute(
+            """
+            SELECT p.sku, p.name, p.description, c.name AS category, p.price, p.cost_price,
+                   COALESCE(i.quantity, p.stock) AS stock, p.reorder_level
+            FROM products p
+            LEFT JOIN categories c ON p.category_id = c.id
+            LEFT JOIN inventory i ON i.product_id = p.id
+            ORDER BY p.id
+            """
+        )
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = None if jsonl else csv.writer(f)
+            if writer:
+                writer.writerow(CATALOG_FIELDS)
+            while True:
+                rows = cursor.fetchmany(CHUNK_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    if writer:
+                        writer.writerow(["" if value is None else value for value in row])
+                    else:
+                        f.write(json.dumps(dict(zip(CATALOG_FIELDS, row))) + "\n")
+                count += len(rows)
+                if progress:
+                    progress(count)
+        return count
+    except Exception as e:
+        print(f"Error exporting catalog: {e}")
+        return None
+    finally:
+        db_manager.disconnect()
+
+
+def format_report(report):
+    """Summarise an import report for display"""
+    action = "Would import" if report['dry_run'] else "Imported"
+    lines = [
+        f"{action} {report['inserted'] + report['updated']} of {report['rows']} rows "
+        f"in {report['seconds']:.1f}s: {report['inserted']} new, {report['updated']} updated, "
+        f"{report['rejected']} rejected"
+    ]
+    if report['duplicates']:
+        lines.append(f"Skipped {report['duplicates']} rows repeating a SKU later in the file")
+    if report['categories_created']:
+        lines.append(f"New categories: {', '.join(report['categories_created'])}")
+    for line_number, message in report['errors']:
+        lines.append(f"  line {line_number}: {message}" if line_number else f"  {message}")
+    if report['rejected'] > len(report['errors']):
+        lines.append(f"  ... and {report['rejected'] - len(report['errors'])} more")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import or export the product catalog")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("path", help="Catalog file, .csv or .jsonl")
+    parser.add_argument("--db", default=DATABASE_PATH, help="Path to the database")
+    parser.add_argument("--dry-run", action="store_true", help="Validate and count without changing anything")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(args.db)
+    if args.action == "export":
+        count = export_catalog(db_manager, args.path)
+        if count is not None:
+            print(f"Exported {count} products to {os.path.abspath(args.path)}")
+        return
+
+    report = CatalogImporter(db_manager).import_file(args.path, args.dry_run)
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+import os
+import re
+import time
+import threading
+from array import array
+from collections import Counter
+
+from config import CUSTOMER_INDEX_REFRESH
+from db_manager import DatabaseManager
+
+# Rows read per batch while building the index
+BUILD_CHUNK_SIZE = 10000
+
+# Postings scanned per name search; the rarest trigrams are used first
+MAX_POSTINGS = 2000000
+
+# Candidates re-scored exactly after the trigram vote
+MAX_CANDIDATES = 200
+
+# Lowest similarity returned by a name search
+MIN_SCORE = 0.3
+
+_EMPTY = array('I')
+
+# numpy is imported on the first name search, not at startup
+_numpy = None
+
+
+def _load_numpy():
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:  # Name votes are counted in pure Python instead
+            _numpy = False
+    return _numpy
+
+
+def normalize_phone(phone):
+    """Keep only the digits of a phone number"""
+    return re.sub(r"\D", "", phone or "")
+
+
+def normalize_name(name):
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", (name or "").lower()).split())
+
+
+def trigrams(name):
+    """Trigrams of each word, padded like pg_trgm so word starts weigh more"""
+    grams = set()
+    for word in normalize_name(name).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class CustomerIndex:
+    """In-memory search index over the customers table.
+
+    Phone numbers are indexed by their digits and by their last four digits,
+    so a cashier can type the full number in any format or just the last
+    four. Names are indexed by trigram for typo-tolerant matching. The index
+    is built once per process in the background, kept current by
+    Customer.add_customer / update_customer / delete_customer, and picks up
+    customers added or changed on other tills every CUSTOMER_INDEX_REFRESH
+    seconds, by their updated_at. Until the build finishes, searches only
+    find exact phone numbers, straight from the database.
+    """
+
+    def __init__(self, db_manager):
+        # A private manager, so building never disturbs the caller's connection
+        self.db_manager = DatabaseManager(db_manager.db_path)
+        self._lock = threading.RLock()
+        self._built = False
+        self._building = False
+        self._build_lock = threading.Lock()
+        self._last_refresh = 0
+        # Set when a change was skipped during the build
+        self._stale = False
+        # Latest customers.updated_at indexed
+        self.watermark = None
+        self._names = {}
+        self._phones = {}
+        self._by_phone = {}
+        self._by_last4 = {}
+        self._postings = {}
+        # Trigram count of each customer's name, indexed by id
+        self._gram_counts = array('H')
+
+    # Maintenance
+    def _index(self, customer_id, name, phone):
+        self._names[customer_id] = name or ""
+        grams = trigrams(name)
+        if customer_id >= len(self._gram_counts):
+            self._gram_counts.frombytes(bytes(2 * (customer_id + 1 - len(self._gram_counts))))
+        self._gram_counts[customer_id] = min(len(grams), 65535)
+        for gram in grams:
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = array('I')
+            postings.append(customer_id)
+
+        digits = normalize_phone(phone)
+        self._phones[customer_id] = digits
+        if digits:
+            self._by_phone[digits] = customer_id
+            self._by_last4.setdefault(digits[-4:], []).append(customer_id)
+
+    def _unindex(self, customer_id):
+        # Name postings are left in place and filtered at query time, removing
+        # ids from large arrays would cost more than the stale entries do
+        self._names.pop(customer_id, None)
+        digits = self._phones.pop(customer_id, "")
+        if digits:
+            if self._by_phone.get(digits) == customer_id:
+                del self._by_phone[digits]
+            last4 = self._by_last4.get(digits[-4:], [])
+            if customer_id in last4:
+                last4.remove(customer_id)
+
+    def _load(self, since=None):
+        """Index customers added or changed at or after since, all of them if None"""
+        self._stale = False
+        try:
+            self.db_manager.connect()
+            cursor = self.db_manager.cursor
+            if since is None:
+                cursor.execute("SELECT id, name, phone, updated_at FROM customers ORDER BY id")
+            else:
+                # At or after: changes later in the same second as the
+                # watermark would otherwise be missed
+                cursor.execute(
+                    "SELECT id, name, phone, updated_at FROM customers WHERE updated_at >= ? ORDER BY updated_at",
+                    (since,)
+                )
+            while True:
+                rows = cursor.fetchmany(BUILD_CHUNK_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    # Rows read again at the watermark are usually unchanged;
+                    # re-indexing them would pile up duplicate postings
+                    if self._names.get(row['id']) != (row['name'] or "") or \
+                            self._phones.get(row['id']) != normalize_phone(row['phone']):
+                        self._unindex(row['id'])
+                        self._index(row['id'], row['name'], row['phone'])
+                    if row['updated_at'] and (self.watermark is None or row['updated_at'] > self.watermark):
+                        self.watermark = row['updated_at']
+        finally:
+            self.db_manager.disconnect()
+        self._last_refresh = time.monotonic()
+
+    def ensure_built(self):
+        """Build the index on first use, refresh it when due"""
+        with self._lock:
+            if not self._built:
+                self._load()
+                self._built = True
+            elif self._stale or time.monotonic() - self._last_refresh >= CUSTOMER_INDEX_REFRESH:
+                self._load(self.watermark)
+
+    def _build(self):
+        try:
+            self.ensure_built()
+        finally:
+            with self._build_lock:
+                self._building = False
+
+    def warm_up(self):
+        """Build the index in a background thread, unless built or building already"""
+        with self._build_lock:
+            if self._built or self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._build, name="customer-index", daemon=True).start()
+
+    def add(self, customer_id, name, phone):
+        """Index a new customer"""
+        # While building, the refresh after the build picks the change up
+        # by its updated_at; waiting on the build would stall the till
+        if not self._built:
+            self._stale = True
+            return
+        with self._lock:
+            self._unindex(customer_id)
+            self._index(customer_id, name, phone)
+
+    def update(self, customer_id, name, phone):
+        """Re-index a changed customer"""
+        self.add(customer_id, name, phone)
+
+    def remove(self, customer_id):
+        """Drop a deleted customer"""
+        # Ids indexed for deleted customers are dropped when their rows are read
+        if not self._built:
+            return
+        with self._lock:
+            self._unindex(customer_id)
+
+    # Search
+    def find_by_phone(self, phone):
+        """Get the id of the customer with exactly these phone digits, or None
+
+        None while the index is still being built.
+        """
+        if not self._built:
+            self.warm_up()
+            return None
+        self.ensure_built()
+        with self._lock:
+            return self._by_phone.get(normalize_phone(phone))
+
+    def search(self, query, limit=20):
+        """Rank customers matching a phone fragment or a name
+
+        Args:
+            query (str): Phone number, its last digits, or (part of) a name
+            limit (int): Maximum number of matches
+
+        Returns:
+            list: (customer_id, score) pairs, best match first
+        """
+        query = (query or "").strip()
+        if not query:
+            return []
+
+        if not self._built:
+            self.warm_up()
+            return self._search_database(query)
+
+        self.ensure_built()
+        with self._lock:
+            digits = normalize_phone(query)
+            if digits and not re.search(r"[A-Za-z]", query):
+                matches = self._search_phone(digits)
+            else:
+                matches = self._search_name(query)
+
+        matches.sort(key=lambda match: (-match[1], self._names.get(match[0], "")))
+        return matches[:limit]
+
+    def _search_database(self, query):
+        """Exact phone matches read from the database, for use while building"""
+        digits = normalize_phone(query)
+        if not digits or re.search(r"[A-Za-z]", query):
+            return []
+
+        # Own manager: the build thread is using the index's
+        db_manager = DatabaseManager(self.db_manager.db_path)
+        try:
+            db_manager.connect()
+            rows = db_manager.fetch_all("SELECT id FROM customers WHERE phone IN (?, ?)", (query, digits))
+        finally:
+            db_manager.disconnect()
+        return [(row['id'], 2.0) for row in rows]
+
+    def _search_phone(self, digits):
+        if len(digits) < 4:
+            return []
+
+        matches = {}
+        exact = self._by_phone.get(digits)
+        if exact is not None:
+            matches[exact] = 2.0
+
+        # Typed the last digits, or the stored number carries a country code
+        for customer_id in self._by_last4.get(digits[-4:], []):
+            if customer_id not in matches and self._phones.get(customer_id, "").endswith(digits):
+                matches[customer_id] = 1.0 + len(digits) / max(len(self._phones[customer_id]), 1)
+
+        return list(matches.items())
+
+    def _vote(self, postings, query_size):
+        """Rank customers by trigram overlap with the query
+
+        Returns the ids with the best approximate similarity, estimated from
+        the votes and the stored trigram count of each name.
+        """
+        np = _load_numpy()
+        if np:
+            ids = np.concatenate([np.frombuffer(ids, dtype=np.uint32) for ids in postings])
+            counts = np.bincount(ids)
+            candidates = np.flatnonzero(counts)
+            name_sizes = np.frombuffer(self._gram_counts, dtype=np.uint16)[candidates]
+            scores = counts[candidates] / (query_size + name_sizes.astype(np.float64))
+            if len(candidates) > MAX_CANDIDATES:
+                best = np.argpartition(-scores, MAX_CANDIDATES)[:MAX_CANDIDATES]
+                candidates = candidates[best]
+            return candidates.tolist()
+
+        votes = Counter()
+        for ids in postings:
+            votes.update(ids)
+        gram_counts = self._gram_counts
+        ranked = sorted(votes.items(), key=lambda vote: vote[1] / (query_size + gram_counts[vote[0]]), reverse=True)
+        return [customer_id for customer_id, _ in ranked[:MAX_CANDIDATES]]
+
+    def _search_name(self, query):
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+
+        # Vote with the rarest trigrams first so a common one ("  j") can't
+        # blow up the scan
+        postings = sorted((self._postings.get(gram, _EMPTY) for gram in query_grams), key=len)
+        used = []
+        scanned = 0
+        for ids in postings:
+            if not ids or (scanned and scanned + len(ids) > MAX_POSTINGS):
+                continue
+            used.append(ids)
+            scanned += len(ids)
+        if not used:
+            return []
+
+        # Re-score the short list exactly; this also drops stale postings
+        # left behind by renamed or deleted customers
+        normalized_query = normalize_name(query)
+        matches = []
+        for customer_id in self._vote(used, len(query_grams)):
+            name = self._names.get(customer_id)
+            if name is None:
+                continue
+
+            name_grams = trigrams(name)
+            score = 2 * len(query_grams & name_grams) / (len(query_grams) + len(name_grams))
+            normalized = normalize_name(name)
+            if normalized.startswith(normalized_query):
+                score += 0.5
+            elif normalized_query in normalized:
+                score += 0.25
+
+            if score >= MIN_SCORE:
+                matches.append((customer_id, score))
+
+        return matches
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_customer_index(db_manager):
+    """Get the customer index of a database, shared within the process"""
+    db_path = os.path.abspath(db_manager.db_path)
+    with _indexes_lock:
+        if db_path not in _indexes:
+            _indexes[db_path] = CustomerIndex(db_manager)
+        return _indexes[db_path]
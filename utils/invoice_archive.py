@@ -0,0 +1,344 @@
+import os
+import re
+import datetime
+import argparse
+
+from config import ARCHIVE_DIRECTORY, DATABASE_PATH
+from db_manager import DatabaseManager
+
+# Tables moved into the archive, with the column that ties a row to its invoice
+ARCHIVED_TABLES = [
+    ('invoices', 'id'),
+    ('invoice_items', 'invoice_id'),
+    ('returns', 'invoice_id'),
+    ('return_items', 'invoice_id'),
+    ('payments', 'invoice_id'),
+]
+
+# Beyond this many months a report stages archived rows into temp tables,
+# SQLite only allows a handful of attached databases per connection
+MAX_DIRECT_ATTACH = 8
+
+
+def _columns(db_manager, schema, table):
+    """Get the (name, type) pairs of a table"""
+    rows = db_manager.fetch_all(f"PRAGMA {schema}.table_info({table})")
+    return [(row['name'], row['type']) for row in rows]
+
+
+def _manifest_exists(db_manager):
+    return db_manager.fetch_one(
+        "SELECT name FROM main.sqlite_master WHERE type = 'table' AND name = 'invoice_archives'"
+    ) is not None
+
+
+def _archive_path(file_name):
+    return os.path.join(ARCHIVE_DIRECTORY, file_name)
+
+
+def _union_view(db_manager, view, table, schemas):
+    """Create a temp view over a table in main and the given schemas"""
+    main_columns = [name for name, _ in _columns(db_manager, 'main', table)]
+    columns = main_columns
+    for schema in schemas:
+        archived = {name for name, _ in _columns(db_manager, schema, table)}
+        columns = [name for name in columns if name in archived]
+
+    column_list = ", ".join(columns)
+    selects = [f"SELECT {column_list} FROM main.{table}"]
+    selects += [f"SELECT {column_list} FROM {schema}.{table}" for schema in schemas]
+
+    db_manager.execute(f"DROP VIEW IF EXISTS temp.{view}")
+    db_manager.execute(f"CREATE TEMP VIEW {view} AS " + " UNION ALL ".join(selects))
+
+
+def report_tables(db_manager, from_date=None, to_date=None):
+    """Make archived invoices of a date range visible on the current connection
+
+    Must be called after db_manager.connect(). Archived months overlapping the
+    range are attached (or, for long ranges, staged into temp tables) and
+    unioned with the hot tables in temp views. When no archive is needed the
+    hot tables are returned and nothing is attached.
+
+    Returns:
+        tuple: Names to read invoices and invoice items from
+    """
+    hot = ('invoices', 'invoice_items')
+    if not _manifest_exists(db_manager):
+        return hot
+
+    query = "SELECT period, file_name FROM invoice_archives WHERE 1=1"
+    params = []
+    if from_date:
+        query += " AND period >= ?"
+        params.append(str(from_date)[:7])
+    if to_date:
+        query += " AND period <= ?"
+        params.append(str(to_date)[:7])
+    archives = [
+        row for row in db_manager.fetch_all(query + " ORDER BY period", params)
+        if os.path.exists(_archive_path(row['file_name']))
+    ]
+    if not archives:
+        return hot
+
+    if len(archives) <= MAX_DIRECT_ATTACH:
+        schemas = []
+        for index, archive in enumerate(archives):
+            schema = f"archive_{index}"
+            db_manager.execute(f"ATTACH DATABASE ? AS {schema}", (_archive_path(archive['file_name']),))
+            schemas.append(schema)
+    else:
+        # Copy the archived rows into temp tables one archive at a time
+        for table in hot:
+            columns = ", ".join(name for name, _ in _columns(db_manager, 'main', table))
+            db_manager.execute(f"DROP TABLE IF EXISTS temp.staged_{table}")
+            db_manager.execute(f"CREATE TEMP TABLE staged_{table} AS SELECT {columns} FROM main.{table} WHERE 0")
+        for archive in archives:
+            db_manager.execute("ATTACH DATABASE ? AS archive_stage", (_archive_path(archive['file_name']),))
+            for table in hot:
+                archived = {name for name, _ in _columns(db_manager, 'archive_stage', table)}
+                columns = ", ".join(
+                    name for name, _ in _columns(db_manager, 'temp', f"staged_{table}") if name in archived
+                )
+                db_manager.execute(
+                    f"INSERT INTO temp.staged_{table} ({columns}) SELECT {columns} FROM archive_stage.{table}"
+                )
+            db_manager.commit()
+            db_manager.execute("DETACH DATABASE archive_stage")
+        schemas = None
+
+    names = []
+    for table in hot:
+        view = f"report_{table}"
+        if schemas is None:
+            main_columns = ", ".join(name for name, _ in _columns(db_manager, 'main', table))
+            db_manager.execute(f"DROP VIEW IF EXISTS temp.{view}")
+            db_manager.execute(
+                f"CREATE TEMP VIEW {view} AS SELECT {main_columns} FROM main.{table} "
+                f"UNION ALL SELECT {main_columns} FROM temp.staged_{table}"
+            )
+        else:
+            _union_view(db_manager, view, table, schemas)
+        names.append(view)
+    return tuple(names)
+
+
+def last_archived_invoice_id(db_manager):
+    """Get the highest invoice id moved to the archive, 0 when nothing is"""
+    if not _manifest_exists(db_manager):
+        return 0
+    row = db_manager.fetch_one("SELECT COALESCE(MAX(last_invoice_id), 0) AS id FROM invoice_archives")
+    return row['id']
+
+
+def archive_tables_for_invoice(db_manager, invoice_id):
+    """Attach the archive holding an invoice that is no longer in the hot tables
+
+    Returns:
+        tuple: Names to read the invoice, its items and its payments from, or None
+    """
+    if not _manifest_exists(db_manager):
+        return None
+
+    # Id ranges of neighbouring months can overlap, so check each candidate
+    candidates = db_manager.fetch_all(
+        """
+        SELECT file_name FROM invoice_archives
+        WHERE ? BETWEEN first_invoice_id AND last_invoice_id
+        ORDER BY period
+        """,
+        (invoice_id,)
+    )
+    for archive in candidates:
+        if not os.path.exists(_archive_path(archive['file_name'])):
+            continue
+        db_manager.execute("ATTACH DATABASE ? AS archive_lookup", (_archive_path(archive['file_name']),))
+        if db_manager.fetch_one("SELECT id FROM archive_lookup.invoices WHERE id = ?", (invoice_id,)):
+            # Months archived before payments were moved left them in the hot table
+            has_payments = db_manager.fetch_one(
+                "SELECT 1 FROM archive_lookup.sqlite_master WHERE type = 'table' AND name = 'payments'"
+            )
+            return ('archive_lookup.invoices', 'archive_lookup.invoice_items',
+                    'archive_lookup.payments' if has_payments else 'payments')
+        db_manager.execute("DETACH DATABASE archive_lookup")
+    return None
+
+
+class InvoiceArchiver:
+    """Moves invoices of closed months out of the hot database.
+
+    Each month goes to its own SQLite file under the archive directory and is
+    recorded in the invoice_archives manifest, which report_tables() uses to
+    attach only the months a report actually needs.
+    """
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def get_archives(self):
+        """Get the manifest of archived months"""
+        try:
+            self.db_manager.connect()
+            if not _manifest_exists(self.db_manager):
+                return []
+            return self.db_manager.fetch_all("SELECT * FROM invoice_archives ORDER BY period")
+        finally:
+            self.db_manager.disconnect()
+
+    def get_closed_periods(self, keep_months=1):
+        """Get months with hot invoices that are old enough to archive
+
+        Args:
+            keep_months (int): Number of most recent months (including the
+                current one) that stay in the hot database
+        """
+        today = datetime.date.today()
+        month_index = today.year * 12 + today.month - 1 - (max(keep_months, 1) - 1)
+        first_kept = f"{month_index // 12:04d}-{month_index % 12 + 1:02d}"
+
+        try:
+            self.db_manager.connect()
+            rows = self.db_manager.fetch_all(
+                """
+                SELECT DISTINCT substr(created_at, 1, 7) AS period
+                FROM invoices
+                WHERE created_at < ?
+                ORDER BY period
+                """,
+                (first_kept + "-01",)
+            )
+            return [row['period'] for row in rows if row['period']]
+        finally:
+            self.db_manager.disconnect()
+
+    def archive_period(self, period):
+        """Move the invoices of one month (YYYY-MM) into its archive file
+
+        Returns:
+            int: Number of invoices archived, or None on error
+        """
+        if not re.fullmatch(r"\d{4}-\d{2}", period):
+            raise ValueError(f"Invalid period: {period}")
+
+        file_name = f"invoices_{period}.db"
+        os.makedirs(ARCHIVE_DIRECTORY, exist_ok=True)
+
+        next_month = datetime.date(int(period[:4]), int(period[5:]), 28) + datetime.timedelta(days=4)
+        period_end = next_month.replace(day=1).isoformat()
+
+        try:
+            self.db_manager.connect()
+            self.db_manager.execute("ATTACH DATABASE ? AS archive", (_archive_path(file_name),))
+
+            # Mirror the hot table definitions, adding columns introduced since
+            for table, _ in ARCHIVED_TABLES:
+                ddl = self.db_manager.fetch_one(
+                    "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+                )['sql']
+                ddl = re.sub(
+                    rf"^CREATE TABLE\s+(IF NOT EXISTS\s+)?[\"']?{table}[\"']?",
+                    f"CREATE TABLE IF NOT EXISTS archive.{table}", ddl, flags=re.IGNORECASE
+                )
+                self.db_manager.connection.execute(ddl)
+
+                archived = {name for name, _ in _columns(self.db_manager, 'archive', table)}
+                for name, column_type in _columns(self.db_manager, 'main', table):
+                    if name not in archived:
+                        self.db_manager.connection.execute(
+                            f"ALTER TABLE archive.{table} ADD COLUMN {name} {column_type}"
+                        )
+
+            self.db_manager.execute("BEGIN IMMEDIATE")
+
+            self.db_manager.execute("DROP TABLE IF EXISTS temp.archiving_invoices")
+            self.db_manager.execute(
+                """
+                CREATE TEMP TABLE archiving_invoices AS
+                SELECT id FROM main.invoices WHERE created_at >= ? AND created_at < ?
+                """,
+                (period + "-01", period_end)
+            )
+            stats = self.db_manager.fetch_one(
+                "SELECT COUNT(*) AS count, MIN(id) AS first_id, MAX(id) AS last_id FROM temp.archiving_invoices"
+            )
+            if not stats['count']:
+                self.db_manager.rollback()
+                return 0
+
+            # Children first, so the invoice ids are still there to match on
+            for table, invoice_column in reversed(ARCHIVED_TABLES):
+                columns = ", ".join(name for name, _ in _columns(self.db_manager, 'main', table))
+                self.db_manager.connection.execute(
+                    f"""
+                    INSERT INTO archive.{table} ({columns})
+                    SELECT {columns} FROM main.{table}
+                    WHERE {invoice_column} IN (SELECT id FROM temp.archiving_invoices)
+                    """
+                )
+                self.db_manager.connection.execute(
+                    f"""
+                    DELETE FROM main.{table}
+                    WHERE {invoice_column} IN (SELECT id FROM temp.archiving_invoices)
+                    """
+                )
+
+            self.db_manager.connection.execute(
+                """
+                INSERT INTO invoice_archives
+                    (period, file_name, first_invoice_id, last_invoice_id, invoice_count)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(period) DO UPDATE SET
+                    first_invoice_id = MIN(first_invoice_id, excluded.first_invoice_id),
+                    last_invoice_id = MAX(last_invoice_id, excluded.last_invoice_id),
+                    invoice_count = invoice_count + excluded.invoice_count,
+                    archived_at = CURRENT_TIMESTAMP
+                """,
+                (period, file_name, stats['first_id'], stats['last_id'], stats['count'])
+            )
+
+            # Both files commit atomically through SQLite's multi-database journal
+            self.db_manager.commit()
+            self.db_manager.execute("DROP TABLE IF EXISTS temp.archiving_invoices")
+            return stats['count']
+        except Exception as e:
+            print(f"Error archiving period {period}: {e}")
+            self.db_manager.rollback()
+            return None
+        finally:
+            self.db_manager.disconnect()
+
+    def archive_closed_periods(self, keep_months=1, vacuum=False):
+        """Archive every closed month, optionally compacting the hot database after
+
+        Returns:
+            dict: Invoices archived per period
+        """
+        results = {}
+        for period in self.get_closed_periods(keep_months):
+            results[period] = self.archive_period(period)
+
+        if vacuum and any(results.values()):
+            try:
+                self.db_manager.connect()
+                self.db_manager.connection.execute("VACUUM")
+            finally:
+                self.db_manager.disconnect()
+
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive invoices of closed months")
+    parser.add_argument("--db", default=DATABASE_PATH, help="Path to the hot database")
+    parser.add_argument("--keep-months", type=int, default=3, help="Months to keep in the hot database")
+    parser.add_argument("--vacuum", action="store_true", help="Compact the hot database afterwards")
+    args = parser.parse_args()
+
+    archiver = InvoiceArchiver(DatabaseManager(args.db))
+    for period, count in archiver.archive_closed_periods(args.keep_months, args.vacuum).items():
+        print(f"{period}: {'failed' if count is None else f'{count} invoices archived'}")
+
+
+if __name__ == "__main__":
+    main()
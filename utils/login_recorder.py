@@ -0,0 +1,88 @@
+import os
+import atexit
+import threading
+
+from config import LOGIN_FLUSH_INTERVAL
+from db_manager import DatabaseManager
+from utils.sales_metrics import utc_timestamp
+
+
+class LoginRecorder:
+    """Batches users.last_login updates off the login path.
+
+    Logins only note the time in memory; a background thread writes all
+    pending times in one transaction every LOGIN_FLUSH_INTERVAL seconds, so
+    a burst of logins at shift change costs a single commit.
+    """
+
+    def __init__(self, db_manager, interval=LOGIN_FLUSH_INTERVAL):
+        # A private manager, flushing never disturbs the caller's connection
+        self.db_manager = DatabaseManager(db_manager.db_path)
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def record(self, user_id):
+        """Note a login, written at the next flush"""
+        with self._lock:
+            self._pending[user_id] = utc_timestamp()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="login-recorder", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """Write pending login times
+
+        Returns:
+            int: Number of users updated
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            try:
+                self.db_manager.connect()
+                self.db_manager.connection.executemany(
+                    "UPDATE users SET last_login = ? WHERE id = ?",
+                    [(logged_in_at, user_id) for user_id, logged_in_at in pending.items()]
+                )
+                self.db_manager.commit()
+                return len(pending)
+            except Exception as e:
+                print(f"Error recording logins: {e}")
+                self.db_manager.rollback()
+                # Put them back unless a newer login arrived meanwhile
+                with self._lock:
+                    for user_id, logged_in_at in pending.items():
+                        self._pending.setdefault(user_id, logged_in_at)
+                return 0
+            finally:
+                self.db_manager.disconnect()
+
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+
+def get_login_recorder(db_manager):
+    """Get the login recorder of a database, shared within the process"""
+    db_path = os.path.abspath(db_manager.db_path)
+    with _recorders_lock:
+        if db_path not in _recorders:
+            _recorders[db_path] = LoginRecorder(db_manager)
+        return _recorders[db_path]
+
+
+@atexit.register
+def _flush_all():
+    for recorder in list(_recorders.values()):
+        recorder.flush()
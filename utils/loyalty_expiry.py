@@ -0,0 +1,142 @@
+import os
+import time
+import random
+import shutil
+import datetime
+import argparse
+import tempfile
+
+from config import DATABASE_PATH
+from db_manager import DatabaseManager
+from models.loyalty import Loyalty
+
+
+def expire_points_per_customer(db_manager, as_of):
+    """The row-at-a-time expiry the set-wise job replaces, kept for benchmarking"""
+    try:
+        db_manager.connect()
+        customers = db_manager.fetch_all(
+            "SELECT DISTINCT customer_id FROM loyalty_ledger WHERE remaining > 0 AND expires_at <= ?",
+            (as_of,)
+        )
+        for customer in customers:
+            lots = db_manager.fetch_all(
+                "SELECT id, remaining FROM loyalty_ledger WHERE customer_id = ? AND remaining > 0 AND expires_at <= ?",
+                (customer['customer_id'], as_of)
+            )
+            points = sum(lot['remaining'] for lot in lots)
+            for lot in lots:
+                db_manager.execute("UPDATE loyalty_ledger SET remaining = 0 WHERE id = ?", (lot['id'],))
+            db_manager.execute(
+                "INSERT INTO loyalty_ledger (customer_id, entry_type, points) VALUES (?, 'expire', ?)",
+                (customer['customer_id'], -points)
+            )
+            db_manager.execute(
+                "UPDATE customers SET loyalty_points = MAX(loyalty_points - ?, 0) WHERE id = ?",
+                (points, customer['customer_id'])
+            )
+            db_manager.commit()
+        return len(customers)
+    finally:
+        db_manager.disconnect()
+
+
+def _build_benchmark_database(path, customers, lots_per_customer, expired_share):
+    db_manager = DatabaseManager(path)
+    # The full schema, so the ledger and its indexes are the ones tills have
+    db_manager.initialize_database()
+    db_manager.connect()
+    connection = db_manager.connection
+
+    random.seed(42)
+    today = datetime.date.today()
+    connection.executemany(
+        "INSERT INTO customers (id, name, phone) VALUES (?, ?, ?)",
+        ((i, f"Customer {i}", f"{i:010d}") for i in range(1, customers + 1))
+    )
+
+    def lots():
+        for customer_id in range(1, customers + 1):
+            for _ in range(lots_per_customer):
+                points = random.randint(1, 200)
+                if random.random() < expired_share:
+                    expires_at = today - datetime.timedelta(days=random.randint(1, 30))
+                else:
+                    expires_at = today + datetime.timedelta(days=random.randint(1, 365))
+                yield customer_id, points, points, expires_at.isoformat()
+
+    connection.executemany(
+        """
+        INSERT INTO loyalty_ledger (customer_id, entry_type, points, remaining, expires_at)
+        VALUES (?, 'earn', ?, ?, ?)
+        """,
+        lots()
+    )
+    connection.execute("""
+        UPDATE customers SET loyalty_points = (
+            SELECT SUM(remaining) FROM loyalty_ledger l WHERE l.customer_id = customers.id
+        )
+    """)
+    db_manager.commit()
+    db_manager.disconnect()
+
+
+def benchmark(customers=100000, lots_per_customer=5, expired_share=0.2):
+    """Time set-wise against per-customer expiry on identical synthetic ledgers
+
+    Returns:
+        dict: Seconds taken by each approach and the number of customers affected
+    """
+    directory = tempfile.mkdtemp(prefix="loyalty_benchmark_")
+    try:
+        base_path = os.path.join(directory, "base.db")
+        _build_benchmark_database(base_path, customers, lots_per_customer, expired_share)
+        as_of = datetime.date.today().isoformat()
+
+        set_wise_path = os.path.join(directory, "set_wise.db")
+        per_customer_path = os.path.join(directory, "per_customer.db")
+        shutil.copy(base_path, set_wise_path)
+        shutil.copy(base_path, per_customer_path)
+
+        started = time.perf_counter()
+        result = Loyalty(DatabaseManager(set_wise_path)).expire_points(as_of)
+        set_wise = time.perf_counter() - started
+
+        started = time.perf_counter()
+        expire_points_per_customer(DatabaseManager(per_customer_path), as_of)
+        per_customer = time.perf_counter() - started
+
+        return {
+            'customers': customers,
+            'lots': customers * lots_per_customer,
+            'customers_expired': result['customers'] if result else 0,
+            'set_wise_seconds': set_wise,
+            'per_customer_seconds': per_customer
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expire loyalty points past their expiry date")
+    parser.add_argument("--db", default=DATABASE_PATH, help="Path to the database")
+    parser.add_argument("--as-of", help="Expire lots due on or before this date (YYYY-MM-DD), default today")
+    parser.add_argument("--benchmark", type=int, metavar="CUSTOMERS",
+                        help="Compare set-wise and per-customer expiry on a synthetic ledger instead")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        result = benchmark(args.benchmark)
+        print(f"{result['customers']} customers, {result['lots']} lots, "
+              f"{result['customers_expired']} with expiring points")
+        print(f"set-wise:     {result['set_wise_seconds']:.2f}s")
+        print(f"per-customer: {result['per_customer_seconds']:.2f}s")
+        return
+
+    result = Loyalty(DatabaseManager(args.db)).expire_points(args.as_of)
+    if result is not None:
+        print(f"Expired {result['points']} points from {result['customers']} customers")
+
+
+if __name__ == "__main__":
+    main()
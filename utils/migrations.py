@@ -0,0 +1,650 @@
+import time
+import sqlite3
+import argparse
+
+from config import DATABASE_PATH
+from utils.backup import BackupManager
+
+# Seconds a migration waits for tills to finish their own writes
+BUSY_TIMEOUT = 30
+
+# VM instructions between progress checks while an index is built
+PROGRESS_INTERVAL = 200000
+
+# Seconds between progress reports during a long index build
+HEARTBEAT_SECONDS = 1.0
+
+
+class Migration:
+    """One schema version.
+
+    The statements are frozen copies of the DDL at the time the version
+    shipped, so a migration never changes under a database that has not run
+    it yet. Online migrations commit after each statement instead of once at
+    the end, which keeps the write lock short and lets an interrupted run
+    resume; every statement in them must therefore be idempotent.
+    """
+
+    def __init__(self, version, description, statements, online=False):
+        self.version = version
+        self.description = description
+        self.statements = statements
+        self.online = online
+
+
+def _replication_triggers(tables):
+    """Change log triggers for a frozen copy of the replicated tables and columns"""
+    statements = []
+    for table, columns in tables.items():
+        payload = ", ".join(f"'{column}', NEW.{column}" for column in columns)
+        for event in ("INSERT", "UPDATE"):
+            statements.append(f"""
+        CREATE TRIGGER IF NOT EXISTS replicate_{table}_{event.lower()}
+        AFTER {event} ON {table}
+        WHEN EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+        BEGIN
+            INSERT INTO replication_log (table_name, row_id, payload)
+            VALUES ('{table}', NEW.id, json_object({payload}));
+        END
+        """)
+    return statements
+
+
+def _replication_backfill(tables):
+    """Log the existing rows of tables a replicating till has not shipped yet"""
+    return [
+        f"""
+        INSERT INTO replication_log (table_name, row_id, payload)
+        SELECT '{table}', id, json_object({", ".join(f"'{column}', {column}" for column in columns)})
+        FROM {table}
+        WHERE EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+        """
+        for table, columns in tables.items()
+    ]
+
+
+_REPLICATED_V11 = {
+    'invoices': ['id', 'invoice_number', 'customer_id', 'total_amount', 'tax_amount', 'discount_amount',
+                 'final_amount', 'payment_method', 'payment_status', 'card_last4', 'client_ref',
+                 'created_by', 'created_at'],
+    'invoice_items': ['id', 'invoice_id', 'product_id', 'quantity', 'unit_price', 'total_price', 'created_at'],
+    'returns': ['id', 'return_number', 'invoice_id', 'customer_id', 'refund_amount', 'tax_refunded',
+                'refund_method', 'points_reversed', 'points_restored', 'reason', 'created_by', 'created_at'],
+    'return_items': ['id', 'return_id', 'invoice_id', 'product_id', 'quantity', 'unit_price', 'total_price',
+                     'restocked'],
+    'payments': ['id', 'invoice_id', 'return_id', 'tender', 'amount', 'tendered', 'change_given', 'card_last4',
+                 'till_id', 'created_by', 'created_at'],
+    'inventory': ['id', 'product_id', 'quantity', 'last_updated', 'last_restock_date'],
+    'inventory_transactions': ['id', 'product_id', 'quantity_change', 'transaction_type', 'reference_id',
+                               'notes', 'created_by', 'created_at'],
+    'stock_transactions': ['id', 'product_id', 'quantity', 'type', 'notes', 'user_id', 'created_at'],
+}
+
+# Tables first replicated by version 11; rows written before it are shipped once
+_BACKFILLED_V11 = {table: _REPLICATED_V11[table] for table in ('returns', 'return_items', 'payments')}
+
+
+MIGRATIONS = [
+    Migration(1, "Tables added after the first release", [
+        """
+        CREATE TABLE IF NOT EXISTS stock_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            type VARCHAR(50) NOT NULL,
+            notes TEXT,
+            user_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES products(id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS invoice_archives (
+            period TEXT PRIMARY KEY,
+            file_name TEXT NOT NULL,
+            first_invoice_id INTEGER NOT NULL,
+            last_invoice_id INTEGER NOT NULL,
+            invoice_count INTEGER NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_pins (
+            user_id INTEGER PRIMARY KEY,
+            pin_hash TEXT NOT NULL,
+            salt TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS loyalty_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            invoice_id INTEGER,
+            entry_type TEXT NOT NULL CHECK (entry_type IN ('earn', 'redeem', 'expire', 'adjust')),
+            points INTEGER NOT NULL,
+            remaining INTEGER NOT NULL DEFAULT 0,
+            expires_at DATE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (customer_id) REFERENCES customers (id),
+            FOREIGN KEY (invoice_id) REFERENCES invoices (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_loyalty_ledger_customer ON loyalty_ledger (customer_id, created_at)",
+        """
+        CREATE INDEX IF NOT EXISTS idx_loyalty_ledger_open_lots ON loyalty_ledger (expires_at)
+        WHERE remaining > 0
+        """,
+    ]),
+    Migration(2, "Indexes for invoice, report and stock lookups", [
+        "CREATE INDEX IF NOT EXISTS idx_invoices_created_at ON invoices (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_invoices_customer ON invoices (customer_id)",
+        "CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice ON invoice_items (invoice_id)",
+        "CREATE INDEX IF NOT EXISTS idx_invoice_items_product ON invoice_items (product_id)",
+        "CREATE INDEX IF NOT EXISTS idx_inventory_transactions_product ON inventory_transactions (product_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_stock_transactions_product ON stock_transactions (product_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_cart_items_session ON cart_items (session_id, product_id)",
+    ], online=True),
+    Migration(3, "Product SKUs for catalog import", [
+        "ALTER TABLE products ADD COLUMN sku TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku ON products (sku)",
+        "CREATE INDEX IF NOT EXISTS idx_inventory_product ON inventory (product_id)",
+    ]),
+    Migration(4, "Effective-dated price lists", [
+        """
+        CREATE TABLE IF NOT EXISTS price_list_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            store_id INTEGER,
+            price REAL NOT NULL,
+            cost_price REAL,
+            effective_from TIMESTAMP NOT NULL,
+            note TEXT,
+            created_by INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES products (id),
+            FOREIGN KEY (created_by) REFERENCES users (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_price_list_product ON price_list_entries (product_id, effective_from)",
+        "CREATE INDEX IF NOT EXISTS idx_price_list_effective ON price_list_entries (effective_from)",
+    ]),
+    Migration(5, "Client references for sales replayed from the offline journal", [
+        "ALTER TABLE invoices ADD COLUMN client_ref TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_invoices_client_ref ON invoices (client_ref)",
+    ]),
+    Migration(6, "Cart sessions snapshotted for suspend, resume and crash recovery", [
+        """
+        CREATE TABLE IF NOT EXISTS cart_sessions (
+            session_id TEXT PRIMARY KEY,
+            till_id TEXT NOT NULL,
+            user_id INTEGER,
+            customer_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'active' CHECK (status IN ('active', 'suspended')),
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (customer_id) REFERENCES customers (id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_cart_sessions_till ON cart_sessions (till_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_cart_sessions_status ON cart_sessions (status, updated_at)",
+        "ALTER TABLE cart_items ADD COLUMN unit_price REAL",
+    ]),
+    Migration(7, "Parked baskets keep their bill state and are found by customer", [
+        "ALTER TABLE cart_sessions ADD COLUMN state TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_cart_sessions_customer ON cart_sessions (customer_id, status)",
+    ]),
+    Migration(8, "Returns and refunds against past invoices", [
+        """
+        CREATE TABLE IF NOT EXISTS returns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            return_number TEXT UNIQUE NOT NULL,
+            invoice_id INTEGER NOT NULL,
+            customer_id INTEGER,
+            refund_amount REAL NOT NULL,
+            tax_refunded REAL NOT NULL DEFAULT 0,
+            refund_method TEXT NOT NULL,
+            points_reversed INTEGER NOT NULL DEFAULT 0,
+            points_restored INTEGER NOT NULL DEFAULT 0,
+            reason TEXT,
+            created_by INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (invoice_id) REFERENCES invoices (id),
+            FOREIGN KEY (customer_id) REFERENCES customers (id),
+            FOREIGN KEY (created_by) REFERENCES users (id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS return_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            return_id INTEGER NOT NULL,
+            invoice_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK (quantity > 0),
+            unit_price REAL NOT NULL,
+            total_price REAL NOT NULL,
+            restocked INTEGER NOT NULL DEFAULT 1,
+            FOREIGN KEY (return_id) REFERENCES returns (id),
+            FOREIGN KEY (invoice_id) REFERENCES invoices (id),
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_returns_invoice ON returns (invoice_id)",
+        "CREATE INDEX IF NOT EXISTS idx_return_items_invoice ON return_items (invoice_id, product_id)",
+        "ALTER TABLE invoices ADD COLUMN card_last4 TEXT",
+        """
+        CREATE INDEX IF NOT EXISTS idx_invoices_card_last4 ON invoices (card_last4, created_at)
+        WHERE card_last4 IS NOT NULL
+        """,
+    ]),
+    Migration(9, "Split tender payments for the end-of-day cash-up", [
+        """
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_id INTEGER NOT NULL,
+            return_id INTEGER,
+            tender TEXT NOT NULL,
+            amount REAL NOT NULL,
+            tendered REAL NOT NULL,
+            change_given REAL NOT NULL DEFAULT 0,
+            card_last4 TEXT,
+            till_id TEXT,
+            created_by INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (invoice_id) REFERENCES invoices (id),
+            FOREIGN KEY (return_id) REFERENCES returns (id),
+            FOREIGN KEY (created_by) REFERENCES users (id)
+        )
+        """,
+        # Earlier sales were paid in one tender, and refunds went back the same way
+        """
+        INSERT INTO payments (invoice_id, tender, amount, tendered, card_last4, created_by, created_at)
+        SELECT id, payment_method, ROUND(final_amount, 2), ROUND(final_amount, 2), card_last4, created_by, created_at
+        FROM invoices
+        """,
+        """
+        INSERT INTO payments (invoice_id, return_id, tender, amount, tendered, created_by, created_at)
+        SELECT invoice_id, id, refund_method, -refund_amount, -refund_amount, created_by, created_at
+        FROM returns
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_payments_invoice ON payments (invoice_id)",
+        """
+        CREATE INDEX IF NOT EXISTS idx_payments_cash_up
+        ON payments (created_at, till_id, created_by, tender, amount, tendered, change_given)
+        """,
+    ]),
+    Migration(10, "Shift and day close with frozen X/Z report counters", [
+        """
+        CREATE TABLE IF NOT EXISTS shifts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            till_id TEXT NOT NULL,
+            business_date TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'open' CHECK (status IN ('open', 'closed')),
+            opened_by INTEGER,
+            opened_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            opening_float REAL NOT NULL DEFAULT 0,
+            sale_count INTEGER NOT NULL DEFAULT 0,
+            subtotal REAL NOT NULL DEFAULT 0,
+            tax_total REAL NOT NULL DEFAULT 0,
+            discount_total REAL NOT NULL DEFAULT 0,
+            gross_sales REAL NOT NULL DEFAULT 0,
+            refund_count INTEGER NOT NULL DEFAULT 0,
+            refund_total REAL NOT NULL DEFAULT 0,
+            tax_refunded REAL NOT NULL DEFAULT 0,
+            last_payment_id INTEGER NOT NULL DEFAULT 0,
+            z_number INTEGER,
+            closed_by INTEGER,
+            closed_at TIMESTAMP,
+            FOREIGN KEY (opened_by) REFERENCES users (id),
+            FOREIGN KEY (closed_by) REFERENCES users (id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS shift_tenders (
+            shift_id INTEGER NOT NULL,
+            tender TEXT NOT NULL,
+            payment_count INTEGER NOT NULL DEFAULT 0,
+            taken REAL NOT NULL DEFAULT 0,
+            refunded REAL NOT NULL DEFAULT 0,
+            change_given REAL NOT NULL DEFAULT 0,
+            counted REAL,
+            PRIMARY KEY (shift_id, tender),
+            FOREIGN KEY (shift_id) REFERENCES shifts (id)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS day_closes (
+            business_date TEXT PRIMARY KEY,
+            shift_count INTEGER NOT NULL,
+            sale_count INTEGER NOT NULL,
+            subtotal REAL NOT NULL,
+            tax_total REAL NOT NULL,
+            discount_total REAL NOT NULL,
+            gross_sales REAL NOT NULL,
+            refund_count INTEGER NOT NULL,
+            refund_total REAL NOT NULL,
+            tax_refunded REAL NOT NULL,
+            cash_variance REAL,
+            closed_by INTEGER NOT NULL,
+            closed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (closed_by) REFERENCES users (id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS shift_cursor (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_payment_id INTEGER NOT NULL
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_shifts_open_till ON shifts (till_id) WHERE status = 'open'",
+        "CREATE INDEX IF NOT EXISTS idx_shifts_business_date ON shifts (business_date, status)",
+        # Sales before the upgrade belong to no shift
+        "INSERT OR IGNORE INTO shift_cursor (id, last_payment_id) SELECT 1, COALESCE(MAX(id), 0) FROM payments",
+        """
+        CREATE TRIGGER IF NOT EXISTS shifts_closed_locked
+        BEFORE UPDATE ON shifts WHEN OLD.status = 'closed'
+        BEGIN
+            SELECT RAISE(ABORT, 'shift is closed');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS shifts_closed_kept
+        BEFORE DELETE ON shifts WHEN OLD.status = 'closed'
+        BEGIN
+            SELECT RAISE(ABORT, 'shift is closed');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS shifts_day_closed
+        BEFORE INSERT ON shifts WHEN EXISTS (SELECT 1 FROM day_closes WHERE business_date = NEW.business_date)
+        BEGIN
+            SELECT RAISE(ABORT, 'day is closed');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS shift_tenders_insert_locked
+        BEFORE INSERT ON shift_tenders WHEN (SELECT status FROM shifts WHERE id = NEW.shift_id) = 'closed'
+        BEGIN
+            SELECT RAISE(ABORT, 'shift is closed');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS shift_tenders_update_locked
+        BEFORE UPDATE ON shift_tenders WHEN (SELECT status FROM shifts WHERE id = OLD.shift_id) = 'closed'
+        BEGIN
+            SELECT RAISE(ABORT, 'shift is closed');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS shift_tenders_delete_locked
+        BEFORE DELETE ON shift_tenders WHEN (SELECT status FROM shifts WHERE id = OLD.shift_id) = 'closed'
+        BEGIN
+            SELECT RAISE(ABORT, 'shift is closed');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS day_closes_update_locked
+        BEFORE UPDATE ON day_closes
+        BEGIN
+            SELECT RAISE(ABORT, 'day is closed');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS day_closes_delete_locked
+        BEFORE DELETE ON day_closes
+        BEGIN
+            SELECT RAISE(ABORT, 'day is closed');
+        END
+        """,
+    ]),
+    Migration(11, "Replicate returns, payments and the card and offline invoice columns", [
+        """
+        CREATE TABLE IF NOT EXISTS replication_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS replication_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        """,
+        # Tills that installed the old triggers keep replicating
+        """
+        INSERT OR IGNORE INTO replication_state (key, value)
+        SELECT 'enabled', CURRENT_TIMESTAMP
+        WHERE EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'replicate_invoices_insert')
+        """,
+        *[f"DROP TRIGGER IF EXISTS replicate_{table}_{event}"
+          for table in ('invoices', 'invoice_items', 'inventory', 'inventory_transactions', 'stock_transactions')
+          for event in ('insert', 'update')],
+        *_replication_triggers(_REPLICATED_V11),
+        *_replication_backfill(_BACKFILLED_V11),
+        # Invoices already shipped without their card or offline reference
+        """
+        INSERT INTO replication_log (table_name, row_id, payload)
+        SELECT 'invoices', id, json_object(
+            'id', id, 'invoice_number', invoice_number, 'customer_id', customer_id,
+            'total_amount', total_amount, 'tax_amount', tax_amount, 'discount_amount', discount_amount,
+            'final_amount', final_amount, 'payment_method', payment_method, 'payment_status', payment_status,
+            'card_last4', card_last4, 'client_ref', client_ref, 'created_by', created_by, 'created_at', created_at
+        )
+        FROM invoices
+        WHERE (card_last4 IS NOT NULL OR client_ref IS NOT NULL)
+          AND EXISTS (SELECT 1 FROM replication_state WHERE key = 'enabled')
+        """,
+    ]),
+    Migration(12, "Customer change times for the search index refresh", [
+        "ALTER TABLE customers ADD COLUMN updated_at TIMESTAMP",
+        "UPDATE customers SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)",
+        "CREATE INDEX IF NOT EXISTS idx_customers_updated_at ON customers (updated_at)",
+        # Stamped by triggers so every writer keeps it, not just models/customer.py
+        """
+        CREATE TRIGGER IF NOT EXISTS customers_touch_insert
+        AFTER INSERT ON customers WHEN NEW.updated_at IS NULL
+        BEGIN
+            UPDATE customers SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS customers_touch_update
+        AFTER UPDATE OF name, phone ON customers
+        BEGIN
+            UPDATE customers SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+        END
+        """,
+    ]),
+    Migration(13, "Payment ranges of shifts, so a day's sales are attributed to its shifts", [
+        "ALTER TABLE shifts ADD COLUMN first_payment_id INTEGER NOT NULL DEFAULT 0",
+        # Closed shifts are locked; the trigger is put back once they are filled in
+        "DROP TRIGGER IF EXISTS shifts_closed_locked",
+        # A shift starts where the till's previous shift ended; a till's
+        # first shift after the payments taken before any shift was opened,
+        # which were never folded
+        """
+        UPDATE shifts SET first_payment_id = COALESCE(
+            (SELECT MAX(previous.last_payment_id) FROM shifts previous
+             WHERE previous.till_id = shifts.till_id AND previous.id < shifts.id),
+            (SELECT MAX(p.id) FROM payments p
+             WHERE COALESCE(p.till_id, '') = shifts.till_id
+               AND p.created_at < (SELECT MIN(opened_at) FROM shifts)),
+            0
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS shifts_closed_locked
+        BEFORE UPDATE ON shifts WHEN OLD.status = 'closed'
+        BEGIN
+            SELECT RAISE(ABORT, 'shift is closed');
+        END
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_shifts_till ON shifts (till_id, first_payment_id)",
+    ]),
+]
+
+# Version of a database created from schema.sql
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def get_user_version(connection):
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def set_user_version(connection, version):
+    # PRAGMA does not take parameters; int() keeps the statement safe
+    connection.execute(f"PRAGMA user_version = {int(version)}")
+
+
+class MigrationRunner:
+    """Brings a database up to SCHEMA_VERSION, tracked in PRAGMA user_version.
+
+    Each migration runs in a BEGIN IMMEDIATE transaction together with the
+    user_version bump, so a database is always at exactly one version. SQLite
+    holds the write lock for the whole of a CREATE INDEX; online migrations
+    build one index per transaction so tills are only held up for one build
+    at a time (they wait up to BUSY_TIMEOUT rather than fail), and readers
+    carry on throughout.
+    """
+
+    def __init__(self, db_path, migrations=None):
+        self.db_path = db_path
+        self.migrations = sorted(migrations or MIGRATIONS, key=lambda migration: migration.version)
+
+    def _connect(self):
+        # Autocommit mode, transactions are managed explicitly
+        connection = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        connection.execute("PRAGMA temp_store = MEMORY")
+        return connection
+
+    def current_version(self):
+        connection = self._connect()
+        try:
+            return get_user_version(connection)
+        finally:
+            connection.close()
+
+    def pending(self):
+        """Get the migrations not yet applied, oldest first"""
+        version = self.current_version()
+        return [migration for migration in self.migrations if migration.version > version]
+
+    def migrate(self, target=None, progress=None, backup=True):
+        """Apply pending migrations in order
+
+        Args:
+            target (int, optional): Stop after this version, the latest by default
+            progress (callable, optional): Called with (message, done_steps, total_steps)
+            backup (bool): Snapshot the database before changing it
+
+        Returns:
+            int: The database's version afterwards, or None on error
+        """
+        pending = [migration for migration in self.pending()
+                   if target is None or migration.version <= target]
+        if not pending:
+            return self.current_version()
+
+        total = sum(len(migration.statements) for migration in pending)
+        done = 0
+
+        def report(message):
+            if progress:
+                progress(message, done, total)
+
+        if backup:
+            report("Taking a snapshot before migrating")
+            if not BackupManager(self.db_path).create_snapshot(f"pre-migration-v{pending[0].version}"):
+                report("Snapshot failed, database left unchanged")
+                return None
+
+        connection = self._connect()
+        try:
+            for migration in pending:
+                report(f"Migrating to version {migration.version}: {migration.description}")
+                if migration.online:
+                    for statement in migration.statements:
+                        self._run_online(connection, statement, report)
+                        done += 1
+                    connection.execute("BEGIN IMMEDIATE")
+                    set_user_version(connection, migration.version)
+                    connection.execute("COMMIT")
+                else:
+                    connection.execute("BEGIN IMMEDIATE")
+                    try:
+                        for statement in migration.statements:
+                            connection.execute(statement)
+                            done += 1
+                        set_user_version(connection, migration.version)
+                        connection.execute("COMMIT")
+                    except Exception:
+                        connection.execute("ROLLBACK")
+                        raise
+            report("Migration complete")
+            return get_user_version(connection)
+        except Exception as e:
+            print(f"Error migrating database: {e}")
+            return None
+        finally:
+            connection.close()
+
+    def _run_online(self, connection, statement, report):
+        """Run one statement in its own transaction, reporting while it runs"""
+        started = time.perf_counter()
+        last_report = [started]
+        name = " ".join(statement.split()[:6])
+
+        def heartbeat():
+            now = time.perf_counter()
+            if now - last_report[0] >= HEARTBEAT_SECONDS:
+                last_report[0] = now
+                report(f"  {name} ... {now - started:.0f}s")
+            return 0
+
+        connection.set_progress_handler(heartbeat, PROGRESS_INTERVAL)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(statement)
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        finally:
+            connection.set_progress_handler(None, 0)
+        report(f"  {name} done in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade the database schema")
+    parser.add_argument("--db", default=DATABASE_PATH, help="Path to the database")
+    parser.add_argument("--to", type=int, metavar="VERSION", help="Stop after this version")
+    parser.add_argument("--status", action="store_true", help="Show the version and pending migrations only")
+    parser.add_argument("--no-backup", action="store_true", help="Skip the snapshot taken before migrating")
+    args = parser.parse_args()
+
+    runner = MigrationRunner(args.db)
+
+    if args.status:
+        print(f"Database version {runner.current_version()}, latest {SCHEMA_VERSION}")
+        for migration in runner.pending():
+            print(f"  pending {migration.version}: {migration.description}")
+        return
+
+    def progress(message, done, total):
+        print(f"[{done}/{total}] {message}")
+
+    version = runner.migrate(args.to, progress, backup=not args.no_backup)
+    if version is None:
+        print("Migration failed")
+    else:
+        print(f"Database at version {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+import os
+import json
+import argparse
+import uuid
+import sqlite3
+import datetime
+import threading
+
+from config import STORE_ID, OFFLINE_JOURNAL_PATH, OFFLINE_RETRY_INTERVAL, DATABASE_PATH
+
+JOURNAL_DDL = """
+    CREATE TABLE IF NOT EXISTS pending_sales (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        client_ref TEXT UNIQUE NOT NULL,
+        offline_number TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'applied', 'failed')),
+        attempts INTEGER NOT NULL DEFAULT 0,
+        invoice_id INTEGER,
+        invoice_number TEXT,
+        conflicts TEXT,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        applied_at TIMESTAMP
+    )
+"""
+
+# SQLite errors that mean the store database can't be reached right now,
+# as opposed to a problem with the sale itself
+UNAVAILABLE_ERRORS = ("database is locked", "database is busy", "unable to open database", "disk i/o error")
+
+
+def is_unavailable(error):
+    """Check whether an exception means the store database is unreachable"""
+    return isinstance(error, sqlite3.OperationalError) and \
+        any(message in str(error).lower() for message in UNAVAILABLE_ERRORS)
+
+
+class OfflineJournal:
+    """Local write-ahead queue for sales made while the store database is unreachable.
+
+    Queued sales live in a small SQLite file on the till's own disk and get
+    a provisional OFF- number for the customer's receipt. They are replayed
+    to the store database strictly in the order they were rung up, before
+    any new sale, and each carries a client_ref stored on the invoice, so a
+    replay interrupted after its commit is recognised instead of repeated.
+    """
+
+    def __init__(self, path=None, store_id=STORE_ID):
+        self.path = path or OFFLINE_JOURNAL_PATH
+        self.store_id = store_id
+        self._lock = threading.RLock()
+        self._replay_lock = threading.Lock()
+        self._pending = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.row_factory = sqlite3.Row
+        connection.execute(JOURNAL_DDL)
+        return connection
+
+    def has_pending(self):
+        """Check for sales still waiting to be replayed, without touching disk after the first call"""
+        with self._lock:
+            if self._pending is None:
+                connection = self._connect()
+                try:
+                    self._pending = connection.execute(
+                        "SELECT COUNT(*) FROM pending_sales WHERE status = 'pending'"
+                    ).fetchone()[0]
+                finally:
+                    connection.close()
+            return self._pending > 0
+
+    def enqueue(self, sale):
+        """Queue a sale
+
+        Args:
+            sale (dict): The arguments of Invoice.create_invoice
+
+        Returns:
+            tuple: (True, None, provisional invoice number)
+        """
+        with self._lock:
+            connection = self._connect()
+            try:
+                client_ref = uuid.uuid4().hex
+                today = datetime.datetime.now().strftime("%Y%m%d")
+                count = connection.execute(
+                    "SELECT COUNT(*) FROM pending_sales WHERE offline_number LIKE ?",
+                    (f"OFF-{self.store_id}-{today}-%",)
+                ).fetchone()[0]
+                offline_number = f"OFF-{self.store_id}-{today}-{count + 1:04d}"
+
+                # Replayed sales keep the time and invoice-number day they were made
+                sale = dict(sale, client_ref=client_ref, offline_number=offline_number, sold_on=today,
+                            sold_at=datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S'))
+                connection.execute(
+                    "INSERT INTO pending_sales (client_ref, offline_number, payload) VALUES (?, ?, ?)",
+                    (client_ref, offline_number, json.dumps(sale))
+                )
+                connection.commit()
+                self._pending = (self._pending or 0) + 1
+                return True, None, offline_number
+            finally:
+                connection.close()
+
+    def replay(self, apply):
+        """Send queued sales to the store database, oldest first
+
+        The journal is only locked while it is read and updated, not while a
+        sale is written to the store database, so checkout can keep queueing
+        sales behind a slow replay. Sales queued meanwhile are replayed too.
+
+        Args:
+            apply (callable): Commits one sale; returns (invoice_id,
+                invoice_number, conflicts) and raises if it can't
+
+        Returns:
+            bool: True once nothing is left pending
+        """
+        with self._replay_lock:
+            connection = self._connect()
+            try:
+                while True:
+                    with self._lock:
+                        if not self.has_pending():
+                            return True
+                        rows = connection.execute(
+                            "SELECT id, payload FROM pending_sales WHERE status = 'pending' ORDER BY id"
+                        ).fetchall()
+                    for row in rows:
+                        sale = json.loads(row['payload'])
+                        try:
+                            invoice_id, invoice_number, conflicts = apply(sale)
+                        except Exception as e:
+                            if is_unavailable(e):
+                                # Still offline: keep this sale and everything after it in order
+                                with self._lock:
+                                    connection.execute(
+                                        "UPDATE pending_sales SET attempts = attempts + 1, last_error = ? WHERE id = ?",
+                                        (str(e), row['id'])
+                                    )
+                                    connection.commit()
+                                return False
+                            # The sale itself is broken; park it for a manager instead of blocking the queue
+                            print(f"Error replaying offline sale {sale['offline_number']}: {e}")
+                            with self._lock:
+                                connection.execute(
+                                    """
+                                    UPDATE pending_sales SET status = 'failed', attempts = attempts + 1, last_error = ?
+                                    WHERE id = ?
+                                    """,
+                                    (str(e), row['id'])
+                                )
+                                connection.commit()
+                                self._pending -= 1
+                        else:
+                            with self._lock:
+                                connection.execute(
+                                    """
+                                    UPDATE pending_sales
+                                    SET status = 'applied', attempts = attempts + 1, invoice_id = ?, invoice_number = ?,
+                                        conflicts = ?, last_error = NULL, applied_at = CURRENT_TIMESTAMP
+                                    WHERE id = ?
+                                    """,
+                                    (invoice_id, invoice_number, json.dumps(conflicts) if conflicts else None, row['id'])
+                                )
+                                connection.commit()
+                                self._pending -= 1
+            finally:
+                connection.close()
+
+    def get_sales(self, status=None, limit=100, conflicts=False):
+        """Get queued sales, newest first
+
+        Args:
+            status (str, optional): Only sales 'pending', 'applied' or 'failed'
+            limit (int): Most sales returned
+            conflicts (bool): Only sales replayed with conflicts, e.g.
+                oversold stock or loyalty points the customer no longer had
+        """
+        connection = self._connect()
+        try:
+            query = "SELECT * FROM pending_sales"
+            conditions = []
+            params = []
+            if status:
+                conditions.append("status = ?")
+                params.append(status)
+            if conflicts:
+                conditions.append("conflicts IS NOT NULL")
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            query += " ORDER BY id DESC LIMIT ?"
+            params.append(limit)
+            return connection.execute(query, params).fetchall()
+        finally:
+            connection.close()
+
+    def get_attention(self, limit=100):
+        """Get the sales a manager should look at: not yet synced, failed, or synced with conflicts"""
+        connection = self._connect()
+        try:
+            return connection.execute(
+                """
+                SELECT * FROM pending_sales
+                WHERE status IN ('pending', 'failed') OR conflicts IS NOT NULL
+                ORDER BY id DESC LIMIT ?
+                """,
+                (limit,)
+            ).fetchall()
+        finally:
+            connection.close()
+
+    def find_sale(self, offline_number):
+        """Get a queued sale by the OFF- number on the customer's receipt, or None
+
+        Once replayed, its invoice_id and invoice_number name the invoice
+        the sale became.
+        """
+        connection = self._connect()
+        try:
+            return connection.execute(
+                "SELECT * FROM pending_sales WHERE offline_number = ?", (offline_number.strip(),)
+            ).fetchone()
+        finally:
+            connection.close()
+
+    def start(self, apply, interval=OFFLINE_RETRY_INTERVAL):
+        """Keep retrying the replay in a background thread until the queue is empty"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+
+            def run():
+                while not self._stop.wait(interval):
+                    if self.replay(apply):
+                        # Stop only if checkout queued nothing since; a sale
+                        # queued after this sees no thread and starts one
+                        with self._lock:
+                            if not self.has_pending():
+                                self._thread = None
+                                break
+
+            self._stop.clear()
+            self._thread = threading.Thread(target=run, name="offline-replay", daemon=True)
+            self._thread.start()
+
+    def is_retrying(self):
+        """Check whether the background replay is running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        self._stop.set()
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_offline_journal():
+    """Get the till's offline journal, shared within the process"""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = OfflineJournal()
+        return _journal
+
+
+def set_offline_journal(journal):
+    """Replace the process's journal, e.g. to keep a benchmark's sales off the till's own queue"""
+    global _journal
+    with _journal_lock:
+        _journal = journal
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List sales this till queued offline")
+    parser.add_argument("--journal", default=OFFLINE_JOURNAL_PATH, help="Path to the offline journal")
+    parser.add_argument("--status", choices=("pending", "applied", "failed"),
+                        help="Only sales with this status (default: those needing attention)")
+    parser.add_argument("--conflicts", action="store_true", help="Only sales replayed with conflicts")
+    parser.add_argument("--reprint", metavar="OFFLINE_NUMBER", help="Reprint the receipt of a synced sale")
+    parser.add_argument("--db", default=DATABASE_PATH, help="Path to the store database, for --reprint")
+    args = parser.parse_args()
+
+    journal = OfflineJournal(args.journal)
+
+    if args.reprint:
+        sale = journal.find_sale(args.reprint)
+        if not sale:
+            print(f"No offline sale {args.reprint}")
+        elif sale['invoice_id'] is None:
+            print(f"{sale['offline_number']} is {sale['status']} and has no invoice yet: {sale['last_error'] or ''}")
+        else:
+            from db_manager import DatabaseManager
+            from utils.pdf_generator import generate_receipt
+            path = generate_receipt(DatabaseManager(args.db), sale['invoice_id'], offline_number=sale['offline_number'])
+            print(f"Receipt for {sale['invoice_number']} written to {path}" if path else "Reprint failed")
+        return
+
+    if args.status or args.conflicts:
+        sales = journal.get_sales(status=args.status, conflicts=args.conflicts)
+    else:
+        sales = journal.get_attention()
+    for sale in sales:
+        problem = sale['conflicts'] if sale['status'] == 'applied' else sale['last_error']
+        print(f"{sale['offline_number']}  {sale['created_at']}  {sale['status']:<8} "
+              f"{sale['invoice_number'] or '-':<20} {problem or ''}")
+
+
+if __name__ == "__main__":
+    main()
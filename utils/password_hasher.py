@@ -0,0 +1,214 @@
+import os
+import hmac
+import json
+import time
+import hashlib
+import argparse
+
+from config import PASSWORD_HASHER, PASSWORD_HASHING_PATH
+
+# Login time the calibration aims for on this machine
+DEFAULT_TARGET_MS = 100
+
+
+class ScryptHasher:
+    """scrypt with tunable CPU/memory cost; stored as scrypt$n$r$p$digest"""
+
+    algorithm = 'scrypt'
+
+    def __init__(self, n=2 ** 14, r=8, p=1):
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def params(self):
+        return {'n': self.n, 'r': self.r, 'p': self.p}
+
+    def _derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(
+            password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+            maxmem=256 * n * r * p, dklen=32
+        ).hex()
+
+    def hash(self, password, salt):
+        digest = self._derive(password, salt, self.n, self.r, self.p)
+        return f"{self.algorithm}${self.n}${self.r}${self.p}${digest}"
+
+    def verify(self, password, salt, encoded):
+        _, n, r, p, digest = encoded.split('$')
+        return hmac.compare_digest(self._derive(password, salt, int(n), int(r), int(p)), digest)
+
+    def needs_rehash(self, encoded):
+        return encoded.split('$')[1:4] != [str(self.n), str(self.r), str(self.p)]
+
+    def calibrate(self, target_ms):
+        """Raise n until one hash takes at least target_ms"""
+        n = 2 ** 12
+        while n < 2 ** 20:
+            started = time.perf_counter()
+            self._derive('calibration', 'calibration', n, self.r, self.p)
+            if (time.perf_counter() - started) * 1000 >= target_ms:
+                break
+            n *= 2
+        self.n = n
+
+
+class Pbkdf2Hasher:
+    """PBKDF2-HMAC-SHA256; stored as pbkdf2_sha256$iterations$digest"""
+
+    algorithm = 'pbkdf2_sha256'
+
+    def __init__(self, iterations=600000):
+        self.iterations = iterations
+
+    def params(self):
+        return {'iterations': self.iterations}
+
+    def _derive(self, password, salt, iterations):
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations).hex()
+
+    def hash(self, password, salt):
+        return f"{self.algorithm}${self.iterations}${self._derive(password, salt, self.iterations)}"
+
+    def verify(self, password, salt, encoded):
+        _, iterations, digest = encoded.split('$')
+        return hmac.compare_digest(self._derive(password, salt, int(iterations)), digest)
+
+    def needs_rehash(self, encoded):
+        return encoded.split('$')[1] != str(self.iterations)
+
+    def calibrate(self, target_ms):
+        """Scale the iteration count so one hash takes about target_ms"""
+        sample = 100000
+        started = time.perf_counter()
+        self._derive('calibration', 'calibration', sample)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.iterations = max(100000, int(sample * target_ms / max(elapsed_ms, 0.001)) // 1000 * 1000)
+
+
+class LegacySha256Hasher:
+    """The original single salted SHA-256, kept only to verify old rows"""
+
+    algorithm = 'sha256'
+
+    def verify(self, password, salt, encoded):
+        return hmac.compare_digest(hashlib.sha256((password + salt).encode()).hexdigest(), encoded)
+
+
+HASHERS = {
+    ScryptHasher.algorithm: ScryptHasher,
+    Pbkdf2Hasher.algorithm: Pbkdf2Hasher,
+}
+
+
+def _algorithm_of(encoded):
+    # Legacy rows are a bare hex digest without an algorithm prefix
+    return encoded.split('$', 1)[0] if '$' in encoded else LegacySha256Hasher.algorithm
+
+
+class PasswordHashing:
+    """Hashes new passwords with the configured algorithm and verifies any stored format.
+
+    The algorithm comes from config.PASSWORD_HASHER, the cost from the
+    calibration file written by calibrate(), so each deployment can tune
+    login time to its hardware. Hashes made with another algorithm or an
+    older cost report needs_rehash() and are upgraded at the next login.
+    """
+
+    def __init__(self, algorithm=None, settings_path=None):
+        self.settings_path = settings_path or PASSWORD_HASHING_PATH
+        self.algorithm = algorithm or PASSWORD_HASHER
+        self.hasher = HASHERS[self.algorithm](**self._load_params())
+
+    def _load_params(self):
+        try:
+            with open(self.settings_path, 'r') as f:
+                settings = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return settings.get(self.algorithm, {})
+
+    def hash(self, password, salt):
+        """Hash a password for storage"""
+        return self.hasher.hash(password, salt)
+
+    def verify(self, password, salt, encoded):
+        """Check a password against a stored hash of any supported format"""
+        if not encoded or salt is None:
+            return False
+
+        algorithm = _algorithm_of(encoded)
+        if algorithm == self.algorithm:
+            hasher = self.hasher
+        elif algorithm in HASHERS:
+            hasher = HASHERS[algorithm]()
+        elif algorithm == LegacySha256Hasher.algorithm:
+            hasher = LegacySha256Hasher()
+        else:
+            return False
+
+        try:
+            return hasher.verify(password, salt, encoded)
+        except (ValueError, MemoryError) as e:
+            print(f"Error verifying password: {e}")
+            return False
+
+    def needs_rehash(self, encoded):
+        """Check whether a stored hash should be upgraded to the current settings"""
+        if _algorithm_of(encoded) != self.algorithm:
+            return True
+        return self.hasher.needs_rehash(encoded)
+
+    def calibrate(self, target_ms=DEFAULT_TARGET_MS):
+        """Tune the cost to this machine and save it
+
+        Returns:
+            dict: The chosen parameters
+        """
+        self.hasher.calibrate(target_ms)
+
+        try:
+            with open(self.settings_path, 'r') as f:
+                settings = json.load(f)
+        except (OSError, ValueError):
+            settings = {}
+        settings[self.algorithm] = self.hasher.params()
+
+        directory = os.path.dirname(self.settings_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.settings_path, 'w') as f:
+            json.dump(settings, f, indent=2)
+
+        return self.hasher.params()
+
+
+_password_hashing = None
+
+
+def get_password_hashing():
+    """Get the process-wide password hashing settings"""
+    global _password_hashing
+    if _password_hashing is None:
+        _password_hashing = PasswordHashing()
+    return _password_hashing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate password hashing cost for this machine")
+    parser.add_argument("--algorithm", choices=sorted(HASHERS), default=PASSWORD_HASHER,
+                        help="Algorithm to calibrate")
+    parser.add_argument("--target-ms", type=float, default=DEFAULT_TARGET_MS,
+                        help="Time one password check should take")
+    args = parser.parse_args()
+
+    hashing = PasswordHashing(args.algorithm)
+    params = hashing.calibrate(args.target_ms)
+
+    started = time.perf_counter()
+    hashing.hash('calibration', os.urandom(16).hex())
+    print(f"{args.algorithm}: {params} ({(time.perf_counter() - started) * 1000:.0f} ms per hash)")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,18 @@ from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
+from reportlab.graphics.barcode import code128
 import datetime
 from config import COMPANY_NAME, COMPANY_ADDRESS, COMPANY_PHONE, COMPANY_EMAIL, CURRENCY_SYMBOL
+from utils.tracing import span, traced
 
-def generate_receipt(db_manager, invoice_id):
-    """Generate a PDF receipt for an invoice"""
+@traced("receipt.generate")
+def generate_receipt(db_manager, invoice_id, offline_number=None):
+    """Generate a PDF receipt for an invoice
+
+    offline_number, the OFF- number given when the sale was queued offline,
+    is printed too so the customer's first slip can be matched up.
+    """
     try:
         # Create invoice model to get invoice data
         from models.invoice import Invoice
@@ -50,6 +57,8 @@ def generate_receipt(db_manager, invoice_id):
         # Add invoice information
         elements.append(Paragraph("RECEIPT", subtitle_style))
         elements.append(Paragraph(f"Invoice: {invoice['invoice_number']}", normal_style))
+        if offline_number:
+            elements.append(Paragraph(f"Rung up offline as: {offline_number}", normal_style))
         elements.append(Paragraph(f"Date: {invoice['created_at']}", normal_style))
         elements.append(Paragraph(f"Cashier: {invoice['created_by_user']}", normal_style))
         
@@ -106,14 +115,27 @@ def generate_receipt(db_manager, invoice_id):
         # Add payment information
         elements.append(Spacer(1, 0.25 * inch))
         elements.append(Paragraph(f"Payment Method: {invoice['payment_method']}", normal_style))
+        for payment in invoice.get('payments') or []:
+            if payment['amount'] <= 0:
+                continue
+            card = f" ****{payment['card_last4']}" if payment['card_last4'] else ""
+            line = f"{payment['tender']}{card}: {CURRENCY_SYMBOL}{payment['tendered']:.2f}"
+            if payment['change_given']:
+                line += f" (Change: {CURRENCY_SYMBOL}{payment['change_given']:.2f})"
+            elements.append(Paragraph(line, normal_style))
         elements.append(Paragraph(f"Payment Status: {invoice['payment_status']}", normal_style))
         
         # Add thank you message
         elements.append(Spacer(1, 0.5 * inch))
         elements.append(Paragraph("Thank you for your purchase!", subtitle_style))
         
+        # The invoice number as a barcode, scanned to find the sale for a return
+        elements.append(Spacer(1, 0.25 * inch))
+        elements.append(code128.Code128(invoice['invoice_number'], barHeight=0.5 * inch, humanReadable=True))
+        
         # Build PDF
-        doc.build(elements)
+        with span("receipt.build_pdf", items=len(invoice['items'])):
+            doc.build(elements)
         
         return filename
         
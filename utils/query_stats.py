@@ -0,0 +1,336 @@
+import os
+import re
+import sys
+import json
+import argparse
+import time
+import sqlite3
+import datetime
+import threading
+from collections import deque
+from functools import lru_cache
+
+from config import SLOW_QUERY_MS, SLOW_QUERY_LOG_PATH, SLOW_QUERY_LOG_SIZE
+
+# Checked by DatabaseManager.connect; while False connections are plain
+# sqlite3 connections and nothing here runs
+enabled = False
+
+_slow_seconds = SLOW_QUERY_MS / 1000
+_log_path = SLOW_QUERY_LOG_PATH
+_stats = {}
+_slow = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_plans = {}
+_lock = threading.Lock()
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_SKIPPED_FILES = {os.path.abspath(__file__), os.path.join(_ROOT, "db_manager.py")}
+
+# Statements EXPLAIN QUERY PLAN can't describe or that have no plan worth seeing
+_NO_PLAN = ("BEGIN", "COMMIT", "END", "ROLLBACK", "SAVEPOINT", "RELEASE", "PRAGMA", "EXPLAIN", "CREATE",
+            "DROP", "ALTER", "ANALYZE", "VACUUM", "ATTACH", "DETACH", "REINDEX")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """Normalise SQL to its shape: literals become ?, IN lists collapse and whitespace is squeezed"""
+    shape = _STRING.sub("?", sql)
+    shape = _NUMBER.sub("?", shape)
+    shape = _IN_LIST.sub("(?...)", shape)
+    return _SPACE.sub(" ", shape).strip()
+
+
+def enable(slow_ms=None, log_path=None):
+    """Start recording queries on connections opened from now on
+
+    Args:
+        slow_ms (float, optional): Queries at least this slow are logged
+            with their plan, SLOW_QUERY_MS by default
+        log_path (str, optional): JSON-lines file the slow-query log is
+            appended to, SLOW_QUERY_LOG_PATH by default; "" keeps it in memory
+    """
+    global enabled, _slow_seconds, _log_path
+    with _lock:
+        if slow_ms is not None:
+            _slow_seconds = slow_ms / 1000
+        if log_path is not None:
+            _log_path = log_path
+        enabled = True
+
+
+def disable():
+    """Stop recording; connections already open keep recording until closed"""
+    global enabled
+    enabled = False
+
+
+def reset():
+    """Forget the collected statistics and slow queries"""
+    with _lock:
+        _stats.clear()
+        _slow.clear()
+        _plans.clear()
+
+
+def connection_factory():
+    """The sqlite3.connect factory for a new connection"""
+    return InstrumentedConnection if enabled else sqlite3.Connection
+
+
+def _call_site():
+    # The first frame outside this module and DatabaseManager is the caller
+    frame = sys._getframe(2)
+    while frame and frame.f_code.co_filename in _SKIPPED_FILES:
+        frame = frame.f_back
+    if not frame:
+        return "unknown"
+    return _describe_site(frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+
+
+@lru_cache(maxsize=4096)
+def _describe_site(path, line, function):
+    if path.startswith(_ROOT):
+        path = os.path.relpath(path, _ROOT)
+    return f"{path}:{line} {function}"
+
+
+def _query_plan(connection, sql, params):
+    if sql.lstrip().split(None, 1)[0].upper() in _NO_PLAN:
+        return None
+    try:
+        rows = sqlite3.Connection.execute(connection, f"EXPLAIN QUERY PLAN {sql}", params or ()).fetchall()
+    except sqlite3.Error:
+        # e.g. the connection was closed before the cursor was dropped
+        return None
+    # Rows are (id, parent, unused, detail); indent each step under its parent
+    depth = {0: -1}
+    lines = []
+    for row in rows:
+        depth[row[0]] = depth.get(row[1], -1) + 1
+        lines.append("  " * depth[row[0]] + row[3])
+    return lines
+
+
+def _record(connection, sql, params, elapsed, rows, call_site):
+    shape = fingerprint(sql)
+    with _lock:
+        stats = _stats.get(shape)
+        if stats is None:
+            stats = _stats[shape] = {'fingerprint': shape, 'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                                     'rows': 0, 'slow': 0, 'call_sites': {}}
+        stats['calls'] += 1
+        stats['total_seconds'] += elapsed
+        stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+        stats['rows'] += rows
+        stats['call_sites'][call_site] = stats['call_sites'].get(call_site, 0) + 1
+        if elapsed < _slow_seconds:
+            return
+        stats['slow'] += 1
+        capture_plan = shape not in _plans
+        log_path = _log_path
+
+    # The plan of a query shape rarely changes, so it is captured once
+    if capture_plan:
+        plan = _query_plan(connection, sql, params)
+        if plan is not None:
+            with _lock:
+                _plans[shape] = plan
+    entry = {
+        'at': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'milliseconds': round(elapsed * 1000, 3),
+        'rows': rows,
+        'call_site': call_site,
+        'fingerprint': shape,
+        'sql': sql.strip(),
+        'params': repr(params)[:200] if params else None,
+        'plan': _plans.get(shape),
+    }
+    with _lock:
+        _slow.append(entry)
+    if log_path:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+            with open(log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Error writing slow-query log: {e}")
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """A cursor that times each query from execute until its rows are read.
+
+    A query is recorded once its rows are exhausted, the cursor runs
+    another query or is closed, so fetching counts towards its time.
+    """
+
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        call_site = _call_site()
+        started = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except sqlite3.Error:
+            _record(self.connection, sql, parameters, time.perf_counter() - started, 0, call_site)
+            raise
+        self._pending = [sql, parameters, time.perf_counter() - started, 0, call_site]
+        if self.description is None:
+            # Not a query returning rows; all the work is done
+            self._pending[3] = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        call_site = _call_site()
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record(self.connection, sql, None, time.perf_counter() - started, max(self.rowcount, 0), call_site)
+
+    def _timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        result = fetch(*args)
+        if self._pending:
+            self._pending[2] += time.perf_counter() - started
+        return result
+
+    def fetchone(self):
+        row = self._timed_fetch(super().fetchone)
+        if row is None:
+            self._finish()
+        elif self._pending:
+            self._pending[3] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed_fetch(super().fetchmany, size)
+        if self._pending:
+            self._pending[3] += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed_fetch(super().fetchall)
+        if self._pending:
+            self._pending[3] += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed_fetch(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        if self._pending:
+            self._pending[3] += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending:
+            _record(self.connection, *pending)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """A connection whose shortcut execute methods use InstrumentedCursor"""
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or InstrumentedCursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def get_stats(sort="total_seconds", limit=None):
+    """Get per query shape statistics, the costliest first
+
+    Args:
+        sort (str): 'total_seconds', 'calls', 'max_seconds', 'rows' or 'slow'
+        limit (int, optional): Only the first this many shapes
+
+    Returns:
+        list: Dicts with fingerprint, calls, total/mean/max seconds, rows,
+            slow count and call sites ordered by use
+    """
+    with _lock:
+        stats = [dict(entry, call_sites=dict(entry['call_sites'])) for entry in _stats.values()]
+    for entry in stats:
+        entry['mean_seconds'] = entry['total_seconds'] / entry['calls']
+        entry['call_sites'] = sorted(entry['call_sites'].items(), key=lambda site: -site[1])
+        entry['plan'] = _plans.get(entry['fingerprint'])
+    stats.sort(key=lambda entry: entry[sort], reverse=True)
+    return stats[:limit] if limit else stats
+
+
+def get_slow_queries():
+    """Get the most recent slow queries, oldest first"""
+    with _lock:
+        return list(_slow)
+
+
+def format_stats(limit=15):
+    """Render the costliest query shapes and their plans as text"""
+    lines = [f"{'calls':>8} {'total ms':>10} {'mean ms':>9} {'max ms':>9} {'rows':>9} {'slow':>5}  query"]
+    for entry in get_stats(limit=limit):
+        lines.append(
+            f"{entry['calls']:>8} {entry['total_seconds'] * 1000:>10.1f} {entry['mean_seconds'] * 1000:>9.2f} "
+            f"{entry['max_seconds'] * 1000:>9.2f} {entry['rows']:>9} {entry['slow']:>5}  {entry['fingerprint'][:120]}"
+        )
+        sites = entry['call_sites']
+        more = f" and {len(sites) - 1} more" if len(sites) > 1 else ""
+        lines.append(f"{'':>55}from {sites[0][0]}{more}")
+        for step in entry['plan'] or []:
+            lines.append(f"{'':>55}| {step}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise the slow-query log")
+    parser.add_argument("--log", default=SLOW_QUERY_LOG_PATH, help="Slow-query log to read")
+    parser.add_argument("--limit", type=int, default=15, help="Query shapes to show")
+    args = parser.parse_args()
+
+    shapes = {}
+    with open(args.log, "r", encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            shape = shapes.setdefault(entry['fingerprint'], {'count': 0, 'total': 0.0, 'max': 0.0, 'last': entry})
+            shape['count'] += 1
+            shape['total'] += entry['milliseconds']
+            shape['max'] = max(shape['max'], entry['milliseconds'])
+            shape['last'] = entry
+
+    print(f"{'count':>6} {'total ms':>10} {'max ms':>9}  query")
+    for fingerprint_, shape in sorted(shapes.items(), key=lambda item: -item[1]['total'])[:args.limit]:
+        print(f"{shape['count']:>6} {shape['total']:>10.1f} {shape['max']:>9.1f}  {fingerprint_[:120]}")
+        print(f"{'':>28}last from {shape['last']['call_site']} at {shape['last']['at']}")
+        for step in shape['last']['plan'] or []:
+            print(f"{'':>28}| {step}")
+
+
+if __name__ == "__main__":
+    main()
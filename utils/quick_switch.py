@@ -0,0 +1,134 @@
+import os
+import time
+import threading
+
+from config import PIN_MAX_ATTEMPTS, PIN_LOCKOUT_SECONDS, PROFILE_CACHE_TTL
+from db_manager import DatabaseManager
+from utils.password_hasher import get_password_hashing
+from utils.login_recorder import get_login_recorder
+
+
+def is_valid_pin(pin):
+    """Quick switch PINs are 4 to 6 digits"""
+    return pin.isdigit() and 4 <= len(pin) <= 6
+
+
+class QuickSwitch:
+    """Unlocks a shared till for cashiers with a short PIN.
+
+    Profiles of every user with a PIN are loaded once and kept in memory,
+    so a wrong PIN is refused by a hash check with no database round trip.
+    A right one is confirmed against the user's current row, so a user
+    deleted, demoted or given a new PIN on another till since the profiles
+    were loaded isn't let in on the cached copy; the last_login write goes
+    to the batched login recorder.
+    Repeated wrong PINs lock that user out of quick switch for a while,
+    the full password login still works.
+    """
+
+    def __init__(self, db_manager, ttl=PROFILE_CACHE_TTL):
+        self.db_manager = DatabaseManager(db_manager.db_path)
+        self.ttl = ttl
+        self._profiles = None
+        self._loaded_at = 0
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def _load_profiles(self, user_id=None):
+        query = """
+            SELECT u.id, u.username, u.full_name, u.role, u.email, u.last_login, u.created_at,
+                   up.pin_hash, up.salt AS pin_salt
+            FROM user_pins up
+            JOIN users u ON u.id = up.user_id
+        """
+        params = None
+        if user_id is not None:
+            query += " WHERE u.id = ?"
+            params = (user_id,)
+        try:
+            self.db_manager.connect()
+            rows = self.db_manager.fetch_all(query + " ORDER BY u.full_name", params)
+        finally:
+            self.db_manager.disconnect()
+
+        return {row['id']: dict(row) for row in rows}
+
+    def get_profiles(self):
+        """Get cached profiles of users who can quick switch, without PIN hashes"""
+        with self._lock:
+            if self._profiles is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._profiles = self._load_profiles()
+                self._loaded_at = time.monotonic()
+            profiles = list(self._profiles.values())
+
+        return [
+            {key: value for key, value in profile.items() if key not in ('pin_hash', 'pin_salt')}
+            for profile in profiles
+        ]
+
+    def locked_for(self, user_id):
+        """Seconds until a locked out user may try a PIN again, 0 if not locked"""
+        with self._lock:
+            failures, locked_until = self._failures.get(user_id, (0, 0))
+        return max(0, locked_until - time.monotonic())
+
+    def unlock(self, user_id, pin):
+        """Verify a PIN against the cached profile, then the user's current row
+
+        Returns:
+            dict: The user, or None if the PIN is wrong or the user is locked out
+        """
+        self.get_profiles()
+        with self._lock:
+            profile = self._profiles.get(user_id)
+            failures, locked_until = self._failures.get(user_id, (0, 0))
+        if not profile or locked_until > time.monotonic():
+            return None
+
+        if not get_password_hashing().verify(pin, profile['pin_salt'], profile['pin_hash']):
+            with self._lock:
+                failures += 1
+                if failures >= PIN_MAX_ATTEMPTS:
+                    self._failures[user_id] = (0, time.monotonic() + PIN_LOCKOUT_SECONDS)
+                else:
+                    self._failures[user_id] = (failures, 0)
+            return None
+
+        # The cache may be behind another till: take the role and PIN as they are now
+        current = self._load_profiles(user_id).get(user_id)
+        with self._lock:
+            if self._profiles is not None:
+                if current:
+                    self._profiles[user_id] = current
+                else:
+                    self._profiles.pop(user_id, None)
+        if not current:
+            return None
+        if (current['pin_hash'], current['pin_salt']) != (profile['pin_hash'], profile['pin_salt']) and \
+                not get_password_hashing().verify(pin, current['pin_salt'], current['pin_hash']):
+            return None
+        profile = current
+
+        with self._lock:
+            self._failures.pop(user_id, None)
+        get_login_recorder(self.db_manager).record(user_id)
+
+        return {key: value for key, value in profile.items() if key not in ('pin_hash', 'pin_salt')}
+
+    def invalidate(self):
+        """Reload profiles on next use, after a PIN or user changed"""
+        with self._lock:
+            self._profiles = None
+
+
+_switches = {}
+_switches_lock = threading.Lock()
+
+
+def get_quick_switch(db_manager):
+    """Get the quick switch of a database, shared within the process"""
+    db_path = os.path.abspath(db_manager.db_path)
+    with _switches_lock:
+        if db_path not in _switches:
+            _switches[db_path] = QuickSwitch(db_manager)
+        return _switches[db_path]
@@ -0,0 +1,440 @@
+import os
+import re
+import gzip
+import json
+import time
+import sqlite3
+import argparse
+import datetime
+import threading
+
+from config import DATABASE_PATH, STORE_ID, REPLICATION_INBOX, REPLICATION_INTERVAL
+from db_manager import DatabaseManager
+from utils.migrations import _replication_backfill
+
+# Changes written per batch file
+BATCH_SIZE = 5000
+
+# Tables shipped to head office and their columns; every table has an id key.
+# The till's change log triggers are created by migration 11 from the same list
+REPLICATED_TABLES = {
+    'invoices': ['id', 'invoice_number', 'customer_id', 'total_amount', 'tax_amount', 'discount_amount',
+                 'final_amount', 'payment_method', 'payment_status', 'card_last4', 'client_ref',
+                 'created_by', 'created_at'],
+    'invoice_items': ['id', 'invoice_id', 'product_id', 'quantity', 'unit_price', 'total_price', 'created_at'],
+    'returns': ['id', 'return_number', 'invoice_id', 'customer_id', 'refund_amount', 'tax_refunded',
+                'refund_method', 'points_reversed', 'points_restored', 'reason', 'created_by', 'created_at'],
+    'return_items': ['id', 'return_id', 'invoice_id', 'product_id', 'quantity', 'unit_price', 'total_price',
+                     'restocked'],
+    'payments': ['id', 'invoice_id', 'return_id', 'tender', 'amount', 'tendered', 'change_given', 'card_last4',
+                 'till_id', 'created_by', 'created_at'],
+    'inventory': ['id', 'product_id', 'quantity', 'last_updated', 'last_restock_date'],
+    'inventory_transactions': ['id', 'product_id', 'quantity_change', 'transaction_type', 'reference_id',
+                               'notes', 'created_by', 'created_at'],
+    'stock_transactions': ['id', 'product_id', 'quantity', 'type', 'notes', 'user_id', 'created_at'],
+}
+
+BATCH_PATTERN = re.compile(r"^store(?P<store>\d+)_(?P<first>\d{12})-(?P<last>\d{12})\.jsonl\.gz$")
+
+
+def _head_office_ddl():
+    # Untyped columns keep whatever type the till stored
+    statements = [
+        """
+        CREATE TABLE IF NOT EXISTS replication_progress (
+            store_id INTEGER PRIMARY KEY,
+            last_seq INTEGER NOT NULL DEFAULT 0,
+            last_change_at TIMESTAMP,
+            applied_at TIMESTAMP
+        )
+        """,
+    ]
+    for table, columns in REPLICATED_TABLES.items():
+        statements.append(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                store_id INTEGER NOT NULL,
+                {', '.join(columns)},
+                PRIMARY KEY (store_id, id)
+            )
+        """)
+    statements.extend([
+        "CREATE INDEX IF NOT EXISTS idx_invoices_store_created_at ON invoices (store_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_invoice_items_store_invoice ON invoice_items (store_id, invoice_id)",
+        "CREATE INDEX IF NOT EXISTS idx_returns_store_invoice ON returns (store_id, invoice_id)",
+        "CREATE INDEX IF NOT EXISTS idx_payments_store_invoice ON payments (store_id, invoice_id)",
+    ])
+    return statements
+
+
+HEAD_OFFICE_DDL = _head_office_ddl()
+
+
+def _utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _seconds_since(timestamp):
+    if not timestamp:
+        return None
+    then = datetime.datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S').replace(tzinfo=datetime.timezone.utc)
+    return max((datetime.datetime.now(datetime.timezone.utc) - then).total_seconds(), 0)
+
+
+class ReplicationShipper:
+    """Ships a till's committed sales and stock changes to a head-office inbox.
+
+    Once enabled, triggers on the replicated tables append every insert and
+    update to replication_log inside the writing transaction, so a change is
+    logged if and only if it commits. ship() writes the log in seq order to gzipped
+    JSON Lines batch files named after their seq range, publishes each with
+    an atomic rename and then trims the log, so a crash can at worst ship a
+    batch twice, which head office ignores.
+    """
+
+    def __init__(self, db_manager, inbox=None, store_id=STORE_ID, batch_size=BATCH_SIZE):
+        self.db_manager = DatabaseManager(db_manager.db_path)
+        self.inbox = inbox or REPLICATION_INBOX
+        self.store_id = store_id
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def enable(self):
+        """Start logging changes to ship; safe to run repeatedly
+
+        The first time, the rows already in the replicated tables are logged
+        too, in the same transaction, so head office gets the till's history
+        and later changes have a row to apply to.
+        """
+        try:
+            self.db_manager.connect()
+            connection = self.db_manager.connection
+            connection.execute("BEGIN IMMEDIATE")
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO replication_state (key, value) VALUES ('enabled', ?)",
+                (_utc_now(),)
+            )
+            if cursor.rowcount:
+                for statement in _replication_backfill(REPLICATED_TABLES):
+                    connection.execute(statement)
+            self.db_manager.commit()
+            return True
+        except Exception as e:
+            print(f"Error enabling replication: {e}")
+            self.db_manager.rollback()
+            return False
+        finally:
+            self.db_manager.disconnect()
+
+    def _batch_path(self, first_seq, last_seq):
+        return os.path.join(self.inbox, f"store{self.store_id:04d}_{first_seq:012d}-{last_seq:012d}.jsonl.gz")
+
+    def ship(self):
+        """Write all logged changes to the inbox
+
+        Returns:
+            int: Number of changes shipped, or None on error
+        """
+        with self._lock:
+            shipped = 0
+            try:
+                os.makedirs(self.inbox, exist_ok=True)
+                self.db_manager.connect()
+                while True:
+                    rows = self.db_manager.fetch_all(
+                        "SELECT seq, table_name, row_id, payload, created_at FROM replication_log ORDER BY seq LIMIT ?",
+                        (self.batch_size,)
+                    )
+                    if not rows:
+                        break
+
+                    target = self._batch_path(rows[0]['seq'], rows[-1]['seq'])
+                    partial = target + ".partial"
+                    with gzip.open(partial, "wt", encoding="utf-8") as f:
+                        for row in rows:
+                            f.write(json.dumps({
+                                'seq': row['seq'], 'table': row['table_name'], 'id': row['row_id'],
+                                'at': row['created_at'], 'row': json.loads(row['payload'])
+                            }) + "\n")
+                    os.replace(partial, target)
+
+                    self.db_manager.connection.execute(
+                        "DELETE FROM replication_log WHERE seq <= ?", (rows[-1]['seq'],)
+                    )
+                    self.db_manager.connection.execute(
+                        "INSERT OR REPLACE INTO replication_state (key, value) VALUES ('last_shipped_at', ?)",
+                        (_utc_now(),)
+                    )
+                    self.db_manager.commit()
+                    shipped += len(rows)
+                return shipped
+            except Exception as e:
+                print(f"Error shipping changes: {e}")
+                self.db_manager.rollback()
+                return None
+            finally:
+                self.db_manager.disconnect()
+
+    def status(self):
+        """Get the number and age of changes not yet shipped"""
+        try:
+            self.db_manager.connect()
+            pending = self.db_manager.fetch_one(
+                "SELECT COUNT(*) AS changes, MIN(created_at) AS oldest FROM replication_log"
+            )
+            last_shipped = self.db_manager.fetch_one(
+                "SELECT value FROM replication_state WHERE key = 'last_shipped_at'"
+            )
+            return {
+                'store_id': self.store_id,
+                'pending_changes': pending['changes'],
+                'oldest_pending_seconds': _seconds_since(pending['oldest']),
+                'last_shipped_at': last_shipped['value'] if last_shipped else None
+            }
+        except Exception as e:
+            print(f"Error getting replication status: {e}")
+            return None
+        finally:
+            self.db_manager.disconnect()
+
+    def start(self, interval=REPLICATION_INTERVAL):
+        """Ship in a background thread every interval seconds"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                self.ship()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="replication-shipper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+class HeadOfficeApplier:
+    """Applies batch files from the inbox to the head-office database.
+
+    Rows are upserted by (store_id, id) and each store's last applied seq is
+    stored with the rows in the same transaction, so a batch delivered twice
+    or a run interrupted half way changes nothing the second time. Batches
+    must arrive without gaps; a store whose next batch is missing is held
+    back and reported rather than applied out of order.
+    """
+
+    def __init__(self, head_office_path, inbox=None):
+        self.head_office_path = head_office_path
+        self.inbox = inbox or REPLICATION_INBOX
+        self.applied_dir = os.path.join(self.inbox, "applied")
+
+    def _connect(self):
+        connection = sqlite3.connect(self.head_office_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        for ddl in HEAD_OFFICE_DDL:
+            connection.execute(ddl)
+        # Columns a replicated table gained after head office first created it
+        for table, columns in REPLICATED_TABLES.items():
+            present = {row['name'] for row in connection.execute(f"PRAGMA table_info({table})")}
+            for column in columns:
+                if column not in present:
+                    connection.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+        return connection
+
+    def pending_batches(self):
+        """List (store_id, first_seq, last_seq, path) for the inbox, in apply order"""
+        if not os.path.isdir(self.inbox):
+            return []
+        batches = []
+        for name in os.listdir(self.inbox):
+            match = BATCH_PATTERN.match(name)
+            if match:
+                batches.append((int(match.group('store')), int(match.group('first')),
+                                int(match.group('last')), os.path.join(self.inbox, name)))
+        return sorted(batches)
+
+    def apply_inbox(self):
+        """Apply every batch that is next in line for its store
+
+        Returns:
+            dict: Batches and changes applied, and stores held back by a gap
+        """
+        result = {'batches': 0, 'changes': 0, 'held_back': {}}
+        connection = self._connect()
+        try:
+            for store_id, first_seq, last_seq, path in self.pending_batches():
+                if store_id in result['held_back']:
+                    continue
+                row = connection.execute(
+                    "SELECT last_seq FROM replication_progress WHERE store_id = ?", (store_id,)
+                ).fetchone()
+                applied_seq = row['last_seq'] if row else 0
+
+                if last_seq <= applied_seq:
+                    self._retire(path)  # Shipped again after a crash
+                    continue
+                if first_seq > applied_seq + 1:
+                    result['held_back'][store_id] = (applied_seq + 1, first_seq - 1)
+                    continue
+
+                result['changes'] += self._apply_batch(connection, store_id, path, applied_seq)
+                result['batches'] += 1
+                self._retire(path)
+            return result
+        finally:
+            connection.close()
+
+    def _apply_batch(self, connection, store_id, path, applied_seq):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            changes = [json.loads(line) for line in f if line.strip()]
+        changes = [change for change in changes if change['seq'] > applied_seq]
+        if not changes:
+            return 0
+
+        # Only the latest version of a row matters
+        latest = {}
+        for change in changes:
+            latest[(change['table'], change['id'])] = change['row']
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for table, columns in REPLICATED_TABLES.items():
+                rows = [row for (name, _), row in latest.items() if name == table]
+                if not rows:
+                    continue
+                updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column != 'id')
+                connection.executemany(
+                    f"""
+                    INSERT INTO {table} (store_id, {', '.join(columns)})
+                    VALUES (?, {', '.join('?' for _ in columns)})
+                    ON CONFLICT (store_id, id) DO UPDATE SET {updates}
+                    """,
+                    [(store_id, *(row.get(column) for column in columns)) for row in rows]
+                )
+            connection.execute(
+                """
+                INSERT INTO replication_progress (store_id, last_seq, last_change_at, applied_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (store_id) DO UPDATE SET
+                    last_seq = excluded.last_seq,
+                    last_change_at = excluded.last_change_at,
+                    applied_at = excluded.applied_at
+                """,
+                (store_id, changes[-1]['seq'], changes[-1]['at'], _utc_now())
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return len(changes)
+
+    def _retire(self, path):
+        os.makedirs(self.applied_dir, exist_ok=True)
+        os.replace(path, os.path.join(self.applied_dir, os.path.basename(path)))
+
+    def lag_report(self):
+        """Get each store's replication position and lag
+
+        Returns:
+            list: One dict per store with the last applied seq, the commit
+                time of the last applied change, how long that change took to
+                arrive and how long ago it was committed (this grows while a
+                store is closed as well as while its batches are late)
+        """
+        connection = self._connect()
+        try:
+            report = []
+            rows = connection.execute("SELECT * FROM replication_progress ORDER BY store_id").fetchall()
+            waiting = {}
+            for store_id, _, _, _ in self.pending_batches():
+                waiting[store_id] = waiting.get(store_id, 0) + 1
+            for row in rows:
+                change_at = datetime.datetime.strptime(row['last_change_at'], '%Y-%m-%d %H:%M:%S')
+                applied_at = datetime.datetime.strptime(row['applied_at'], '%Y-%m-%d %H:%M:%S')
+                report.append({
+                    'store_id': row['store_id'],
+                    'last_seq': row['last_seq'],
+                    'last_change_at': row['last_change_at'],
+                    'apply_delay_seconds': max((applied_at - change_at).total_seconds(), 0),
+                    'staleness_seconds': _seconds_since(row['last_change_at']),
+                    'batches_waiting': waiting.pop(row['store_id'], 0)
+                })
+            for store_id, count in waiting.items():
+                report.append({'store_id': store_id, 'last_seq': 0, 'last_change_at': None,
+                               'apply_delay_seconds': None, 'staleness_seconds': None,
+                               'batches_waiting': count})
+            return report
+        finally:
+            connection.close()
+
+
+_shippers = {}
+_shippers_lock = threading.Lock()
+
+
+def get_replication_shipper(db_manager):
+    """Get the shipper of a database, shared within the process"""
+    db_path = os.path.abspath(db_manager.db_path)
+    with _shippers_lock:
+        if db_path not in _shippers:
+            _shippers[db_path] = ReplicationShipper(db_manager)
+        return _shippers[db_path]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replicate sales and stock changes to head office")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ship = subparsers.add_parser("ship", help="Ship this till's changes to the inbox")
+    ship.add_argument("--db", default=DATABASE_PATH, help="Path to the till database")
+    ship.add_argument("--inbox", default=REPLICATION_INBOX, required=REPLICATION_INBOX is None,
+                      help="Head-office inbox directory")
+    ship.add_argument("--store", type=int, default=STORE_ID, help="Store id of this till")
+    ship.add_argument("--enable", action="store_true", help="Start logging this till's changes first")
+
+    apply = subparsers.add_parser("apply", help="Apply inbox batches at head office")
+    apply.add_argument("head_office", help="Path to the head-office database")
+    apply.add_argument("--inbox", default=REPLICATION_INBOX, required=REPLICATION_INBOX is None,
+                       help="Inbox directory")
+    apply.add_argument("--watch", type=float, metavar="SECONDS", help="Keep applying at this interval")
+
+    lag = subparsers.add_parser("lag", help="Show replication lag per store")
+    lag.add_argument("head_office", help="Path to the head-office database")
+    lag.add_argument("--inbox", default=REPLICATION_INBOX, required=REPLICATION_INBOX is None,
+                     help="Inbox directory")
+    args = parser.parse_args()
+
+    if args.command == "ship":
+        shipper = ReplicationShipper(DatabaseManager(args.db), args.inbox, args.store)
+        if args.enable and not shipper.enable():
+            return
+        shipped = shipper.ship()
+        if shipped is not None:
+            print(f"Shipped {shipped} changes from store {args.store}")
+        return
+
+    applier = HeadOfficeApplier(args.head_office, args.inbox)
+    if args.command == "lag":
+        for store in applier.lag_report():
+            delay = store['apply_delay_seconds']
+            staleness = store['staleness_seconds']
+            print(f"store {store['store_id']}: seq {store['last_seq']}, "
+                  f"delay {'-' if delay is None else f'{delay:.0f}s'}, "
+                  f"stale {'-' if staleness is None else f'{staleness:.0f}s'}, "
+                  f"{store['batches_waiting']} batches waiting")
+        return
+
+    while True:
+        result = applier.apply_inbox()
+        print(f"Applied {result['batches']} batches, {result['changes']} changes")
+        for store_id, (first, last) in result['held_back'].items():
+            print(f"  store {store_id} held back: changes {first}-{last} missing")
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class ReportCache:
+    """LRU cache for report results.
+
+    Entries are keyed on (database, report, parameters) and remember the
+    invoice / invoice item watermark they were computed at. When new invoices
+    arrive, an entry for a date range stays valid as long as none of the new
+    invoices fall inside that range, so closed periods are never recomputed.
+    """
+
+    def __init__(self, max_entries=64, max_rows=200000):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _size(result):
+        return len(result) if isinstance(result, (list, tuple)) else 1
+
+    def _watermark(self, db_manager):
+        """Get the newest invoice and invoice item ids"""
+        try:
+            db_manager.connect()
+            row = db_manager.fetch_one("""
+                SELECT (SELECT MAX(id) FROM invoices) AS invoice_id,
+                       (SELECT MAX(id) FROM invoice_items) AS item_id
+            """)
+            if not row:
+                return None
+            return (row['invoice_id'] or 0, row['item_id'] or 0)
+        finally:
+            db_manager.disconnect()
+
+    def _new_invoice_dates(self, db_manager, since_invoice_id):
+        """Get the date span of invoices created after a watermark"""
+        try:
+            db_manager.connect()
+            row = db_manager.fetch_one("""
+                SELECT MIN(DATE(created_at)) AS first_date, MAX(DATE(created_at)) AS last_date
+                FROM invoices
+                WHERE id > ?
+            """, (since_invoice_id,))
+            if not row:
+                return None
+            return row['first_date'], row['last_date']
+        finally:
+            db_manager.disconnect()
+
+    def _is_current(self, db_manager, entry, watermark):
+        """Check whether an entry survives the invoices added since it was computed"""
+        if entry['watermark'] == watermark:
+            return True
+
+        date_range = entry['date_range']
+        if date_range is None:
+            return False
+
+        # Rows were deleted, the cached result may count them
+        if watermark[0] < entry['watermark'][0] or watermark[1] < entry['watermark'][1]:
+            return False
+
+        span = self._new_invoice_dates(db_manager, entry['watermark'][0])
+        if span is None:
+            return False
+
+        first_date, last_date = span
+        if first_date is None:
+            # Only invoice items changed, the new rows belong to older invoices
+            return False
+
+        from_date, to_date = date_range
+        return last_date < from_date or first_date > to_date
+
+    def get_or_compute(self, db_manager, report, params, compute, date_range=None):
+        """Get a cached report result, computing and storing it on a miss
+
+        Args:
+            db_manager: Database the report reads from
+            report (str): Report name
+            params (tuple): Hashable report parameters
+            compute (callable): Produces the result on a miss
+            date_range (tuple, optional): (from_date, to_date) covered by the report
+
+        Returns:
+            The report result
+        """
+        key = (os.path.abspath(db_manager.db_path), report, params)
+        watermark = self._watermark(db_manager)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is not None and watermark is not None and self._is_current(db_manager, entry, watermark):
+            with self._lock:
+                entry['watermark'] = watermark
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                self.hits += 1
+            return entry['result']
+
+        result = compute()
+
+        with self._lock:
+            self.misses += 1
+            if watermark is not None:
+                self._store(key, {
+                    'result': result,
+                    'watermark': watermark,
+                    'date_range': date_range,
+                    'size': self._size(result)
+                })
+
+        return result
+
+    def _store(self, key, entry):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._rows -= old['size']
+
+        # Results too large for the cache are simply not kept
+        if entry['size'] > self.max_rows:
+            return
+
+        self._entries[key] = entry
+        self._rows += entry['size']
+
+        while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+            _, evicted = self._entries.popitem(last=False)
+            self._rows -= evicted['size']
+
+    def invalidate(self, db_manager=None, report=None):
+        """Drop cached entries, optionally only for one database and/or report"""
+        db_path = os.path.abspath(db_manager.db_path) if db_manager else None
+        with self._lock:
+            for key in list(self._entries):
+                if db_path is not None and key[0] != db_path:
+                    continue
+                if report is not None and key[1] != report:
+                    continue
+                self._rows -= self._entries.pop(key)['size']
+
+    def get_stats(self):
+        """Get cache usage statistics"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'rows': self._rows,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+# Shared by every ReportController so results survive switching windows
+report_cache = ReportCache()
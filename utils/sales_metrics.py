@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import datetime
+import threading
+
+from config import METRICS_CHECKPOINT_PATH
+from db_manager import DatabaseManager
+
+# Seconds between checkpoint writes
+CHECKPOINT_INTERVAL = 60
+
+
+def utc_timestamp():
+    """Current time in the format SQLite's datetime('now') produces"""
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def day_bounds(from_date, to_date=None):
+    """created_at bounds [start, end) of whole days from YYYY-MM-DD dates
+
+    Compared as strings they select the same rows as DATE(created_at)
+    BETWEEN from_date AND to_date, but can be answered from an index.
+    """
+    to_date = to_date or from_date
+    end = datetime.date.fromisoformat(str(to_date)[:10]) + datetime.timedelta(days=1)
+    return str(from_date)[:10], end.isoformat()
+
+
+class SalesMetrics:
+    """In-process counters for today's sales.
+
+    Invoice.create_invoice records every committed invoice, so reading the
+    dashboard figures never touches the database. Invoices written by other
+    tills are picked up by refresh(), which only reads rows above the last
+    seen invoice id. The counters are checkpointed to disk periodically so a
+    restart resumes from the checkpoint instead of rescanning the day.
+    """
+
+    def __init__(self, db_manager, checkpoint_path=None):
+        # A private manager, so catching up never disturbs the caller's connection
+        self.db_manager = DatabaseManager(db_manager.db_path)
+        self.checkpoint_path = checkpoint_path or METRICS_CHECKPOINT_PATH
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._last_checkpoint = 0
+        self._reset(utc_timestamp()[:10])
+
+    def _reset(self, day):
+        self.day = day
+        self.watermark = 0
+        # Invoice ids above the watermark already counted by record_invoice
+        self._recorded = set()
+        self.revenue = 0.0
+        self.invoice_count = 0
+        self.item_count = 0
+        self.hourly = [{'invoices': 0, 'revenue': 0.0} for _ in range(24)]
+        self.cashiers = {}
+        self.payment_methods = {}
+
+    # Counters
+    def _add(self, created_at, final_amount, item_count, payment_method, cashier_id):
+        self.revenue += final_amount
+        self.invoice_count += 1
+        self.item_count += item_count
+
+        hour = self.hourly[int(created_at[11:13] or 0)]
+        hour['invoices'] += 1
+        hour['revenue'] += final_amount
+
+        cashier = self.cashiers.setdefault(str(cashier_id), {'invoices': 0, 'revenue': 0.0})
+        cashier['invoices'] += 1
+        cashier['revenue'] += final_amount
+
+        method = self.payment_methods.setdefault(payment_method, {'invoices': 0, 'revenue': 0.0})
+        method['invoices'] += 1
+        method['revenue'] += final_amount
+
+    def record_invoice(self, invoice_id, created_at, final_amount, item_count, payment_method, cashier_id):
+        """Count a committed invoice"""
+        with self._lock:
+            self._ensure_loaded()
+
+            if created_at[:10] != self.day:
+                if created_at[:10] < self.day:
+                    return
+                self._reset(created_at[:10])
+
+            if invoice_id <= self.watermark or invoice_id in self._recorded:
+                return
+
+            self._recorded.add(invoice_id)
+            self._add(created_at, final_amount, item_count, payment_method, cashier_id)
+            self._maybe_checkpoint()
+
+    def refresh(self):
+        """Catch up with invoices committed by other processes"""
+        with self._lock:
+            self._catch_up()
+            self._maybe_checkpoint()
+
+    def _catch_up(self):
+        with self._lock:
+            self._ensure_loaded()
+
+            today = utc_timestamp()[:10]
+            if today != self.day:
+                self._reset(today)
+
+            try:
+                self.db_manager.connect()
+                rows = self.db_manager.fetch_all(
+                    """
+                    SELECT i.id, i.created_at, i.final_amount, i.payment_method, i.created_by,
+                           (SELECT COALESCE(SUM(ii.quantity), 0) FROM invoice_items ii
+                            WHERE ii.invoice_id = i.id) AS item_count
+                    FROM invoices i
+                    WHERE i.id > ? AND i.created_at >= ?
+                    ORDER BY i.id
+                    """,
+                    (self.watermark, self.day)
+                )
+            finally:
+                self.db_manager.disconnect()
+
+            for row in rows:
+                if row['created_at'][:10] != self.day or row['id'] in self._recorded:
+                    continue
+                self._add(
+                    row['created_at'], row['final_amount'], row['item_count'],
+                    row['payment_method'], row['created_by']
+                )
+
+            if rows:
+                self.watermark = max(self.watermark, rows[-1]['id'])
+            self._recorded = {invoice_id for invoice_id in self._recorded if invoice_id > self.watermark}
+
+    def get_snapshot(self):
+        """Get a copy of today's counters"""
+        with self._lock:
+            return {
+                'day': self.day,
+                'revenue': self.revenue,
+                'invoice_count': self.invoice_count,
+                'item_count': self.item_count,
+                'average_basket': self.revenue / self.invoice_count if self.invoice_count else 0,
+                'hourly': [dict(hour) for hour in self.hourly],
+                'cashiers': {key: dict(value) for key, value in self.cashiers.items()},
+                'payment_methods': {key: dict(value) for key, value in self.payment_methods.items()}
+            }
+
+    # Checkpoints
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        # Only a checkpoint of today's sales on this database is usable
+        if state.get('db_path') != os.path.abspath(self.db_manager.db_path) or state.get('day') != self.day:
+            return
+
+        self.watermark = state['watermark']
+        self.revenue = state['revenue']
+        self.invoice_count = state['invoice_count']
+        self.item_count = state['item_count']
+        self.hourly = state['hourly']
+        self.cashiers = state['cashiers']
+        self.payment_methods = state['payment_methods']
+
+    def _maybe_checkpoint(self):
+        if time.monotonic() - self._last_checkpoint >= CHECKPOINT_INTERVAL:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Persist the counters
+
+        Counts recorded above the watermark are only safe to persist once
+        refresh() has folded them in, so the checkpoint runs a refresh first
+        when such counts exist.
+        """
+        with self._lock:
+            self._last_checkpoint = time.monotonic()
+            if self._recorded:
+                try:
+                    self._catch_up()
+                except Exception as e:
+                    print(f"Error refreshing sales metrics: {e}")
+                    return
+
+            state = {
+                'db_path': os.path.abspath(self.db_manager.db_path),
+                'day': self.day,
+                'watermark': self.watermark,
+                'revenue': self.revenue,
+                'invoice_count': self.invoice_count,
+                'item_count': self.item_count,
+                'hourly': self.hourly,
+                'cashiers': self.cashiers,
+                'payment_methods': self.payment_methods
+            }
+
+            try:
+                directory = os.path.dirname(self.checkpoint_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                tmp_path = self.checkpoint_path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, self.checkpoint_path)
+            except OSError as e:
+                print(f"Error writing sales metrics checkpoint: {e}")
+
+
+_hubs = {}
+_hubs_lock = threading.Lock()
+
+
+def get_sales_metrics(db_manager):
+    """Get the metrics hub of a database, shared within the process"""
+    db_path = os.path.abspath(db_manager.db_path)
+    with _hubs_lock:
+        if db_path not in _hubs:
+            _hubs[db_path] = SalesMetrics(db_manager)
+        return _hubs[db_path]
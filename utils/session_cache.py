@@ -0,0 +1,128 @@
+import hmac
+import time
+import hashlib
+import secrets
+import threading
+
+from config import SESSION_TTL
+
+
+class SessionCache:
+    """Short-lived in-memory cache of verified logins and session tokens.
+
+    A successful login is remembered under an HMAC of the credentials and
+    the stored password hash keyed with a per-process secret, so the same
+    cashier signing in again within the TTL skips the deliberately slow
+    password hash and no plaintext is kept. Tokens identify a logged-in user
+    without re-checking the password and expire after the TTL of inactivity.
+    Callers confirm both against the user's current row, one indexed read, so
+    a password changed or account deleted on another till is not trusted;
+    entries of a user are dropped at once when the change is made in this
+    process.
+    """
+
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._secret = secrets.token_bytes(32)
+        self._logins = {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _login_key(self, username, password, stored_hash):
+        message = f"{username}\0{password}\0{stored_hash}".encode()
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def _stamp(self, stored_hash):
+        return hmac.new(self._secret, stored_hash.encode(), hashlib.sha256).digest()
+
+    def _purge(self, now):
+        for store in (self._logins, self._sessions):
+            for key in [key for key, entry in store.items() if entry[1] <= now]:
+                del store[key]
+
+    def remember_login(self, username, password, user, stored_hash):
+        """Remember a verified login against the password hash it was verified with"""
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            self._logins[self._login_key(username, password, stored_hash)] = (dict(user), now + self.ttl)
+
+    def lookup_login(self, username, password, stored_hash):
+        """Get the user of a recently verified login, or None
+
+        Args:
+            stored_hash (str): The user's password hash as stored now; a
+                login verified against an older one is not found
+        """
+        now = time.monotonic()
+        key = self._login_key(username, password, stored_hash)
+        with self._lock:
+            entry = self._logins.get(key)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires <= now:
+                del self._logins[key]
+                return None
+            return dict(user)
+
+    def create_session(self, user):
+        """Issue a session token for a logged-in user"""
+        token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            self._sessions[token] = (dict(user), now + self.ttl, None)
+        return token
+
+    def get_session(self, token):
+        """Get the user of a live session, extending it; None if expired or unknown"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(token)
+            if entry is None:
+                return None
+            user, expires, stamp = entry
+            if expires <= now:
+                del self._sessions[token]
+                return None
+            self._sessions[token] = (user, now + self.ttl, stamp)
+            return dict(user)
+
+    def check_session(self, token, stored_hash):
+        """Check a session against its user's password hash as stored now
+
+        The first check records the hash; a later one that finds it changed
+        ends the session.
+
+        Returns:
+            bool: False if the session is gone or was ended
+        """
+        stamp = self._stamp(stored_hash)
+        with self._lock:
+            entry = self._sessions.get(token)
+            if entry is None:
+                return False
+            user, expires, recorded = entry
+            if recorded is None:
+                self._sessions[token] = (user, expires, stamp)
+            elif not hmac.compare_digest(recorded, stamp):
+                del self._sessions[token]
+                return False
+            return True
+
+    def end_session(self, token):
+        """Forget a session token"""
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def forget_user(self, user_id):
+        """Drop cached logins and sessions of a user"""
+        with self._lock:
+            for store in (self._logins, self._sessions):
+                for key in [key for key, entry in store.items() if entry[0]['id'] == user_id]:
+                    del store[key]
+
+
+# Shared by every User model and AuthController in the process
+session_cache = SessionCache()
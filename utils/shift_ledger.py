@@ -0,0 +1,555 @@
+import os
+import datetime
+import threading
+
+from config import TILL_ID, SHIFT_FOLD_INTERVAL
+from db_manager import DatabaseManager
+from models.payment import CHANGE_TENDERS
+from utils.sales_metrics import utc_timestamp, day_bounds
+from utils.tracing import traced
+
+# Counters a shift accumulates, and a day close freezes as their sum
+SHIFT_COUNTERS = (
+    'sale_count', 'subtotal', 'tax_total', 'discount_total', 'gross_sales',
+    'refund_count', 'refund_total', 'tax_refunded',
+)
+TENDER_COUNTERS = ('payment_count', 'taken', 'refunded', 'change_given')
+
+# Whether a payment p was folded into a shift: each shift holds its till's
+# payments with ids in (first_payment_id, last_payment_id]
+FOLDED = """
+    EXISTS (
+        SELECT 1 FROM shifts s
+        WHERE s.till_id = COALESCE(p.till_id, '') AND p.id > s.first_payment_id AND p.id <= s.last_payment_id
+    )
+"""
+
+
+class ShiftLedger:
+    """Shift and day close with X/Z reports read from running counters.
+
+    Every sale and refund writes payments (see models.payment), so the
+    ledger folds payments above a cursor into the open shift of the till
+    that took them: one grouped read of the new rows, then an upsert per
+    till and tender. Folding runs in the background every
+    SHIFT_FOLD_INTERVAL seconds and again before a report, so an X report
+    reads the counters plus at most a few seconds of payments, however
+    busy the day.
+
+    The Z report closes a shift with its counters and the counted drawer
+    frozen, and closing a day freezes the sum of its shifts into
+    day_closes. Triggers refuse any change to a closed shift or day, and
+    payments arriving after a close (a late offline sale, a return) fold
+    into the next open shift instead of reopening it.
+
+    A sale or refund belongs to the business day of the shift it was folded
+    into, so an offline sale replayed the next morning counts on the day it
+    reached the drawer. Sales no shift holds (made before shifts existed)
+    belong to the UTC day of their created_at; a day with any of those
+    can't be closed, so its figures are the same before and after.
+    """
+
+    def __init__(self, db_manager, interval=SHIFT_FOLD_INTERVAL):
+        # A private manager, folding never disturbs the caller's connection
+        self.db_manager = DatabaseManager(db_manager.db_path)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Keep the open shifts' counters current from a background thread"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="shift-fold", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            self.fold()
+
+    def _business_date(self):
+        # Today, or the next day not yet closed when today's close is done.
+        # UTC, like the created_at days reports are bounded by
+        day = datetime.datetime.now(datetime.timezone.utc).date()
+        while self.db_manager.fetch_one("SELECT 1 FROM day_closes WHERE business_date = ?", (day.isoformat(),)):
+            day += datetime.timedelta(days=1)
+        return day.isoformat()
+
+    def _open_shift_id(self, till_id, opened_by=None, opening_float=0.0):
+        shift = self.db_manager.fetch_one(
+            "SELECT id FROM shifts WHERE till_id = ? AND status = 'open'", (till_id,)
+        )
+        if shift:
+            return shift['id']
+        cursor = self.db_manager.connection.execute(
+            """
+            INSERT INTO shifts (till_id, business_date, opened_by, opened_at, opening_float,
+                                first_payment_id, last_payment_id)
+            SELECT ?, ?, ?, ?, ?, last_payment_id, last_payment_id FROM shift_cursor WHERE id = 1
+            """,
+            (till_id, self._business_date(), opened_by, utc_timestamp(), opening_float)
+        )
+        return cursor.lastrowid
+
+    def _fold(self):
+        """Fold payments above the cursor into the open shifts; call inside a write transaction"""
+        connection = self.db_manager.connection
+        cursor = self.db_manager.fetch_one("SELECT last_payment_id FROM shift_cursor WHERE id = 1")
+        first = cursor['last_payment_id'] if cursor else 0
+        last = self.db_manager.fetch_one("SELECT COALESCE(MAX(id), 0) AS id FROM payments")['id']
+        if last <= first:
+            return 0
+
+        # One writer at a time, so payment ids are committed in order and
+        # nothing below MAX(id) can still turn up
+        params = (first, last)
+        tenders = self.db_manager.fetch_all(
+            """
+            SELECT COALESCE(till_id, '') AS till_id, tender,
+                   SUM(amount > 0) AS payment_count,
+                   SUM(MAX(amount, 0)) AS taken,
+                   -SUM(MIN(amount, 0)) AS refunded,
+                   SUM(change_given) AS change_given
+            FROM payments
+            WHERE id > ? AND id <= ?
+            GROUP BY 1, tender
+            """,
+            params
+        )
+        sales = self.db_manager.fetch_all(
+            """
+            SELECT p.till_id, COUNT(*) AS sale_count, SUM(i.total_amount) AS subtotal,
+                   SUM(i.tax_amount) AS tax_total, SUM(i.discount_amount) AS discount_total,
+                   SUM(i.final_amount) AS gross_sales
+            FROM (
+                SELECT invoice_id, MIN(COALESCE(till_id, '')) AS till_id
+                FROM payments
+                WHERE id > ? AND id <= ? AND return_id IS NULL
+                GROUP BY invoice_id
+            ) p
+            JOIN invoices i ON i.id = p.invoice_id
+            GROUP BY p.till_id
+            """,
+            params
+        )
+        refunds = self.db_manager.fetch_all(
+            """
+            SELECT p.till_id, COUNT(*) AS refund_count,
+                   SUM(r.refund_amount) AS refund_total, SUM(r.tax_refunded) AS tax_refunded
+            FROM (
+                SELECT return_id, MIN(COALESCE(till_id, '')) AS till_id
+                FROM payments
+                WHERE id > ? AND id <= ? AND return_id IS NOT NULL
+                GROUP BY return_id
+            ) p
+            JOIN returns r ON r.id = p.return_id
+            GROUP BY p.till_id
+            """,
+            params
+        )
+
+        counters = {}
+        for row in list(sales) + list(refunds):
+            totals = counters.setdefault(row['till_id'], dict.fromkeys(SHIFT_COUNTERS, 0))
+            for key in row.keys():
+                if key != 'till_id':
+                    totals[key] += row[key] or 0
+        shift_ids = {}
+        for till_id in sorted(set(counters) | {row['till_id'] for row in tenders}):
+            shift_ids[till_id] = self._open_shift_id(till_id)
+            totals = counters.get(till_id, dict.fromkeys(SHIFT_COUNTERS, 0))
+            connection.execute(
+                f"""
+                UPDATE shifts
+                SET {", ".join(f"{key} = {key} + ?" for key in SHIFT_COUNTERS)}, last_payment_id = ?
+                WHERE id = ?
+                """,
+                [totals[key] for key in SHIFT_COUNTERS] + [last, shift_ids[till_id]]
+            )
+
+        connection.executemany(
+            f"""
+            INSERT INTO shift_tenders (shift_id, tender, {", ".join(TENDER_COUNTERS)})
+            VALUES (?, ?, {", ".join("?" for _ in TENDER_COUNTERS)})
+            ON CONFLICT (shift_id, tender) DO UPDATE SET
+                {", ".join(f"{key} = {key} + excluded.{key}" for key in TENDER_COUNTERS)}
+            """,
+            [
+                [shift_ids[row['till_id']], row['tender']] + [row[key] for key in TENDER_COUNTERS]
+                for row in tenders
+            ]
+        )
+        connection.execute("UPDATE shift_cursor SET last_payment_id = ? WHERE id = 1", (last,))
+        return last - first
+
+    @traced("shift.fold")
+    def fold(self):
+        """Bring the open shifts' counters up to date
+
+        Returns:
+            int: Payment ids folded, None on error
+        """
+        try:
+            self.db_manager.connect()
+            self.db_manager.connection.execute("BEGIN IMMEDIATE")
+            folded = self._fold()
+            self.db_manager.commit()
+            return folded
+        except Exception as e:
+            print(f"Error folding shift counters: {e}")
+            self.db_manager.rollback()
+            return None
+        finally:
+            self.db_manager.disconnect()
+
+    def open_shift(self, till_id, user_id, opening_float=0.0):
+        """Start a till's shift with the float put in its drawer
+
+        A shift opened by the ledger for sales taken before anyone opened
+        one is taken over instead.
+
+        Returns:
+            tuple: (True, shift id) or (False, why it was refused)
+        """
+        try:
+            self.db_manager.connect()
+            self.db_manager.connection.execute("BEGIN IMMEDIATE")
+            self._fold()
+            shift = self.db_manager.fetch_one(
+                "SELECT id, opened_by FROM shifts WHERE till_id = ? AND status = 'open'", (till_id,)
+            )
+            if shift and shift['opened_by'] is not None:
+                self.db_manager.rollback()
+                return False, "A shift is already open on this till"
+            if shift:
+                self.db_manager.connection.execute(
+                    "UPDATE shifts SET opened_by = ?, opening_float = ? WHERE id = ?",
+                    (user_id, opening_float, shift['id'])
+                )
+                shift_id = shift['id']
+            else:
+                shift_id = self._open_shift_id(till_id, user_id, opening_float)
+            self.db_manager.commit()
+            return True, shift_id
+        except Exception as e:
+            print(f"Error opening shift: {e}")
+            self.db_manager.rollback()
+            return False, "The shift could not be opened"
+        finally:
+            self.db_manager.disconnect()
+
+    def _shift_report(self, shift_id):
+        shift = self.db_manager.fetch_one(
+            """
+            SELECT s.*, o.username AS opened_by_user, c.username AS closed_by_user
+            FROM shifts s
+            LEFT JOIN users o ON o.id = s.opened_by
+            LEFT JOIN users c ON c.id = s.closed_by
+            WHERE s.id = ?
+            """,
+            (shift_id,)
+        )
+        if not shift:
+            return None
+        report = dict(shift)
+        report['net_sales'] = round(report['gross_sales'] - report['refund_total'], 2)
+        report['tenders'] = []
+        report['cash_variance'] = None
+        for row in self.db_manager.fetch_all(
+            "SELECT * FROM shift_tenders WHERE shift_id = ? ORDER BY tender", (shift_id,)
+        ):
+            tender = dict(row)
+            tender['net'] = round(tender['taken'] - tender['refunded'], 2)
+            tender['expected'] = tender['net']
+            if tender['tender'] in CHANGE_TENDERS:
+                tender['expected'] = round(tender['net'] + report['opening_float'], 2)
+            tender['variance'] = None
+            if tender['counted'] is not None:
+                tender['variance'] = round(tender['counted'] - tender['expected'], 2)
+                report['cash_variance'] = round((report['cash_variance'] or 0) + tender['variance'], 2)
+            report['tenders'].append(tender)
+        return report
+
+    def get_shift_report(self, shift_id):
+        """Get a shift's report; a closed shift's is its frozen Z report"""
+        try:
+            self.db_manager.connect()
+            return self._shift_report(shift_id)
+        except Exception as e:
+            print(f"Error getting shift report: {e}")
+            return None
+        finally:
+            self.db_manager.disconnect()
+
+    @traced("shift.x_report")
+    def x_report(self, till_id=TILL_ID):
+        """Get the running totals of a till's open shift without closing it
+
+        Returns:
+            dict: The shift report, or None when the till has no open shift
+        """
+        self.fold()
+        try:
+            self.db_manager.connect()
+            shift = self.db_manager.fetch_one(
+                "SELECT id FROM shifts WHERE till_id = ? AND status = 'open'", (till_id,)
+            )
+            return self._shift_report(shift['id']) if shift else None
+        except Exception as e:
+            print(f"Error getting X report: {e}")
+            return None
+        finally:
+            self.db_manager.disconnect()
+
+    @traced("shift.close_shift")
+    def close_shift(self, till_id, closed_by, counted=None):
+        """Close a till's shift with its Z report
+
+        Args:
+            till_id (str): The till being cashed up
+            closed_by (int): The user closing it
+            counted (dict, optional): tender -> amount counted in the drawer
+                or on the card terminal's end-of-day slip
+
+        Returns:
+            tuple: (True, the frozen Z report) or (False, why it was refused)
+        """
+        try:
+            self.db_manager.connect()
+            connection = self.db_manager.connection
+            connection.execute("BEGIN IMMEDIATE")
+            self._fold()
+            shift = self.db_manager.fetch_one(
+                "SELECT id FROM shifts WHERE till_id = ? AND status = 'open'", (till_id,)
+            )
+            if not shift:
+                self.db_manager.rollback()
+                return False, "No shift is open on this till"
+
+            # Counted amounts go in before the close locks the shift
+            connection.executemany(
+                """
+                INSERT INTO shift_tenders (shift_id, tender, counted) VALUES (?, ?, ?)
+                ON CONFLICT (shift_id, tender) DO UPDATE SET counted = excluded.counted
+                """,
+                [(shift['id'], tender, amount) for tender, amount in (counted or {}).items()]
+            )
+            z_number = self.db_manager.fetch_one(
+                "SELECT COALESCE(MAX(z_number), 0) + 1 AS z_number FROM shifts WHERE till_id = ?", (till_id,)
+            )['z_number']
+            connection.execute(
+                """
+                UPDATE shifts SET status = 'closed', z_number = ?, closed_by = ?, closed_at = ?
+                WHERE id = ?
+                """,
+                (z_number, closed_by, utc_timestamp(), shift['id'])
+            )
+            self.db_manager.commit()
+            return True, self._shift_report(shift['id'])
+        except Exception as e:
+            print(f"Error closing shift: {e}")
+            self.db_manager.rollback()
+            return False, "The shift could not be closed"
+        finally:
+            self.db_manager.disconnect()
+
+    def get_shifts(self, business_date):
+        """Get the shifts of a business day, open ones included"""
+        try:
+            self.db_manager.connect()
+            return self.db_manager.fetch_all(
+                """
+                SELECT s.id, s.till_id, s.status, s.z_number, s.opened_at, s.closed_at,
+                       s.sale_count, s.gross_sales, s.refund_total, u.username AS closed_by_user
+                FROM shifts s LEFT JOIN users u ON u.id = s.closed_by
+                WHERE s.business_date = ?
+                ORDER BY s.till_id, s.id
+                """,
+                (business_date,)
+            )
+        except Exception as e:
+            print(f"Error getting shifts: {e}")
+            return []
+        finally:
+            self.db_manager.disconnect()
+
+    def _shift_totals(self, business_date):
+        return self.db_manager.fetch_one(
+            f"""
+            SELECT COUNT(*) AS shift_count,
+                   {", ".join(f"COALESCE(SUM({key}), 0) AS {key}" for key in SHIFT_COUNTERS)}
+            FROM shifts
+            WHERE business_date = ?
+            """,
+            (business_date,)
+        )
+
+    def _unfolded_totals(self, business_date):
+        # Sales and refunds made on the day that no shift holds
+        start, end = day_bounds(business_date)
+        sales = self.db_manager.fetch_one(
+            f"""
+            SELECT COUNT(*) AS sale_count, COALESCE(SUM(total_amount), 0) AS subtotal,
+                   COALESCE(SUM(tax_amount), 0) AS tax_total,
+                   COALESCE(SUM(discount_amount), 0) AS discount_total,
+                   COALESCE(SUM(final_amount), 0) AS gross_sales
+            FROM invoices i
+            WHERE i.created_at >= ? AND i.created_at < ? AND NOT EXISTS (
+                SELECT 1 FROM payments p WHERE p.invoice_id = i.id AND p.return_id IS NULL AND {FOLDED}
+            )
+            """,
+            (start, end)
+        )
+        refunds = self.db_manager.fetch_one(
+            f"""
+            SELECT COUNT(*) AS refund_count, COALESCE(SUM(refund_amount), 0) AS refund_total,
+                   COALESCE(SUM(tax_refunded), 0) AS tax_refunded
+            FROM returns r
+            WHERE r.created_at >= ? AND r.created_at < ? AND NOT EXISTS (
+                SELECT 1 FROM payments p WHERE p.return_id = r.id AND {FOLDED}
+            )
+            """,
+            (start, end)
+        )
+        return dict(dict(sales), **dict(refunds))
+
+    def get_day_totals(self, business_date):
+        """Get a business day's counters as they stand, whether or not it is closed
+
+        The day's shifts, open ones included, plus the sales and refunds
+        made that day that no shift holds. Closing the day freezes the same
+        figures.
+
+        Returns:
+            dict: SHIFT_COUNTERS and shift_count, or None on error
+        """
+        self.fold()
+        try:
+            self.db_manager.connect()
+            totals = dict(self._shift_totals(business_date))
+            for key, value in self._unfolded_totals(business_date).items():
+                totals[key] += value
+            return totals
+        except Exception as e:
+            print(f"Error getting day totals: {e}")
+            return None
+        finally:
+            self.db_manager.disconnect()
+
+    @traced("shift.close_day")
+    def close_day(self, business_date, closed_by):
+        """Freeze a business day once all of its shifts are closed
+
+        Refused for a day still to come, a day without shifts, and a day
+        with sales or refunds no shift holds, which the frozen sum of its
+        shifts would leave out.
+
+        Returns:
+            tuple: (True, the day report) or (False, why it was refused)
+        """
+        try:
+            self.db_manager.connect()
+            connection = self.db_manager.connection
+            connection.execute("BEGIN IMMEDIATE")
+            if self.db_manager.fetch_one("SELECT 1 FROM day_closes WHERE business_date = ?", (business_date,)):
+                self.db_manager.rollback()
+                return False, f"{business_date} is already closed"
+            if business_date > self._business_date():
+                self.db_manager.rollback()
+                return False, f"{business_date} has not started yet"
+            self._fold()
+            open_tills = [
+                row['till_id'] for row in self.db_manager.fetch_all(
+                    "SELECT till_id FROM shifts WHERE business_date = ? AND status = 'open'", (business_date,)
+                )
+            ]
+            if open_tills:
+                self.db_manager.rollback()
+                return False, f"Close the shifts still open first: {', '.join(open_tills)}"
+
+            unfolded = self._unfolded_totals(business_date)
+            if unfolded['sale_count'] or unfolded['refund_count']:
+                self.db_manager.rollback()
+                return False, (f"{unfolded['sale_count']} sales and {unfolded['refund_count']} refunds "
+                               f"on {business_date} are not in any shift")
+            totals = self._shift_totals(business_date)
+            if not totals['shift_count']:
+                self.db_manager.rollback()
+                return False, f"No shifts were taken on {business_date}"
+            variances = [
+                report['cash_variance']
+                for report in (self._shift_report(row['id']) for row in self.db_manager.fetch_all(
+                    "SELECT id FROM shifts WHERE business_date = ?", (business_date,)
+                ))
+                if report['cash_variance'] is not None
+            ]
+            columns = ('shift_count',) + SHIFT_COUNTERS
+            connection.execute(
+                f"""
+                INSERT INTO day_closes (business_date, {", ".join(columns)}, cash_variance, closed_by, closed_at)
+                VALUES (?, {", ".join("?" for _ in columns)}, ?, ?, ?)
+                """,
+                [business_date] + [totals[key] for key in columns]
+                + [round(sum(variances), 2) if variances else None, closed_by, utc_timestamp()]
+            )
+            self.db_manager.commit()
+            return True, self._day_report(business_date)
+        except Exception as e:
+            print(f"Error closing day: {e}")
+            self.db_manager.rollback()
+            return False, "The day could not be closed"
+        finally:
+            self.db_manager.disconnect()
+
+    def _day_report(self, business_date):
+        day = self.db_manager.fetch_one(
+            """
+            SELECT d.*, u.username AS closed_by_user
+            FROM day_closes d LEFT JOIN users u ON u.id = d.closed_by
+            WHERE d.business_date = ?
+            """,
+            (business_date,)
+        )
+        if not day:
+            return None
+        report = dict(day)
+        report['net_sales'] = round(report['gross_sales'] - report['refund_total'], 2)
+        report['tenders'] = [
+            dict(row) for row in self.db_manager.fetch_all(
+                f"""
+                SELECT t.tender, {", ".join(f"SUM(t.{key}) AS {key}" for key in TENDER_COUNTERS)},
+                       ROUND(SUM(t.taken) - SUM(t.refunded), 2) AS net
+                FROM shifts s JOIN shift_tenders t ON t.shift_id = s.id
+                WHERE s.business_date = ?
+                GROUP BY t.tender
+                ORDER BY t.tender
+                """,
+                (business_date,)
+            )
+        ]
+        return report
+
+    def get_day_report(self, business_date):
+        """Get the frozen report of a closed business day, or None if it is still open"""
+        try:
+            self.db_manager.connect()
+            return self._day_report(business_date)
+        except Exception as e:
+            print(f"Error getting day report: {e}")
+            return None
+        finally:
+            self.db_manager.disconnect()
+
+
+_ledgers = {}
+_ledgers_lock = threading.Lock()
+
+
+def get_shift_ledger(db_manager):
+    """Get the shift ledger of a database, shared within the process"""
+    db_path = os.path.abspath(db_manager.db_path)
+    with _ledgers_lock:
+        if db_path not in _ledgers:
+            _ledgers[db_path] = ShiftLedger(db_manager)
+        return _ledgers[db_path]
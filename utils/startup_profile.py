@@ -0,0 +1,46 @@
+import sys
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    """Wall-clock timings of the startup stages, printed with main.py --profile.
+
+    Each stage also reports how many modules it imported, which points at
+    the stage to make lazier when cold start gets slow again.
+    """
+
+    def __init__(self, enabled=False, started=None):
+        self.enabled = enabled
+        self.started = started if started is not None else time.perf_counter()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block"""
+        if not self.enabled:
+            yield
+            return
+
+        modules_before = len(sys.modules)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - started, len(sys.modules) - modules_before))
+
+    def mark(self, name):
+        """Record the time elapsed since startup under a name"""
+        if self.enabled:
+            self.stages.append((name, time.perf_counter() - self.started, None))
+
+    def report(self):
+        """Print the collected timings"""
+        if not self.enabled:
+            return
+
+        print("Startup profile:")
+        for name, seconds, modules in self.stages:
+            imported = f"  ({modules} modules imported)" if modules else ""
+            print(f"  {name:<32} {seconds * 1000:8.1f} ms{imported}")
+        print(f"  {'total':<32} {(time.perf_counter() - self.started) * 1000:8.1f} ms")
@@ -0,0 +1,364 @@
+import os
+import math
+import time
+import random
+import sqlite3
+import argparse
+import datetime
+
+from config import DEFAULT_TAX_RATE
+
+# Invoices written per transaction
+CHUNK_INVOICES = 20000
+
+# Product popularity follows a Zipf law: the n-th best seller sells about
+# 1 / n ** POPULARITY_EXPONENT as much as the best one
+POPULARITY_EXPONENT = 1.1
+
+# Regular customers are also long-tailed, but less steeply than products
+CUSTOMER_EXPONENT = 0.8
+
+# Share of invoices rung up for a loyalty customer
+CUSTOMER_SHARE = 0.35
+
+# Basket sizes are log-normal around the requested mean with this spread
+BASKET_SIGMA = 0.8
+MAX_BASKET = 80
+
+QUANTITY_WEIGHTS = {1: 70, 2: 20, 3: 6, 4: 4}
+
+PAYMENT_WEIGHTS = {"Cash": 40, "Credit Card": 30, "Debit Card": 20, "Mobile Payment": 10}
+
+# Relative trade by weekday (Monday first) and by opening hour
+WEEKDAY_WEIGHTS = [0.85, 0.8, 0.85, 0.95, 1.15, 1.35, 1.05]
+HOUR_WEIGHTS = {7: 2, 8: 4, 9: 5, 10: 6, 11: 7, 12: 9, 13: 8, 14: 6, 15: 6,
+                16: 8, 17: 10, 18: 11, 19: 9, 20: 6, 21: 3}
+
+# Trade on particular days of the year relative to an ordinary day
+HOLIDAY_FACTORS = {(12, 24): 1.8, (12, 23): 1.6, (12, 22): 1.4, (12, 21): 1.3, (12, 25): 0.2,
+                   (12, 31): 1.4, (1, 1): 0.3}
+
+# Amplitude of the yearly cycle, which peaks in late December
+ANNUAL_AMPLITUDE = 0.15
+
+# Catalog vocabulary per category: (typical price, product nouns)
+CATEGORIES = {
+    "Fruits": (3.0, ["Apples", "Bananas", "Oranges", "Grapes", "Pears", "Mangoes", "Strawberries", "Lemons"]),
+    "Vegetables": (2.5, ["Carrots", "Potatoes", "Onions", "Tomatoes", "Spinach", "Broccoli", "Peppers", "Cucumbers"]),
+    "Dairy": (3.5, ["Milk", "Yogurt", "Cheddar", "Butter", "Cream", "Mozzarella", "Kefir", "Cottage Cheese"]),
+    "Bakery": (3.0, ["Bread", "Bagels", "Croissants", "Muffins", "Rolls", "Baguette", "Pita", "Tortillas"]),
+    "Meat": (9.0, ["Chicken Breast", "Ground Beef", "Pork Chops", "Sausages", "Bacon", "Lamb", "Turkey", "Ham"]),
+    "Seafood": (11.0, ["Salmon", "Shrimp", "Tuna", "Cod", "Mussels", "Tilapia", "Crab", "Sardines"]),
+    "Beverages": (2.5, ["Cola", "Orange Juice", "Sparkling Water", "Iced Tea", "Coffee", "Green Tea", "Lemonade", "Energy Drink"]),
+    "Snacks": (2.5, ["Potato Chips", "Pretzels", "Popcorn", "Cookies", "Crackers", "Trail Mix", "Granola Bars", "Nachos"]),
+    "Frozen Foods": (5.0, ["Pizza", "Ice Cream", "Peas", "Fries", "Dumplings", "Fish Fingers", "Waffles", "Berries"]),
+    "Household": (6.0, ["Detergent", "Dish Soap", "Paper Towels", "Toilet Paper", "Sponges", "Trash Bags", "Bleach", "Foil"]),
+}
+BRANDS = ["Fresh Farm", "Golden Valley", "Blue Ridge", "Sunrise", "Green Leaf", "Harbor", "Maple Grove",
+          "Prime", "Everyday", "Natural Choice", "Hillside", "Silver Spoon"]
+SIZES = ["", "Small", "Large", "Family Pack", "Organic", "Value Pack", "Light", "Classic"]
+FIRST_NAMES = ["James", "Mary", "Ravi", "Aisha", "Wei", "Sofia", "Carlos", "Priya", "John", "Fatima",
+               "Liam", "Emma", "Noah", "Olivia", "Arjun", "Mei", "Omar", "Anna", "Lucas", "Zara"]
+LAST_NAMES = ["Smith", "Patel", "Chen", "Garcia", "Khan", "Johnson", "Kim", "Singh", "Brown", "Lopez",
+              "Nguyen", "Ali", "Martin", "Sharma", "Wilson", "Rossi", "Ahmed", "Taylor", "Silva", "Mehta"]
+
+
+def cumulative(weights):
+    """Running totals of weights, for random.choices(cum_weights=...)"""
+    totals = []
+    running = 0.0
+    for weight in weights:
+        running += weight
+        totals.append(running)
+    return totals
+
+
+def zipf_weights(count, exponent):
+    return [1 / rank ** exponent for rank in range(1, count + 1)]
+
+
+def day_weight(day):
+    """Relative trade on a date: weekday pattern, yearly cycle and holidays"""
+    annual = 1 + ANNUAL_AMPLITUDE * math.cos(2 * math.pi * (day.timetuple().tm_yday - 358) / 365.25)
+    return WEEKDAY_WEIGHTS[day.weekday()] * annual * HOLIDAY_FACTORS.get((day.month, day.day), 1.0)
+
+
+def allocate(total, weights):
+    """Split total into integer shares proportional to weights, summing exactly to total"""
+    scale = total / sum(weights)
+    shares = [int(weight * scale) for weight in weights]
+    # Largest remainders get the leftover units; ties go to the earlier index
+    leftover = total - sum(shares)
+    by_remainder = sorted(range(len(weights)), key=lambda i: (shares[i] - weights[i] * scale, i))
+    for i in by_remainder[:leftover]:
+        shares[i] += 1
+    return shares
+
+
+class SyntheticDataGenerator:
+    """Deterministic store history for benchmarks, written straight into SQLite.
+
+    The same seed and arguments always produce the same database. Products
+    sell with long-tailed (Zipf) popularity, baskets are log-normal in size,
+    and invoices follow weekday, time-of-day, yearly and holiday patterns.
+    Rows are generated a day at a time and bulk inserted with executemany,
+    with the invoice indexes dropped during the load and rebuilt afterwards,
+    so millions of invoices take minutes rather than hours.
+
+    Stock is not drawn down by the generated sales, and loyalty ledgers and
+    inventory transactions are not generated.
+    """
+
+    def __init__(self, db_path, seed=42, products=5000, customers=20000, invoices=100000,
+                 days=365, end_date=None, basket_size=12, cashiers=8, stock=10 ** 6):
+        self.db_path = db_path
+        self.seed = seed
+        self.products = products
+        self.customers = customers
+        self.invoices = invoices
+        self.days = days
+        self.end_date = end_date or datetime.date.today()
+        self.basket_size = basket_size
+        self.cashiers = cashiers
+        self.stock = stock
+
+    def generate(self, progress=None):
+        """Create the database and fill it
+
+        Args:
+            progress (callable, optional): Called with (invoices_written, invoices_total)
+
+        Returns:
+            dict: Row counts and the seconds taken
+
+        Raises:
+            FileExistsError: If the database already exists
+        """
+        from db_manager import DatabaseManager
+
+        if os.path.exists(self.db_path):
+            raise FileExistsError(f"{self.db_path} already exists")
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        if not DatabaseManager(self.db_path).initialize_database():
+            raise RuntimeError(f"Could not create {self.db_path}")
+
+        started = time.perf_counter()
+        rng = random.Random(self.seed)
+        connection = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            # Nothing else uses the file until it is complete, and a failed
+            # load is simply generated again
+            connection.execute("PRAGMA synchronous = OFF")
+            connection.execute("BEGIN")
+            prices = self._generate_catalog(connection, rng)
+            cashier_ids = self._generate_people(connection, rng)
+            connection.execute("COMMIT")
+
+            indexes = connection.execute(
+                """
+                SELECT name, sql FROM sqlite_master
+                WHERE type = 'index' AND tbl_name IN ('invoices', 'invoice_items', 'payments') AND sql IS NOT NULL
+                """
+            ).fetchall()
+            for name, _ in indexes:
+                connection.execute(f"DROP INDEX {name}")
+
+            items = self._generate_invoices(connection, rng, prices, cashier_ids, progress)
+
+            for _, sql in indexes:
+                connection.execute(sql)
+            # Generated history is before any shift, like sales before an upgrade
+            connection.execute("UPDATE shift_cursor SET last_payment_id = (SELECT COALESCE(MAX(id), 0) FROM payments)")
+            connection.execute("ANALYZE")
+        finally:
+            connection.close()
+
+        return {
+            'products': self.products,
+            'customers': self.customers,
+            'invoices': self.invoices,
+            'invoice_items': items,
+            'seconds': time.perf_counter() - started,
+        }
+
+    def _generate_catalog(self, connection, rng):
+        connection.executemany("INSERT INTO categories (name) VALUES (?)", [(name,) for name in CATEGORIES])
+        category_ids = dict(connection.execute("SELECT name, id FROM categories"))
+
+        rows = []
+        prices = []
+        names = list(CATEGORIES)
+        for n in range(1, self.products + 1):
+            category = names[rng.randrange(len(names))]
+            typical_price, nouns = CATEGORIES[category]
+            name = " ".join(part for part in (rng.choice(BRANDS), rng.choice(nouns), rng.choice(SIZES)) if part)
+            price = round(max(0.25, rng.lognormvariate(math.log(typical_price), 0.5)), 2)
+            rows.append((f"SKU-{n:07d}", f"{name} #{n}", price, round(price * rng.uniform(0.55, 0.8), 2),
+                         category_ids[category], self.stock))
+            prices.append(price)
+
+        connection.executemany(
+            "INSERT INTO products (sku, name, price, cost_price, category_id, stock) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        connection.execute("INSERT INTO inventory (product_id, quantity) SELECT id, ? FROM products", (self.stock,))
+
+        # Products were inserted in order, so the n-th price belongs to the n-th id
+        first_id = connection.execute("SELECT MIN(id) FROM products").fetchone()[0]
+        return [(first_id + n, price) for n, price in enumerate(prices)]
+
+    def _generate_people(self, connection, rng):
+        connection.executemany(
+            "INSERT INTO customers (name, phone, email) VALUES (?, ?, ?)",
+            [
+                (f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", f"555{n:07d}", f"customer{n}@example.com")
+                for n in range(1, self.customers + 1)
+            ]
+        )
+        # Cashier accounts exist to spread invoices over users; an empty
+        # salt and an invalid hash mean they cannot log in
+        connection.executemany(
+            "INSERT INTO users (username, password, salt, full_name, role) VALUES (?, '!', '', ?, 'cashier')",
+            [(f"cashier{n}", f"Cashier {n}") for n in range(1, self.cashiers + 1)]
+        )
+        return [row[0] for row in connection.execute("SELECT id FROM users ORDER BY id")]
+
+    def _generate_invoices(self, connection, rng, products, cashier_ids, progress):
+        # Shuffled so best sellers are spread over categories and ids
+        ranked = products[:]
+        rng.shuffle(ranked)
+        product_weights = cumulative(zipf_weights(len(ranked), POPULARITY_EXPONENT))
+        customer_ids = [row[0] for row in connection.execute("SELECT id FROM customers ORDER BY id")]
+        rng.shuffle(customer_ids)
+        customer_weights = cumulative(zipf_weights(len(customer_ids), CUSTOMER_EXPONENT))
+        hours = list(HOUR_WEIGHTS)
+        hour_weights = cumulative(HOUR_WEIGHTS.values())
+        quantities = list(QUANTITY_WEIGHTS)
+        quantity_weights = cumulative(QUANTITY_WEIGHTS.values())
+        methods = list(PAYMENT_WEIGHTS)
+        method_weights = cumulative(PAYMENT_WEIGHTS.values())
+        basket_mu = math.log(self.basket_size) - BASKET_SIGMA ** 2 / 2
+
+        start_date = self.end_date - datetime.timedelta(days=self.days - 1)
+        dates = [start_date + datetime.timedelta(days=n) for n in range(self.days)]
+        per_day = allocate(self.invoices, [day_weight(day) for day in dates])
+
+        invoice_id = (connection.execute("SELECT MAX(id) FROM invoices").fetchone()[0] or 0) + 1
+        invoice_rows = []
+        item_rows = []
+        written = 0
+        item_count = 0
+
+        for day, count in zip(dates, per_day):
+            if not count:
+                continue
+            # Local opening hours, stored in UTC like CURRENT_TIMESTAMP
+            times = sorted(
+                datetime.datetime.combine(day, datetime.time(hour, rng.randrange(60), rng.randrange(60)))
+                for hour in rng.choices(hours, cum_weights=hour_weights, k=count)
+            )
+            sizes = [min(MAX_BASKET, max(1, round(rng.lognormvariate(basket_mu, BASKET_SIGMA))))
+                     for _ in range(count)]
+            picks = iter(rng.choices(ranked, cum_weights=product_weights, k=sum(sizes)))
+            picked_quantities = iter(rng.choices(quantities, cum_weights=quantity_weights, k=sum(sizes)))
+            day_number = day.strftime("%Y%m%d")
+
+            for seq, (sold_at, size) in enumerate(zip(times, sizes), 1):
+                created_at = sold_at.astimezone(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+                basket = {}
+                for _ in range(size):
+                    product = next(picks)
+                    basket[product] = basket.get(product, 0) + next(picked_quantities)
+
+                subtotal = 0.0
+                for (product_id, price), quantity in basket.items():
+                    total_price = round(price * quantity, 2)
+                    subtotal += total_price
+                    item_rows.append((invoice_id, product_id, quantity, price, total_price, created_at))
+                item_count += len(basket)
+
+                subtotal = round(subtotal, 2)
+                tax = round(subtotal * DEFAULT_TAX_RATE, 2)
+                customer_id = None
+                if customer_ids and rng.random() < CUSTOMER_SHARE:
+                    customer_id = rng.choices(customer_ids, cum_weights=customer_weights)[0]
+                invoice_rows.append((
+                    invoice_id, f"INV-{day_number}-{seq:04d}", customer_id, subtotal, tax, 0,
+                    round(subtotal + tax, 2), rng.choices(methods, cum_weights=method_weights)[0], 'paid',
+                    rng.choice(cashier_ids), created_at
+                ))
+                invoice_id += 1
+
+            if len(invoice_rows) >= CHUNK_INVOICES:
+                written += self._flush(connection, invoice_rows, item_rows)
+                if progress:
+                    progress(written, self.invoices)
+
+        written += self._flush(connection, invoice_rows, item_rows)
+        if progress:
+            progress(written, self.invoices)
+        return item_count
+
+    def _flush(self, connection, invoice_rows, item_rows):
+        count = len(invoice_rows)
+        if not count:
+            return 0
+        connection.execute("BEGIN")
+        connection.executemany(
+            """
+            INSERT INTO invoices (
+                id, invoice_number, customer_id, total_amount, tax_amount, discount_amount,
+                final_amount, payment_method, payment_status, created_by, created_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            invoice_rows
+        )
+        # Each sale paid in full in its one tender, as the tills record it
+        connection.executemany(
+            """
+            INSERT INTO payments (invoice_id, tender, amount, tendered, created_by, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [(row[0], row[7], row[6], row[6], row[9], row[10]) for row in invoice_rows]
+        )
+        connection.executemany(
+            """
+            INSERT INTO invoice_items (invoice_id, product_id, quantity, unit_price, total_price, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            item_rows
+        )
+        connection.execute("COMMIT")
+        invoice_rows.clear()
+        item_rows.clear()
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic store database")
+    parser.add_argument("path", help="Database to create; must not exist yet")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--customers", type=int, default=20000)
+    parser.add_argument("--invoices", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=365, help="Days of trading history")
+    parser.add_argument("--end", type=datetime.date.fromisoformat, help="Last trading day (YYYY-MM-DD), "
+                                                                      "today by default; pin it for identical output")
+    parser.add_argument("--basket-size", type=int, default=12, help="Average scans per basket")
+    args = parser.parse_args()
+
+    def progress(done, total):
+        print(f"\r{done}/{total} invoices", end="", flush=True)
+
+    generator = SyntheticDataGenerator(
+        args.path, seed=args.seed, products=args.products, customers=args.customers, invoices=args.invoices,
+        days=args.days, end_date=args.end, basket_size=args.basket_size
+    )
+    stats = generator.generate(progress)
+    print(f"\nGenerated {stats['invoices']} invoices with {stats['invoice_items']} items, "
+          f"{stats['products']} products and {stats['customers']} customers in {stats['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
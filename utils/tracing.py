@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import datetime
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+
+from config import TRACE_BUFFER_SIZE, TRACE_DIRECTORY
+
+# Spans cost two clock reads and a list append; set False to skip even that
+enabled = True
+
+_traces = deque(maxlen=TRACE_BUFFER_SIZE)
+_local = threading.local()
+
+
+class Span:
+    """One timed step, with the steps it ran nested as children"""
+
+    __slots__ = ("name", "attributes", "started", "finished", "children", "thread_id", "error")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.started = time.perf_counter()
+        self.finished = None
+        self.children = []
+        self.thread_id = threading.get_ident()
+        self.error = None
+
+    @property
+    def duration(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'attributes': self.attributes,
+            'milliseconds': round(self.duration * 1000, 3),
+            'error': self.error,
+            'children': [child.to_dict() for child in self.children],
+        }
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time the enclosed block as a span
+
+    Spans opened inside it on the same thread become its children; a span
+    opened with none already open starts a new trace, which is kept in the
+    ring buffer once it ends.
+    """
+    if not enabled:
+        yield None
+        return
+
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    current = Span(name, attributes)
+    if stack:
+        stack[-1].children.append(current)
+    stack.append(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.finished = time.perf_counter()
+        stack.pop()
+        if not stack:
+            _traces.append((datetime.datetime.now(), current))
+
+
+def traced(name):
+    """Decorator running a function inside a span of the given name"""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def get_traces(limit=None, slower_than_ms=None):
+    """Get recent traces, newest first, as (ended_at, root span) pairs"""
+    traces = list(reversed(_traces))
+    if slower_than_ms is not None:
+        traces = [(ended_at, root) for ended_at, root in traces if root.duration * 1000 >= slower_than_ms]
+    return traces[:limit] if limit else traces
+
+
+def clear():
+    _traces.clear()
+
+
+def format_trace(root):
+    """Render a trace as an indented tree of spans with their times"""
+    lines = []
+
+    def walk(current, depth):
+        attributes = " ".join(f"{key}={value}" for key, value in current.attributes.items())
+        error = f" !{current.error}" if current.error else ""
+        lines.append(f"{'  ' * depth}{current.name} {current.duration * 1000:.1f} ms {attributes}{error}".rstrip())
+        for child in current.children:
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    return "\n".join(lines)
+
+
+def export_chrome_trace(path=None, traces=None):
+    """Write traces in the Chrome trace event format
+
+    The file opens in chrome://tracing or ui.perfetto.dev, with one row per
+    thread and spans nested by time.
+
+    Args:
+        path (str, optional): File to write, a timestamped file in
+            TRACE_DIRECTORY by default
+        traces (list, optional): (ended_at, root span) pairs, everything in
+            the ring buffer by default
+
+    Returns:
+        str: The path written, or None on error
+    """
+    traces = list(_traces) if traces is None else traces
+    if path is None:
+        path = os.path.join(TRACE_DIRECTORY, f"trace_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
+    events = []
+    pid = os.getpid()
+
+    def walk(current):
+        args = dict(current.attributes)
+        if current.error:
+            args['error'] = current.error
+        events.append({
+            'name': current.name,
+            'cat': current.name.split(".", 1)[0],
+            'ph': 'X',
+            'ts': round(current.started * 1_000_000, 3),
+            'dur': round(current.duration * 1_000_000, 3),
+            'pid': pid,
+            'tid': current.thread_id,
+            'args': args,
+        })
+        for child in current.children:
+            walk(child)
+
+    for _, root in traces:
+        walk(root)
+
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return path
+    except OSError as e:
+        print(f"Error exporting traces: {e}")
+        return None
+
+
+def export_json(path, traces=None):
+    """Write traces as nested JSON, newest first"""
+    traces = get_traces() if traces is None else traces
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([dict(root.to_dict(), ended_at=ended_at.isoformat()) for ended_at, root in traces], f, indent=2)
+        return path
+    except OSError as e:
+        print(f"Error exporting traces: {e}")
+        return None
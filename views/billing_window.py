@@ -3,19 +3,29 @@ from tkinter import ttk, messagebox, simpledialog
 from models.product import Product
 from models.invoice import Invoice
 from models.customer import Customer
+from models.loyalty import Loyalty, points_value
+from models.payment import settle_tenders, SPLIT_PAYMENT_METHOD
 import datetime
-from config import DEFAULT_TAX_RATE, CURRENCY_SYMBOL
-from utils.pdf_generator import generate_receipt
+from config import DEFAULT_TAX_RATE, CURRENCY_SYMBOL, TILL_ID
+from utils.customer_index import get_customer_index
+from utils.cart_store import get_cart_store
+from utils.shift_ledger import get_shift_ledger
+from utils.tracing import span, traced, export_chrome_trace
 
 class BillingWindow:
-    def __init__(self, root, db_manager, user, return_callback):
+    def __init__(self, root, db_manager, user, return_callback, switch_callback=None):
         self.root = root
         self.db_manager = db_manager
         self.user = user
         self.return_callback = return_callback
+        self.switch_callback = switch_callback
         self.product_model = Product(db_manager)
         self.invoice_model = Invoice(db_manager)
         self.customer_model = Customer(db_manager)
+        self.loyalty_model = Loyalty(db_manager)
+        get_customer_index(db_manager).warm_up()
+        # Shift counters are kept current while the till is selling
+        get_shift_ledger(db_manager).start()
         
         # Configure the window
         self.root.title("Supermarket Billing System - New Bill")
@@ -34,10 +44,126 @@ class BillingWindow:
         # Create UI components
         self.create_ui()
         
-        # Initialize cart and customer
-        self.cart_items = []
+        # Initialize cart and customer; the cart is held in the cart store
+        self.cart_store = get_cart_store(db_manager)
+        self.cart = self.cart_store.open(user['id'])
         self.selected_customer = None
         self.discount_amount = 0.0
+        self.points_redeemed = 0
+        self.recover_cart()
+        
+    @property
+    def cart_items(self):
+        return self.cart.items()
+        
+    def recover_cart(self):
+        """Carry on with a bill this till had open when it last stopped"""
+        recovered = self.cart_store.recover()
+        if not recovered:
+            return
+        # The most recent becomes the bill; any others wait to be resumed
+        for session in recovered[:-1]:
+            self.cart_store.suspend(session.session_id)
+        self._load_cart(recovered[-1])
+        messagebox.showinfo("Bill Restored", "The bill that was open when this till stopped has been restored.")
+        
+    def _load_cart(self, cart):
+        self.cart = cart
+        self.selected_customer = self.customer_model.get_customer_by_id(cart.customer_id) if cart.customer_id else None
+        if self.selected_customer:
+            self.customer_name_var.set(f"{self.selected_customer['name']} ({self.selected_customer['phone']})")
+        else:
+            self.customer_name_var.set("Walk-in Customer")
+        self.show_loyalty()
+        
+        # A parked discount or redemption can't exceed the bill or balance as they are now
+        subtotal = sum(item['total_price'] for item in self.cart_items)
+        self.discount_amount = min(cart.state.get('discount', 0.0), subtotal)
+        if self.selected_customer and cart.state.get('points_redeemed'):
+            balance = self.loyalty_model.get_balance(self.selected_customer['id'])
+            self.points_redeemed = min(cart.state['points_redeemed'], balance)
+        self.update_cart_display()
+        
+    def park_bill(self):
+        if not self.cart_items:
+            messagebox.showwarning("Warning", "Cart is empty")
+            return
+            
+        note = simpledialog.askstring("Park Bill", "Note to find the bill by (optional):", parent=self.root)
+        if note is None:
+            return
+            
+        self.cart.set_state(discount=self.discount_amount or None, points_redeemed=self.points_redeemed or None)
+        if not self.cart_store.suspend(self.cart.session_id, note.strip()):
+            messagebox.showerror("Error", "Failed to park the bill")
+            return
+            
+        self._load_cart(self.cart_store.open(self.user['id']))
+        messagebox.showinfo("Bill Parked", "The bill can be resumed on any till.")
+        
+    def resume_bill(self):
+        if self.cart_items:
+            messagebox.showwarning("Warning", "Complete or park the current bill first")
+            return
+            
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Resume Bill")
+        dialog.geometry("520x360")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        # Parked bills of this till, every till or the selected customer
+        filters = {"This till": {'till_id': TILL_ID}, "All tills": {}}
+        if self.selected_customer:
+            filters[f"Customer: {self.selected_customer['name']}"] = {'customer_id': self.selected_customer['id']}
+        filter_var = tk.StringVar(value="This till")
+        filter_combo = ttk.Combobox(dialog, textvariable=filter_var, values=list(filters), state="readonly")
+        filter_combo.pack(fill=tk.X, padx=10, pady=(10, 0))
+        
+        listbox = tk.Listbox(dialog, width=70, height=15)
+        listbox.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+        parked = []
+        
+        def on_filter(event=None):
+            parked[:] = self.cart_store.get_suspended(**filters[filter_var.get()])
+            listbox.delete(0, tk.END)
+            for bill in parked:
+                note = f" - {bill['note']}" if bill['note'] else ""
+                listbox.insert(tk.END, f"{bill['updated_at']} - {bill['till_id']} - {bill['customer_name'] or 'Walk-in'} - "
+                                       f"{bill['item_count']} items, {CURRENCY_SYMBOL}{bill['total']:.2f}{note}")
+                
+        filter_combo.bind("<<ComboboxSelected>>", on_filter)
+        on_filter()
+            
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        def on_resume():
+            selection = listbox.curselection()
+            if not selection:
+                messagebox.showwarning("Warning", "Please select a bill")
+                return
+                
+            cart = self.cart_store.resume(parked[selection[0]]['session_id'], self.user['id'])
+            dialog.destroy()
+            if not cart:
+                messagebox.showerror("Error", "The bill has already been resumed elsewhere")
+                return
+            self._load_cart(cart)
+            
+            # Tell the cashier what changed while the bill was parked
+            changes = [f"{change['product_name']}: {CURRENCY_SYMBOL}{change['old_price']:.2f} -> "
+                       f"{CURRENCY_SYMBOL}{change['new_price']:.2f}" for change in cart.price_changes]
+            for line in cart.unavailable:
+                if line['removed']:
+                    changes.append(f"{line['product_name']}: no longer sold, removed")
+                else:
+                    changes.append(f"{line['product_name']}: only {line['stock']} in stock")
+            if changes:
+                messagebox.showwarning("Bill Changed", "Since the bill was parked:\n" + "\n".join(changes))
+            
+        ttk.Button(button_frame, text="Resume", command=on_resume).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Cancel", command=dialog.destroy).pack(side=tk.RIGHT, padx=5)
         
     def create_ui(self):
         # Create a frame for customer selection
@@ -49,6 +175,10 @@ class BillingWindow:
         ttk.Label(customer_frame, textvariable=self.customer_name_var).grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
         ttk.Button(customer_frame, text="Select Customer", command=self.select_customer).grid(row=0, column=2, padx=5, pady=5)
         ttk.Button(customer_frame, text="New Customer", command=self.add_customer).grid(row=0, column=3, padx=5, pady=5)
+        ttk.Button(customer_frame, text="Redeem Points", command=self.redeem_points).grid(row=0, column=4, padx=5, pady=5)
+        
+        self.loyalty_var = tk.StringVar()
+        ttk.Label(customer_frame, textvariable=self.loyalty_var).grid(row=1, column=1, padx=5, pady=(0, 5), sticky=tk.W)
         
         # Create a frame for product search
         search_frame = ttk.LabelFrame(self.frame, text="Product Search")
@@ -60,6 +190,9 @@ class BillingWindow:
         search_entry.grid(row=0, column=1, padx=5, pady=5)
         search_entry.bind("<Return>", self.search_product)
         
+        # Ctrl+Shift+T saves the recent billing traces for a slow-till report
+        self.root.bind("<Control-T>", self.export_traces)
+        
         ttk.Button(search_frame, text="Search", command=self.search_product).grid(row=0, column=2, padx=5, pady=5)
         
         # Create a frame for the cart
@@ -95,6 +228,8 @@ class BillingWindow:
         ttk.Button(cart_actions_frame, text="Change Quantity", command=self.change_quantity).pack(side=tk.LEFT, padx=5)
         ttk.Button(cart_actions_frame, text="Clear Cart", command=self.clear_cart).pack(side=tk.LEFT, padx=5)
         ttk.Button(cart_actions_frame, text="Apply Discount", command=self.apply_discount).pack(side=tk.LEFT, padx=5)
+        ttk.Button(cart_actions_frame, text="Park Bill", command=self.park_bill).pack(side=tk.LEFT, padx=5)
+        ttk.Button(cart_actions_frame, text="Resume Bill", command=self.resume_bill).pack(side=tk.LEFT, padx=5)
         
         # Create a frame for totals
         totals_frame = ttk.LabelFrame(self.frame, text="Bill Summary")
@@ -128,12 +263,26 @@ class BillingWindow:
         ttk.Label(payment_frame, text="Payment Method:").pack(side=tk.LEFT, padx=5)
         self.payment_method_var = tk.StringVar(value="Cash")
         payment_method_combo = ttk.Combobox(payment_frame, textvariable=self.payment_method_var, width=15)
-        payment_method_combo['values'] = ('Cash', 'Credit Card', 'Debit Card', 'Mobile Payment')
+        payment_method_combo['values'] = ('Cash', 'Credit Card', 'Debit Card', 'Mobile Payment', SPLIT_PAYMENT_METHOD)
         payment_method_combo.pack(side=tk.LEFT, padx=5)
         
         # Buttons
         ttk.Button(payment_frame, text="Complete Sale", command=self.complete_sale).pack(side=tk.RIGHT, padx=5)
         ttk.Button(payment_frame, text="Back to Main Menu", command=self.return_callback).pack(side=tk.RIGHT, padx=5)
+        if self.switch_callback:
+            ttk.Button(payment_frame, text="Switch Cashier", command=self.switch_callback).pack(side=tk.RIGHT, padx=5)
+        
+    def export_traces(self, event=None):
+        path = export_chrome_trace()
+        if path:
+            messagebox.showinfo("Traces Saved", f"Recent billing traces saved to\n{path}\n\n"
+                                                "Open them in chrome://tracing or ui.perfetto.dev")
+        
+    def resume(self, user):
+        """Show the bill again after a cashier switch; the sale is credited to the new cashier"""
+        self.user = user
+        self.root.title("Supermarket Billing System - New Bill")
+        self.frame.pack(fill=tk.BOTH, expand=True)
 
     def search_product(self, event=None):
         search_term = self.search_var.get().strip()
@@ -141,8 +290,11 @@ class BillingWindow:
             messagebox.showwarning("Warning", "Please enter a product name")
             return
         
-        # Search for products
-        products = self.product_model.search_products(search_term)
+        with span("billing_window.search") as search:
+            # Search for products
+            products = self.product_model.search_products(search_term)
+            if search:
+                search.attributes['results'] = len(products)
     
         if not products:  # Check if products list is empty
             messagebox.showinfo("Info", "No products found")
@@ -246,31 +398,16 @@ class BillingWindow:
         dialog.wait_window()
         return selected_product
         
+    @traced("billing_window.add_to_cart")
     def add_to_cart(self, product, quantity):
-        # Check if product already in cart
-        for i, item in enumerate(self.cart_items):
-            if item['product_id'] == product['id']:
-                # Update quantity
-                new_quantity = item['quantity'] + quantity
-                if new_quantity > product['stock']:
-                    messagebox.showwarning("Warning", "Cannot add more than available stock")
-                    return
-                    
-                self.cart_items[i]['quantity'] = new_quantity
-                self.cart_items[i]['total_price'] = new_quantity * product['price']
-                self.update_cart_display()
-                return
-                
-        # Add new item to cart
-        cart_item = {
-            'product_id': product['id'],
-            'product_name': product['name'],
-            'unit_price': product['price'],
-            'quantity': quantity,
-            'total_price': quantity * product['price']
-        }
-        
-        self.cart_items.append(cart_item)
+        # Check stock against what is already in the cart
+        in_cart = self.cart.quantity(product['id'])
+        if in_cart and in_cart + quantity > product['stock']:
+            messagebox.showwarning("Warning", "Cannot add more than available stock")
+            return
+            
+        # Merges with the product's line if it is already in the cart
+        self.cart.add(product, quantity)
         self.update_cart_display()
         
     def update_cart_display(self):
@@ -294,11 +431,12 @@ class BillingWindow:
     def update_totals(self):
         subtotal = sum(item['total_price'] for item in self.cart_items)
         tax = subtotal * DEFAULT_TAX_RATE
-        total = subtotal + tax - self.discount_amount
+        discount = self.discount_amount + points_value(self.points_redeemed)
+        total = subtotal + tax - discount
         
         self.subtotal_var.set(f"{CURRENCY_SYMBOL}{subtotal:.2f}")
         self.tax_var.set(f"{CURRENCY_SYMBOL}{tax:.2f}")
-        self.discount_var.set(f"{CURRENCY_SYMBOL}{self.discount_amount:.2f}")
+        self.discount_var.set(f"{CURRENCY_SYMBOL}{discount:.2f}")
         self.total_var.set(f"{CURRENCY_SYMBOL}{total:.2f}")
         
     def remove_item(self):
@@ -311,7 +449,7 @@ class BillingWindow:
         item_id = self.cart_tree.item(selected[0])['values'][0]
         
         # Remove from cart
-        self.cart_items = [item for item in self.cart_items if item['product_id'] != item_id]
+        self.cart.remove(item_id)
         
         # Update display
         self.update_cart_display()
@@ -326,7 +464,7 @@ class BillingWindow:
         item_id = self.cart_tree.item(selected[0])['values'][0]
         
         # Find the item in cart
-        for i, item in enumerate(self.cart_items):
+        for item in self.cart_items:
             if item['product_id'] == item_id:
                 # Get product to check stock
                 product = self.product_model.get_product_by_id(item_id)
@@ -342,15 +480,15 @@ class BillingWindow:
                     return
                     
                 # Update quantity
-                self.cart_items[i]['quantity'] = new_quantity
-                self.cart_items[i]['total_price'] = new_quantity * item['unit_price']
+                self.cart.set_quantity(item_id, new_quantity)
                 self.update_cart_display()
                 return
                 
     def clear_cart(self):
         if messagebox.askyesno("Confirm", "Are you sure you want to clear the cart?"):
-            self.cart_items = []
+            self.cart.clear()
             self.discount_amount = 0.0
+            self.points_redeemed = 0
             self.update_cart_display()
             
     def apply_discount(self):
@@ -373,23 +511,69 @@ class BillingWindow:
         self.discount_amount = discount
         self.update_totals()
         
-    def select_customer(self):
-        # This would open a customer selection dialog
-        # For simplicity
-        customers = self.customer_model.get_all_customers()
+    def show_loyalty(self):
+        # A new customer starts with no redemption on the bill
+        self.points_redeemed = 0
+        self.update_totals()
+        
+        if not self.selected_customer:
+            self.loyalty_var.set("")
+            return
+            
+        customer_id = self.selected_customer['id']
+        balance = self.loyalty_model.get_balance(customer_id)
+        tier = self.loyalty_model.get_tier(customer_id)
+        self.loyalty_var.set(f"{tier} member - {balance} points ({CURRENCY_SYMBOL}{points_value(balance):.2f})")
+        
+    def redeem_points(self):
+        if not self.selected_customer:
+            messagebox.showwarning("Warning", "Please select a customer first")
+            return
+            
+        if not self.cart_items:
+            messagebox.showwarning("Warning", "Cart is empty")
+            return
+            
+        balance = self.loyalty_model.get_balance(self.selected_customer['id'])
+        subtotal = sum(item['total_price'] for item in self.cart_items)
+        payable = subtotal + subtotal * DEFAULT_TAX_RATE - self.discount_amount
         
-        if not customers:
-            messagebox.showinfo("Info", "No customers found")
+        # Points can cover the bill but not go beyond it
+        max_points = min(balance, int(payable / points_value(1))) if points_value(1) else 0
+        if max_points <= 0:
+            messagebox.showinfo("Info", "No points available to redeem")
             return
             
-        # Create a simple dialog to select customer
+        points = simpledialog.askinteger(
+            "Redeem Points",
+            f"Enter points to redeem (0-{max_points}):",
+            minvalue=0,
+            maxvalue=max_points
+        )
+        if points is None:
+            return
+            
+        self.points_redeemed = points
+        self.update_totals()
+        
+    def select_customer(self):
+        # Create a dialog to search for a customer by phone or name
         dialog = tk.Toplevel(self.root)
         dialog.title("Select Customer")
-        dialog.geometry("400x300")
+        dialog.geometry("400x340")
         dialog.transient(self.root)
         dialog.grab_set()
         
-        # Create a listbox with customers
+        # Search box
+        search_frame = ttk.Frame(dialog)
+        search_frame.pack(fill=tk.X, padx=10, pady=(10, 0))
+        ttk.Label(search_frame, text="Phone or Name:").pack(side=tk.LEFT)
+        query_var = tk.StringVar()
+        query_entry = ttk.Entry(search_frame, textvariable=query_var)
+        query_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        query_entry.focus_set()
+        
+        # Create a listbox with matching customers
         listbox = tk.Listbox(dialog, width=50, height=15)
         listbox.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
         
@@ -398,9 +582,13 @@ class BillingWindow:
         listbox.configure(yscrollcommand=scrollbar.set)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        # Populate listbox
-        for customer in customers:
-            listbox.insert(tk.END, f"{customer['id']} - {customer['name']} ({customer['phone']})")
+        # Populate listbox as the cashier types
+        def on_search(event=None):
+            listbox.delete(0, tk.END)
+            for customer in self.customer_model.search_customers(query_var.get()):
+                listbox.insert(tk.END, f"{customer['id']} - {customer['name']} ({customer['phone']})")
+                
+        query_entry.bind("<KeyRelease>", on_search)
             
         # Add buttons
         button_frame = ttk.Frame(dialog)
@@ -418,7 +606,9 @@ class BillingWindow:
             
             if customer:
                 self.selected_customer = customer
+                self.cart.set_customer(customer['id'])
                 self.customer_name_var.set(f"{customer['name']} ({customer['phone']})")
+                self.show_loyalty()
                 dialog.destroy()
                 
         def on_cancel():
@@ -481,7 +671,9 @@ class BillingWindow:
                 customer = self.customer_model.get_customer_by_phone(phone)
                 if customer:
                     self.selected_customer = customer
+                    self.cart.set_customer(customer['id'])
                     self.customer_name_var.set(f"{customer['name']} ({customer['phone']})")
+                    self.show_loyalty()
                     messagebox.showinfo("Success", "Customer added successfully")
                     dialog.destroy()
             else:
@@ -493,6 +685,98 @@ class BillingWindow:
         ttk.Button(button_frame, text="Save", command=on_save).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Cancel", command=on_cancel).pack(side=tk.LEFT, padx=5)
         
+    def _ask_card_last4(self, tender):
+        # The card's last four digits let the sale be found again for a return
+        digits = simpledialog.askstring(tender, "Last four digits of the card (optional):", parent=self.root)
+        digits = (digits or "").strip()
+        return digits if len(digits) == 4 and digits.isdigit() else None
+        
+    def collect_tenders(self, total, payment_method):
+        """Ask for what the customer hands over; None if the cashier cancels"""
+        if payment_method == SPLIT_PAYMENT_METHOD:
+            return self.split_payment(total)
+        if payment_method == "Cash":
+            tendered = simpledialog.askfloat(
+                "Cash",
+                f"Amount tendered (due {CURRENCY_SYMBOL}{total:.2f}):",
+                parent=self.root,
+                initialvalue=round(total, 2),
+                minvalue=round(total, 2)
+            )
+            if tendered is None:
+                return None
+            return [{'tender': "Cash", 'tendered': tendered}]
+        tender = {'tender': payment_method}
+        if "Card" in payment_method:
+            tender['card_last4'] = self._ask_card_last4(payment_method)
+        return [tender]
+        
+    def split_payment(self, total):
+        # Amounts per tender; cash may be over what is left and gets change
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Split Payment")
+        dialog.geometry("380x260")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        ttk.Label(dialog, text=f"Total due: {CURRENCY_SYMBOL}{total:.2f}", font=("Arial", 12, "bold")).pack(pady=10)
+        
+        form = ttk.Frame(dialog)
+        form.pack(padx=10, fill=tk.X)
+        amount_vars = {}
+        for row, tender in enumerate(('Credit Card', 'Debit Card', 'Mobile Payment', 'Cash')):
+            ttk.Label(form, text=f"{tender}:").grid(row=row, column=0, sticky=tk.W, pady=3)
+            amount_vars[tender] = tk.StringVar()
+            ttk.Entry(form, textvariable=amount_vars[tender], width=15).grid(row=row, column=1, pady=3)
+            
+        status_var = tk.StringVar()
+        ttk.Label(dialog, textvariable=status_var).pack(pady=5)
+        result = []
+        
+        def read_tenders():
+            tenders = []
+            for tender, amount_var in amount_vars.items():
+                text = amount_var.get().strip()
+                if text:
+                    tenders.append({'tender': tender, 'tendered': float(text)})
+            return tenders
+            
+        def on_change(*args):
+            try:
+                paid = sum(tender['tendered'] for tender in read_tenders())
+            except ValueError:
+                status_var.set("Enter amounts as numbers")
+                return
+            if paid < round(total, 2):
+                status_var.set(f"Remaining: {CURRENCY_SYMBOL}{total - paid:.2f}")
+            else:
+                status_var.set(f"Change: {CURRENCY_SYMBOL}{paid - total:.2f}")
+                
+        for amount_var in amount_vars.values():
+            amount_var.trace_add("write", on_change)
+        on_change()
+        
+        def on_ok():
+            try:
+                tenders = read_tenders()
+                settle_tenders(total, tenders)
+            except ValueError as e:
+                messagebox.showwarning("Warning", str(e), parent=dialog)
+                return
+            result.extend(tenders)
+            dialog.destroy()
+            
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(fill=tk.X, padx=10, pady=10)
+        ttk.Button(button_frame, text="OK", command=on_ok).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Cancel", command=dialog.destroy).pack(side=tk.RIGHT, padx=5)
+        
+        dialog.wait_window()
+        for tender in result:
+            if "Card" in tender['tender']:
+                tender['card_last4'] = self._ask_card_last4(tender['tender'])
+        return result or None
+        
     def complete_sale(self):
         if not self.cart_items:
             messagebox.showwarning("Warning", "Cart is empty")
@@ -501,7 +785,8 @@ class BillingWindow:
         # Calculate totals
         subtotal = sum(item['total_price'] for item in self.cart_items)
         tax = subtotal * DEFAULT_TAX_RATE
-        total = subtotal + tax - self.discount_amount
+        discount = self.discount_amount + points_value(self.points_redeemed)
+        total = subtotal + tax - discount
         
         # Get payment method
         payment_method = self.payment_method_var.get()
@@ -510,34 +795,73 @@ class BillingWindow:
         if not messagebox.askyesno("Confirm Sale", f"Complete sale for {CURRENCY_SYMBOL}{total:.2f}?"):
             return
             
+        tenders = self.collect_tenders(total, payment_method)
+        if not tenders:
+            return
+        try:
+            payments = settle_tenders(total, tenders)
+        except ValueError as e:
+            messagebox.showwarning("Warning", str(e))
+            return
+        change = sum(payment['change_given'] for payment in payments)
+            
         # Create invoice
         customer_id = self.selected_customer['id'] if self.selected_customer else None
         
-        success, invoice_id, invoice_number = self.invoice_model.create_invoice(
-            customer_id=customer_id,
-            items=self.cart_items,
-            total_amount=subtotal,
-            tax_amount=tax,
-            discount_amount=self.discount_amount,
-            final_amount=total,
-            payment_method=payment_method,
-            payment_status="Paid",
-            created_by=self.user['id']
-        )
+        with span("billing_window.complete_sale", items=len(self.cart_items), payment_method=payment_method):
+            # Snapshots leave the basket alone; its rows go with the sale
+            session = self.cart_store.detach(self.cart.session_id)
+            try:
+                success, invoice_id, invoice_number = self.invoice_model.create_invoice(
+                    customer_id=customer_id,
+                    items=self.cart_items,
+                    total_amount=subtotal,
+                    tax_amount=tax,
+                    discount_amount=discount,
+                    final_amount=total,
+                    payment_method=payment_method,
+                    payment_status="Paid",
+                    created_by=self.user['id'],
+                    points_redeemed=self.points_redeemed if self.selected_customer else 0,
+                    tenders=tenders,
+                    till_id=TILL_ID,
+                    cart_session_id=self.cart.session_id
+                )
+            except ValueError as e:
+                self.cart_store.reattach(session)
+                messagebox.showwarning("Warning", str(e))
+                return
         
         if success:
-            messagebox.showinfo("Success", f"Sale completed successfully!\nInvoice: {invoice_number}")
+            if invoice_id is None:
+                # Queued in the offline journal; the receipt can be printed once it has synced
+                messagebox.showwarning(
+                    "Saved Offline",
+                    f"The store database is unavailable. The sale was saved on this till as "
+                    f"{invoice_number} and will be sent automatically when the database is back. "
+                    f"Its receipt can be reprinted from Reports > Offline Sales once it has synced."
+                )
+            else:
+                messagebox.showinfo("Success", f"Sale completed successfully!\nInvoice: {invoice_number}")
+            if change:
+                messagebox.showinfo("Change", f"Change due: {CURRENCY_SYMBOL}{change:.2f}")
             
             # Ask if user wants to print receipt
-            if messagebox.askyesno("Print Receipt", "Do you want to print the receipt?"):
-                # Generate receipt PDF
-                generate_receipt(self.db_manager, invoice_id)
+            if invoice_id is not None and messagebox.askyesno("Print Receipt", "Do you want to print the receipt?"):
+                # Generate receipt PDF; ReportLab is only loaded once a receipt is printed
+                with span("billing_window.print_receipt"):
+                    from utils.pdf_generator import generate_receipt
+                    generate_receipt(self.db_manager, invoice_id)
                 
             # Clear cart and reset
-            self.cart_items = []
+            self.cart.clear()
+            self.cart.set_customer(None)
             self.discount_amount = 0.0
+            self.points_redeemed = 0
             self.selected_customer = None
             self.customer_name_var.set("Walk-in Customer")
+            self.loyalty_var.set("")
             self.update_cart_display()
         else:
+            self.cart_store.reattach(session)
             messagebox.showerror("Error", "Failed to complete sale")
\ No newline at end of file
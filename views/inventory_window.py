@@ -1,8 +1,10 @@
 from tkinter import *
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import tkinter as tk
+from datetime import datetime, timedelta
 from models.product import Product
 from models.category import Category
+from models.price_list import PriceList
 
 class InventoryWindow:
     def __init__(self, root, db_manager, user=None, callback=None):
@@ -12,6 +14,7 @@ class InventoryWindow:
         self.callback = callback
         self.product_model = Product(db_manager)
         self.category_model = Category(db_manager)
+        self.price_list = PriceList(db_manager)
 
         self.window = Toplevel(root)
         self.window.title("Inventory Management")
@@ -56,6 +59,8 @@ class InventoryWindow:
         Entry(search_frame, textvariable=self.search_var, width=30).pack(side=LEFT, padx=5)
         Button(search_frame, text="Search", command=self.search_products).pack(side=LEFT, padx=5)
         Button(search_frame, text="Clear", command=self.clear_search).pack(side=LEFT, padx=5)
+        Button(search_frame, text="Export Catalog", command=self.export_catalog).pack(side=RIGHT, padx=5)
+        Button(search_frame, text="Import Catalog", command=self.import_catalog).pack(side=RIGHT, padx=5)
 
         list_frame = Frame(left_frame)
         list_frame.pack(fill=BOTH, expand=True, padx=10, pady=10)
@@ -87,6 +92,11 @@ class InventoryWindow:
         Button(button_frame, text="Save", command=self.save_product).pack(side=LEFT, padx=5)
         Button(button_frame, text="Delete", command=self.delete_product).pack(side=LEFT, padx=5)
 
+        price_frame = Frame(right_frame)
+        price_frame.pack(pady=5)
+        Button(price_frame, text="Schedule Price Change", command=self.schedule_price_change).pack(side=LEFT, padx=5)
+        Button(price_frame, text="Price History", command=self.show_price_history).pack(side=LEFT, padx=5)
+
         if self.user:
             stock_frame = Frame(right_frame)
             stock_frame.pack(pady=10)
@@ -338,4 +348,104 @@ class InventoryWindow:
         except ValueError:
             messagebox.showerror("Error", "Current stock value is not a valid number.")
         except Exception as e:
-            messagebox.showerror("Unexpected Error", f"Error adjusting stock: {str(e)}")
\ No newline at end of file
+            messagebox.showerror("Unexpected Error", f"Error adjusting stock: {str(e)}")
+
+    def schedule_price_change(self):
+        if not self.product_id:
+            messagebox.showerror("Error", "No product selected.")
+            return
+
+        price = simpledialog.askfloat("Schedule Price Change", "New price:", minvalue=0, parent=self.window)
+        if price is None:
+            return
+        effective_from = simpledialog.askstring(
+            "Schedule Price Change",
+            "Effective from (YYYY-MM-DD or YYYY-MM-DD HH:MM):",
+            initialvalue=(datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d"),
+            parent=self.window
+        )
+        if not effective_from:
+            return
+        try:
+            datetime.fromisoformat(effective_from.strip())
+        except ValueError:
+            messagebox.showerror("Error", "Invalid date.")
+            return
+
+        this_store_only = messagebox.askyesno(
+            "Schedule Price Change", "Apply to this store only?\n\nChoose No to change the price in every store.",
+            parent=self.window
+        )
+        entry_id = self.price_list.schedule_price_change(
+            self.product_id,
+            price,
+            effective_from,
+            store_id=self.price_list.store_id if this_store_only else None,
+            user_id=self.user["id"] if self.user else None
+        )
+        if entry_id:
+            messagebox.showinfo("Success", "Price change scheduled.", parent=self.window)
+            self.load_products()
+        else:
+            messagebox.showerror("Error", "Failed to schedule price change.")
+
+    def show_price_history(self):
+        if not self.product_id:
+            messagebox.showerror("Error", "No product selected.")
+            return
+
+        entries = self.price_list.get_price_history(self.product_id, limit=20)
+        if not entries:
+            messagebox.showinfo("Price History", "No price changes recorded.", parent=self.window)
+            return
+
+        lines = []
+        for entry in entries:
+            scope = "this store" if entry["store_id"] is not None else "all stores"
+            lines.append(f"{entry['effective_from']} UTC  ${entry['price']:.2f}  ({scope})")
+        messagebox.showinfo("Price History", "\n".join(lines), parent=self.window)
+
+    def import_catalog(self):
+        from utils.catalog import CatalogImporter, format_report
+
+        file_path = filedialog.askopenfilename(
+            parent=self.window,
+            filetypes=[("Catalog files", "*.csv *.jsonl"), ("All files", "*.*")],
+            title="Import Catalog"
+        )
+        if not file_path:
+            return
+
+        try:
+            importer = CatalogImporter(self.db_manager)
+
+            # Validate the whole file first so nothing is half-imported by surprise
+            report = importer.import_file(file_path, dry_run=True)
+            if not messagebox.askyesno("Import Catalog", format_report(report) + "\n\nImport now?",
+                                       parent=self.window):
+                return
+
+            report = importer.import_file(file_path)
+            messagebox.showinfo("Import Catalog", format_report(report), parent=self.window)
+            self.load_categories()
+            self.load_products()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to import catalog: {str(e)}")
+
+    def export_catalog(self):
+        from utils.catalog import export_catalog
+
+        file_path = filedialog.asksaveasfilename(
+            parent=self.window,
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("JSON Lines files", "*.jsonl")],
+            title="Export Catalog"
+        )
+        if not file_path:
+            return
+
+        count = export_catalog(self.db_manager, file_path)
+        if count is None:
+            messagebox.showerror("Error", "Failed to export catalog.")
+        else:
+            messagebox.showinfo("Export Catalog", f"Exported {count} products to {file_path}", parent=self.window)
@@ -2,7 +2,7 @@ import tkinter as tk
 from tkinter import ttk
 
 class MainMenu:
-    def __init__(self, root, user, billing_callback, inventory_callback, reports_callback, settings_callback, logout_callback):
+    def __init__(self, root, user, billing_callback, inventory_callback, reports_callback, settings_callback, logout_callback, switch_callback=None, returns_callback=None):
         self.root = root
         self.user = user
         self.billing_callback = billing_callback
@@ -10,6 +10,8 @@ class MainMenu:
         self.reports_callback = reports_callback
         self.settings_callback = settings_callback
         self.logout_callback = logout_callback
+        self.switch_callback = switch_callback
+        self.returns_callback = returns_callback
         
         # Configure the window
         self.root.title("Supermarket Billing System - Main Menu")
@@ -41,6 +43,13 @@ class MainMenu:
             text=f"Logged in as: {self.user['full_name']} ({self.user['role']})"
         ).pack(side=tk.LEFT, padx=(0, 10))
         
+        if self.switch_callback:
+            ttk.Button(
+                user_frame, 
+                text="Switch Cashier", 
+                command=self.switch_callback
+            ).pack(side=tk.LEFT, padx=(0, 5))
+        
         ttk.Button(
             user_frame, 
             text="Logout", 
@@ -87,6 +96,16 @@ class MainMenu:
         )
         settings_btn.grid(row=1, column=1, padx=10, pady=10)
         
+        # Returns button
+        if self.returns_callback:
+            returns_btn = ttk.Button(
+                menu_frame, 
+                text="Returns", 
+                command=self.returns_callback,
+                width=20
+            )
+            returns_btn.grid(row=2, column=0, padx=10, pady=10)
+        
         # Disable settings for non-admin users
         if self.user['role'] != 'admin':
             settings_btn.state(['disabled'])
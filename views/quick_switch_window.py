@@ -0,0 +1,86 @@
+import tkinter as tk
+from tkinter import ttk, messagebox
+from utils.quick_switch import get_quick_switch
+
+class QuickSwitchWindow:
+    def __init__(self, root, db_manager, switch_callback, full_login_callback):
+        self.root = root
+        self.db_manager = db_manager
+        self.switch_callback = switch_callback
+        self.full_login_callback = full_login_callback
+        self.quick_switch = get_quick_switch(db_manager)
+
+        # Configure the window
+        self.root.title("Supermarket Billing System - Switch Cashier")
+
+        # Create main frame
+        self.frame = ttk.Frame(root, padding="20")
+        self.frame.pack(fill=tk.BOTH, expand=True)
+
+        # Create UI components
+        self.create_ui()
+
+    def create_ui(self):
+        # Center the unlock form
+        main_frame = ttk.Frame(self.frame)
+        main_frame.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
+
+        # Title
+        ttk.Label(
+            main_frame,
+            text="Till Locked",
+            font=("Arial", 16, "bold")
+        ).grid(row=0, column=0, columnspan=2, pady=(0, 20))
+
+        self.profiles = self.quick_switch.get_profiles()
+
+        # Cashier
+        ttk.Label(main_frame, text="Cashier:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        self.cashier_var = tk.StringVar()
+        self.cashier_combo = ttk.Combobox(main_frame, textvariable=self.cashier_var, state="readonly", width=28)
+        self.cashier_combo["values"] = [profile['full_name'] for profile in self.profiles]
+        self.cashier_combo.grid(row=1, column=1, pady=5)
+
+        # PIN
+        ttk.Label(main_frame, text="PIN:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        self.pin_var = tk.StringVar()
+        pin_entry = ttk.Entry(main_frame, textvariable=self.pin_var, show="*", width=30)
+        pin_entry.grid(row=2, column=1, pady=5)
+        pin_entry.bind("<Return>", self.unlock)
+
+        if self.profiles:
+            self.cashier_combo.current(0)
+            pin_entry.focus_set()
+        else:
+            ttk.Label(
+                main_frame,
+                text="No cashier has a PIN yet. Set one under Settings.",
+                font=("Arial", 8)
+            ).grid(row=3, column=0, columnspan=2, pady=5)
+
+        # Buttons
+        ttk.Button(main_frame, text="Unlock", command=self.unlock).grid(row=4, column=0, columnspan=2, pady=(20, 5))
+        ttk.Button(main_frame, text="Login with Password", command=self.full_login_callback).grid(row=5, column=0, columnspan=2, pady=5)
+
+    def unlock(self, event=None):
+        index = self.cashier_combo.current()
+        pin = self.pin_var.get().strip()
+
+        if index < 0 or not pin:
+            messagebox.showerror("Error", "Please select a cashier and enter the PIN")
+            return
+
+        profile = self.profiles[index]
+        locked_for = self.quick_switch.locked_for(profile['id'])
+        if locked_for:
+            messagebox.showerror("Error", f"Too many wrong PINs. Try again in {int(locked_for) + 1} seconds "
+                                          "or login with the password.")
+            return
+
+        user = self.quick_switch.unlock(profile['id'], pin)
+        self.pin_var.set("")
+
+        if user:
+            self.switch_callback(user)
+        else:
+            messagebox.showerror("Error", "Invalid PIN")
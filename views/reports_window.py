@@ -1,9 +1,14 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import datetime
+import json
 from models.product import Product
 from models.invoice import Invoice
-from utils.pdf_generator import generate_sales_report
+from controllers.report_controller import ReportController
+from models.user import User
+from utils.sales_metrics import get_sales_metrics
+from utils.offline_journal import get_offline_journal
+from config import TILL_ID
 import os
 
 class ReportsWindow:
@@ -14,6 +19,9 @@ class ReportsWindow:
         self.return_callback = return_callback
         self.product_model = Product(db_manager)
         self.invoice_model = Invoice(db_manager)
+        self.report_controller = ReportController(db_manager)
+        self.sales_metrics = get_sales_metrics(db_manager)
+        self.cashier_names = {}
         
         # Configure the window
         self.root.title("Supermarket Billing System - Reports")
@@ -36,13 +44,22 @@ class ReportsWindow:
         # Create tabs
         self.sales_frame = ttk.Frame(self.notebook, padding="10")
         self.inventory_frame = ttk.Frame(self.notebook, padding="10")
+        self.dashboard_frame = ttk.Frame(self.notebook, padding="10")
+        self.cash_up_frame = ttk.Frame(self.notebook, padding="10")
+        self.offline_frame = ttk.Frame(self.notebook, padding="10")
         
         self.notebook.add(self.sales_frame, text="Sales Reports")
         self.notebook.add(self.inventory_frame, text="Inventory Reports")
+        self.notebook.add(self.dashboard_frame, text="Today's Dashboard")
+        self.notebook.add(self.cash_up_frame, text="Cash-up")
+        self.notebook.add(self.offline_frame, text="Offline Sales")
         
         # Create UI components
         self.create_sales_report_ui()
         self.create_inventory_report_ui()
+        self.create_dashboard_ui()
+        self.create_cash_up_ui()
+        self.create_offline_ui()
         
         # Back button
         ttk.Button(self.frame, text="Back to Main Menu", command=self.return_callback).pack(side=tk.RIGHT, pady=10)
@@ -203,6 +220,362 @@ class ReportsWindow:
         # Load inventory data
         self.load_inventory()
         
+    def create_dashboard_ui(self):
+        # Headline figures
+        totals_frame = ttk.LabelFrame(self.dashboard_frame, text="Today So Far")
+        totals_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        self.dashboard_vars = {}
+        headlines = (
+            ("revenue", "Revenue:", "$0.00"),
+            ("invoice_count", "Invoices:", "0"),
+            ("average_basket", "Average Basket:", "$0.00"),
+            ("item_count", "Items Sold:", "0")
+        )
+        for column, (key, label, default) in enumerate(headlines):
+            ttk.Label(totals_frame, text=label).grid(row=0, column=column * 2, padx=5, pady=5, sticky=tk.W)
+            self.dashboard_vars[key] = tk.StringVar(value=default)
+            ttk.Label(
+                totals_frame, 
+                textvariable=self.dashboard_vars[key], 
+                font=("Arial", 10, "bold")
+            ).grid(row=0, column=column * 2 + 1, padx=5, pady=5, sticky=tk.W)
+            
+        # Breakdown tables
+        tables_frame = ttk.Frame(self.dashboard_frame)
+        tables_frame.pack(fill=tk.BOTH, expand=True)
+        
+        self.hourly_tree = self._create_dashboard_table(tables_frame, "By Hour (UTC)", ("Hour", "Invoices", "Revenue"))
+        self.cashier_tree = self._create_dashboard_table(tables_frame, "By Cashier", ("Cashier", "Invoices", "Revenue"))
+        self.payment_tree = self._create_dashboard_table(tables_frame, "By Payment Method", ("Method", "Invoices", "Revenue"))
+        
+        # Refresh button
+        ttk.Button(self.dashboard_frame, text="Refresh", command=self.refresh_dashboard).pack(side=tk.RIGHT, pady=5)
+        
+        self._dashboard_tick()
+        
+    def _dashboard_tick(self):
+        # The window may have been closed since the refresh was scheduled
+        if not self.frame.winfo_exists():
+            return
+            
+        self.refresh_dashboard()
+        
+        # Keep the dashboard live while the window is open
+        self.frame.after(5000, self._dashboard_tick)
+        
+    def _create_dashboard_table(self, parent, title, columns):
+        frame = ttk.LabelFrame(parent, text=title)
+        frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
+        
+        tree = ttk.Treeview(frame, columns=columns, show="headings", height=10)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=90)
+            
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscroll=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True)
+        return tree
+        
+    def _cashier_name(self, cashier_id):
+        if cashier_id not in self.cashier_names:
+            self.cashier_names = {str(user['id']): user['full_name'] for user in User(self.db_manager).get_all_users()}
+        return self.cashier_names.get(cashier_id, f"User {cashier_id}")
+        
+    def refresh_dashboard(self):
+        try:
+            self.sales_metrics.refresh()
+        except Exception as e:
+            print(f"Error refreshing sales metrics: {e}")
+            
+        metrics = self.sales_metrics.get_snapshot()
+        
+        self.dashboard_vars["revenue"].set(f"${metrics['revenue']:.2f}")
+        self.dashboard_vars["invoice_count"].set(str(metrics['invoice_count']))
+        self.dashboard_vars["average_basket"].set(f"${metrics['average_basket']:.2f}")
+        self.dashboard_vars["item_count"].set(str(metrics['item_count']))
+        
+        hourly_rows = [
+            (f"{hour:02d}:00", bucket['invoices'], f"${bucket['revenue']:.2f}")
+            for hour, bucket in enumerate(metrics['hourly']) if bucket['invoices']
+        ]
+        cashier_rows = [
+            (self._cashier_name(cashier_id), counts['invoices'], f"${counts['revenue']:.2f}")
+            for cashier_id, counts in metrics['cashiers'].items()
+        ]
+        payment_rows = [
+            (method, counts['invoices'], f"${counts['revenue']:.2f}")
+            for method, counts in metrics['payment_methods'].items()
+        ]
+        
+        for tree, rows in ((self.hourly_tree, hourly_rows), (self.cashier_tree, cashier_rows), (self.payment_tree, payment_rows)):
+            for item in tree.get_children():
+                tree.delete(item)
+            for row in rows:
+                tree.insert("", tk.END, values=row)
+                
+    def create_cash_up_ui(self):
+        # Day and till to cash up
+        select_frame = ttk.LabelFrame(self.cash_up_frame, text="Select Day")
+        select_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        ttk.Label(select_frame, text="Date (YYYY-MM-DD):").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
+        self.cash_up_date_var = tk.StringVar(value=datetime.date.today().isoformat())
+        ttk.Entry(select_frame, textvariable=self.cash_up_date_var, width=12).grid(row=0, column=1, padx=5, pady=5)
+        
+        ttk.Label(select_frame, text="Till (blank for all):").grid(row=0, column=2, padx=5, pady=5, sticky=tk.W)
+        self.cash_up_till_var = tk.StringVar()
+        ttk.Entry(select_frame, textvariable=self.cash_up_till_var, width=20).grid(row=0, column=3, padx=5, pady=5)
+        
+        ttk.Button(select_frame, text="Load", command=self.load_cash_up).grid(row=0, column=4, padx=10, pady=5)
+        ttk.Button(select_frame, text="Reconcile", command=self.reconcile_cash_up).grid(row=0, column=5, padx=5, pady=5)
+        
+        # Shift and day close for the till given, this one by default
+        close_frame = ttk.Frame(self.cash_up_frame)
+        close_frame.pack(fill=tk.X, pady=(0, 10))
+        ttk.Button(close_frame, text="X Report", command=self.show_x_report).pack(side=tk.LEFT, padx=5)
+        ttk.Button(close_frame, text="Close Shift (Z Report)", command=self.close_shift).pack(side=tk.LEFT, padx=5)
+        close_day_btn = ttk.Button(close_frame, text="Close Day", command=self.close_day)
+        close_day_btn.pack(side=tk.LEFT, padx=5)
+        if self.user['role'] != 'admin':
+            close_day_btn.configure(state=tk.DISABLED)
+        
+        # Takings by till, cashier and tender
+        columns = ("Till", "Cashier", "Tender", "Payments", "Taken", "Refunded", "Change", "Net")
+        self.cash_up_tree = ttk.Treeview(self.cash_up_frame, columns=columns, show="headings")
+        for col in columns:
+            self.cash_up_tree.heading(col, text=col)
+            self.cash_up_tree.column(col, width=90 if col not in ("Till", "Cashier") else 140)
+        self.cash_up_tree.pack(fill=tk.BOTH, expand=True)
+        
+    def _cash_up_selection(self):
+        day = self.cash_up_date_var.get().strip()
+        try:
+            datetime.date.fromisoformat(day)
+        except ValueError:
+            messagebox.showerror("Error", "Enter the date as YYYY-MM-DD")
+            return None, None
+        return day, self.cash_up_till_var.get().strip() or None
+        
+    def load_cash_up(self):
+        day, till_id = self._cash_up_selection()
+        if not day:
+            return
+        for item in self.cash_up_tree.get_children():
+            self.cash_up_tree.delete(item)
+        for row in self.report_controller.get_cash_up(day, till_id=till_id):
+            self.cash_up_tree.insert("", tk.END, values=(
+                row['till_id'] or "-",
+                row['cashier'] or row['created_by'],
+                row['tender'],
+                row['payment_count'],
+                f"${row['taken']:.2f}",
+                f"${row['refunded']:.2f}",
+                f"${row['change_given']:.2f}",
+                f"${row['net']:.2f}"
+            ))
+            
+    def reconcile_cash_up(self):
+        day, till_id = self._cash_up_selection()
+        if not day:
+            return
+        totals = self.report_controller.payment_model.get_tender_totals(day, till_id=till_id)
+        if not totals:
+            messagebox.showinfo("Cash-up", "No payments on that day")
+            return
+            
+        opening_float = simpledialog.askfloat("Cash-up", "Opening float in the drawer:", initialvalue=0.0, minvalue=0.0)
+        if opening_float is None:
+            return
+        counted = {}
+        for tender in sorted(totals):
+            amount = simpledialog.askfloat("Cash-up", f"{tender} counted:", minvalue=0.0)
+            if amount is None:
+                return
+            counted[tender] = amount
+            
+        rows = self.report_controller.reconcile(counted, day, till_id=till_id, opening_float=opening_float)
+        lines = []
+        for row in rows:
+            line = f"{row['tender']}: expected ${row['expected']:.2f}, counted ${row['counted']:.2f}"
+            if row['variance'] > 0:
+                line += f", over ${row['variance']:.2f}"
+            elif row['variance'] < 0:
+                line += f", short ${-row['variance']:.2f}"
+            lines.append(line)
+        messagebox.showinfo("Cash-up", "\n".join(lines))
+        
+    def _format_shift_report(self, title, report):
+        lines = [
+            title,
+            f"Till: {report['till_id']}    Business day: {report['business_date']}",
+            f"Sales: {report['sale_count']}    Gross: ${report['gross_sales']:.2f}    "
+            f"Tax: ${report['tax_total']:.2f}    Discounts: ${report['discount_total']:.2f}",
+            f"Refunds: {report['refund_count']}    ${report['refund_total']:.2f}",
+            f"Net sales: ${report['net_sales']:.2f}",
+            "",
+        ]
+        for tender in report['tenders']:
+            line = f"{tender['tender']}: net ${tender['net']:.2f}, expected ${tender['expected']:.2f}"
+            if tender['variance'] is not None:
+                line += f", counted ${tender['counted']:.2f} ({tender['variance']:+.2f})"
+            lines.append(line)
+        return "\n".join(lines)
+        
+    def show_x_report(self):
+        till_id = self.cash_up_till_var.get().strip() or TILL_ID
+        report = self.report_controller.get_x_report(till_id)
+        if not report:
+            messagebox.showinfo("X Report", f"No shift is open on {till_id}")
+            return
+        messagebox.showinfo("X Report", self._format_shift_report("X Report (shift still open)", report))
+        
+    def close_shift(self):
+        till_id = self.cash_up_till_var.get().strip() or TILL_ID
+        report = self.report_controller.get_x_report(till_id)
+        if not report:
+            messagebox.showinfo("Close Shift", f"No shift is open on {till_id}")
+            return
+            
+        # Counted before the totals are shown, so the count is blind
+        counted = {}
+        for tender in report['tenders']:
+            amount = simpledialog.askfloat("Close Shift", f"{tender['tender']} counted:", minvalue=0.0)
+            if amount is None:
+                return
+            counted[tender['tender']] = amount
+            
+        if not messagebox.askyesno("Close Shift", f"Close the shift on {till_id}? It can't be changed afterwards."):
+            return
+        success, result = self.report_controller.close_shift(till_id, self.user['id'], counted)
+        if not success:
+            messagebox.showerror("Error", result)
+            return
+        messagebox.showinfo("Z Report", self._format_shift_report(f"Z Report #{result['z_number']}", result))
+        
+    def close_day(self):
+        day = simpledialog.askstring("Close Day", "Business day to close (YYYY-MM-DD):",
+                                     initialvalue=datetime.date.today().isoformat())
+        if not day:
+            return
+        try:
+            datetime.date.fromisoformat(day)
+        except ValueError:
+            messagebox.showerror("Error", "Enter the date as YYYY-MM-DD")
+            return
+        if not messagebox.askyesno("Close Day", f"Close {day}? Its totals are frozen and can't be changed."):
+            return
+        success, result = self.report_controller.close_day(day, self.user['id'])
+        if not success:
+            messagebox.showerror("Error", result)
+            return
+        lines = [
+            f"Day {result['business_date']} closed: {result['shift_count']} shift(s)",
+            f"Sales: {result['sale_count']}    Gross: ${result['gross_sales']:.2f}",
+            f"Refunds: {result['refund_count']}    ${result['refund_total']:.2f}",
+            f"Net sales: ${result['net_sales']:.2f}",
+        ]
+        if result['cash_variance'] is not None:
+            lines.append(f"Drawer variance: {result['cash_variance']:+.2f}")
+        lines += [f"{tender['tender']}: ${tender['net']:.2f}" for tender in result['tenders']]
+        messagebox.showinfo("Day Closed", "\n".join(lines))
+        
+    def create_offline_ui(self):
+        ttk.Label(
+            self.offline_frame,
+            text="Sales this till queued while the store database was unavailable."
+        ).pack(anchor=tk.W, pady=(0, 10))
+        
+        filter_frame = ttk.Frame(self.offline_frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 10))
+        ttk.Label(filter_frame, text="Show:").pack(side=tk.LEFT, padx=5)
+        self.offline_filter_var = tk.StringVar(value="Needs attention")
+        filter_combo = ttk.Combobox(
+            filter_frame, textvariable=self.offline_filter_var, state="readonly", width=16,
+            values=("Needs attention", "Pending", "Failed", "Conflicts", "All")
+        )
+        filter_combo.pack(side=tk.LEFT, padx=5)
+        filter_combo.bind("<<ComboboxSelected>>", lambda event: self.load_offline_sales())
+        ttk.Button(filter_frame, text="Refresh", command=self.load_offline_sales).pack(side=tk.LEFT, padx=5)
+        ttk.Button(filter_frame, text="Reprint Receipt", command=self.reprint_offline_receipt).pack(side=tk.RIGHT, padx=5)
+        
+        columns = ("Offline No.", "Rung Up", "Status", "Invoice", "Attempts", "Problem")
+        self.offline_tree = ttk.Treeview(self.offline_frame, columns=columns, show="headings")
+        for col in columns:
+            self.offline_tree.heading(col, text=col)
+            self.offline_tree.column(col, width=260 if col == "Problem" else 130)
+        self.offline_tree.pack(fill=tk.BOTH, expand=True)
+        
+        self.load_offline_sales()
+        
+    def _offline_problem(self, sale):
+        if sale['status'] == 'pending':
+            return f"Waiting to sync: {sale['last_error']}" if sale['last_error'] else "Waiting to sync"
+        if sale['status'] == 'failed':
+            return sale['last_error'] or "Failed"
+        if sale['conflicts']:
+            problems = []
+            for conflict in json.loads(sale['conflicts']):
+                if conflict['type'] == 'stock':
+                    problems.append(f"product {conflict['product_id']} oversold (stock {conflict['quantity']})")
+                else:
+                    problems.append(f"customer {conflict['customer_id']} short of {conflict['points']} points")
+            return "; ".join(problems)
+        return ""
+        
+    def load_offline_sales(self):
+        for item in self.offline_tree.get_children():
+            self.offline_tree.delete(item)
+            
+        journal = get_offline_journal()
+        shown = self.offline_filter_var.get()
+        if shown == "Needs attention":
+            sales = journal.get_attention()
+        elif shown == "Conflicts":
+            sales = journal.get_sales(conflicts=True)
+        else:
+            sales = journal.get_sales(status=None if shown == "All" else shown.lower())
+            
+        for sale in sales:
+            self.offline_tree.insert("", tk.END, values=(
+                sale['offline_number'],
+                sale['created_at'],
+                sale['status'].capitalize(),
+                sale['invoice_number'] or "",
+                sale['attempts'],
+                self._offline_problem(sale)
+            ))
+            
+    def reprint_offline_receipt(self):
+        selection = self.offline_tree.selection()
+        if selection:
+            offline_number = self.offline_tree.item(selection[0], "values")[0]
+        else:
+            offline_number = simpledialog.askstring("Reprint Receipt", "Offline number (OFF-...):")
+        if not offline_number:
+            return
+            
+        sale = get_offline_journal().find_sale(offline_number)
+        if not sale:
+            messagebox.showerror("Error", f"No offline sale {offline_number} on this till")
+            return
+        if sale['invoice_id'] is None:
+            messagebox.showinfo(
+                "Reprint Receipt",
+                f"{sale['offline_number']} has no invoice yet: {self._offline_problem(sale)}"
+            )
+            return
+            
+        # ReportLab is only loaded once a receipt is printed
+        from utils.pdf_generator import generate_receipt
+        path = generate_receipt(self.db_manager, sale['invoice_id'], offline_number=sale['offline_number'])
+        if path:
+            messagebox.showinfo("Reprint Receipt", f"Receipt for invoice {sale['invoice_number']} saved to {path}")
+        else:
+            messagebox.showerror("Error", "Failed to print the receipt")
+        
     def generate_sales_report(self):
         try:
             # Get date range
@@ -227,7 +600,7 @@ class ReportsWindow:
                 return
                 
             # Get sales data
-            sales_data = self.invoice_model.get_sales_report(from_date, to_date)
+            sales_data = self.report_controller.get_invoice_sales(from_date, to_date)
             
             # Clear existing items
             for item in self.sales_tree.get_children():
@@ -275,7 +648,7 @@ class ReportsWindow:
             to_date = f"{to_year}-{to_month:02d}-{to_day:02d}"
             
             # Get sales data
-            sales_data = self.invoice_model.get_sales_report(from_date, to_date)
+            sales_data = self.report_controller.get_invoice_sales(from_date, to_date)
             
             if not sales_data:
                 messagebox.showinfo("Info", "No sales data to export")
@@ -296,6 +669,7 @@ class ReportsWindow:
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
             
             # Generate PDF report
+            from utils.pdf_generator import generate_sales_report
             generate_sales_report(
                 file_path,
                 sales_data,
@@ -0,0 +1,216 @@
+import tkinter as tk
+from tkinter import ttk, messagebox, simpledialog
+from models.refund import Refund
+from models.payment import SPLIT_PAYMENT_METHOD
+from config import CURRENCY_SYMBOL
+
+class ReturnsWindow:
+    def __init__(self, root, db_manager, user, return_callback):
+        self.root = root
+        self.db_manager = db_manager
+        self.user = user
+        self.return_callback = return_callback
+        self.refund_model = Refund(db_manager)
+        self.invoice = None
+        self.found = []
+
+        # Configure the window
+        self.root.title("Supermarket Billing System - Returns")
+
+        # Create main frame
+        self.frame = ttk.Frame(root, padding="20")
+        self.frame.pack(fill=tk.BOTH, expand=True)
+
+        # Header
+        ttk.Label(
+            self.frame,
+            text="Returns",
+            font=("Arial", 16, "bold")
+        ).pack(pady=10)
+
+        # Create UI components
+        self.create_ui()
+
+    def create_ui(self):
+        # Search by invoice number, receipt barcode, phone or card
+        search_frame = ttk.LabelFrame(self.frame, text="Find the Sale")
+        search_frame.pack(fill=tk.X, pady=5)
+
+        ttk.Label(search_frame, text="Invoice / Barcode / Phone / Card last 4:").grid(row=0, column=0, padx=5, pady=5)
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=30)
+        search_entry.grid(row=0, column=1, padx=5, pady=5)
+        search_entry.bind("<Return>", self.search)
+        search_entry.focus_set()
+        ttk.Button(search_frame, text="Search", command=self.search).grid(row=0, column=2, padx=5, pady=5)
+
+        # Matching invoices
+        columns = ("number", "date", "customer", "amount", "payment")
+        self.invoice_tree = ttk.Treeview(self.frame, columns=columns, show="headings", height=5)
+        for column, heading, width in (("number", "Invoice", 150), ("date", "Date", 150), ("customer", "Customer", 150),
+                                       ("amount", "Amount", 100), ("payment", "Payment", 120)):
+            self.invoice_tree.heading(column, text=heading)
+            self.invoice_tree.column(column, width=width)
+        self.invoice_tree.pack(fill=tk.X, pady=5)
+        self.invoice_tree.bind("<<TreeviewSelect>>", self.select_invoice)
+
+        # Lines of the chosen invoice with what can still be returned
+        lines_frame = ttk.LabelFrame(self.frame, text="Items")
+        lines_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+
+        columns = ("id", "name", "sold", "returned", "returnable", "price", "return")
+        self.lines_tree = ttk.Treeview(lines_frame, columns=columns, show="headings")
+        for column, heading, width in (("id", "ID", 50), ("name", "Product", 200), ("sold", "Sold", 60),
+                                       ("returned", "Returned", 70), ("returnable", "Returnable", 80),
+                                       ("price", "Unit Price", 90), ("return", "To Return", 80)):
+            self.lines_tree.heading(column, text=heading)
+            self.lines_tree.column(column, width=width)
+        self.lines_tree.pack(fill=tk.BOTH, expand=True)
+        self.lines_tree.bind("<Double-1>", self.set_quantity)
+
+        # Return options
+        options_frame = ttk.Frame(self.frame)
+        options_frame.pack(fill=tk.X, pady=5)
+
+        ttk.Button(options_frame, text="Set Quantity", command=self.set_quantity).pack(side=tk.LEFT, padx=5)
+        ttk.Button(options_frame, text="Return All", command=self.return_all).pack(side=tk.LEFT, padx=5)
+
+        ttk.Label(options_frame, text="Refund To:").pack(side=tk.LEFT, padx=(20, 5))
+        self.refund_method_var = tk.StringVar()
+        refund_method_combo = ttk.Combobox(options_frame, textvariable=self.refund_method_var, width=15)
+        refund_method_combo['values'] = ('Cash', 'Credit Card', 'Debit Card', 'Mobile Payment', 'Store Credit')
+        refund_method_combo.pack(side=tk.LEFT, padx=5)
+
+        self.restock_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(options_frame, text="Return to stock", variable=self.restock_var).pack(side=tk.LEFT, padx=10)
+
+        ttk.Label(options_frame, text="Reason:").pack(side=tk.LEFT, padx=5)
+        self.reason_var = tk.StringVar()
+        ttk.Entry(options_frame, textvariable=self.reason_var, width=25).pack(side=tk.LEFT, padx=5)
+
+        # Buttons
+        button_frame = ttk.Frame(self.frame)
+        button_frame.pack(fill=tk.X, pady=10)
+        ttk.Button(button_frame, text="Process Return", command=self.process_return).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Back to Main Menu", command=self.return_callback).pack(side=tk.RIGHT, padx=5)
+
+    def search(self, event=None):
+        term = self.search_var.get().strip()
+        if not term:
+            messagebox.showwarning("Warning", "Enter an invoice number, phone number or card's last 4 digits")
+            return
+
+        self.found = self.refund_model.find_invoices(term)
+        for item in self.invoice_tree.get_children():
+            self.invoice_tree.delete(item)
+        for index, invoice in enumerate(self.found):
+            card = f" ****{invoice['card_last4']}" if invoice['card_last4'] else ""
+            self.invoice_tree.insert("", tk.END, iid=str(index), values=(
+                invoice['invoice_number'],
+                invoice['created_at'],
+                invoice['customer_name'] or "Walk-in",
+                f"{CURRENCY_SYMBOL}{invoice['final_amount']:.2f}",
+                f"{invoice['payment_method']}{card}"
+            ))
+
+        if not self.found:
+            messagebox.showinfo("Info", "No matching sales found")
+        elif len(self.found) == 1:
+            self.invoice_tree.selection_set("0")
+
+    def select_invoice(self, event=None):
+        selected = self.invoice_tree.selection()
+        if not selected:
+            return
+        self.load_invoice(self.found[int(selected[0])]['id'])
+
+    def load_invoice(self, invoice_id):
+        self.invoice = self.refund_model.get_returnable(invoice_id)
+        if not self.invoice:
+            messagebox.showerror("Error", "The sale could not be loaded")
+            return
+        self.to_return = {}
+        # Split sales leave it blank to refund to each tender up to what it paid
+        method = self.invoice['payment_method']
+        self.refund_method_var.set("" if method == SPLIT_PAYMENT_METHOD else method)
+        self.update_lines()
+
+    def update_lines(self):
+        for item in self.lines_tree.get_children():
+            self.lines_tree.delete(item)
+        for line in self.invoice['lines']:
+            self.lines_tree.insert("", tk.END, iid=str(line['product_id']), values=(
+                line['product_id'],
+                line['product_name'],
+                line['sold'],
+                line['returned'],
+                line['returnable'],
+                f"{CURRENCY_SYMBOL}{line['sold_value'] / line['sold']:.2f}",
+                self.to_return.get(line['product_id'], 0)
+            ))
+
+    def set_quantity(self, event=None):
+        selected = self.lines_tree.selection()
+        if not self.invoice or not selected:
+            messagebox.showwarning("Warning", "Please select an item")
+            return
+
+        product_id = int(selected[0])
+        line = next(line for line in self.invoice['lines'] if line['product_id'] == product_id)
+        if line['returnable'] <= 0:
+            messagebox.showinfo("Info", f"All of {line['product_name']} has already been returned")
+            return
+
+        quantity = simpledialog.askinteger(
+            "Quantity",
+            f"Quantity of {line['product_name']} to return (0-{line['returnable']}):",
+            minvalue=0,
+            maxvalue=line['returnable']
+        )
+        if quantity is None:
+            return
+        self.to_return[product_id] = quantity
+        self.update_lines()
+
+    def return_all(self):
+        if not self.invoice:
+            messagebox.showwarning("Warning", "Please select a sale first")
+            return
+        self.to_return = {line['product_id']: line['returnable'] for line in self.invoice['lines'] if line['returnable'] > 0}
+        self.update_lines()
+
+    def process_return(self):
+        if not self.invoice or not any(self.to_return.values()):
+            messagebox.showwarning("Warning", "Choose the items to return")
+            return
+
+        if not messagebox.askyesno("Confirm Return", f"Return items from {self.invoice['invoice_number']}?"):
+            return
+
+        success, result = self.refund_model.process_return(
+            self.invoice['id'],
+            self.to_return,
+            self.user['id'],
+            refund_method=self.refund_method_var.get() or None,
+            reason=self.reason_var.get().strip() or None,
+            restock=self.restock_var.get()
+        )
+        if not success:
+            messagebox.showerror("Error", result)
+            return
+
+        points = ""
+        if result['points_reversed'] or result['points_restored']:
+            points = f"\nLoyalty points: -{result['points_reversed']} earned, +{result['points_restored']} given back"
+        refunded_by = result['refund_method']
+        if refunded_by == SPLIT_PAYMENT_METHOD:
+            refunded_by = ", ".join(
+                f"{payment['tender']} {CURRENCY_SYMBOL}{-payment['amount']:.2f}" for payment in result['payments']
+            )
+        messagebox.showinfo(
+            "Return Complete",
+            f"Return {result['return_number']}\n"
+            f"Refund {CURRENCY_SYMBOL}{result['refund_amount']:.2f} by {refunded_by}{points}"
+        )
+        self.reason_var.set("")
+        self.load_invoice(self.invoice['id'])
@@ -1,7 +1,10 @@
  
+import os
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, simpledialog
 from models.user import User
+from utils.backup import BackupManager
+from utils.quick_switch import is_valid_pin
 
 class SettingsWindow:
     def __init__(self, root, db_manager, user, return_callback):
@@ -42,6 +45,11 @@ class SettingsWindow:
             users_frame = ttk.Frame(notebook, padding="10")
             notebook.add(users_frame, text="User Management")
             self.create_user_management_ui(users_frame)
+            
+            # Backup Tab (admin only)
+            backup_frame = ttk.Frame(notebook, padding="10")
+            notebook.add(backup_frame, text="Backup")
+            self.create_backup_ui(backup_frame)
         
         # Create User Profile UI
         self.create_profile_ui(profile_frame)
@@ -124,6 +132,46 @@ class SettingsWindow:
                 
         ttk.Button(password_frame, text="Change Password", command=change_password).grid(row=3, column=1, padx=5, pady=10, sticky=tk.E)
         
+        # Quick Switch PIN
+        pin_frame = ttk.LabelFrame(parent_frame, text="Quick Switch PIN")
+        pin_frame.pack(fill=tk.X, pady=10)
+        
+        # Password
+        ttk.Label(pin_frame, text="Current Password:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
+        pin_password_var = tk.StringVar()
+        ttk.Entry(pin_frame, textvariable=pin_password_var, show="*").grid(row=0, column=1, padx=5, pady=5)
+        
+        # PIN
+        ttk.Label(pin_frame, text="PIN (4-6 digits):").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
+        pin_var = tk.StringVar()
+        ttk.Entry(pin_frame, textvariable=pin_var, show="*").grid(row=1, column=1, padx=5, pady=5)
+        
+        # Set PIN Button
+        def set_pin():
+            password = pin_password_var.get()
+            pin = pin_var.get().strip()
+            
+            if not password or not pin:
+                messagebox.showwarning("Warning", "Password and PIN are required")
+                return
+                
+            if not is_valid_pin(pin):
+                messagebox.showwarning("Warning", "PIN must be 4 to 6 digits")
+                return
+                
+            if not self.user_model.verify_password(self.user['username'], password):
+                messagebox.showerror("Error", "Incorrect password")
+                return
+                
+            if self.user_model.set_pin(self.user['id'], pin):
+                messagebox.showinfo("Success", "PIN set. You can now unlock a shared till with it.")
+                pin_password_var.set("")
+                pin_var.set("")
+            else:
+                messagebox.showerror("Error", "Failed to set PIN")
+                
+        ttk.Button(pin_frame, text="Set PIN", command=set_pin).grid(row=2, column=1, padx=5, pady=10, sticky=tk.E)
+        
     def create_user_management_ui(self, parent_frame):
         # Create user list frame
         list_frame = ttk.Frame(parent_frame)
@@ -248,6 +296,29 @@ class SettingsWindow:
                 
         ttk.Button(form_frame, text="Delete Selected User", command=delete_user).grid(row=6, column=1, padx=5, pady=10, sticky=tk.E)
         
+        # Set PIN Button
+        def set_user_pin():
+            selected = self.users_tree.selection()
+            if not selected:
+                messagebox.showwarning("Warning", "Please select a user")
+                return
+                
+            user_id = self.users_tree.item(selected[0])['values'][0]
+            pin = simpledialog.askstring("Quick Switch PIN", "Enter a 4-6 digit PIN:", show="*", parent=self.root)
+            if pin is None:
+                return
+                
+            if not is_valid_pin(pin.strip()):
+                messagebox.showwarning("Warning", "PIN must be 4 to 6 digits")
+                return
+                
+            if self.user_model.set_pin(user_id, pin.strip()):
+                messagebox.showinfo("Success", "PIN set successfully")
+            else:
+                messagebox.showerror("Error", "Failed to set PIN")
+                
+        ttk.Button(form_frame, text="Set PIN for Selected User", command=set_user_pin).grid(row=7, column=1, padx=5, pady=10, sticky=tk.E)
+        
     def load_users(self):
         # Clear existing items
         for item in self.users_tree.get_children():
@@ -265,3 +336,67 @@ class SettingsWindow:
                 user['role'],
                 user['email'] if user['email'] else ""
             ))
+            
+    def create_backup_ui(self, parent_frame):
+        self.backup_manager = BackupManager(self.db_manager.db_path)
+        
+        ttk.Label(
+            parent_frame,
+            text="Backups are taken while the system is in use; tills can keep billing."
+        ).pack(anchor=tk.W, pady=(0, 10))
+        
+        # Snapshot list
+        columns = ("created_at", "label", "file")
+        self.backups_tree = ttk.Treeview(parent_frame, columns=columns, show="headings", height=8)
+        self.backups_tree.heading("created_at", text="Taken At")
+        self.backups_tree.heading("label", text="Label")
+        self.backups_tree.heading("file", text="File")
+        self.backups_tree.column("created_at", width=150)
+        self.backups_tree.column("label", width=120)
+        self.backups_tree.column("file", width=300)
+        self.backups_tree.pack(fill=tk.BOTH, expand=True)
+        
+        status_var = tk.StringVar()
+        ttk.Label(parent_frame, textvariable=status_var).pack(anchor=tk.W, pady=5)
+        
+        def wait_for_backup():
+            if not parent_frame.winfo_exists():
+                return
+            if self.backup_manager.is_running():
+                parent_frame.after(200, wait_for_backup)
+                return
+            
+            backup_button.config(state=tk.NORMAL)
+            result = self.backup_manager.last_result
+            if result:
+                status_var.set(
+                    f"Backup finished in {result['duration']:.1f}s "
+                    f"(longest pause {result['max_step_ms']:.0f} ms)"
+                )
+            else:
+                status_var.set("Backup failed")
+            self.load_backups()
+        
+        def backup_now():
+            self.backup_manager.last_result = None
+            if not self.backup_manager.start_background_snapshot():
+                return
+            backup_button.config(state=tk.DISABLED)
+            status_var.set("Backing up...")
+            parent_frame.after(200, wait_for_backup)
+            
+        backup_button = ttk.Button(parent_frame, text="Backup Now", command=backup_now)
+        backup_button.pack(side=tk.RIGHT, pady=5)
+        
+        self.load_backups()
+        
+    def load_backups(self):
+        for item in self.backups_tree.get_children():
+            self.backups_tree.delete(item)
+            
+        for snapshot in self.backup_manager.list_snapshots():
+            self.backups_tree.insert("", tk.END, values=(
+                snapshot['created_at'].strftime("%Y-%m-%d %H:%M:%S"),
+                snapshot['label'] or "",
+                os.path.basename(snapshot['path'])
+            ))